@@ -0,0 +1,85 @@
+"""
+Admission control under a noisy chat: fair BigQuery slots vs one FIFO queue,
+and what the rate limits let through.
+
+    python benchmarks/bench_admission.py [--slots 4] [--query-ms 200] [--noisy 20] [--quiet 10]
+
+A noisy chat fires --noisy `/pmh_week A` commands at once (5 queries each,
+one per country, run one after the other as the handler does), and 50 ms
+later --quiet other chats each ask one `/dist TH`. Queries are a blocking
+--query-ms sleep run on a thread behind --slots slots, either:
+
+  fifo   one asyncio.Semaphore: every waiter in arrival order
+  fair   bot/query_scheduler.py QueryScheduler: round-robin across chats
+
+and we report how long the quiet chats waited for their report. Then the
+same burst goes through RateLimiter with the default buckets to show how
+much of it is admitted at all.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import admission
+from bot.query_scheduler import QueryScheduler
+
+async def scenario(mode: str, args) -> tuple[list[float], float]:
+    scheduler = QueryScheduler(args.slots)
+    fifo = asyncio.Semaphore(args.slots)
+
+    async def query(chat_id):
+        if mode == "fair":
+            async with scheduler.slot(key=chat_id):
+                await asyncio.to_thread(time.sleep, args.query_ms / 1e3)
+        else:
+            async with fifo:
+                await asyncio.to_thread(time.sleep, args.query_ms / 1e3)
+
+    async def noisy_command():
+        for _ in range(admission.ALL_MULTIPLIER):
+            await query(-1)
+
+    async def quiet_command(chat_id) -> float:
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await query(chat_id)
+        return time.perf_counter() - started
+
+    start = time.perf_counter()
+    noisy = [asyncio.create_task(noisy_command()) for _ in range(args.noisy)]
+    quiet = await asyncio.gather(*(quiet_command(-100 - i) for i in range(args.quiet)))
+    await asyncio.gather(*noisy)
+    return quiet, time.perf_counter() - start
+
+def limiter_burst(args) -> str:
+    limiter = admission.RateLimiter()
+    cost = admission.command_cost("pmh_week", ["A", "20250901"])
+    admitted = sum(not limiter.admit(1, -1, cost) for _ in range(args.noisy))
+    light = admission.command_cost("dist", ["TH", "20250901"])
+    wait = limiter.admit(1, -1, light)
+    return (f"/pmh_week A costs {cost}: {admitted} of {args.noisy} admitted; "
+            f"the user's next /dist TH (cost {light}) waits {wait:.0f}s")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--slots", type=int, default=4)
+    ap.add_argument("--query-ms", type=float, default=200)
+    ap.add_argument("--noisy", type=int, default=20)
+    ap.add_argument("--quiet", type=int, default=10)
+    args = ap.parse_args()
+
+    print(f"{args.noisy} x /pmh_week A in one chat + {args.quiet} quiet chats, "
+          f"{args.slots} slots, {args.query_ms:.0f} ms per query")
+    print(f"{'queue':>6} {'quiet p50 ms':>13} {'quiet max ms':>13} {'total s':>8}")
+    for mode in ("fifo", "fair"):
+        quiet, total = asyncio.run(scenario(mode, args))
+        print(f"{mode:>6} {statistics.median(quiet) * 1e3:>13.0f} {max(quiet) * 1e3:>13.0f} {total:>8.2f}")
+    print(limiter_burst(args))
+
+if __name__ == "__main__":
+    main()
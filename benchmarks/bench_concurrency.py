@@ -0,0 +1,108 @@
+"""
+Cross-chat head-of-line blocking: sequential updates vs ChatOrderedProcessor.
+
+    python benchmarks/bench_concurrency.py [--chats 20] [--slow-ms 2000] [--concurrency 16]
+
+Chat 1 sends a slow /slow (an awaited sleep standing in for `/pmh_week A`)
+followed by a few quick /ping; meanwhile --chats other chats send /ping.
+Against benchmarks/fake_telegram.py (polling with no pause) it reports the
+reply latency of the other chats' /ping and checks that every chat got its
+replies in the order it sent the commands:
+
+  sequential     ApplicationBuilder defaults, one update at a time (the old setup)
+  chat-ordered   bot/update_processor.py ChatOrderedProcessor(--concurrency)
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+
+from benchmarks.fake_telegram import TOKEN, FakeTelegram, command_update
+from bot.update_processor import ChatOrderedProcessor
+
+SLOW_CHAT = 1
+
+
+async def run(mode: str, chats: int, slow: float, concurrency: int) -> tuple[list[float], bool]:
+    async def slow_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await asyncio.sleep(slow)
+        await update.effective_chat.send_message(update.message.text)
+
+    async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await asyncio.sleep(0.001)
+        await update.effective_chat.send_message(update.message.text)
+
+    fake = FakeTelegram()
+    builder = ApplicationBuilder().token(TOKEN).request(fake).get_updates_request(fake)
+    if mode == "chat-ordered":
+        builder = builder.concurrent_updates(ChatOrderedProcessor(concurrency))
+    app = builder.build()
+    app.add_handler(CommandHandler("slow", slow_cmd))
+    app.add_handler(CommandHandler("ping", ping))
+    await app.initialize()
+    await app.start()
+    await app.updater.start_polling(poll_interval=0.0, timeout=50)
+
+    sent: dict[int, list[str]] = {}
+    started: dict[tuple[int, str], float] = {}
+    update_id = 0
+
+    def push(chat_id: int, text: str):
+        nonlocal update_id
+        update_id += 1
+        sent.setdefault(chat_id, []).append(text)
+        started[(chat_id, text)] = time.perf_counter()
+        fake.push_update(command_update(update_id, text, chat_id=chat_id, user_id=chat_id))
+
+    push(SLOW_CHAT, "/slow")
+    for i in range(3):
+        push(SLOW_CHAT, f"/ping after-slow-{i}")
+    await asyncio.sleep(0.05)
+    for chat_id in range(2, chats + 2):
+        push(chat_id, "/ping")
+        await asyncio.sleep(0.005)
+
+    expected = sum(len(v) for v in sent.values())
+    deadline = time.perf_counter() + slow * 2 + 10
+    while len(fake.sent) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+
+    replies: dict[int, list[str]] = {}
+    latencies = []
+    for ts, _, params in sorted(fake.sent, key=lambda s: s[0]):
+        chat_id, text = int(params["chat_id"]), params["text"]
+        replies.setdefault(chat_id, []).append(text)
+        if chat_id != SLOW_CHAT:
+            latencies.append(ts - started[(chat_id, text)])
+    return latencies, replies == sent
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chats", type=int, default=20)
+    ap.add_argument("--slow-ms", type=float, default=2000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    print(f"{'mode':<14} {'median ms':>10} {'max ms':>8} {'in order':>9}")
+    for mode in ("sequential", "chat-ordered"):
+        lat, ordered = asyncio.run(run(mode, args.chats, args.slow_ms / 1e3, args.concurrency))
+        if len(lat) < args.chats:
+            print(f"{mode:<14} only {len(lat)}/{args.chats} replies")
+            continue
+        print(f"{mode:<14} {statistics.median(lat) * 1e3:>10.1f} {max(lat) * 1e3:>8.1f} {'yes' if ordered else 'NO':>9}")
+
+
+if __name__ == "__main__":
+    main()
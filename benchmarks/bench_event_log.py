@@ -0,0 +1,100 @@
+"""
+Event logging cost per message: the old per-event append vs. EventLogWriter.
+
+    python benchmarks/bench_event_log.py [--events 20000] [--slow-ms 0,20]
+
+"sync" reproduces the old _log_event (date, open, append, close on the
+event loop for every message). "emit" is `await EventLogWriter.emit(...)`,
+as echo() does now. Per-call latency is what a handler pays; "drain" is
+how long stop() then needs to get everything on disk. --slow-ms adds a
+sleep to every batch write to mimic a slow disk: emit latency stays flat
+until the queue fills, then back-pressure kicks in. Runs in a temporary
+directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.event_log import EventLogWriter
+
+
+def payload(i: int) -> dict:
+    return {"user_id": 1000 + i % 50, "chat_id": -100 - i % 7, "chat_type": "supergroup", "text": f"message {i}"}
+
+
+def sync_log_event(logs_dir: Path, payload: dict) -> None:
+    now_bkk = datetime.now(ZoneInfo("Asia/Bangkok"))
+    log_path = logs_dir / f"events-{now_bkk.strftime('%Y%m%d')}.jsonl"
+    payload = dict(payload)
+    payload.setdefault("ts", now_bkk.isoformat())
+    logs_dir.mkdir(parents=True, exist_ok=True)
+    with log_path.open("a", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+        f.write("\n")
+
+
+def bench_sync(tmp: Path, n: int) -> tuple[list[float], float]:
+    times = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        sync_log_event(tmp, payload(i))
+        times.append(time.perf_counter() - t0)
+    return times, 0.0
+
+
+async def bench_emit(tmp: Path, n: int, slow_ms: float, queue: int) -> tuple[list[float], float]:
+    writer = EventLogWriter(tmp, max_queue=queue, compression="none")
+    if slow_ms:
+        append = writer._append
+
+        def slow_append(day, payloads):
+            time.sleep(slow_ms / 1e3)
+            return append(day, payloads)
+        writer._append = slow_append
+    await writer.start()
+    times = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        await writer.emit(payload(i))
+        times.append(time.perf_counter() - t0)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # other handlers run in between
+    t0 = time.perf_counter()
+    await writer.stop()
+    return times, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--slow-ms", default="0,20")
+    ap.add_argument("--queue", type=int, default=10000)
+    args = ap.parse_args()
+
+    print(f"{'mode':<14} {'median us':>10} {'p99 us':>8} {'max ms':>8} {'drain ms':>9} {'lines':>7}")
+    runs = [("sync", lambda d: bench_sync(d, args.events))]
+    for slow in (float(x) for x in args.slow_ms.split(",")):
+        runs.append((f"emit slow={slow:g}ms",
+                     lambda d, slow=slow: asyncio.run(bench_emit(d, args.events, slow, args.queue))))
+    for name, run in runs:
+        with tempfile.TemporaryDirectory() as d:
+            times, drain = run(Path(d))
+            lines = sum(1 for f in Path(d).glob("events-*.jsonl") for _ in f.open())
+        times.sort()
+        p99 = times[int(len(times) * 0.99) - 1]
+        print(f"{name:<14} {statistics.median(times) * 1e6:>10.1f} {p99 * 1e6:>8.1f} "
+              f"{times[-1] * 1e3:>8.2f} {drain * 1e3:>9.1f} {lines:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Text-formatting kernel: per-character / per-cell helpers vs. bot.formatting.
+
+    python benchmarks/bench_formatting.py [--rows 1000,10000,100000] [--tables 2000,10000] [--repeat 5]
+
+The "legacy" functions below are the helpers table_renderer.py and main.py
+used before bot/formatting.py (a Python loop per character for stylize, a
+regex for MarkdownV2 escaping, a try/except float() per number). Every case
+asserts the two produce the same strings before it is timed.
+
+The per-table part renders one country's APF, DPF and channel distribution
+with --tables rows through three versions of bot/table_renderer.py: the one
+before bot/formatting.py existed ("before"), the one of the commit that
+added it ("kernel"), both read from git history, and the working tree
+("now", which also has the later table engine), with the clock pinned as
+in benchmarks/golden_reports.py. All three must give the same text; the
+factor is before / kernel.
+"""
+import argparse
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import apf_rows, dist_rows, dpf_rows
+from benchmarks.golden_reports import _FrozenDatetime, pinned
+from bot import table_renderer
+from bot.formatting import (
+    STYLES,
+    column_separators,
+    column_width,
+    count_separators,
+    escape_md_v2,
+    fmt_commas0_column,
+    fmt_number_column,
+    stylize,
+)
+
+
+# ---- reference implementations (previous code) ----
+def legacy_stylize(text: str, style: str = "mono") -> str:
+    spec = STYLES[style]
+    out = []
+    for ch in text:
+        o = ch
+        if "A" <= ch <= "Z" and spec.get("A") is not None:
+            o = chr(spec["A"] + (ord(ch) - ord("A")))
+        elif "a" <= ch <= "z" and spec.get("a") is not None:
+            o = chr(spec["a"] + (ord(ch) - ord("a")))
+        elif "0" <= ch <= "9" and spec.get("0") is not None:
+            o = chr(spec["0"] + (ord(ch) - ord("0")))
+        out.append(o)
+    return "".join(out)
+
+
+def legacy_escape_md_v2(text: str) -> str:
+    if not text:
+        return text
+    return re.sub(r'([\\_*\[\]()~`>#+\-=|{}.!])', r'\\\1', text)
+
+
+def legacy_fmt_number(x):
+    try:
+        if isinstance(x, str) and x.strip() == "":
+            return ""
+        n = float(x)
+        if n.is_integer():
+            return f"{int(n):,}"
+        return f"{n:,.0f}"
+    except Exception:
+        return str(x)
+
+
+def legacy_num_to_float(x):
+    if x is None: return 0.0
+    s = str(x).replace(",", "").replace(" ", "")
+    try:
+        return float(s)
+    except Exception:
+        return 0.0
+
+
+def legacy_widths(cells, header):
+    width = max(len(header), *(len(c) for c in cells))
+    seps = max(count_separators(header), *(count_separators(c) for c in cells))
+    return width, seps
+
+
+# ---- cases ----
+def make_cases(n, rng):
+    labels = [f"Brand {i} (TH) - total.{i % 7}" for i in range(n)]
+    numbers = [rng.uniform(-1e6, 1e9) for _ in range(n)]
+    ints = [rng.randint(0, 10**7) for _ in range(n)]
+    return [
+        ("stylize", lambda: [legacy_stylize(s, "sans_bold") for s in labels],
+                    lambda: [stylize(s, "sans_bold") for s in labels]),
+        ("escape_md_v2", lambda: [legacy_escape_md_v2(s) for s in labels],
+                         lambda: [escape_md_v2(s) for s in labels]),
+        ("fmt_number", lambda: [legacy_fmt_number(v) for v in numbers],
+                       lambda: fmt_number_column(numbers)),
+        ("fmt_commas0", lambda: ["{:,.0f}".format(legacy_num_to_float(v)) for v in ints],
+                        lambda: fmt_commas0_column(ints)),
+        ("widths", lambda: legacy_widths([legacy_fmt_number(v) for v in numbers], "Total"),
+                   lambda: (lambda c: (column_width(c, "Total"), column_separators(c, "Total")))(fmt_number_column(numbers))),
+    ]
+
+
+# ---- per-table: table_renderer.py from git history ----
+def git(*args) -> str:
+    return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+
+def module_at(rev: str, path: str, name: str, deps: dict | None = None) -> types.ModuleType:
+    """Execute `path` as it was at `rev`, with `deps` standing in for its imports of bot modules."""
+    module = types.ModuleType(name)
+    module.__file__ = os.path.join(ROOT, path)
+    saved = {k: sys.modules.get(k) for k in deps or {}}
+    sys.modules.update(deps or {})
+    try:
+        label = git("rev-parse", "--short", rev).strip()
+        exec(compile(git("show", f"{rev}:{path}"), f"{label}:{path}", "exec"), module.__dict__)
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                sys.modules.pop(k, None)
+            else:
+                sys.modules[k] = v
+    return module
+
+
+def renderer_versions() -> dict[str, types.ModuleType]:
+    added = git("log", "--diff-filter=A", "--format=%H", "--", "bot/formatting.py").split()[-1]
+    formatting = module_at(added, "bot/formatting.py", "formatting_kernel")
+    before = module_at(f"{added}^", "bot/table_renderer.py", "table_renderer_before")
+    kernel = module_at(added, "bot/table_renderer.py", "table_renderer_kernel", {"bot.formatting": formatting})
+    for m in (before, kernel):
+        # same header minute as pinned() gives the working tree; the old debug prints cost nothing
+        m.datetime, m.print = _FrozenDatetime, lambda *a, **k: None
+    return {"before": before, "kernel": kernel, "now": table_renderer}
+
+
+def table_cases(n):
+    apf = apf_rows(max(1, n // 3), days=3)
+    dpf = dpf_rows(max(1, n // 3), days=3)
+    dist = dist_rows(n)
+    return [
+        ("apf", len(apf), lambda m: m.render_apf_table_v2("TH", apf)),
+        ("dpf", len(dpf), lambda m: m.render_dpf_table_v2("TH", dpf)),
+        ("dist", len(dist), lambda m: m.render_channel_distribution("TH", dist)),
+    ]
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", default="1000,10000,100000")
+    ap.add_argument("--tables", default="2000,10000", help="rows per rendered table (empty: skip)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'case':<14} {'rows':>8} {'legacy ms':>10} {'kernel ms':>10} {'speedup':>8}")
+    for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+        for name, legacy, kernel in make_cases(n, rng):
+            assert legacy() == kernel(), name
+            t_legacy = best_of(legacy, args.repeat)
+            t_kernel = best_of(kernel, args.repeat)
+            print(f"{name:<14} {n:>8} {t_legacy * 1e3:>10.2f} {t_kernel * 1e3:>10.2f} {t_legacy / t_kernel:>7.1f}x")
+
+    tables = [int(x) for x in args.tables.split(",") if x.strip()]
+    if not tables:
+        return
+    try:
+        versions = renderer_versions()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"\nper-table comparison skipped: needs the git history ({e})")
+        return
+    print(f"\n{'table':<6} {'rows':>8} {'before ms':>10} {'kernel ms':>10} {'factor':>7} {'now ms':>9}")
+    for n in tables:
+        for name, rows, render in table_cases(n):
+            with pinned():
+                assert render(versions["before"]) == render(versions["kernel"]) == render(table_renderer), name
+                t = {v: best_of(lambda: render(m), args.repeat) for v, m in versions.items()}
+            print(f"{name:<6} {rows:>8} {t['before'] * 1e3:>10.1f} {t['kernel'] * 1e3:>10.1f} "
+                  f"{t['before'] / t['kernel']:>6.1f}x {t['now'] * 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Image mode: PNG render cost and what it saves in Telegram sends.
+
+    python benchmarks/bench_images.py [--brands 200,1000] [--groups 20,80] [--repeat 3]
+
+For each report and country: how long build_report_images takes, the PNG
+size and dimensions, and next to it how many text messages the same report
+needs and how many seconds of built-in pauses (OutgoingMessage.delay) those
+messages add. Needs Pillow (requirements2.txt).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import bot.table_renderer as tr
+from benchmarks.fixtures import apf_rows, by_country, pmh_rows
+from bot import image_renderer
+
+
+def reports(brands: int, groups: int):
+    cg = by_country(apf_rows(brands, countries=("TH", "PH")))
+    df = pd.DataFrame(pmh_rows(groups, countries=("TH", "PH")))
+    week = pd.DataFrame(pmh_rows(groups, countries=("TH", "PH"), week=True))
+    return [
+        (f"apf {brands}", "apf", tr.build_apf_messages, tr._split_country_groups(cg, 72)),
+        (f"pmh_provider {groups}", "pmh_provider", tr.build_provider_summary_messages,
+         tr._split_frame(df, "2025-10-06")),
+        (f"pmh_week {groups}", "pmh_week", tr.build_pmh_week_messages, tr._split_frame(week, "2025-09-30")),
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--brands", default="200,1000")
+    ap.add_argument("--groups", default="20,80")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if not image_renderer.available():
+        sys.exit("Pillow is not installed (pip install -r requirements2.txt)")
+
+    sizes = list(zip([int(x) for x in args.brands.split(",")], [int(x) for x in args.groups.split(",")]))
+    print(f"{'report':<18} {'ctry':<4} {'render ms':>10} {'PNG KB':>7} {'size':>11} {'photo':>5} "
+          f"{'msgs':>5} {'pause s':>8}")
+    for brands, groups in sizes:
+        for name, kind, build, inputs in reports(brands, groups):
+            for country, call_args in inputs:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    [im] = tr.build_report_images(kind, build, [(country, call_args)])
+                    best = min(best, time.perf_counter() - t0)
+                messages = build(*call_args)
+                pause = sum(m.delay for m in messages)
+                print(f"{name:<18} {country:<4} {best * 1e3:>10.1f} {len(im.png) / 1024:>7.0f} "
+                      f"{f'{im.width}x{im.height}':>11} {'yes' if im.fits_photo else 'doc':>5} "
+                      f"{len(messages):>5} {pause:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+End-to-end load test: many chats and users sending report commands to
+RealTimeBot at once, as at 9am when everyone opens their dashboards.
+
+    python benchmarks/bench_load.py [--updates 1000] [--ramp 30] [--chats 150] [--users 1500]
+                                    [--query-ms 1500] [--query-p99-ms 6000] [--rtt-ms 60] [--tx 50000]
+
+The real bot runs: RealTimeBot.build_application with every handler,
+ChatOrderedProcessor, admission and rate limits, the query cache and
+scheduler lanes, the renderers and their pools, ResilientRequest. Only the
+edges are stand-ins:
+
+  Telegram   benchmarks/fake_telegram.py ThrottledTelegram, --rtt-ms per
+             call and Telegram's flood limits (429 + retry_after)
+  queries    benchmarks/fake_query.py LatencyQueryClient, results of the
+             sql/ templates on --tx synthetic transactions, each fetch
+             delayed by a log-normal latency (--query-ms median,
+             --query-p99-ms p99)
+
+--updates commands arrive at random over --ramp seconds, from --users
+users (a few heavy ones, many occasional). A --group-share of them are
+sent in one of --chats group chats, the rest in the user's private chat.
+The command mix is COMMANDS, with the current GMT+7 date for the dated
+reports. Bot settings read from the environment can be changed per run
+with --set NAME=VALUE (QUERY_CACHE_TTL, BQ_MAX_JOBS, UPDATE_CONCURRENCY, ...).
+
+Per command it reports how many were answered, the time from the update
+arriving to the first and to the last message reaching Telegram (p50 /
+p99), and the messages sent. Overall, it reports commands handled per
+second, sends per second and the 429s Telegram returned. State, events and
+usage files go to a temporary directory.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_telegram import TOKEN, ThrottledTelegram, command_update, current_update
+
+GMT7 = timezone(timedelta(hours=7))
+# (command template, weight); {date} is today in GMT+7 as YYYYMMDD
+COMMANDS = [
+    ("/apf a", 10), ("/apf TH", 6), ("/dpf TH", 8), ("/dpf PH", 4),
+    ("/dist a {date}", 8), ("/pmh_total A {date}", 10), ("/pmh_total TH {date}", 6),
+    ("/pmh_provider TH {date}", 6), ("/pmh_method PH {date}", 4),
+    ("/pmh_week TH {date}", 6), ("/help", 4),
+]
+
+
+def workload(n: int, ramp: float, chats: int, users: int, group_share: float, seed: int = 7) -> list[tuple]:
+    """(offset s, chat_id, chat_type, user_id, text) for n commands, by arrival."""
+    rng = random.Random(seed)
+    date = datetime.now(GMT7).strftime("%Y%m%d")
+    texts, weights = zip(*COMMANDS)
+    user_ids = [10_000 + i for i in range(users)]
+    activity = [1 / (i + 1) ** 0.6 for i in range(users)]  # Zipf-like: a few heavy users, a long tail
+    out = []
+    for offset in sorted(rng.uniform(0, ramp) for _ in range(n)):
+        user = rng.choices(user_ids, activity)[0]
+        if rng.random() < group_share:
+            chat_id, chat_type = -1_000 - rng.randrange(chats), "supergroup"
+        else:
+            chat_id, chat_type = user, "private"
+        out.append((offset, chat_id, chat_type, user, rng.choices(texts, weights)[0].format(date=date)))
+    return out
+
+
+def command_label(text: str) -> str:
+    """/pmh_total@MyBot A 20250901 -> /pmh_total; other messages -> (message)."""
+    return text.split(maxsplit=1)[0].split("@", 1)[0].lower() if text.startswith("/") else "(message)"
+
+
+def pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))] if values else float("nan")
+
+
+async def run(args, work: list[tuple], tmp: str) -> tuple[dict, ThrottledTelegram, float]:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    import main
+    from benchmarks import synthetic_data
+    from benchmarks.fake_query import LatencyQueryClient
+    from bot import usage
+    from bot.event_log import EventLogWriter
+    from bot.local_query import connect
+    from bot.resilience import ResilientRequest
+
+    logging.getLogger().setLevel(args.log_level)  # main.py configures INFO logging on import
+    bot = main.RealTimeBot()
+    bot.event_log = EventLogWriter(tmp)
+    bot.usage_compactor = usage.UsageCompactor(tmp)
+    con = connect(":memory:")
+    synthetic_data.generate(con, args.tx)
+    bot.bq_client = LatencyQueryClient(bot.config, bot.backend, con=con, median=args.query_ms / 1e3,
+                                       p99=args.query_p99_ms / 1e3, seed=args.seed)
+
+    fake = ThrottledTelegram(rtt=args.rtt_ms / 1e3)
+    app = bot.build_application(ApplicationBuilder().request(ResilientRequest(fake)).get_updates_request(fake))
+    processor = app.update_processor
+    on_arrival, on_done = processor.on_arrival, processor.on_done
+    arrived, done = {}, {}
+
+    def tagged_arrival(update):
+        # runs in the update's own task, so every send of its handler carries the tag
+        current_update.set(update.update_id)
+        on_arrival(update)
+
+    def timed_done(update):
+        done[update.update_id] = time.perf_counter()
+        on_done(update)
+
+    processor.on_arrival, processor.on_done = tagged_arrival, timed_done
+
+    await app.initialize()
+    await bot._post_init(app)
+    await app.start()
+    start = time.perf_counter()
+    for update_id, (offset, chat_id, chat_type, user_id, text) in enumerate(work, 1):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        arrived[update_id] = time.perf_counter()
+        await app.update_queue.put(Update.de_json(command_update(update_id, text, chat_id, user_id, chat_type), app.bot))
+    deadline = time.perf_counter() + args.timeout
+    while len(done) < len(work) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    await app.stop()
+    await app.shutdown()
+    await bot._post_shutdown(app)
+
+    results = {}
+    for update_id, (_, _, _, _, text) in enumerate(work, 1):
+        sends = [t for t, _, _ in fake.sent_by.get(update_id, [])]
+        results[update_id] = (command_label(text), arrived[update_id], sends, update_id in done,
+                              bool(sends) and str(fake.sent_by[update_id][0][2].get("text", "")).startswith("⏳ Too many"))
+    return results, fake, elapsed
+
+
+def report(results: dict, fake: ThrottledTelegram, elapsed: float, n: int) -> None:
+    by_cmd: dict[str, list] = {}
+    for cmd, arrived, sends, finished, limited in results.values():
+        by_cmd.setdefault(cmd, []).append((arrived, sends, finished, limited))
+    print(f"{'command':<14} {'n':>5} {'answered':>9} {'limited':>8} {'first p50':>10} {'first p99':>10} "
+          f"{'last p50':>9} {'last p99':>9} {'msgs':>6}")
+    for cmd, rows in sorted(by_cmd.items()):
+        first = [s[0] - a for a, s, _, _ in rows if s]
+        last = [s[-1] - a for a, s, _, _ in rows if s]
+        print(f"{cmd:<14} {len(rows):>5} {sum(bool(s) for _, s, _, _ in rows):>9} {sum(r[3] for r in rows):>8} "
+              f"{pct(first, .5):>9.2f}s {pct(first, .99):>9.2f}s {pct(last, .5):>8.2f}s {pct(last, .99):>8.2f}s "
+              f"{sum(len(s) for _, s, _, _ in rows) / len(rows):>6.1f}")
+    handled = sum(r[3] for r in results.values())
+    untagged = len(fake.sent_by.get(None, []))
+    print(f"\n{handled}/{n} commands handled in {elapsed:.1f}s: {handled / elapsed:.1f} commands/s, "
+          f"{len(fake.sent) / elapsed:.1f} sends/s, {fake.rejected} sends answered 429"
+          + (f", {untagged} sends outside a handler" if untagged else ""))
+
+
+def add_stand_in_args(ap: argparse.ArgumentParser) -> None:
+    """Options of the stand-in backends, shared with benchmarks/replay_events.py."""
+    ap.add_argument("--query-ms", type=float, default=1500.0, help="median query latency")
+    ap.add_argument("--query-p99-ms", type=float, default=6000.0)
+    ap.add_argument("--rtt-ms", type=float, default=60.0, help="Bot API round trip")
+    ap.add_argument("--tx", type=int, default=50_000, help="synthetic transactions behind the queries")
+    ap.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for stragglers after the last update")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="bot setting for this run, e.g. QUERY_CACHE_TTL=0 or UPDATE_CONCURRENCY=32 (repeatable)")
+    ap.add_argument("--log-level", default="WARNING")
+
+
+def prepare(args) -> str:
+    """Environment for an in-process RealTimeBot; returns the temporary directory for its files."""
+    os.chdir(ROOT)  # sql/ templates and brand mapping
+    tmp = tempfile.mkdtemp(prefix="bench_load_")
+    os.environ.update({"TELEGRAM_BOT_TOKEN": TOKEN, "QUERY_BACKEND": "duckdb", "LOCAL_DB": ":memory:",
+                       "STATE_DB": os.path.join(tmp, "state.db"), "SHARED_BACKEND": "memory://",
+                       "TELEGRAM_MODE": "polling", "BOT_WORKERS": "1"})
+    for setting in args.set:
+        name, _, value = setting.partition("=")
+        os.environ[name.strip()] = value.strip()
+    return tmp
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--updates", type=int, default=1000)
+    ap.add_argument("--ramp", type=float, default=30.0, help="seconds over which the commands arrive")
+    ap.add_argument("--chats", type=int, default=150, help="group chats")
+    ap.add_argument("--users", type=int, default=1500)
+    ap.add_argument("--group-share", type=float, default=0.6)
+    add_stand_in_args(ap)
+    args = ap.parse_args()
+
+    tmp = prepare(args)
+    work = workload(args.updates, args.ramp, args.chats, args.users, args.group_share, args.seed)
+    print(f"{len(work)} commands over {args.ramp:.0f}s from {len({w[3] for w in work})} users in "
+          f"{len({w[1] for w in work})} chats; queries {args.query_ms:.0f} ms median / {args.query_p99_ms:.0f} ms p99, "
+          f"Bot API round trip {args.rtt_ms:.0f} ms")
+    results, fake, elapsed = asyncio.run(run(args, work, tmp))
+    report(results, fake, elapsed, len(work))
+
+
+if __name__ == "__main__":
+    main()
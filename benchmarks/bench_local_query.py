@@ -0,0 +1,76 @@
+"""
+The report queries offline: every sql/ template through bot/local_query.py
+(QUERY_BACKEND=duckdb) against generated tables.
+
+    python benchmarks/bench_local_query.py [--tx 200000] [--db :memory:] [--repeat 3] [--show-sql dist_function]
+
+Fills the tables with benchmarks/synthetic_data.py (--tx transactions over
+the last 30 days), then runs the five commands through LocalQueryClient
+with the query cache off and prints rows returned and the median time per
+command. --db keeps the database in a file (written once, then reused
+read-only, as the bot opens it). For scaling runs saved as JSON see
+benchmarks/bench_sql.py.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QUERY_CACHE_TTL", "0")
+
+from benchmarks import synthetic_data
+from bot.local_query import LocalQueryClient, connect, translate_sql
+from bot.query_client import QueryClient
+
+async def run(client, repeat: int) -> list[tuple]:
+    today = client.now.astimezone(dt.timezone(dt.timedelta(hours=7))).date().isoformat()
+    commands = [("apf", client.execute_apf_query, (None,)),
+                ("dpf", client.execute_dpf_query, ("TH",)),
+                ("dist", client.execute_dist_query, (today, None)),
+                ("pmh", client.execute_pmh_query, (today, None)),
+                ("pmh_week", client.execute_pmh_week_query, (today, "TH"))]
+    out = []
+    for name, fn, args in commands:
+        times, rows = [], []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            rows = await fn(*args)
+            times.append(time.perf_counter() - t)
+        out.append((name, len(rows), statistics.median(times)))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tx", type=int, default=200_000)
+    ap.add_argument("--db", default=":memory:")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--show-sql", metavar="TEMPLATE", help="print a template as translated for DuckDB and exit")
+    args = ap.parse_args()
+
+    if args.show_sql:
+        print(translate_sql(QueryClient.sql(args.show_sql)))
+        return
+    fresh = args.db == ":memory:" or not os.path.exists(args.db)
+    con = connect(args.db)
+    if fresh:
+        t = time.perf_counter()
+        synthetic_data.generate(con, args.tx)
+        print(f"generated {args.tx} transactions in {time.perf_counter() - t:.1f}s")
+        if args.db != ":memory:":
+            con.close()
+            con = connect(args.db)
+    end = dt.datetime.fromisoformat(synthetic_data.read_meta(con)["end"])
+    client = LocalQueryClient(types.SimpleNamespace(LOCAL_DB=args.db), con=con, now=end)
+    count = con.execute("SELECT count(*) FROM ext_funding_tx").fetchone()[0]
+    print(f"duckdb, {count} ext_funding_tx rows, median of {args.repeat}")
+    print(f"{'command':>9} {'rows':>6} {'ms':>8}")
+    for name, rows, seconds in asyncio.run(run(client, args.repeat)):
+        print(f"{name:>9} {rows:>6} {seconds * 1e3:>8.1f}")
+
+if __name__ == "__main__":
+    main()
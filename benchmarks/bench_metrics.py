@@ -0,0 +1,105 @@
+"""
+Hot-path cost of bot/metrics.py and bot/tracing.py: what one observation or
+span adds to a command.
+
+    python benchmarks/bench_metrics.py [--n 200000] [--series 2000] [--budget-us 10]
+
+Times counter inc, gauge inc, histogram observe and a metrics.phase()
+block with no labels and with labels, as the bot calls them, then a span
+and a phase() block inside an update's trace (outside one, spans are a
+ContextVar lookup). It also times one exposition() of a registry holding
+--series labelled histogram series, which is what a Prometheus scrape
+costs the event loop, and the /trace waterfall and OTLP export of a
+trace with --spans spans. Exits 1 if any observation costs more than
+--budget-us microseconds.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import metrics, tracing
+
+
+def per_call(fn, n: int) -> float:
+    """Best of three runs of n calls, in microseconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        t = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, time.perf_counter() - t)
+    return best / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=200_000)
+    ap.add_argument("--series", type=int, default=2000)
+    ap.add_argument("--spans", type=int, default=200)
+    ap.add_argument("--budget-us", type=float, default=10.0)
+    args = ap.parse_args()
+
+    c = metrics.counter("bench_counter_total")
+    g = metrics.gauge("bench_gauge")
+    h = metrics.histogram("bench_seconds")
+    metrics.current_command.set("apf")
+    cases = {
+        "counter.inc()": lambda: c.inc(),
+        "counter.inc(2 labels)": lambda: c.inc(method="sendMessage", status=200),
+        "gauge.inc()": lambda: g.inc(),
+        "histogram.observe(1 label)": lambda: h.observe(0.042, method="sendMessage"),
+        "histogram.observe(2 labels)": lambda: h.observe(0.042, query="pmh", backend="bigquery"),
+    }
+
+    def phase_block():
+        with metrics.phase("render"):
+            pass
+    cases["with metrics.phase()"] = phase_block
+
+    def span_block():
+        with tracing.span("parse"):
+            pass
+    traced = {"tracing.span() traced": span_block, "with metrics.phase() traced": phase_block}
+    baseline = per_call(lambda: None, args.n)
+
+    print(f"{'observation':<28} {'us/call':>8}")
+    over = 0
+    for name, fn in [*cases.items(), *traced.items()]:
+        if name in traced:
+            tracing.start("bench")  # spans pile up in this trace: fewer calls
+            us = per_call(fn, args.n // 10) - baseline
+        else:
+            us = per_call(fn, args.n) - baseline
+        over += us > args.budget_us
+        print(f"{name:<28} {us:>8.2f}{'  OVER BUDGET' if us > args.budget_us else ''}")
+
+    wide = metrics.histogram("bench_wide_seconds")
+    for i in range(args.series):
+        wide.observe(0.1, command=f"c{i % 20}", phase=f"p{i // 20}")
+    t = time.perf_counter()
+    text = metrics.exposition()
+    print(f"\nexposition(): {len(text.splitlines()):,} lines ({len(text) / 1024:.0f} KB) "
+          f"in {(time.perf_counter() - t) * 1e3:.1f} ms")
+
+    trace = tracing.start("pmh_provider", chat_id=-1001, user_id=42)
+    for i in range(args.spans):
+        with metrics.phase("send"), tracing.span("sendMessage", status=200):
+            tracing.event("retry_after", seconds=1)
+    tracing.finish(trace)
+    t = time.perf_counter()
+    tracing.waterfall(trace)
+    drawn = time.perf_counter() - t
+    t = time.perf_counter()
+    line = json.dumps(tracing.to_otlp(trace))
+    print(f"trace of {len(trace.spans)} spans: waterfall {drawn * 1e3:.1f} ms, "
+          f"OTLP/JSON {(time.perf_counter() - t) * 1e3:.1f} ms ({len(line) / 1024:.0f} KB)")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Authorization check: per-call set building vs. the compiled PermissionIndex.
+
+    python benchmarks/bench_permissions.py [--users 100000] [--chats 5000] [--checks 200000]
+
+"sets" reproduces the old _ensure_allowed / _user_allowed_commands logic
+(group policy list -> lowercased set, user list -> lowercased set, on every
+call). "index" is PermissionIndex.allows. Both answer the same random
+(chat, user, command) checks and the answers are compared. Also reports the
+full rebuild cost and one incremental set_user.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.permissions import PermissionIndex
+
+COMMANDS = ["apf", "dpf", "dist", "pmh_total", "pmh_provider", "pmh_method", "pmh_week"]
+
+
+def make_state(n_users: int, n_chats: int, seed: int = 7):
+    rng = random.Random(seed)
+
+    def some():
+        return [c.upper() if rng.random() < 0.2 else c for c in rng.sample(COMMANDS, rng.randint(0, 4))]
+    users = {uid: {"username": f"u{uid}", "allowed_commands": some() if rng.random() < 0.3 else None}
+             for uid in range(n_users)}
+    policies = {str(-1000 - i): {"allowed_commands": some(), "set_by": 1, "ts": ""} for i in range(n_chats)}
+    return users, policies
+
+
+def old_allows(users, policies, chat_id, chat_type, user_id, cmd) -> bool:
+    cmd = cmd.lower()
+    if chat_type in ("group", "supergroup"):
+        policy = policies.get(str(chat_id))
+        if policy is not None:
+            return cmd in set(c.lower() for c in (policy.get("allowed_commands") or []))
+    info = users.get(int(user_id))
+    allowed = info.get("allowed_commands") if info else None
+    return not allowed or cmd in {c.lower() for c in allowed}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--chats", type=int, default=5000)
+    ap.add_argument("--checks", type=int, default=200_000)
+    args = ap.parse_args()
+
+    users, policies = make_state(args.users, args.chats)
+    rng = random.Random(1)
+    checks = []
+    for _ in range(args.checks):
+        private = rng.random() < 0.4
+        uid = rng.randrange(args.users)
+        chat_id = uid if private else -1000 - rng.randrange(args.chats * 2)  # half the groups have no policy
+        checks.append((chat_id, "private" if private else "supergroup", uid, rng.choice(COMMANDS)))
+
+    t0 = time.perf_counter()
+    index = PermissionIndex(COMMANDS).load(users, policies)
+    rebuild = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    old = [old_allows(users, policies, *c) for c in checks]
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = [index.allows(*c) for c in checks]
+    t_new = time.perf_counter() - t0
+    assert old == new, "answers differ"
+
+    t0 = time.perf_counter()
+    for uid in range(1000):
+        index.set_user(uid, ["apf", "dpf"])
+    incr = (time.perf_counter() - t0) / 1000
+
+    print(f"{args.users:,} users, {args.chats:,} group policies, {args.checks:,} checks "
+          f"({sum(new):,} allowed)")
+    print(f"{'check':<8} {'ns/check':>9}")
+    print(f"{'sets':<8} {t_old / args.checks * 1e9:>9.0f}")
+    print(f"{'index':<8} {t_new / args.checks * 1e9:>9.0f}")
+    print(f"full rebuild {rebuild * 1e3:.1f} ms, incremental set_user {incr * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
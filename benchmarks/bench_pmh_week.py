@@ -0,0 +1,101 @@
+"""
+/pmh_week aggregation: per-group filtering loop vs. the single pivot.
+
+    python benchmarks/bench_pmh_week.py [--groups 10,100,300] [--repeat 5]
+
+The "loop" column reproduces the previous send_pmh_week aggregation
+(one boolean filter per group and period, then _weekly_*_metrics and
+_growth_pct per cell). "pivot" is compute_weekly_group_metrics. Both
+results are compared before timing so the speedup is for equal output,
+also on a copy with some NULL status / tnx_type rows (they count in the
+totals).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.fixtures import pmh_week_frame
+from bot.table_renderer import (
+    _growth_pct,
+    _weekly_deposits_metrics,
+    _weekly_withdrawals_metrics,
+    compute_weekly_group_metrics,
+)
+
+DEP_KEYS = ["num", "avg_s", "sc", "to", "er"]
+WDR_KEYS = ["num", "p5m", "p15m"]
+
+
+def loop_metrics(cdf, gkey):
+    cur_df = cdf[cdf["period"] == "CUR"].copy()
+    prv_df = cdf[cdf["period"] == "PREV"].copy()
+    cur_dep, prv_dep, cur_wdr, prv_wdr = {}, {}, {}, {}
+    groups = sorted(set(cur_df[gkey].astype(str)).union(set(prv_df[gkey].astype(str))))
+    for g in groups:
+        g_cur = cur_df[cur_df[gkey].astype(str) == g]
+        g_prv = prv_df[prv_df[gkey].astype(str) == g]
+        cur_dep[g] = _weekly_deposits_metrics(g_cur)
+        prv_dep[g] = _weekly_deposits_metrics(g_prv)
+        cur_wdr[g] = _weekly_withdrawals_metrics(g_cur)
+        prv_wdr[g] = _weekly_withdrawals_metrics(g_prv)
+    if len(groups) > 1:
+        cur_dep["TOTAL"] = _weekly_deposits_metrics(cur_df)
+        prv_dep["TOTAL"] = _weekly_deposits_metrics(prv_df)
+        cur_wdr["TOTAL"] = _weekly_withdrawals_metrics(cur_df)
+        prv_wdr["TOTAL"] = _weekly_withdrawals_metrics(prv_df)
+    dep_growth = {g: [_growth_pct(cur_dep[g][k], prv_dep[g][k]) for k in DEP_KEYS] for g in cur_dep}
+    wdr_growth = {g: [_growth_pct(cur_wdr[g][k], prv_wdr[g][k]) for k in WDR_KEYS] for g in cur_wdr}
+    return cur_dep, cur_wdr, dep_growth, wdr_growth
+
+
+def check_equal(cdf, gkey):
+    cur_dep, cur_wdr, dep_growth, wdr_growth = loop_metrics(cdf, gkey)
+    res = compute_weekly_group_metrics(cdf, gkey)
+    for g in cur_dep:
+        np.testing.assert_allclose(res["cur_dep"].loc[g, DEP_KEYS].to_numpy(float),
+                                   [cur_dep[g][k] for k in DEP_KEYS], rtol=1e-9)
+        np.testing.assert_allclose(res["cur_wdr"].loc[g, WDR_KEYS].to_numpy(float),
+                                   [cur_wdr[g][k] for k in WDR_KEYS], rtol=1e-9)
+        np.testing.assert_allclose(res["dep_growth"].loc[g, DEP_KEYS].to_numpy(float), dep_growth[g], rtol=1e-9)
+        np.testing.assert_allclose(res["wdr_growth"].loc[g, WDR_KEYS].to_numpy(float), wdr_growth[g], rtol=1e-9)
+
+
+def with_nulls(cdf):
+    out = cdf.copy()
+    out.loc[out.index[::7], "status"] = None
+    out.loc[out.index[3::11], "tnx_type"] = None
+    return out
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--groups", default="10,100,300")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'groups':>7} {'rows':>8} {'loop ms':>10} {'pivot ms':>10} {'speedup':>8}")
+    for n in [int(x) for x in args.groups.split(",") if x.strip()]:
+        cdf = pmh_week_frame(n)
+        check_equal(cdf, "group_name")
+        check_equal(with_nulls(cdf), "group_name")
+        t_loop = best_of(lambda: loop_metrics(cdf, "group_name"), args.repeat)
+        t_pivot = best_of(lambda: compute_weekly_group_metrics(cdf, "group_name"), args.repeat)
+        print(f"{n:>7} {len(cdf):>8} {t_loop * 1e3:>10.1f} {t_pivot * 1e3:>10.1f} {t_loop / t_pivot:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+What an admin /profile session costs while it is on, and what its report
+shows, on the benchmarks/bench_renderers.py cases.
+
+    python benchmarks/bench_profiling.py [--size medium] [--repeat 5] [--out /tmp/profiles]
+
+Each renderer runs --repeat times plain and --repeat times inside a
+bot/profiling.py session (cProfile on), and the table gives the median of
+both and the slowdown. The renders run inline on this thread, as with
+RENDER_EXECUTOR=inline. A session's report is then written to --out the
+way the bot writes it to logs/profiles/, and its chat summary is printed.
+That is the place to check that the renderer hot spots are named in it.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["RENDER_CACHE_SIZE"] = "0"
+os.environ["RENDER_EXECUTOR"] = "inline"
+
+from benchmarks.bench_renderers import SIZES, cases, render_once
+from benchmarks.golden_reports import pinned
+from bot import profiling
+
+
+def timed(kind: str, fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        render_once(kind, fn)
+        runs.append(time.perf_counter() - t)
+    return statistics.median(runs)
+
+
+async def profiled(work: dict, repeat: int, out: Path) -> tuple[dict, str]:
+    """Median per renderer with a session on, and the session's chat summary."""
+    summaries = []
+
+    async def report(text: str):
+        summaries.append(text)
+
+    session = profiling.start(out, report, commands=len(work))
+    medians = {}
+    for name, (kind, fn) in work.items():
+        # render_once runs the send_* cases in their own event loop: do that on a thread, as the bot's
+        # pool would (Python 3.12+ profiles every thread; older versions only see the text renderers)
+        medians[name] = await asyncio.to_thread(timed, kind, fn, repeat) if kind == "send" else timed(kind, fn, repeat)
+        profiling.command_done(name, medians[name])
+    await profiling.close()
+    return medians, summaries[0] if summaries else f"(no report for {session.stamp})"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", default="medium", choices=list(SIZES))
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=None, help="report directory (default: a temporary one)")
+    args = ap.parse_args()
+
+    out = Path(args.out or tempfile.mkdtemp(prefix="profiles_"))
+    with pinned():
+        work = cases(SIZES[args.size])
+        plain = {}
+        for name, (kind, fn) in work.items():
+            render_once(kind, fn)  # warm-up
+            plain[name] = timed(kind, fn, args.repeat)
+        medians, summary = asyncio.run(profiled(work, args.repeat, out))
+
+    print(f"{'renderer':>29} {'plain ms':>9} {'profiled ms':>12} {'slowdown':>9}")
+    for name in work:
+        print(f"{name:>29} {plain[name] * 1e3:>9.2f} {medians[name] * 1e3:>12.2f} {medians[name] / plain[name]:>8.1f}x")
+    print(f"\n{summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Renderer timings and allocations at growing input sizes, with every output
+checked against a snapshot.
+
+    python benchmarks/bench_renderers.py [--sizes small,medium,large] [--repeat 5]
+    python benchmarks/bench_renderers.py --update     # rewrite benchmarks/golden/renderers.json
+
+Each size scales the brands, groups, providers and methods of the
+benchmarks/fixtures.py data. The three render_* functions get one
+country's rows; the send_* functions get the whole PMH frame and a
+RecordingUpdate, with the clock pinned and asyncio.sleep disabled as in
+golden_reports.py. The render cache is off and the render pool inline, so
+every run is a full render on this thread.
+
+Per (renderer, size) it prints the median time of --repeat runs, and from
+one more run under tracemalloc the peak and the still-allocated memory.
+The output (the returned text, or every message sent) is hashed and
+compared with the snapshot; any difference exits 1, so an optimization
+only counts if its output is byte for byte the same.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["RENDER_CACHE_SIZE"] = "0"
+os.environ["RENDER_EXECUTOR"] = "inline"
+
+import pandas as pd
+
+import bot.table_renderer as tr
+from benchmarks.fixtures import RecordingUpdate, apf_rows, dist_rows, dpf_rows, pmh_rows
+from benchmarks.golden_reports import pinned
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "renderers.json")
+SIZES = {
+    "small": {"brands": 8, "groups": 2, "providers": 3, "methods": 5},
+    "medium": {"brands": 64, "groups": 8, "providers": 6, "methods": 25},
+    "large": {"brands": 256, "groups": 32, "providers": 12, "methods": 100},
+}
+TODAY = "2025-10-06"
+
+
+def cases(size: dict) -> dict:
+    """{renderer: (kind, fn)}; kind "text" returns a string, "send" records an update's messages."""
+    brands_per_group = max(1, size["brands"] // size["groups"])
+    pmh = pd.DataFrame(pmh_rows(size["groups"], brands_per_group, size["providers"], countries=("TH", "PH")))
+    week = pd.DataFrame(pmh_rows(size["groups"], brands_per_group, size["providers"], countries=("TH", "PH"),
+                                 week=True))
+    apf = apf_rows(size["brands"])
+    dpf = dpf_rows(size["brands"])
+    dist = dist_rows(size["methods"])
+    return {
+        "render_group_then_brands": ("text", lambda: tr.render_group_then_brands("TH", "G0", apf)),
+        "render_dpf_group_then_brands": ("text", lambda: tr.render_dpf_group_then_brands("TH", "G0", dpf)),
+        "render_channel_distribution": ("text", lambda: tr.render_channel_distribution("TH", dist)),
+        "send_pmh_total": ("send", lambda u: tr.send_pmh_total(u, pmh, TODAY)),
+        "send_provider_summaries": ("send", lambda u: tr.send_provider_summaries(u, pmh, TODAY)),
+        "send_method_summaries": ("send", lambda u: tr.send_method_summaries(u, pmh, TODAY)),
+        "send_pmh_week": ("send", lambda u: tr.send_pmh_week(u, week, TODAY)),
+    }
+
+
+def render_once(kind: str, fn) -> list:
+    """The case's output: its text, or the messages a chat would have received."""
+    if kind == "text":
+        return [fn()]
+    update = RecordingUpdate()
+    asyncio.run(fn(update))
+    return update.effective_chat.sent
+
+
+def digest(output: list) -> dict:
+    blob = json.dumps(output, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return {"sha1": hashlib.sha1(blob).hexdigest(), "bytes": len(blob), "messages": len(output)}
+
+
+def measure(kind: str, fn, repeat: int) -> tuple[list, list[float], int, int]:
+    output = render_once(kind, fn)  # warm-up, and the output that gets checked
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        render_once(kind, fn)
+        runs.append(time.perf_counter() - t)
+    tracemalloc.start()
+    try:
+        render_once(kind, fn)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return output, runs, peak, retained
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default=",".join(SIZES), help=f"comma-separated, of: {', '.join(SIZES)}")
+    ap.add_argument("--renderers", default="all", help="comma-separated renderer names (default: all)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--update", action="store_true", help="rewrite the snapshot instead of comparing")
+    args = ap.parse_args()
+
+    golden = {}
+    if os.path.exists(SNAPSHOT) and not args.update:
+        with open(SNAPSHOT, encoding="utf-8") as f:
+            golden = json.load(f)
+    current, failed = {}, []
+    print(f"{'renderer':>29} {'size':>7} {'msgs':>5} {'out KB':>7} {'median ms':>10} {'peak KB':>8} {'kept KB':>8}  output")
+    with pinned():
+        for size_name in args.sizes.split(","):
+            size = SIZES[size_name.strip()]
+            for name, (kind, fn) in cases(size).items():
+                if args.renderers != "all" and name not in args.renderers.split(","):
+                    continue
+                output, runs, peak, retained = measure(kind, fn, args.repeat)
+                key = f"{name}/{size_name.strip()}"
+                current[key] = digest(output)
+                old = golden.get(key)
+                status = "new" if old is None else "same" if old == current[key] else "CHANGED"
+                if status == "CHANGED":
+                    failed.append(key)
+                sys.__stdout__.write(
+                    f"{name:>29} {size_name:>7} {current[key]['messages']:>5} {current[key]['bytes'] / 1024:>7.1f} "
+                    f"{statistics.median(runs) * 1e3:>10.2f} {peak / 1024:>8.0f} {retained / 1024:>8.0f}  {status}\n")
+
+    if args.update:
+        golden = {}
+        if os.path.exists(SNAPSHOT):
+            with open(SNAPSHOT, encoding="utf-8") as f:
+                golden = json.load(f)
+        golden.update(current)
+        os.makedirs(os.path.dirname(SNAPSHOT), exist_ok=True)
+        with open(SNAPSHOT, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(golden.items())), f, indent=1)
+        print(f"wrote {len(current)} outputs to {SNAPSHOT}")
+        return
+    if failed:
+        print(f"{len(failed)} output(s) differ from {SNAPSHOT}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Telegram sends through bot/resilience.py ResilientRequest vs the bare request,
+against a fake Bot API that misbehaves.
+
+    python benchmarks/bench_resilience.py [--sends 400] [--blip-rate 0.1] [--outage-ms 300]
+
+blips    each send fails with a 502 at --blip-rate: how many messages are
+         delivered (retries with jittered backoff vs none)
+outage   Telegram stops answering: every send hangs for --outage-ms and
+         then fails (connection error). Handlers keep sending; we measure
+         the time they spend per failed send (the breaker fails at once
+         after BREAKER_FAILURES failures vs waiting out every timeout)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from telegram.error import NetworkError, TelegramError
+
+from benchmarks.fake_telegram import TOKEN, FakeTelegram
+from bot.resilience import ResilientRequest
+
+class FlakyTelegram(FakeTelegram):
+    def __init__(self, blip_rate: float = 0.0, outage_ms: float | None = None, seed: int = 7):
+        super().__init__()
+        self.blip_rate = blip_rate
+        self.outage_ms = outage_ms
+        self.rng = random.Random(seed)
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if url.endswith("sendMessage"):
+            if self.outage_ms is not None:
+                await asyncio.sleep(self.outage_ms / 1e3)
+                raise NetworkError("connection refused")
+            if self.rng.random() < self.blip_rate:
+                return 502, json.dumps({"ok": False, "error_code": 502, "description": "Bad Gateway"}).encode()
+        return await super().do_request(url, method, request_data, *args, **kwargs)
+
+async def send_all(request, n: int, concurrency: int = 8) -> tuple[int, list[float]]:
+    bot = Bot(TOKEN, request=request, get_updates_request=FakeTelegram())
+    await bot.initialize()
+    sem = asyncio.Semaphore(concurrency)
+    delivered, spent = 0, []
+
+    async def one(i):
+        nonlocal delivered
+        async with sem:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(chat_id=-1000 - i % 50, text=f"report {i}")
+                delivered += 1
+            except TelegramError:
+                spent.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    await bot.shutdown()
+    return delivered, spent
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sends", type=int, default=400)
+    ap.add_argument("--blip-rate", type=float, default=0.1)
+    ap.add_argument("--outage-ms", type=float, default=300)
+    args = ap.parse_args()
+
+    print(f"blips: {args.sends} sends, {args.blip_rate:.0%} answered 502")
+    for label, wrap in (("bare", False), ("resilient", True)):
+        fake = FlakyTelegram(blip_rate=args.blip_rate)
+        request = ResilientRequest(fake, max_retry_after=5) if wrap else fake
+        t = time.perf_counter()
+        delivered, _ = asyncio.run(send_all(request, args.sends))
+        print(f"  {label:>9}: {delivered}/{args.sends} delivered in {time.perf_counter() - t:.2f}s")
+
+    print(f"outage: {args.sends} sends, each hanging {args.outage_ms:.0f} ms then failing")
+    for label, wrap in (("bare", False), ("resilient", True)):
+        fake = FlakyTelegram(outage_ms=args.outage_ms)
+        request = ResilientRequest(fake, retries=0) if wrap else fake
+        t = time.perf_counter()
+        _, spent = asyncio.run(send_all(request, args.sends))
+        mean = sum(spent) / len(spent) * 1e3 if spent else 0
+        print(f"  {label:>9}: {len(spent)} failed, {mean:.1f} ms per failed send, {time.perf_counter() - t:.2f}s total")
+
+if __name__ == "__main__":
+    main()
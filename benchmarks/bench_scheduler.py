@@ -0,0 +1,107 @@
+"""
+Interactive commands competing with scheduled refreshes and a backfill:
+one shared queue vs QueryScheduler lanes.
+
+    python benchmarks/bench_scheduler.py [--slots 4] [--query-ms 100] [--seconds 10]
+                                         [--backfill 200] [--interactive-rps 10] [--refresh-every 1.0]
+
+All queries are a blocking --query-ms sleep on a thread. At t=0 a backfill
+submits --backfill queries, 16 at a time. Every --refresh-every seconds a
+scheduled refresh runs 5 queries (one per country), and interactive queries
+arrive at --interactive-rps, each from a different chat, for --seconds.
+
+  fifo    one asyncio.Semaphore(--slots) for everything, in arrival order
+  lanes   bot/query_scheduler.py: interactive first, a reserved share for
+          scheduled refreshes, the backfill capped at BQ_BATCH_MAX_JOBS
+
+We print queue waits per lane (p50 / p99) and how far the backfill got.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import admission
+from bot.query_scheduler import BATCH, INTERACTIVE, SCHEDULED, QueryScheduler
+
+def pct(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def scenario(mode: str, args) -> tuple[dict[str, list[float]], int]:
+    scheduler = QueryScheduler(args.slots, scheduled_share=1, batch_max_jobs=1)
+    fifo = asyncio.Semaphore(args.slots)
+    waits = {INTERACTIVE: [], SCHEDULED: [], BATCH: []}
+    backfilled = 0
+    stop = time.perf_counter() + args.seconds
+
+    async def query(lane: str, key=None):
+        queued = time.perf_counter()
+        if mode == "lanes":
+            async with scheduler.slot(lane, key):
+                waits[lane].append(time.perf_counter() - queued)
+                await asyncio.to_thread(time.sleep, args.query_ms / 1e3)
+        else:
+            async with fifo:
+                waits[lane].append(time.perf_counter() - queued)
+                await asyncio.to_thread(time.sleep, args.query_ms / 1e3)
+
+    async def backfill():
+        pending = iter(range(args.backfill))
+
+        async def runner():
+            nonlocal backfilled
+            for _ in pending:
+                if time.perf_counter() > stop:
+                    return
+                with admission.lane(BATCH):
+                    await query(BATCH)
+                backfilled += 1
+        await asyncio.gather(*(runner() for _ in range(16)))
+
+    async def refreshes():
+        tasks = []
+        while time.perf_counter() < stop:
+            tasks += [asyncio.create_task(query(SCHEDULED)) for _ in range(5)]
+            await asyncio.sleep(args.refresh_every)
+        await asyncio.gather(*tasks)
+
+    async def interactive():
+        tasks, i = [], 0
+        while time.perf_counter() < stop:
+            tasks.append(asyncio.create_task(query(INTERACTIVE, key=-100 - i)))
+            i += 1
+            await asyncio.sleep(1 / args.interactive_rps)
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(backfill(), refreshes(), interactive())
+    return waits, backfilled
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--slots", type=int, default=4)
+    ap.add_argument("--query-ms", type=float, default=100)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--backfill", type=int, default=200)
+    ap.add_argument("--interactive-rps", type=float, default=10)
+    ap.add_argument("--refresh-every", type=float, default=1.0)
+    args = ap.parse_args()
+
+    print(f"{args.slots} slots, {args.query_ms:.0f} ms per query, {args.seconds:.0f}s, "
+          f"{args.interactive_rps:g} interactive/s, 5 scheduled every {args.refresh_every:g}s, backfill {args.backfill}")
+    print(f"{'queue':>6} {'lane':>12} {'jobs':>5} {'wait p50 ms':>12} {'wait p99 ms':>12}")
+    for mode in ("fifo", "lanes"):
+        waits, backfilled = asyncio.run(scenario(mode, args))
+        for lane, values in waits.items():
+            print(f"{mode:>6} {lane:>12} {len(values):>5} {statistics.median(values) * 1e3 if values else 0:>12.0f} "
+                  f"{pct(values, 0.99) * 1e3:>12.0f}")
+        print(f"{mode:>6} backfill done: {backfilled}/{args.backfill}")
+
+if __name__ == "__main__":
+    main()
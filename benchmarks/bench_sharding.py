@@ -0,0 +1,213 @@
+"""
+Load test for the multi-worker webhook mode: throughput vs number of workers.
+
+    python benchmarks/bench_sharding.py [--workers 1,2,4] [--updates 600] [--chats 200]
+                                        [--query-ms 50] [--rows 300] [--backend redis|sqlite]
+
+For each worker count a ShardRouter (bot/sharding.py) in this process fronts
+N worker processes. Each worker is an Application with ChatOrderedProcessor
+and the fake Bot API (benchmarks/fake_telegram.py), fed through
+WorkerIngress. Its /report handler does what a report command does:
+
+  1. rows from QueryCache on the shared backend; on a miss a --query-ms
+     sleep stands in for the BigQuery job (results vary by chat % 50, so
+     the cache is shared but not everything hits);
+  2. render the rows with bot/table_engine.py (CPU, holds the GIL);
+  3. send the message, which bumps a counter in the shared backend.
+
+The backend is benchmarks/fake_redis.py in its own process (or one SQLite
+file with --backend sqlite). --updates POSTs with the secret header over
+--chats chats, 32 in flight; throughput is measured from the first POST
+until every reply has been counted. Scaling is bounded by CPU cores: the
+router, the client and the fake Redis need some too.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from benchmarks.fake_redis import serve_forever
+from benchmarks.fake_telegram import TOKEN, FakeTelegram, command_update
+from bot.sharding import SECRET_HEADER, ShardRouter, serve_worker
+
+SECRET = "bench-secret"
+PATH = "telegram"
+SENT = "bench:sent"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class CountingTelegram(FakeTelegram):
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    async def answer(self, endpoint: str, params: dict):
+        result = await super().answer(endpoint, params)
+        if endpoint.startswith("send"):
+            await asyncio.to_thread(self.backend.incr, SENT)
+        return result
+
+
+def wait_listening(port: int, timeout: float = 60) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def worker_main(index: int, port: int, backend_url: str, query_ms: float, n_rows: int) -> None:
+    from telegram.ext import ApplicationBuilder, CommandHandler
+
+    from bot.query_cache import QueryCache
+    from bot.shared_backend import open_backend
+    from bot.table_engine import render_table, text_columns
+    from bot.update_processor import ChatOrderedProcessor
+
+    backend = open_backend(backend_url)
+    cache = QueryCache(backend, ttl=300)
+    headers = ["Brand", "Deposits", "Amount", "Success %", "Avg s"]
+
+    async def run_query(seed: int):
+        await asyncio.sleep(query_ms / 1e3)
+        rng = random.Random(seed)
+        return [(f"B{seed:02d}{i:03d}", f"{rng.randint(1, 9999):,}", f"{rng.uniform(1, 1e6):,.2f}",
+                 f"{rng.uniform(50, 100):.1f}%", f"{rng.uniform(1, 900):.0f}") for i in range(n_rows)]
+
+    async def report(update, context):
+        seed = update.effective_chat.id % 50
+        rows = await cache.get_or_run("bench_report", lambda: run_query(seed), seed=seed)
+        text = render_table(text_columns(headers), rows)
+        await update.effective_chat.send_message(text[:4000])
+
+    fake = CountingTelegram(backend)
+    app = (ApplicationBuilder().token(TOKEN).request(fake).get_updates_request(fake)
+           .concurrent_updates(ChatOrderedProcessor(16)).build())
+    app.add_handler(CommandHandler("report", report))
+
+    async def main():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await serve_worker(app, "127.0.0.1", port, SECRET, stop)
+
+    asyncio.run(main())
+
+
+async def drive(router_port: int, n_updates: int, chats: int, backend, in_flight: int = 32) -> float:
+    rng = random.Random(7)
+    updates = [command_update(i, "/report", chat_id=-(1000 + rng.randrange(chats)), chat_type="supergroup")
+               for i in range(1, n_updates + 1)]
+    sem = asyncio.Semaphore(in_flight)
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def post(u):
+            async with sem:
+                r = await client.post(f"http://127.0.0.1:{router_port}/{PATH}", json=u,
+                                      headers={SECRET_HEADER: SECRET})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        deadline = time.perf_counter() + 120
+        while int(await asyncio.to_thread(backend.get, SENT) or 0) < n_updates:
+            if time.perf_counter() > deadline:
+                raise TimeoutError("workers did not answer every update")
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+
+
+def run(n_workers: int, args, backend_url: str) -> float:
+    from bot.shared_backend import open_backend
+
+    ctx = multiprocessing.get_context("spawn")
+    backend = open_backend(backend_url)
+    backend.set(SENT, b"0")
+    ports = [free_port() for _ in range(n_workers)]
+    procs = []
+    for i, port in enumerate(ports):
+        p = ctx.Process(target=worker_main, args=(i, port, backend_url, args.query_ms, args.rows))
+        p.start()
+        procs.append(p)
+    for port in ports:
+        wait_listening(port)
+
+    async def main():
+        router_port = free_port()
+        router = ShardRouter([f"http://127.0.0.1:{p}" for p in ports], PATH, SECRET)
+        router.start("127.0.0.1", router_port)
+        try:
+            return await drive(router_port, args.updates, args.chats, backend)
+        finally:
+            await router.stop()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(30)
+        backend.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--updates", type=int, default=600)
+    ap.add_argument("--chats", type=int, default=200)
+    ap.add_argument("--query-ms", type=float, default=50)
+    ap.add_argument("--rows", type=int, default=300)
+    ap.add_argument("--backend", choices=("redis", "sqlite"), default="redis")
+    args = ap.parse_args()
+
+    redis_proc = None
+    if args.backend == "redis":
+        ctx = multiprocessing.get_context("spawn")
+        bound = ctx.Queue()
+        redis_proc = ctx.Process(target=serve_forever, args=("127.0.0.1", 0, bound), daemon=True)
+        redis_proc.start()
+        backend_url = f"redis://127.0.0.1:{bound.get(timeout=10)}/0"
+    else:
+        backend_url = f"sqlite:///{tempfile.mkdtemp()}/shared.db"
+
+    print(f"{os.cpu_count()} CPU(s), backend {args.backend}, {args.updates} updates over {args.chats} chats")
+    print(f"{'workers':>7} {'seconds':>8} {'updates/s':>10} {'speedup':>8}")
+    base = None
+    try:
+        for n in [int(x) for x in args.workers.split(",")]:
+            # a fresh cache per run: every worker count pays the same misses
+            run_backend = backend_url if args.backend == "redis" else f"sqlite:///{tempfile.mkdtemp()}/shared.db"
+            if args.backend == "redis":
+                from bot.shared_backend import open_backend
+                flush = open_backend(run_backend)
+                flush.command("FLUSHALL")
+                flush.close()
+            elapsed = run(n, args, run_backend)
+            rate = args.updates / elapsed
+            base = base or rate
+            print(f"{n:>7} {elapsed:>8.2f} {rate:>10.1f} {rate / base:>7.2f}x")
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Every sql/ template at several data volumes on the local engine, with
+runtime and peak memory saved as JSON to compare between commits.
+
+    python benchmarks/bench_sql.py [--scales 1M,10M,100M] [--templates all] [--repeat 3]
+                                   [--threads N] [--memory-limit 4GB] [--data-dir data/synthetic]
+                                   [--out benchmarks/results/sql-<commit>.json] [--compare OLD.json]
+
+For each scale, benchmarks/synthetic_data.py generates that many
+transactions once into --data-dir (generator settings in the file name,
+end fixed at --end so every machine gets the same tables). Later runs
+reuse the file. Each template runs --repeat times through LocalQueryClient
+(bot/local_query.py) with the clock pinned at the data's end. /apf, /dpf
+and /pmh_week cover all countries; /dist and /pmh cover the last full day.
+Every (scale, template) runs in a fresh process, so the peak RSS it
+reports is that query's own.
+
+The JSON has the commit, the machine, the settings and one record per
+(scale, template): the run times (the first one cold), median, rows
+returned, and base and peak RSS. --compare OLD.json prints the median
+change against an earlier file. It exits 1 if any query is slower by more
+than --tolerance (and by more than 5 ms).
+"""
+import argparse
+import concurrent.futures
+import datetime as dt
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import duckdb
+
+from benchmarks import synthetic_data
+from bot.local_query import connect
+
+DAY = "day"  # placeholder for the last full local day of the data
+TEMPLATES = {
+    "apf_function": [("target_country", "STRING", None)],
+    "dpf_function": [("target_country", "STRING", None)],
+    "dist_function": [("target_date", "DATE", DAY), ("selected_country", "STRING", None)],
+    "pmh_function": [("target_date", "DATE", DAY), ("selected_country", "STRING", None)],
+    "pmh_week_function": [("as_of_date", "DATE", DAY), ("selected_country", "STRING", None)],
+}
+FRAMES = {"pmh_function", "pmh_week_function"}  # fetched as DataFrames, as the bot does
+NOISE_MS = 5.0
+
+def parse_scale(text: str) -> int:
+    text = text.strip().upper()
+    factor = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("KMB")) * factor)
+
+def label(n: int) -> str:
+    for factor, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K")):
+        if n >= factor and n % factor == 0:
+            return f"{n // factor}{suffix}"
+    return str(n)
+
+def rss_mb(field: str = "VmHWM") -> float:
+    """This process's resident memory now (VmRSS) or at its peak (VmHWM), in MB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # no /proc: peak only, and it may include the parent's (Linux keeps it across exec)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 2**20)
+
+def reset_peak() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")  # resets VmHWM to the current RSS
+    except OSError:
+        pass
+
+def commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"sha": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"),
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"sha": None, "subject": None, "dirty": None}
+
+def dataset(args, tx: int) -> tuple[str, dict, float | None]:
+    """Path and synthetic_meta of the dataset for `tx` transactions, generating it if missing."""
+    settings = f"{tx}:{args.days}:{args.skew}:{args.dup_rate}:{args.seed}:{args.end.isoformat()}"
+    path = os.path.join(args.data_dir, f"tx{label(tx)}-{hashlib.sha1(settings.encode()).hexdigest()[:8]}.duckdb")
+    took = None
+    if not os.path.exists(path):
+        print(f"generating {tx:,} transactions -> {path}")
+        con = connect(path + ".tmp")
+        t = time.perf_counter()
+        synthetic_data.generate(con, tx, args.days, args.skew, args.dup_rate, args.seed, args.end, progress=True)
+        took = time.perf_counter() - t
+        con.close()
+        os.replace(path + ".tmp", path)
+    con = connect(path)
+    meta = synthetic_data.read_meta(con)
+    con.close()
+    return path, meta, took
+
+def measure(path: str, now: str, template: str, params: list, repeat: int, threads: int | None,
+            memory_limit: str | None) -> dict:
+    """Runs in a fresh process: time `template` `repeat` times and report this process's RSS."""
+    import types
+    from bot.local_query import LocalQueryClient
+    con = connect(path)
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    client = LocalQueryClient(types.SimpleNamespace(LOCAL_DB=path), con=con, now=dt.datetime.fromisoformat(now))
+    fetch = client.fetch_frame if template in FRAMES else client.fetch_rows
+    base = rss_mb("VmRSS")
+    reset_peak()
+    runs, rows = [], 0
+    for _ in range(repeat):
+        t = time.perf_counter()
+        rows = len(fetch(template, params))
+        runs.append((time.perf_counter() - t) * 1e3)
+    return {"runs_ms": [round(r, 2) for r in runs], "median_ms": round(statistics.median(runs), 2),
+            "rows": rows, "rss_base_mb": round(base, 1), "rss_peak_mb": round(rss_mb(), 1)}
+
+def compare(results: list[dict], old_path: str, tolerance: float) -> int:
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    before = {(r["tx"], r["template"]): r for r in old["results"]}
+    sha = (old.get("commit") or {}).get("sha") or "?"
+    print(f"\nvs {old_path} ({sha[:10]}), tolerance {tolerance:.0%}")
+    print(f"{'tx':>6} {'template':>18} {'old ms':>9} {'new ms':>9} {'change':>8} {'old MB':>7} {'new MB':>7}")
+    regressions = 0
+    for r in results:
+        o = before.get((r["tx"], r["template"]))
+        if o is None:
+            continue
+        change = r["median_ms"] / o["median_ms"] - 1 if o["median_ms"] else 0.0
+        slower = change > tolerance and r["median_ms"] - o["median_ms"] > NOISE_MS
+        regressions += slower
+        print(f"{label(r['tx']):>6} {r['template']:>18} {o['median_ms']:>9.1f} {r['median_ms']:>9.1f} "
+              f"{change:>+8.0%} {o['rss_peak_mb']:>7.0f} {r['rss_peak_mb']:>7.0f}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="1M,10M,100M")
+    ap.add_argument("--templates", default="all", help=f"comma-separated, of: {', '.join(TEMPLATES)}")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--threads", type=int, help="DuckDB threads (default: all cores)")
+    ap.add_argument("--memory-limit", help="DuckDB memory_limit, e.g. 4GB (default: 80%% of RAM)")
+    ap.add_argument("--data-dir", default=os.path.join(ROOT, "data", "synthetic"))
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--skew", type=float, default=1.1)
+    ap.add_argument("--dup-rate", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--end", type=dt.datetime.fromisoformat, default=dt.datetime(2025, 9, 1, 12, tzinfo=dt.timezone.utc))
+    ap.add_argument("--out", help="results file (default benchmarks/results/sql-<commit>.json)")
+    ap.add_argument("--compare", metavar="OLD.json")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    os.chdir(ROOT)  # the templates and brand mapping are read from ./sql
+    if args.end.tzinfo is None:
+        args.end = args.end.replace(tzinfo=dt.timezone.utc)
+    templates = list(TEMPLATES) if args.templates == "all" else [t.strip() for t in args.templates.split(",")]
+    info = commit()
+    report = {
+        "benchmark": "sql", "created": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "commit": info,
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "duckdb": duckdb.__version__, "cpus": os.cpu_count()},
+        "settings": {"repeat": args.repeat, "threads": args.threads, "memory_limit": args.memory_limit,
+                     "days": args.days, "skew": args.skew, "dup_rate": args.dup_rate, "seed": args.seed,
+                     "end": args.end.isoformat()},
+        "datasets": [], "results": [],
+    }
+    os.makedirs(args.data_dir, exist_ok=True)
+    spawn = multiprocessing.get_context("spawn")
+    print(f"{'tx':>6} {'rows':>12} {'template':>18} {'cold ms':>9} {'median ms':>10} {'out':>6} {'peak MB':>8}")
+    for scale in args.scales.split(","):
+        tx = parse_scale(scale)
+        path, meta, took = dataset(args, tx)
+        report["datasets"].append({"tx": tx, "rows": int(meta["rows"]), "path": path, "generated_s": took,
+                                   "size_mb": round(os.path.getsize(path) / 2**20, 1)})
+        local_day = dt.datetime.fromisoformat(meta["end"]).astimezone(dt.timezone(dt.timedelta(hours=7))).date()
+        day = (local_day - dt.timedelta(days=1)).isoformat()
+        for template in templates:
+            params = [(n, kind, day if value == DAY else value) for n, kind, value in TEMPLATES[template]]
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                r = pool.submit(measure, path, meta["end"], template, params, args.repeat,
+                                args.threads, args.memory_limit).result()
+            r = {"tx": tx, "rows_in": int(meta["rows"]), "template": template, "params": params, **r}
+            report["results"].append(r)
+            print(f"{label(tx):>6} {r['rows_in']:>12,} {template:>18} {r['runs_ms'][0]:>9.1f} {r['median_ms']:>10.1f} "
+                  f"{r['rows']:>6} {r['rss_peak_mb']:>8.0f}")
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results",
+                                   f"sql-{(info['sha'] or 'nocommit')[:10]}{'-dirty' if info['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"results -> {out}")
+    if args.compare and compare(report["results"], args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Registration latency: whole-file JSON rewrite vs. the SQLite state store.
+
+    python benchmarks/bench_state_store.py [--users 100,1000,10000] [--registrations 200]
+
+With N users already registered, time --registrations new registrations.
+"json" reproduces the old _save_registered_users (rewrite
+registered_users.json after every change); "sqlite" is StateStore.put_user
+waited on, as the handlers do. Runs in a temporary directory.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.state_store import StateStore
+
+
+def user(uid: int) -> dict:
+    return {"username": f"user{uid}", "first_name": "First", "last_name": "Last",
+            "ts": "2025-10-06T10:00:00+07:00", "registered_via": "manual", "allowed_commands": ["apf", "dpf"]}
+
+
+def save_json(path: Path, users: dict) -> None:
+    out = {"users": [{"user_id": uid, **info} for uid, info in sorted(users.items())]}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False, indent=2)
+
+
+def bench_json(tmp: Path, n: int, k: int) -> list[float]:
+    path = tmp / f"registered_users-{n}.json"
+    users = {uid: user(uid) for uid in range(n)}
+    save_json(path, users)
+    times = []
+    for uid in range(n, n + k):
+        t0 = time.perf_counter()
+        users[uid] = user(uid)
+        save_json(path, users)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def bench_sqlite(tmp: Path, n: int, k: int) -> list[float]:
+    store = StateStore(tmp / f"state-{n}.db")
+    for uid in range(n):
+        store.put_user(uid, user(uid))
+    store.load_users()  # waits for the queue to drain
+    times = []
+    for uid in range(n, n + k):
+        t0 = time.perf_counter()
+        store.put_user(uid, user(uid)).result()
+        times.append(time.perf_counter() - t0)
+    store.close()
+    return times
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", default="100,1000,10000")
+    ap.add_argument("--registrations", type=int, default=200)
+    args = ap.parse_args()
+
+    print(f"{'users':>7} {'backend':<7} {'median ms':>10} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        for n in (int(x) for x in args.users.split(",")):
+            for name, bench in (("json", bench_json), ("sqlite", bench_sqlite)):
+                times = sorted(bench(tmp, n, args.registrations))
+                p95 = times[int(len(times) * 0.95) - 1]
+                print(f"{n:>7} {name:<7} {statistics.median(times) * 1e3:>10.3f} {p95 * 1e3:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
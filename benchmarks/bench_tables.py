@@ -0,0 +1,73 @@
+"""
+Table engine throughput in rows rendered per second.
+
+    python benchmarks/bench_tables.py [--rows 1000,10000,50000] [--repeat 5]
+
+Each renderer is fed one country's worth of synthetic rows of the given size
+and timed end to end (formatting, width pass, padding, MarkdownV2 wrapping).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from benchmarks.fixtures import apf_rows, dist_rows, dpf_rows
+from bot.table_engine import render_table, text_columns
+from bot.table_renderer import (
+    format_table,
+    render_apf_table_v2,
+    render_channel_distribution,
+    render_dpf_table_v2,
+)
+
+DAYS = 3
+
+
+def cases(n):
+    apf = apf_rows(max(1, n // DAYS), days=DAYS)
+    dpf = dpf_rows(max(1, n // DAYS), days=DAYS)
+    dist = dist_rows(n)
+    frame = pd.DataFrame({
+        "Provider": [f"prov{i}norm" for i in range(n)],
+        "Num": [f"{i * 37:,}" for i in range(n)],
+        "%": [str(i % 100) for i in range(n)],
+        "%3m": [str(i % 97) for i in range(n)],
+    })
+    records = frame.values.tolist()
+    return [
+        ("apf", len(apf), lambda: render_apf_table_v2("TH", apf)),
+        ("dpf", len(dpf), lambda: render_dpf_table_v2("TH", dpf)),
+        ("dist", len(dist), lambda: render_channel_distribution("TH", dist)),
+        ("format_table", n, lambda: format_table(frame)),
+        ("text_columns", n, lambda: render_table(text_columns(list(frame.columns)), records)),
+    ]
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", default="1000,10000,50000")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'table':<13} {'rows':>8} {'ms':>9} {'rows/s':>12}")
+    for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+        for name, rows, fn in cases(n):
+            t = best_of(fn, args.repeat)
+            print(f"{name:<13} {rows:>8} {t * 1e3:>9.2f} {rows / t:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
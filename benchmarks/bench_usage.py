@@ -0,0 +1,97 @@
+"""
+/usage: JSONL scan vs. the Parquet day partitions.
+
+    python benchmarks/bench_usage.py [--days 30] [--events 50000] [--repeat 3]
+
+Writes --days gzipped event logs of --events events each to a temporary
+directory, compacts them with bot.usage.compact_closed_days, and times the
+same questions three ways: "jsonl" reads every gzipped line with json.loads
+(what answering it by hand means today), "parquet" is usage.load_range
+plus the aggregations, and "parquet /dpf" adds a command filter that the
+row-group statistics can prune. Needs pyarrow (requirements2.txt).
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import event_rows
+from bot import usage
+
+
+def write_days(log_dir: Path, days: list[date], n: int) -> None:
+    for d in days:
+        day = d.strftime("%Y%m%d")
+        with gzip.open(log_dir / f"events-{day}.jsonl.gz", "wt", encoding="utf-8") as f:
+            for row in event_rows(n, day):
+                f.write(json.dumps(row) + "\n")
+
+
+def jsonl_scan(log_dir: Path, days: list[date]) -> Counter:
+    commands = Counter()
+    for d in days:
+        with gzip.open(log_dir / f"events-{d.strftime('%Y%m%d')}.jsonl.gz", "rt", encoding="utf-8") as f:
+            for line in f:
+                text = json.loads(line).get("text") or ""
+                if text.startswith("/"):
+                    commands[text.split()[0][1:].split("@")[0].lower()] += 1
+    return commands
+
+
+def best(fn, repeat: int) -> tuple[float, object]:
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--events", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if not usage.available():
+        sys.exit("pyarrow is not installed (pip install -r requirements2.txt)")
+
+    end = datetime.now(usage.TZ).date() - timedelta(days=1)
+    days = [end - timedelta(days=i) for i in range(args.days)][::-1]
+    with tempfile.TemporaryDirectory() as d:
+        log_dir = Path(d)
+        write_days(log_dir, days, args.events)
+        t0 = time.perf_counter()
+        usage.compact_closed_days(log_dir)
+        compact = time.perf_counter() - t0
+        size = sum(p.stat().st_size for p in (log_dir / "usage").rglob("*.parquet"))
+        print(f"{args.days} days x {args.events:,} events: compaction {compact:.2f}s, "
+              f"{size / 2**20:.1f} MB parquet "
+              f"({sum(p.stat().st_size for p in log_dir.glob('*.gz')) / 2**20:.1f} MB gzipped jsonl)")
+
+        def parquet_all():
+            table = usage.load_range(log_dir, days[0], days[-1])
+            return usage.top_commands(table), usage.top_users(table), usage.chat_activity(table)
+
+        t_scan, scan = best(lambda: jsonl_scan(log_dir, days), 1)
+        t_pq, (cmds, _, _) = best(parquet_all, args.repeat)
+        t_dpf, _ = best(lambda: usage.usage_report(log_dir, days[0], days[-1], command="dpf"), args.repeat)
+        assert dict((c, n) for c, n, _ in cmds) == {c: n for c, n in scan.most_common(10)}, "results differ"
+
+        print(f"{'query':<28} {'ms':>9}")
+        print(f"{'jsonl scan (commands only)':<28} {t_scan * 1e3:>9.0f}")
+        print(f"{'parquet commands+users+chats':<28} {t_pq * 1e3:>9.0f}")
+        print(f"{'parquet /dpf report':<28} {t_dpf * 1e3:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Update ingress latency: long polling vs. the webhook server.
+
+    python benchmarks/bench_webhook.py [--updates 50] [--gap-ms 300]
+
+An Application with a /ping handler that replies once is run against
+benchmarks/fake_telegram.py. --updates synthetic updates arrive
+--gap-ms apart (with jitter), and latency is measured from the moment an
+update exists to the moment the bot's sendMessage reaches "Telegram":
+
+  polling 2.0s  run_polling(poll_interval=2.0, timeout=50), the old setup
+  polling 0s    the same without the pause between getUpdates calls
+  webhook       Updater.start_webhook on 127.0.0.1; each update is POSTed as
+                JSON with the secret-token header, as Telegram would
+
+Needs the webhook extra (tornado), see requirements.txt.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+
+from benchmarks.fake_telegram import TOKEN, FakeTelegram, command_update
+
+SECRET = "bench-secret"
+PATH = "telegram"
+
+
+async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.effective_chat.send_message("pong")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(mode: str, n: int, gap: float, seed: int = 7) -> list[float]:
+    fake = FakeTelegram()
+    app = (ApplicationBuilder().token(TOKEN).request(fake).get_updates_request(fake)
+           .concurrent_updates(True).build())
+    app.add_handler(CommandHandler("ping", ping))
+    await app.initialize()
+    await app.start()
+
+    port = free_port()
+    if mode == "webhook":
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path=PATH,
+                                        webhook_url=f"https://bench.invalid/{PATH}", secret_token=SECRET)
+    else:
+        await app.updater.start_polling(poll_interval=2.0 if mode == "polling 2.0s" else 0.0, timeout=50)
+
+    rng = random.Random(seed)
+    started = []
+    async with httpx.AsyncClient() as client:
+        for i in range(1, n + 1):
+            await asyncio.sleep(gap * rng.uniform(0.5, 1.5))
+            update = command_update(i, "/ping")
+            started.append(time.perf_counter())
+            if mode == "webhook":
+                r = await client.post(f"http://127.0.0.1:{port}/{PATH}", json=update,
+                                      headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                r.raise_for_status()
+            else:
+                fake.push_update(update)
+        deadline = time.perf_counter() + 10
+        while len(fake.sent) < n and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    # replies come back in update order (one chat, one reply each)
+    return [t - s for (t, _, _), s in zip(sorted(fake.sent), started)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--updates", type=int, default=50)
+    ap.add_argument("--gap-ms", type=float, default=300)
+    args = ap.parse_args()
+
+    print(f"{'mode':<14} {'median ms':>10} {'p95 ms':>8} {'max ms':>8}")
+    for mode in ("polling 2.0s", "polling 0s", "webhook"):
+        lat = sorted(asyncio.run(run(mode, args.updates, args.gap_ms / 1e3)))
+        if len(lat) < args.updates:
+            print(f"{mode:<14} only {len(lat)}/{args.updates} replies")
+            continue
+        p95 = lat[int(len(lat) * 0.95) - 1]
+        print(f"{mode:<14} {statistics.median(lat) * 1e3:>10.1f} {p95 * 1e3:>8.1f} {lat[-1] * 1e3:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
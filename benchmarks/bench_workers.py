@@ -0,0 +1,117 @@
+"""
+Render pool: event-loop stalls per executor kind, and process-mode pickling cost.
+
+    python benchmarks/bench_workers.py [--brands 500,2000] [--groups 20,80] [--repeat 3]
+
+For each report a heartbeat coroutine ticks every 5 ms while the send_*
+function runs (render cache disabled, sends recorded in memory). "max lag" is
+the worst delay the heartbeat saw, i.e. how long other chats would have been
+blocked. The pickling table shows what process mode pays per call to ship the
+input to a worker and the rendered messages back.
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import bot.table_renderer as tr
+from benchmarks.fixtures import RecordingUpdate, apf_rows, by_country, pmh_rows
+from bot.render_cache import RenderCache
+from bot.workers import EXECUTOR_KINDS, RenderPool
+
+TICK = 0.005
+_real_sleep = asyncio.sleep
+
+
+async def _no_sleep(*_args, **_kwargs):
+    return None
+
+
+async def measure(send) -> tuple[float, float]:
+    """(wall seconds, max heartbeat lag seconds) for one send_* call."""
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal lag
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await _real_sleep(TICK)
+            lag = max(lag, time.perf_counter() - t0 - TICK)
+
+    hb = asyncio.create_task(heartbeat())
+    await _real_sleep(0)
+    t0 = time.perf_counter()
+    await send(RecordingUpdate())
+    wall = time.perf_counter() - t0
+    done.set()
+    await hb
+    return wall, lag
+
+
+def pickle_cost(obj) -> tuple[int, float]:
+    t0 = time.perf_counter()
+    blob = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.loads(blob)
+    return len(blob), time.perf_counter() - t0
+
+
+def reports(brands: int, groups: int):
+    cg = by_country(apf_rows(brands, countries=("TH", "PH")))
+    df = pd.DataFrame(pmh_rows(groups, countries=("TH", "PH")))
+    week = pd.DataFrame(pmh_rows(groups, countries=("TH", "PH"), week=True))
+    return [
+        (f"apf {brands} brands", lambda u: tr.send_apf_tables(u, cg), (cg, 72),
+         lambda: tr.build_apf_messages(cg, 72)),
+        (f"pmh_provider {groups} groups", lambda u: tr.send_provider_summaries(u, df, "2025-10-06"), (df, "2025-10-06"),
+         lambda: tr.build_provider_summary_messages(df, "2025-10-06")),
+        (f"pmh_week {groups} groups", lambda u: tr.send_pmh_week(u, week, "2025-09-30"), (week, "2025-09-30"),
+         lambda: tr.build_pmh_week_messages(week, "2025-09-30")),
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--brands", default="500,2000")
+    ap.add_argument("--groups", default="20,80")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+
+    asyncio.sleep = _no_sleep  # the 1 s pauses between sends are not what we measure here
+    tr.render_cache = RenderCache(0)
+
+    sizes = list(zip([int(x) for x in args.brands.split(",")], [int(x) for x in args.groups.split(",")]))
+    pools = {kind: RenderPool(kind, args.workers) for kind in EXECUTOR_KINDS}
+
+    print(f"{'report':<26} {'executor':<8} {'wall ms':>9} {'max lag ms':>11}")
+    for brands, groups in sizes:
+        for name, send, _, _ in reports(brands, groups):
+            for kind, pool in pools.items():
+                tr.render_pool = pool
+                asyncio.run(measure(send))  # warm-up (process start, imports)
+                runs = [asyncio.run(measure(send)) for _ in range(args.repeat)]
+                wall = min(w for w, _ in runs)
+                lag = min(l for _, l in runs)
+                print(f"{name:<26} {kind:<8} {wall * 1e3:>9.1f} {lag * 1e3:>11.1f}")
+
+    print()
+    print(f"{'report':<26} {'args KB':>8} {'args ms':>8} {'result KB':>10} {'result ms':>10}")
+    for brands, groups in sizes:
+        for name, _, call_args, build in reports(brands, groups):
+            a_size, a_time = pickle_cost(call_args)
+            r_size, r_time = pickle_cost(build())
+            print(f"{name:<26} {a_size / 1024:>8.0f} {a_time * 1e3:>8.1f} {r_size / 1024:>10.0f} {r_time * 1e3:>10.1f}")
+
+    for pool in pools.values():
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Stand-in query backend for load tests: real result shapes, BigQuery-like
+latency, no BigQuery.
+
+LatencyQueryClient is bot/local_query.py's LocalQueryClient over tables
+filled by benchmarks/synthetic_data.py. Each distinct (template, params)
+is computed on DuckDB once and remembered. Every fetch, including the
+first, then waits a latency drawn from a log-normal with the given median
+and p99 before returning a copy of the result. Handlers mutate the rows
+they get. The wait checks the request's cancellation every
+JOB_POLL_SECONDS, as BigQueryClient._wait does, so deadlines and
+supersedes behave as they would against BigQuery.
+
+It plugs in below the query cache, scheduler lanes and breaker of
+bot/query_client.py, so those stay in the measured path.
+"""
+import math
+import random
+import threading
+import time
+
+from bot.admission import QueryCancelled, current_request
+from bot.local_query import LocalQueryClient
+from bot.query_client import JOB_POLL_SECONDS
+
+Z99 = 2.326  # standard normal 99th percentile
+
+
+class LatencyQueryClient(LocalQueryClient):
+    name = "fake"
+
+    def __init__(self, config, backend=None, con=None, median: float = 1.5, p99: float = 6.0, seed: int = 7):
+        super().__init__(config, backend, con=con)
+        self.mu = math.log(median)
+        self.sigma = math.log(max(p99, median) / median) / Z99
+        self.rng = random.Random(seed)
+        self.results: dict[tuple, object] = {}
+        self.lock = threading.Lock()
+        self.waits: list[float] = []
+
+    def latency(self) -> float:
+        with self.lock:
+            return self.rng.lognormvariate(self.mu, self.sigma)
+
+    def _wait(self, seconds: float) -> None:
+        self.waits.append(seconds)
+        req = current_request.get()
+        end = time.monotonic() + seconds
+        while (left := end - time.monotonic()) > 0:
+            time.sleep(min(left, JOB_POLL_SECONDS))
+            if req is not None and req.cancelled():
+                raise QueryCancelled(req.reason or "deadline")
+
+    def _result(self, template: str, params: list[tuple], frame: bool):
+        key = (template, frame, tuple(params))
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                fetch = super().fetch_frame if frame else super().fetch_rows
+                result = self.results[key] = fetch(template, params)
+        self._wait(self.latency())
+        return result.copy() if frame else [dict(r) for r in result]
+
+    def fetch_rows(self, template, params):
+        return self._result(template, params, frame=False)
+
+    def fetch_frame(self, template, params):
+        return self._result(template, params, frame=True)
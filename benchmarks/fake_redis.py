@@ -0,0 +1,149 @@
+"""
+In-process stand-in for a Redis server, for RedisBackend (bot/shared_backend.py)
+in benchmarks and local multi-worker runs without a real Redis.
+
+Speaks RESP2 over TCP and implements what the bot uses: PING, AUTH, SELECT,
+GET, SET (EX/PX/NX), DEL, INCR/INCRBY, HGET, HSET, HGETALL, FLUSHALL, DBSIZE.
+
+    python benchmarks/fake_redis.py [--port 6379]
+
+or from code: `port = FakeRedis().start_in_thread()` / `serve_forever()`.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values: dict[bytes, tuple[bytes, float | None]] = {}
+        self.hashes: dict[bytes, dict[bytes, bytes]] = {}
+        self.commands = 0
+
+    # ---------- protocol ----------
+    @staticmethod
+    def _bulk(value: bytes | None) -> bytes:
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command (e.g. from telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                if args:
+                    self.commands += 1
+                    writer.write(self.execute(args))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ---------- commands ----------
+    def _get(self, key: bytes) -> bytes | None:
+        item = self.values.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return None if item is None else item[0]
+
+    def execute(self, args: list[bytes]) -> bytes:
+        cmd, args = args[0].upper(), args[1:]
+        try:
+            if cmd == b"PING":
+                return b"+PONG\r\n"
+            if cmd in (b"AUTH", b"SELECT"):
+                return b"+OK\r\n"
+            if cmd == b"GET":
+                return self._bulk(self._get(args[0]))
+            if cmd == b"SET":
+                expires = None
+                opts = [a.upper() for a in args[2:]]
+                if b"EX" in opts:
+                    expires = time.monotonic() + int(args[2 + opts.index(b"EX") + 1])
+                elif b"PX" in opts:
+                    expires = time.monotonic() + int(args[2 + opts.index(b"PX") + 1]) / 1000
+                if b"NX" in opts and self._get(args[0]) is not None:
+                    return b"$-1\r\n"
+                self.values[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if cmd == b"DEL":
+                n = sum((self.values.pop(k, None) is not None) + (self.hashes.pop(k, None) is not None) for k in args)
+                return b":%d\r\n" % n
+            if cmd in (b"INCR", b"INCRBY"):
+                value = int(self._get(args[0]) or 0) + (int(args[1]) if cmd == b"INCRBY" else 1)
+                self.values[args[0]] = (str(value).encode(), None)
+                return b":%d\r\n" % value
+            if cmd == b"HGET":
+                return self._bulk(self.hashes.get(args[0], {}).get(args[1]))
+            if cmd == b"HSET":
+                h = self.hashes.setdefault(args[0], {})
+                added = 0
+                for i in range(1, len(args), 2):
+                    added += args[i] not in h
+                    h[args[i]] = args[i + 1]
+                return b":%d\r\n" % added
+            if cmd == b"HGETALL":
+                h = self.hashes.get(args[0], {})
+                return b"*%d\r\n" % (2 * len(h)) + b"".join(self._bulk(k) + self._bulk(v) for k, v in h.items())
+            if cmd == b"FLUSHALL":
+                self.values.clear()
+                self.hashes.clear()
+                return b"+OK\r\n"
+            if cmd == b"DBSIZE":
+                return b":%d\r\n" % (len(self.values) + len(self.hashes))
+        except (IndexError, ValueError):
+            return b"-ERR wrong number or type of arguments for '%s'\r\n" % cmd.lower()
+        return b"-ERR unknown command '%s'\r\n" % cmd.lower()
+
+    # ---------- running ----------
+    async def serve(self, host: str = "127.0.0.1", port: int = 0, ready: threading.Event | None = None,
+                    bound: list | None = None) -> None:
+        server = await asyncio.start_server(self._client, host, port)
+        if bound is not None:
+            bound.append(server.sockets[0].getsockname()[1])
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Serve from a daemon thread; returns the bound port."""
+        ready, bound = threading.Event(), []
+        threading.Thread(target=lambda: asyncio.run(self.serve(host, port, ready, bound)),
+                         name="fake-redis", daemon=True).start()
+        ready.wait(5)
+        return bound[0]
+
+
+def serve_forever(host: str = "127.0.0.1", port: int = 6379, bound=None) -> None:
+    """Process entry point; `bound` (a multiprocessing queue) receives the port."""
+    async def main():
+        ports = []
+        server_task = asyncio.create_task(FakeRedis().serve(host, port, bound=ports))
+        while not ports:
+            await asyncio.sleep(0.01)
+        if bound is not None:
+            bound.put(ports[0])
+        await server_task
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6379)
+    args = ap.parse_args()
+    print(f"fake redis on {args.host}:{args.port}")
+    serve_forever(args.host, args.port)
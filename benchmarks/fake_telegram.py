@@ -0,0 +1,176 @@
+"""
+In-process stand-in for the Telegram Bot API, plugged into python-telegram-bot
+through ApplicationBuilder().request(...) / .get_updates_request(...).
+
+Answers getMe / setWebhook / deleteWebhook, serves getUpdates as a long poll
+over updates queued with push_update(), and records every send* call with
+its perf_counter() timestamp so benchmarks can measure end-to-end latency
+without a network or a real bot token. Like Telegram, it answers 400 to a
+sendMessage whose text is over MAX_MESSAGE_LENGTH characters.
+
+ThrottledTelegram adds a network round trip and the Bot API's flood limits
+(per chat, per group per minute, overall), answering 429 with retry_after
+as Telegram does. It also groups sends by the update they answer: set
+current_update in the task that handles the update.
+"""
+import asyncio
+import contextvars
+import json
+import math
+import time
+from typing import Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+
+# Bot API limit on a sendMessage text (after entity parsing; the fakes count the raw text)
+MAX_MESSAGE_LENGTH = 4096
+
+# the update a send answers (ThrottledTelegram.sent_by); set by the harness per handler task
+current_update: contextvars.ContextVar[int | None] = contextvars.ContextVar("fake_telegram_update", default=None)
+
+
+def command_update(update_id: int, text: str, chat_id: int = 1, user_id: int = 1, chat_type: str = "private") -> dict:
+    """Update JSON for a text message; a leading /command gets its bot_command entity."""
+    message = {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": chat_id, "type": chat_type, **({"title": "bench"} if chat_type != "private" else {})},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+class FakeTelegram(BaseRequest):
+    def __init__(self):
+        self.sent: list[tuple[float, str, dict]] = []
+        self._updates: list[dict] = []
+        self._new_update: asyncio.Event | None = None
+        self._message_id = 0
+        self.refused: list[str] = []
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        self._new_update = asyncio.Event()
+
+    async def shutdown(self) -> None:
+        pass
+
+    def push_update(self, update: dict) -> None:
+        """Queue an update for the next getUpdates (polling mode)."""
+        self._updates.append(update)
+        self._new_update.set()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self._too_long(endpoint, params):
+            return self._bad_request("message is too long")
+        return 200, json.dumps({"ok": True, "result": await self.answer(endpoint, params)}).encode()
+
+    @staticmethod
+    def _too_long(endpoint: str, params: dict) -> bool:
+        return endpoint == "sendMessage" and len(str(params.get("text", ""))) > MAX_MESSAGE_LENGTH
+
+    def _bad_request(self, reason: str) -> Tuple[int, bytes]:
+        self.refused.append(reason)
+        return 400, json.dumps({"ok": False, "error_code": 400, "description": f"Bad Request: {reason}"}).encode()
+
+    async def answer(self, endpoint: str, params: dict):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("setWebhook", "deleteWebhook", "setMyCommands"):
+            return True
+        if endpoint == "getUpdates":
+            return await self._get_updates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        if endpoint.startswith("send"):
+            self.sent.append((time.perf_counter(), endpoint, params))
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            return {"message_id": self._message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}}
+        return True
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self._updates)
+
+
+class ThrottledTelegram(FakeTelegram):
+    """
+    FakeTelegram with a round trip of `rtt` seconds per call and token buckets
+    for Telegram's documented limits: about one message per second per chat
+    (short bursts of `chat_burst` pass), 20 per minute in a group and 30 per
+    second overall. A send over a limit is not delivered and gets 429 with
+    the whole seconds until it would pass.
+    """
+
+    def __init__(self, rtt: float = 0.06, per_chat: float = 1.0, chat_burst: int = 3,
+                 group_per_minute: int = 20, overall: float = 30.0):
+        super().__init__()
+        self.rtt = rtt
+        self.limits = {"chat": (per_chat, chat_burst), "group": (group_per_minute / 60, group_per_minute),
+                       "overall": (overall, overall)}
+        self._buckets: dict[tuple, list[float]] = {}
+        self.rejected = 0
+        self.sent_by: dict[int | None, list[tuple[float, str, dict]]] = {}
+
+    def _wait_for(self, keys: list[tuple]) -> float:
+        """Seconds until every bucket in `keys` has a token; takes the tokens if that is now."""
+        now = time.monotonic()
+        wait = 0.0
+        for key in keys:
+            rate, burst = self.limits[key[0]]
+            bucket = self._buckets.setdefault(key, [burst, now])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                wait = max(wait, (1 - bucket[0]) / rate)
+        if wait == 0:
+            for key in keys:
+                self._buckets[key][0] -= 1
+        return wait
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getUpdates":
+            return await super().do_request(url, method, request_data)
+        await asyncio.sleep(self.rtt / 2)
+        if self._too_long(endpoint, params):
+            await asyncio.sleep(self.rtt / 2)
+            return self._bad_request("message is too long")
+        if endpoint.startswith("send"):
+            chat_id = int(params.get("chat_id", 0))
+            keys = [("overall",), ("chat", chat_id)] + ([("group", chat_id)] if chat_id < 0 else [])
+            wait = self._wait_for(keys)
+            if wait:
+                self.rejected += 1
+                retry_after = math.ceil(wait)
+                await asyncio.sleep(self.rtt / 2)
+                return 429, json.dumps({"ok": False, "error_code": 429,
+                                        "description": f"Too Many Requests: retry after {retry_after}",
+                                        "parameters": {"retry_after": retry_after}}).encode()
+        result = await self.answer(endpoint, params)
+        if endpoint.startswith("send"):
+            self.sent_by.setdefault(current_update.get(), []).append(self.sent[-1])
+        await asyncio.sleep(self.rtt / 2)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
@@ -0,0 +1,173 @@
+"""
+Synthetic inputs shared by the benchmark scripts.
+
+Shapes follow what bq_client returns after the brand-mapping merge, so the
+frames can be fed straight into the table_renderer functions.
+"""
+import hashlib
+import random
+
+import pandas as pd
+
+PMH_STATUSES = ["completed", "error", "timeout"]
+PMH_TYPES = ["DEPOSIT", "WITHDRAWAL"]
+
+
+def pmh_rows(n_groups: int, brands_per_group: int = 2, providers: int = 6,
+             countries=("TH",), week: bool = False, seed: int = 7) -> list[dict]:
+    """Rows shaped like execute_pmh_query / execute_pmh_week_query results."""
+    rng = random.Random(seed)
+    periods = ["CUR", "PREV"] if week else [None]
+    rows = []
+    for country in countries:
+        for gi in range(n_groups):
+            group = f"g{gi:03d}"
+            for bi in range(brands_per_group):
+                brand = f"{group}b{bi}".upper()
+                for pi in range(providers):
+                    provider = f"prov-{pi}-normal"
+                    for tnx_type in PMH_TYPES:
+                        for status in PMH_STATUSES:
+                            for period in periods:
+                                total = rng.randint(1, 3000)
+                                row = {
+                                    "tnx_type": tnx_type,
+                                    "providerKey": provider,
+                                    "method": provider.replace("prov", "meth"),
+                                    "brand": brand,
+                                    "status": status,
+                                    "country": country,
+                                    "avg_diff_seconds_transaction": rng.uniform(5, 900),
+                                    "total_count": total,
+                                    "transaction_within_180s": rng.randint(0, total),
+                                    "transaction_within_300s": rng.randint(0, total),
+                                    "transaction_within_900s": total,
+                                    "whitelabel": "kz",
+                                    "group_name": group,
+                                    "sub_group_name": f"{group}1",
+                                }
+                                if period:
+                                    row["period"] = period
+                                rows.append(row)
+    return rows
+
+
+def pmh_week_frame(n_groups: int, **kwargs) -> pd.DataFrame:
+    return pd.DataFrame(pmh_rows(n_groups, week=True, **kwargs))
+
+
+def apf_rows(n_brands: int, countries=("TH",), days: int = 3, seed: int = 7) -> list[dict]:
+    """Rows shaped like execute_apf_query results."""
+    rng = random.Random(seed)
+    rows = []
+    for country in countries:
+        for bi in range(n_brands):
+            for d in range(days):
+                rows.append({
+                    "date": f"2025-10-{6 - d:02d}",
+                    "group": f"G{bi % 8}",
+                    "brand": f"B{bi:04d}",
+                    "country": country,
+                    "NAR": rng.randint(0, 20000),
+                    "FTD": rng.randint(0, 900),
+                    "STD": rng.randint(0, 90),
+                    "TTD": rng.randint(0, 2000),
+                })
+    return rows
+
+
+def dist_rows(n_methods: int, countries=("TH",), seed: int = 7) -> list[dict]:
+    """Rows shaped like execute_deposit_distribution_query results."""
+    rng = random.Random(seed)
+    rows = []
+    for country in countries:
+        for mi in range(n_methods):
+            rows.append({
+                "country": country,
+                "method": f"bank-transfer-{mi}",
+                "currency": "THB",
+                "deposit_tnx_count": rng.randint(1, 500000),
+                "total_deposit_amount_native": float(rng.randint(1, 10**9)),
+                "average_deposit_amount_native": rng.uniform(1, 10000),
+                "pct_of_country_total_native": f"{rng.uniform(0, 100):.2f}%",
+            })
+    return rows
+
+
+def dpf_rows(n_brands: int, countries=("TH",), days: int = 3, seed: int = 7) -> list[dict]:
+    """Rows shaped like execute_dpf_query results (some days without an average)."""
+    rng = random.Random(seed)
+    rows = []
+    for country in countries:
+        for bi in range(n_brands):
+            for d in range(days):
+                rows.append({
+                    "date": f"2025-10-{6 - d:02d}",
+                    "country": country,
+                    "group": f"G{bi % 8}",
+                    "brand": f"B{bi:04d}",
+                    "AverageDeposit": None if rng.random() < 0.1 else rng.uniform(10, 5000),
+                    "TotalDeposit": round(rng.uniform(0, 5e7), 0),
+                    "Weightage": 0.5,
+                })
+    return rows
+
+
+def by_country(rows: list[dict]) -> dict[str, list[dict]]:
+    """{country: rows} as main.py hands them to the send_* functions."""
+    out = {}
+    for r in rows:
+        out.setdefault(r["country"], []).append(r)
+    return out
+
+
+EVENT_COMMANDS = ["/apf a", "/dpf TH", "/dist a 20251005", "/pmh_total A 20251005", "/pmh_week TH 20251005", "/help"]
+
+
+def event_rows(n: int, day: str, users: int = 500, chats: int = 40, seed: int = 7) -> list[dict]:
+    """echo() payloads for one GMT+7 day (YYYYMMDD); about a quarter are commands."""
+    rng = random.Random(f"{seed}-{day}")
+    base = f"{day[:4]}-{day[4:6]}-{day[6:]}T"
+    rows = []
+    for i in range(n):
+        secs = i * 86400 // n
+        chat = -1000 - rng.randrange(chats)
+        rows.append({
+            "user_id": 10_000 + int(rng.paretovariate(1.2)) % users,
+            "chat_id": chat,
+            "chat_type": "supergroup" if chat % 5 else "private",
+            "text": rng.choice(EVENT_COMMANDS) if rng.random() < 0.25 else f"message {i}",
+            "ts": f"{base}{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}+07:00",
+        })
+    return rows
+
+
+class RecordingChat:
+    """Stands in for update.effective_chat; keeps what would have been sent."""
+    def __init__(self, chat_id: int = 1, chat_type: str = "private"):
+        self.id = chat_id
+        self.type = chat_type
+        self.sent = []
+
+    async def send_message(self, text, **kwargs):
+        self.sent.append({"text": text, **{k: str(v) for k, v in sorted(kwargs.items())}})
+
+    async def send_photo(self, photo, **kwargs):
+        self.sent.append({"photo": _digest(photo), **{k: str(v) for k, v in sorted(kwargs.items())}})
+
+    async def send_document(self, document, **kwargs):
+        self.sent.append({"document": _digest(document), **{k: str(v) for k, v in sorted(kwargs.items())}})
+
+    async def send_media_group(self, media, **kwargs):
+        self.sent.append({"media_group": [(_digest(m.media), m.caption) for m in media]})
+
+
+def _digest(blob) -> str:
+    """sha1 of the image bytes, so recorded sends stay small and comparable."""
+    data = getattr(blob, "input_file_content", blob)
+    return hashlib.sha1(data).hexdigest() if isinstance(data, bytes) else str(data)
+
+
+class RecordingUpdate:
+    def __init__(self, chat_id: int = 1, chat_type: str = "private"):
+        self.effective_chat = RecordingChat(chat_id, chat_type)
@@ -0,0 +1,116 @@
+"""
+Golden-output check for every text report.
+
+    python benchmarks/golden_reports.py            # compare with benchmarks/golden/reports.json
+    python benchmarks/golden_reports.py --update   # rewrite the snapshot
+
+Runs each send_* function on fixed synthetic data with the clock pinned to
+2025-10-06 10:37 UTC and asyncio.sleep disabled, records the messages a
+chat would receive, and compares them byte for byte with the snapshot.
+Exits non-zero on any difference, so renderer refactors can be checked
+without BigQuery or Telegram.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import bot.table_renderer as tr
+from benchmarks.fixtures import RecordingUpdate, apf_rows, by_country, dist_rows, dpf_rows, pmh_rows
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "reports.json")
+FROZEN_NOW = datetime(2025, 10, 6, 10, 37, tzinfo=timezone.utc)
+COUNTRIES = ("TH", "PH", "BD")
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return FROZEN_NOW.astimezone(tz) if tz else FROZEN_NOW.replace(tzinfo=None)
+
+
+async def _no_sleep(*_args, **_kwargs):
+    return None
+
+
+@contextlib.contextmanager
+def pinned():
+    """Clock pinned to FROZEN_NOW, asyncio.sleep disabled and stdout muted while rendering."""
+    real_datetime, real_sleep = tr.datetime, asyncio.sleep
+    tr.datetime, asyncio.sleep = _FrozenDatetime, _no_sleep
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        tr.datetime, asyncio.sleep = real_datetime, real_sleep
+
+
+def report_cases():
+    pmh = pd.DataFrame(pmh_rows(4, countries=("TH", "PH")))
+    week = pd.DataFrame(pmh_rows(4, countries=("TH", "PH"), week=True))
+    dist = dist_rows(7, countries=COUNTRIES)
+    dist.append({"country": "TH", "method": None, "currency": "THB", "deposit_tnx_count": 0,
+                 "total_deposit_amount_native": None, "average_deposit_amount_native": "",
+                 "pct_of_country_total_native": None})
+    return {
+        "apf": lambda u: tr.send_apf_tables(u, by_country(apf_rows(12, countries=COUNTRIES))),
+        "dpf": lambda u: tr.send_dpf_tables(u, by_country(dpf_rows(12, countries=COUNTRIES))),
+        "dist": lambda u: tr.send_channel_distribution(u, by_country(dist)),
+        "pmh_total_today": lambda u: tr.send_pmh_total(u, pmh, "2025-10-06"),
+        "pmh_total_past": lambda u: tr.send_pmh_total(u, pmh, "2025-10-01"),
+        "pmh_provider": lambda u: tr.send_provider_summaries(u, pmh, "2025-10-06"),
+        "pmh_method": lambda u: tr.send_method_summaries(u, pmh, "2025-10-06"),
+        "pmh_week_today": lambda u: tr.send_pmh_week(u, week, "2025-10-06"),
+        "pmh_week_past": lambda u: tr.send_pmh_week(u, week, "2025-09-30"),
+        "pmh_week_single": lambda u: tr.send_pmh_week(u, week[week["group_name"] == "g000"], "2025-10-06"),
+    }
+
+
+def render_all() -> dict[str, list[dict]]:
+    out = {}
+    with pinned():
+        for name, case in report_cases().items():
+            update = RecordingUpdate()
+            asyncio.run(case(update))
+            out[name] = update.effective_chat.sent
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--update", action="store_true", help="rewrite the snapshot instead of comparing")
+    args = ap.parse_args()
+
+    current = render_all()
+    if args.update:
+        os.makedirs(os.path.dirname(SNAPSHOT), exist_ok=True)
+        with open(SNAPSHOT, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=1)
+        print(f"wrote {len(current)} reports to {SNAPSHOT}")
+        return
+
+    with open(SNAPSHOT, encoding="utf-8") as f:
+        golden = json.load(f)
+    failed = sorted(k for k in golden.keys() | current.keys() if golden.get(k) != current.get(k))
+    for name in failed:
+        old, new = golden.get(name, []), current.get(name, [])
+        print(f"--- {name}: {len(old)} golden vs {len(new)} rendered messages")
+        for i, (a, b) in enumerate(zip(old, new)):
+            if a != b:
+                print(f"first difference in message {i}:\n{a.get('text')!r}\n{b.get('text')!r}")
+                break
+    if failed:
+        sys.exit(1)
+    print(f"all {len(golden)} reports match")
+
+
+if __name__ == "__main__":
+    main()
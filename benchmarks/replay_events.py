@@ -0,0 +1,125 @@
+"""
+Replay a day of real traffic from the event log against the bot, with the
+stand-in backends of benchmarks/bench_load.py.
+
+    python benchmarks/replay_events.py 20251006 [--logs logs] [--from 08:00] [--to 11:00] [--speed 10]
+                                       [--all-messages] [--keep-dates] [--set QUERY_CACHE_TTL=0] ...
+
+Reads logs/events-YYYYMMDD[.w<i>].jsonl[.gz|.zst] (every worker's file) and
+turns each logged command into an Update from the same user and chat, with
+the same chat type, at the same time of day. --from / --to (GMT+7) cut out
+a window such as the morning peak. --speed divides the gaps between
+updates, so --speed 10 plays an hour in six minutes. Messages that are not
+commands are skipped unless --all-messages.
+
+Dates in the commands (/pmh_total A 20251006) are moved by as many days
+as the log day is before today, so they hit the synthetic data, which
+ends now. --keep-dates leaves them as they are.
+
+Run it twice with different bot settings (--set QUERY_CACHE_TTL=0,
+--set BQ_MAX_JOBS=8, --set UPDATE_CONCURRENCY=32, ...) or on two commits
+to see what a caching, coalescing or scheduling change would have done to
+that day's peak. The report is bench_load.py's: per command the time to
+the first and last message, throughput and 429s.
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_load import GMT7, add_stand_in_args, prepare, report, run
+from bot import usage
+
+_DATE_ARG = re.compile(r"(?<=\s)(\d{8})(?=\s|$)")
+
+
+def open_log(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        import zstandard  # optional, as in bot/event_log.py
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(path.open("rb")), encoding="utf-8")
+    return path.open(encoding="utf-8")
+
+
+def read_day(log_dir: Path, day: str) -> list[dict]:
+    """Every worker's events of one GMT+7 day, by time."""
+    paths = usage.event_files(log_dir).get(day)
+    if not paths:
+        raise SystemExit(f"no events-{day}*.jsonl* in {log_dir}")
+    events = []
+    for path in paths:
+        with open_log(path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if event.get("text") and event.get("ts") and event.get("chat_id") is not None:
+                    event["at"] = datetime.fromisoformat(event["ts"]).astimezone(GMT7)
+                    events.append(event)
+    return sorted(events, key=lambda e: e["at"])
+
+
+def shift_dates(text: str, days: int) -> str:
+    def shift(m):
+        try:
+            return (datetime.strptime(m.group(1), "%Y%m%d") + timedelta(days=days)).strftime("%Y%m%d")
+        except ValueError:
+            return m.group(1)
+    return _DATE_ARG.sub(shift, text) if days else text
+
+
+def workload(events: list[dict], day: str, start: str | None, end: str | None, speed: float,
+             all_messages: bool, keep_dates: bool) -> list[tuple]:
+    """(offset s, chat_id, chat_type, user_id, text) as bench_load.run takes them."""
+    base = datetime.strptime(day, "%Y%m%d").replace(tzinfo=GMT7)
+    lo = base + timedelta(hours=int(start[:2]), minutes=int(start[3:])) if start else base
+    hi = base + timedelta(hours=int(end[:2]), minutes=int(end[3:])) if end else base + timedelta(days=1)
+    days = 0 if keep_dates else (datetime.now(GMT7).date() - base.date()).days
+    picked = [e for e in events if lo <= e["at"] < hi and (all_messages or e["text"].startswith("/"))]
+    if not picked:
+        return []
+    first = picked[0]["at"]
+    return [((e["at"] - first).total_seconds() / speed, int(e["chat_id"]),
+             e.get("chat_type") or ("private" if int(e["chat_id"]) > 0 else "supergroup"),
+             int(e.get("user_id") or e["chat_id"]), shift_dates(e["text"], days))
+            for e in picked]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("day", help="YYYYMMDD (GMT+7)")
+    ap.add_argument("--logs", default=os.path.join(ROOT, "logs"), help="directory with the events-*.jsonl files")
+    ap.add_argument("--from", dest="start", metavar="HH:MM", help="window start, GMT+7 (default 00:00)")
+    ap.add_argument("--to", dest="end", metavar="HH:MM", help="window end, GMT+7 (default 24:00)")
+    ap.add_argument("--speed", type=float, default=10.0, help="time compression factor (1 = real time)")
+    ap.add_argument("--all-messages", action="store_true", help="replay plain messages too, not just commands")
+    ap.add_argument("--keep-dates", action="store_true", help="do not move dates in the commands to today")
+    add_stand_in_args(ap)
+    args = ap.parse_args()
+
+    events = read_day(Path(args.logs), args.day)
+    work = workload(events, args.day, args.start, args.end, args.speed, args.all_messages, args.keep_dates)
+    if not work:
+        raise SystemExit(f"{len(events)} events on {args.day}, none to replay in the window")
+    span = work[-1][0] * args.speed
+    print(f"{args.day} {args.start or '00:00'}-{args.end or '24:00'}: {len(work)} of {len(events)} events, "
+          f"{span / 60:.0f} min played in {work[-1][0] / 60:.1f} min (x{args.speed:g}), "
+          f"{len({w[3] for w in work})} users in {len({w[1] for w in work})} chats")
+    tmp = prepare(args)
+    results, fake, elapsed = asyncio.run(run(args, work, tmp))
+    report(results, fake, elapsed, len(work))
+
+
+if __name__ == "__main__":
+    main()
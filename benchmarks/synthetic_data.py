@@ -0,0 +1,220 @@
+"""
+Synthetic ext_funding_tx / ext_member / account tables for the local query
+backend (bot/local_query.py): realistic enough that the sql/ templates do
+the work they do on BigQuery.
+
+    python benchmarks/synthetic_data.py --db data/local.duckdb [--tx 1000000] [--days 30]
+                                        [--skew 1.1] [--dup-rate 0.3] [--seed 7] [--end 2025-09-01T12:00]
+
+- accounts: the brands of sql/brand_mapping.csv (so the pmh merge finds
+  their groups), each in one country. Brand sizes follow a Zipf law
+  (--skew): a few brands carry most of the traffic.
+- members: one per ~6 transactions, registered over the window and the
+  60 days before it (so /apf finds first, second and third deposits).
+- transactions: --tx over the --days before --end (default now). Each
+  one's currency, methods and providers belong to its brand's country.
+  Amounts are log-normal around each currency's typical deposit. Times
+  peak in the local evening. Processing times are log-normal, and timeouts
+  take 15 min. 75% are deposits; the statuses are completed / error /
+  timeout / errors (legacy spelling).
+- duplicate-update rows: --dup-rate of the transactions get a second row,
+  as the realtime replica does. Either an earlier "pending" version, or
+  a replay of the final row with a later updatedAt. The QUALIFY
+  ROW_NUMBER() dedup in the templates has to drop them.
+
+Rows are generated in chunks of 1M transactions, each from its own seeded
+RNG, so a given --seed and --tx give the same tables. The parameters go
+into a synthetic_meta table; benchmarks read "end" from it and pin the
+backend's clock there (LOCAL_NOW).
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from bot.local_query import connect
+
+CHUNK = 1_000_000
+US = 1_000_000  # microseconds per second
+
+# country -> (currency, typical deposit in that currency, UTC offset hours, methods)
+COUNTRIES = {
+    "TH": ("THB", 500, 7, ["QR", "BANK", "TRUEWALLET"]),
+    "PH": ("PHP", 300, 8, ["GCASH", "MAYA", "BANK"]),
+    "BD": ("BDT", 1000, 6, ["BKASH", "NAGAD", "ROCKET"]),
+    "PK": ("PKR", 2000, 5, ["EASYPAISA", "JAZZCASH", "BANK"]),
+    "ID": ("IDR", 100_000, 7, ["QRIS", "DANA", "OVO", "BANK"]),
+    "BR": ("BRL", 50, -3, ["PIX"]),
+}
+COUNTRY_SHARE = [0.3, 0.2, 0.2, 0.1, 0.1, 0.1]
+PROVIDERS_PER_COUNTRY = 4
+STATUSES = ["completed", "error", "timeout", "errors", "pending"]
+STATUS_SHARE = [0.88, 0.06, 0.04, 0.02]
+TYPES = ["deposit", "withdraw"]
+
+def brands(skew: float, seed: int) -> pd.DataFrame:
+    """One row per brand: id, name, group, gamePrefix, country index and traffic weight."""
+    rng = np.random.default_rng([seed, 0])
+    mapping = pd.read_csv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       "sql", "brand_mapping.csv"))
+    n = len(mapping)
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    rng.shuffle(weights)
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "name": mapping["brand"].str.upper(),
+        "group": mapping["group_name"],
+        "gamePrefix": mapping["brand"].str.lower().str[:3],
+        "country": rng.choice(len(COUNTRIES), n, p=COUNTRY_SHARE),
+        "weight": weights / weights.sum(),
+    })
+
+def _local_times(rng, n: int, start_us: int, days: int, offset_h) -> np.ndarray:
+    """UTC microseconds of n events over `days` local days, peaking in the local evening."""
+    day = rng.integers(0, days, n)
+    hour = np.where(rng.random(n) < 0.7, rng.normal(20, 3.5, n), rng.uniform(0, 24, n)) % 24
+    return start_us + (day * 86400 + hour * 3600 - offset_h * 3600).astype(np.int64) * US
+
+def _ts(us: np.ndarray, index=None) -> pd.Series:
+    return pd.Series(pd.to_datetime(us, unit="us", utc=True), index=index)
+
+def _members(b: pd.DataFrame, n: int, start_us: int, end_us: int, seed: int):
+    rng = np.random.default_rng([seed, 1])
+    counts = np.maximum(1, np.round(b["weight"].to_numpy() * n).astype(np.int64))
+    brand = np.repeat(np.arange(len(b)), counts)
+    total = len(brand)
+    reg = rng.integers(start_us - 60 * 86400 * US, end_us, total)
+    df = pd.DataFrame({
+        "id": np.arange(1, total + 1),
+        "accountId": b["id"].to_numpy()[brand],
+        "registerAt": _ts(reg),
+    })
+    first = np.concatenate([[1], 1 + np.cumsum(counts)[:-1]])  # members of brand k: first[k] .. first[k]+counts[k]-1
+    return df, first, counts
+
+def _transactions(b: pd.DataFrame, first_member, member_counts, lo: int, hi: int, start_us: int, end_us: int,
+                  days: int, dup_rate: float, seed: int, chunk: int) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, 2, chunk])
+    n = hi - lo
+    brand = rng.choice(len(b), n, p=b["weight"].to_numpy())
+    country = b["country"].to_numpy()[brand]
+    specs = list(COUNTRIES.values())
+    offset = np.array([s[2] for s in specs])[country]
+    typical = np.array([s[1] for s in specs], dtype=float)[country]
+    currencies = [s[0] for s in specs]
+
+    methods = sorted({m for s in specs for m in s[3]})
+    n_methods = np.array([len(s[3]) for s in specs])[country]
+    local_method = (rng.random(n) * n_methods).astype(np.int64)
+    method_table = np.full((len(specs), max(len(s[3]) for s in specs)), -1)
+    for i, s in enumerate(specs):
+        method_table[i, :len(s[3])] = [methods.index(m) for m in s[3]]
+    method = method_table[country, local_method]
+    providers = [f"{c.lower()}pay{k}" for c in COUNTRIES for k in range(1, PROVIDERS_PER_COUNTRY + 1)]
+    provider = country * PROVIDERS_PER_COUNTRY + np.minimum(rng.zipf(2.0, n) - 1, PROVIDERS_PER_COUNTRY - 1)
+
+    kind = (rng.random(n) < 0.25).astype(np.int64)  # 0 deposit, 1 withdraw
+    status = rng.choice(len(STATUS_SHARE), n, p=STATUS_SHARE)
+    amount = typical * np.exp(rng.normal(0, 0.9, n)) * np.where(kind == 1, 2.0, 1.0)
+    amount = np.where(country == list(COUNTRIES).index("ID"), np.round(amount, -3), np.round(amount, 2))
+
+    created = np.minimum(_local_times(rng, n, start_us, days, offset), end_us - 1)
+    took = np.where(kind == 1, rng.lognormal(np.log(420), 1.0, n), rng.lognormal(np.log(60), 1.2, n))
+    took = np.where(status == 2, 900 + rng.uniform(0, 30, n), np.where(status == 0, took, rng.lognormal(np.log(20), 1, n)))
+    completed = created + (took * US).astype(np.int64)
+    lag = (rng.exponential(2, n) * US).astype(np.int64)
+
+    df = pd.DataFrame({
+        "id": np.arange(lo + 1, hi + 1),
+        "type": pd.Categorical.from_codes(kind, TYPES),
+        "status": pd.Categorical.from_codes(status, STATUSES),
+        "method": pd.Categorical.from_codes(method, methods),
+        "providerKey": pd.Categorical.from_codes(provider, providers),
+        "reqCurrency": pd.Categorical.from_codes(country, currencies),
+        "netCurrency": pd.Categorical.from_codes(country, currencies),
+        "netAmount": amount,
+        "accountId": b["id"].to_numpy()[brand],
+        "memberId": first_member[brand] + (rng.random(n) * member_counts[brand]).astype(np.int64),
+        "createdAt": _ts(created),
+        "completedAt": _ts(completed),
+        "updatedAt": _ts(completed),
+        "insertedAt": _ts(completed + lag),
+    })
+
+    # duplicate-update rows: an earlier pending version or a later replay of the final one
+    dup = np.flatnonzero(rng.random(n) < dup_rate)
+    if len(dup):
+        extra = df.iloc[dup].copy()
+        pending = rng.random(len(dup)) < 0.6
+        later = (rng.uniform(1, 60, len(dup)) * US).astype(np.int64)
+        upd = np.where(pending, created[dup], completed[dup] + later)
+        extra["status"] = extra["status"].where(~pending, "pending")
+        extra["completedAt"] = extra["completedAt"].where(~pending, pd.NaT)
+        extra["updatedAt"] = _ts(upd, extra.index)
+        extra["insertedAt"] = _ts(upd + lag[dup], extra.index)
+        df = pd.concat([df, extra], ignore_index=True)
+    return df
+
+def generate(con, tx: int, days: int = 30, skew: float = 1.1, dup_rate: float = 0.3, seed: int = 7,
+             end: dt.datetime | None = None, progress: bool = False) -> dict:
+    """Fill the (empty) tables of a local_query database; returns what went into synthetic_meta."""
+    end = (end or dt.datetime.now(dt.timezone.utc)).astimezone(dt.timezone.utc)
+    end_us = int(end.timestamp() * US)
+    start_us = end_us - days * 86400 * US
+    b = brands(skew, seed)
+    members, first, counts = _members(b, max(1, tx // 6), start_us, end_us, seed)
+    con.register("chunk", b[["id", "name", "group", "gamePrefix"]])
+    con.execute("INSERT INTO account BY NAME SELECT * FROM chunk")
+    con.register("chunk", members)
+    con.execute("INSERT INTO ext_member BY NAME SELECT *, 'm' || lpad(id::VARCHAR, 8, '0') AS apiIdentifier FROM chunk")
+    con.unregister("chunk")
+    rows = 0
+    for i, lo in enumerate(range(0, tx, CHUNK)):
+        df = _transactions(b, first, counts, lo, min(tx, lo + CHUNK), start_us, end_us, days, dup_rate, seed, i)
+        con.register("chunk", df)
+        con.execute("INSERT INTO ext_funding_tx BY NAME SELECT * FROM chunk")
+        con.unregister("chunk")
+        rows += len(df)
+        if progress:
+            print(f"  {min(tx, lo + CHUNK):>12,} / {tx:,} transactions", end="\r", flush=True)
+    if progress:
+        print()
+    meta = {"tx": tx, "rows": rows, "members": len(members), "brands": len(b), "days": days, "skew": skew,
+            "dup_rate": dup_rate, "seed": seed, "end": end.isoformat()}
+    con.execute("CREATE OR REPLACE TABLE synthetic_meta (key VARCHAR, value VARCHAR)")
+    con.executemany("INSERT INTO synthetic_meta VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+    return meta
+
+def read_meta(con) -> dict:
+    return dict(con.execute("SELECT key, value FROM synthetic_meta").fetchall())
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", required=True, help="DuckDB file to create (must not exist)")
+    ap.add_argument("--tx", type=int, default=1_000_000)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--skew", type=float, default=1.1)
+    ap.add_argument("--dup-rate", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--end", type=dt.datetime.fromisoformat, help="last moment of data, UTC (default: now)")
+    args = ap.parse_args()
+
+    if os.path.exists(args.db):
+        sys.exit(f"{args.db} exists; pick a new file")
+    end = args.end.replace(tzinfo=args.end.tzinfo or dt.timezone.utc) if args.end else None
+    con = connect(args.db)
+    t = time.perf_counter()
+    meta = generate(con, args.tx, args.days, args.skew, args.dup_rate, args.seed, end, progress=True)
+    con.close()
+    print(f"{meta['rows']:,} ext_funding_tx rows ({meta['tx']:,} transactions), {meta['members']:,} members, "
+          f"{meta['brands']} brands in {time.perf_counter() - t:.1f}s -> {args.db}")
+    print(f"QUERY_BACKEND=duckdb LOCAL_DB={args.db} LOCAL_NOW={meta['end']} (or leave LOCAL_NOW unset while it is fresh)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# admission.py
+"""
+Admission control for the report commands.
+
+Two gates:
+
+1. Rate limits. Every report command has a cost (COMMAND_COSTS, times
+   ALL_MULTIPLIER when it asks for all countries). Each user and each chat
+   has a token bucket, and a command runs only if both buckets still hold
+   its cost. Otherwise the user is told when to try again. Admins are not
+   limited.
+
+       RATE_USER_BURST / RATE_USER_PER_MIN   bucket size / refill per minute (default 20 / 10)
+       RATE_CHAT_BURST / RATE_CHAT_PER_MIN   the same per chat (default 40 / 20)
+
+   `/pmh_week A` (4 x 5 = 20) empties a fresh user bucket; `/dist TH` (1)
+   hardly dents it.
+
+2. BigQuery slots. BigQueryClient runs its jobs through QueryScheduler
+   (bot/query_scheduler.py): a fixed number at once, interactive waiters
+   served round-robin across chats. A command whose first query has to
+   wait gets one "queued, position N" reply.
+
+Queries are tagged with `current_request` (a ContextVar), which carries
+the lane, the chat and the reply callback down to BigQueryClient without
+changing its signatures: RealTimeBot._admit sets it for handlers, and
+refreshes or backfills wrap their calls in `with lane("scheduled"):`.
+
+Each report also gets a deadline (COMMAND_DEADLINE seconds, default 120)
+and can be cancelled: QueryRequest.cancel() stops its queued or running
+queries, and BigQueryClient cancels the BigQuery job itself. RealTimeBot
+cancels a request when its deadline passes, when the same user sends
+another report command in the same chat (InFlight.supersede) and when the
+bot stops; the handler then gets QueryCancelled.
+
+Both gates are per process: with several workers (bot/sharding.py) a chat
+always hits the same worker, but a user's limit and the job cap apply per
+worker.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable, Sequence
+
+from bot import metrics
+
+# relative BigQuery cost of one run for one country
+COMMAND_COSTS = {"dist": 1, "apf": 2, "dpf": 2, "pmh_total": 2, "pmh_provider": 2, "pmh_method": 2, "pmh_week": 4}
+ALL_MULTIPLIER = 5  # `a` / `A`: every country (the pmh_* commands run one query per country)
+
+COMMAND_DEADLINE = float(os.environ.get("COMMAND_DEADLINE", "120"))
+
+RATE_LIMITED = metrics.counter("rate_limited_total", "Commands refused by the per-user/per-chat rate limits")
+REQUESTS_CANCELLED = metrics.counter("requests_cancelled_total", "Report commands cancelled, by reason")
+
+def command_cost(command: str, args: Sequence[str] | None) -> int:
+    cost = COMMAND_COSTS.get(command, 1)
+    if args and str(args[0]).strip().upper() == "A":
+        cost *= ALL_MULTIPLIER
+    return cost
+
+class TokenBuckets:
+    """One token bucket per key: `burst` tokens, refilled at `per_minute`."""
+
+    def __init__(self, burst: float, per_minute: float, max_keys: int = 100_000):
+        self.burst = float(burst)
+        self.rate = float(per_minute) / 60.0
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, list[float]] = OrderedDict()  # key -> [tokens, updated]
+
+    def _bucket(self, key, now: float) -> list[float]:
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # least recently seen; it would be full again by now
+        else:
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            self._buckets.move_to_end(key)
+        return b
+
+    def wait_time(self, key, cost: float, now: float | None = None) -> float:
+        """Seconds until `cost` tokens are there (0.0: now). Costs above the burst wait for a full bucket."""
+        b = self._bucket(key, time.monotonic() if now is None else now)
+        missing = min(cost, self.burst) - b[0]
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else math.inf
+
+    def take(self, key, cost: float, now: float | None = None) -> None:
+        b = self._bucket(key, time.monotonic() if now is None else now)
+        b[0] -= min(cost, self.burst)
+
+class RateLimiter:
+    def __init__(self):
+        env = os.environ.get
+        self.users = TokenBuckets(float(env("RATE_USER_BURST", "20")), float(env("RATE_USER_PER_MIN", "10")))
+        self.chats = TokenBuckets(float(env("RATE_CHAT_BURST", "40")), float(env("RATE_CHAT_PER_MIN", "20")))
+
+    def admit(self, user_id: int, chat_id: int, cost: float) -> float:
+        """Take `cost` from both buckets and return 0.0, or return the seconds to wait (nothing taken)."""
+        now = time.monotonic()
+        wait_user = self.users.wait_time(user_id, cost, now)
+        wait_chat = self.chats.wait_time(chat_id, cost, now)
+        if wait_user or wait_chat:
+            RATE_LIMITED.inc(scope="user" if wait_user >= wait_chat else "chat")
+            return max(wait_user, wait_chat)
+        self.users.take(user_id, cost, now)
+        self.chats.take(chat_id, cost, now)
+        return 0.0
+
+class QueryCancelled(Exception):
+    """A query given up on: reason is "deadline", "superseded", "shutdown" or "abandoned"."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"query cancelled ({reason})")
+        self.reason = reason
+
+@dataclass(eq=False)
+class QueryRequest:
+    """What a query runs for: its chat (the fair-queue key), its scheduler lane, how to say it is
+    queued, its deadline (time.monotonic()) and, once cancelled, why."""
+    chat_id: Hashable
+    notify: Callable[[int], Awaitable] | None = None
+    notified: bool = False
+    lane: str = "interactive"
+    deadline: float | None = None
+    reason: str | None = None
+    # unix time of the oldest stale result a query fell back to (BigQuery unavailable)
+    stale_since: float | None = None
+    stale_noticed: bool = False
+    # the query tasks in flight for this request (event loop only)
+    tasks: set[asyncio.Task] = field(default_factory=set, repr=False)
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> float | None:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def cancelled(self) -> bool:
+        """Safe from any thread (BigQueryClient polls it while a job runs)."""
+        return self.reason is not None or self.expired()
+
+    def check(self) -> None:
+        if self.cancelled():
+            raise QueryCancelled(self.reason or "deadline")
+
+    def mark(self, reason: str) -> str:
+        """Record why the request is given up (the first reason wins); returns it."""
+        if self.reason is None:
+            self.reason = reason
+            REQUESTS_CANCELLED.inc(reason=reason)
+        return self.reason
+
+    def cancel(self, reason: str) -> None:
+        """Mark the request and cancel its queued/running queries. Event loop only."""
+        if self.reason is not None:
+            return
+        self.mark(reason)
+        for task in list(self.tasks):
+            task.cancel()
+
+current_request: ContextVar[QueryRequest | None] = ContextVar("current_request", default=None)
+
+@contextmanager
+def lane(name: str, key: Hashable = None):
+    """Run the BigQueryClient calls inside in scheduler lane `name` ("scheduled", "batch")."""
+    token = current_request.set(QueryRequest(key, lane=name))
+    try:
+        yield
+    finally:
+        current_request.reset(token)
+
+class InFlight:
+    """The running report request of each (chat, user): what a new command supersedes, what stop() cancels."""
+
+    def __init__(self):
+        self._requests: dict[tuple, QueryRequest] = {}
+
+    def start(self, chat_id: int, user_id: int, request: QueryRequest) -> None:
+        self._requests[(chat_id, user_id)] = request
+
+    def finish(self, chat_id: int, user_id: int, request: QueryRequest) -> None:
+        if self._requests.get((chat_id, user_id)) is request:
+            del self._requests[(chat_id, user_id)]
+
+    def supersede(self, chat_id: int, user_id: int) -> bool:
+        req = self._requests.pop((chat_id, user_id), None)
+        if req is None or req.reason is not None:
+            return False
+        req.cancel("superseded")
+        return True
+
+    def cancel_all(self, reason: str) -> int:
+        requests, self._requests = list(self._requests.values()), {}
+        for req in requests:
+            req.cancel(reason)
+        return len(requests)
@@ -1,13 +1,72 @@
 import os
+import re
 
 class Config:
     def __init__(self):
         self.TELEGRAM_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
         self.BQ_PROJECT = os.environ.get("BQ_PROJECT")
         self.BQ_LOCATION = os.environ.get("BQ_LOCATION", "asia-southeast1")
+        # where the report SQL runs: "bigquery" or "duckdb" (local tables, see bot/local_query.py)
+        self.QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "bigquery").strip().lower()
+        self.LOCAL_DB = os.environ.get("LOCAL_DB", "data/local.duckdb")
         self.APF_ALLOWED = {"TH", "PH", "BD", "PK", "BR"}
+        # send reports as one PNG per country by default (`-img` asks for it per command)
+        self.IMAGE_MODE = os.environ.get("REPORT_IMAGE_MODE", "").strip().lower() in ("1", "true", "yes", "on")
+
+        # Update ingress: "polling" (getUpdates) or "webhook" (built-in HTTP server, see README)
+        self.TELEGRAM_MODE = os.environ.get("TELEGRAM_MODE", "polling").strip().lower()
+        self.WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+        self.WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+        self.WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")    # public https base URL
+        self.WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram").strip("/")
+        self.WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")              # X-Telegram-Bot-Api-Secret-Token
+        # set both only if this process terminates TLS itself; behind a proxy leave them empty
+        self.WEBHOOK_CERT = os.environ.get("WEBHOOK_CERT") or None
+        self.WEBHOOK_KEY = os.environ.get("WEBHOOK_KEY") or None
+        self.WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+        # Multi-worker webhook mode: a router shards updates by chat id across workers (bot/sharding.py)
+        self.BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "1"))
+        self.BOT_WORKER_URLS = [u.strip() for u in os.environ.get("BOT_WORKER_URLS", "").split(",") if u.strip()]
+        self.WORKER_LISTEN = os.environ.get("WORKER_LISTEN", "127.0.0.1")
+        self.WORKER_PORT_BASE = int(os.environ.get("WORKER_PORT_BASE") or self.WEBHOOK_PORT + 1)
+        # what the workers share: memory:// | sqlite:///path.db | redis://host:6379/0 (bot/shared_backend.py)
+        self.SHARED_BACKEND = os.environ.get("SHARED_BACKEND", "memory://").strip()
+        self.STATE_STORE = os.environ.get("STATE_STORE", "sqlite").strip().lower()    # sqlite | backend
+        # Prometheus /metrics endpoint (bot/metrics_server.py); 0 = off
+        self.METRICS_PORT = int(os.environ.get("METRICS_PORT") or 0)
+        self.METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
         
+
         if not self.TELEGRAM_TOKEN:
             raise RuntimeError("Missing TELEGRAM_BOT_TOKEN in environment")
-        if not self.BQ_PROJECT:
-            raise RuntimeError("Missing BQ_PROJECT in environment")
\ No newline at end of file
+        if self.QUERY_BACKEND not in ("bigquery", "duckdb"):
+            raise RuntimeError(f"Unknown QUERY_BACKEND '{self.QUERY_BACKEND}'. Try: bigquery, duckdb")
+        if self.QUERY_BACKEND == "bigquery" and not self.BQ_PROJECT:
+            raise RuntimeError("Missing BQ_PROJECT in environment")
+        if self.TELEGRAM_MODE not in ("polling", "webhook"):
+            raise RuntimeError(f"Unknown TELEGRAM_MODE '{self.TELEGRAM_MODE}'. Try: polling, webhook")
+        if self.TELEGRAM_MODE == "webhook":
+            if not self.WEBHOOK_URL.startswith("https://"):
+                raise RuntimeError("TELEGRAM_MODE=webhook needs WEBHOOK_URL=https://<public host>[:port]")
+            if not self.WEBHOOK_SECRET or not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", self.WEBHOOK_SECRET):
+                raise RuntimeError("TELEGRAM_MODE=webhook needs WEBHOOK_SECRET (1-256 chars of A-Z, a-z, 0-9, _ and -)")
+            if bool(self.WEBHOOK_CERT) != bool(self.WEBHOOK_KEY):
+                raise RuntimeError("Set both WEBHOOK_CERT and WEBHOOK_KEY, or neither (TLS at the proxy)")
+        if self.STATE_STORE not in ("sqlite", "backend"):
+            raise RuntimeError(f"Unknown STATE_STORE '{self.STATE_STORE}'. Try: sqlite, backend")
+        if self.BOT_WORKERS < 1:
+            raise RuntimeError("BOT_WORKERS must be at least 1")
+        if self.worker_count > 1:
+            if self.TELEGRAM_MODE != "webhook":
+                raise RuntimeError("Several bot workers need TELEGRAM_MODE=webhook (only one process may poll)")
+            if self.SHARED_BACKEND.startswith("memory"):
+                raise RuntimeError("Several bot workers need a SHARED_BACKEND they can all reach (sqlite:// or redis://)")
+        if self.BOT_WORKER_URLS and self.STATE_STORE != "backend":
+            # the change feed only names changed keys: every node must read the records from one place
+            raise RuntimeError("BOT_WORKER_URLS (workers on other hosts) needs STATE_STORE=backend; "
+                               "with sqlite each node would keep its own logs/state.db")
+
+    @property
+    def worker_count(self) -> int:
+        return len(self.BOT_WORKER_URLS) or self.BOT_WORKERS
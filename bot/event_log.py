@@ -0,0 +1,229 @@
+# event_log.py
+"""
+Buffered writer for the logs/events-YYYYMMDD.jsonl event log.
+
+Handlers hand events to an in-memory queue and return; one background task
+drains it and appends whole batches to the day's file from a worker thread,
+so a busy group no longer costs a file open + write on the event loop per
+message.
+
+    EVENT_LOG_BATCH           events per write (default 500)
+    EVENT_LOG_FLUSH_INTERVAL  max seconds an event waits in the queue (default 1.0)
+    EVENT_LOG_QUEUE           queue capacity (default 10000)
+    EVENT_LOG_COMPRESSION     gzip (default) | zstd | none, for closed days
+
+Days are GMT+7, like the event timestamps. When the day rolls over the
+previous file is closed and compressed to events-YYYYMMDD.jsonl.gz (or .zst,
+which needs the optional `zstandard` package); leftovers from earlier runs
+are compressed at start().
+
+With several bot workers (bot/sharding.py) each one writes its own
+events-YYYYMMDD.w<i>.jsonl (the `shard` suffix), so no two processes append
+to or rotate the same file; /usage reads them all.
+
+Back-pressure: `await emit(...)` waits for room once the queue is full, so
+a slow disk slows the chatty handlers down instead of growing memory.
+log_nowait() never waits and drops (and counts) the event instead.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+TZ = ZoneInfo("Asia/Bangkok")
+COMPRESSIONS = ("gzip", "zstd", "none")
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+EVENTS_WRITTEN = metrics.counter("event_log_written_total", "Events appended to the event log")
+EVENTS_DROPPED = metrics.counter("event_log_dropped_total", "Events dropped because the event-log queue was full")
+EVENT_FLUSHES = metrics.counter("event_log_flushes_total", "Batched event-log writes")
+
+def event_file(log_dir: Path, day: str, shard: str = "") -> Path:
+    return log_dir / f"events-{day}{shard}.jsonl"
+
+def compress_file(path: Path, compression: str) -> Path:
+    """path -> path + .gz/.zst, removing the original. Returns the new path."""
+    target = path.with_name(path.name + SUFFIXES[compression])
+    tmp = target.with_name(target.name + ".tmp")
+    with path.open("rb") as src:
+        if compression == "zstd":
+            with tmp.open("wb") as dst:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+        else:
+            with gzip.open(tmp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+    tmp.replace(target)
+    path.unlink()
+    return target
+
+class EventLogWriter:
+    def __init__(self, log_dir: str | Path, *, batch_size: int | None = None, flush_interval: float | None = None,
+                 max_queue: int | None = None, compression: str | None = None, shard: str = ""):
+        self.log_dir = Path(log_dir)
+        self.shard = shard  # ".w<i>" per worker in multi-worker mode
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size or int(os.environ.get("EVENT_LOG_BATCH", "500"))
+        self.flush_interval = flush_interval or float(os.environ.get("EVENT_LOG_FLUSH_INTERVAL", "1.0"))
+        self.max_queue = max_queue or int(os.environ.get("EVENT_LOG_QUEUE", "10000"))
+        compression = (compression or os.environ.get("EVENT_LOG_COMPRESSION", "gzip")).strip().lower()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown EVENT_LOG_COMPRESSION '{compression}'. Try: {', '.join(COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("EVENT_LOG_COMPRESSION=zstd but zstandard is not installed; using gzip")
+            compression = "gzip"
+        self.compression = compression
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._compressions: set[asyncio.Task] = set()
+        # only touched from the writer thread
+        self._day: str | None = None
+        self._fh = None
+
+    # ---------- producers (event loop) ----------
+    def _item(self, payload: dict) -> tuple[str, dict]:
+        now = datetime.now(TZ)
+        payload = dict(payload)  # avoid mutating caller's dict
+        payload.setdefault("ts", now.isoformat())
+        return now.strftime("%Y%m%d"), payload
+
+    async def emit(self, payload: dict) -> None:
+        """Queue one event; waits only while the queue is full (back-pressure)."""
+        if self._queue is None:
+            return self._write_now(payload)
+        await self._queue.put(self._item(payload))
+
+    def log_nowait(self, payload: dict) -> None:
+        """Queue one event without waiting; dropped (and counted) if the queue is full."""
+        if self._queue is None:
+            return self._write_now(payload)
+        try:
+            self._queue.put_nowait(self._item(payload))
+        except asyncio.QueueFull:
+            EVENTS_DROPPED.inc()
+
+    def _write_now(self, payload: dict) -> None:
+        # before start() / after stop(): write through, like the old _log_event
+        day, payload = self._item(payload)
+        self._append(day, [payload])
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name="event-log-writer")
+        if self.compression != "none":
+            today = datetime.now(TZ).strftime("%Y%m%d")
+            own = re.compile(rf"events-(\d{{8}}){re.escape(self.shard)}\.jsonl")
+            for path in sorted(self.log_dir.glob("events-*.jsonl")):
+                m = own.fullmatch(path.name)
+                # only this writer's files: another worker may still be appending to its own
+                if m and m.group(1) != today:
+                    self._compress_later(path)
+        logger.info("Event log writer started: %s (batch %d, every %.1fs, %s)",
+                    self.log_dir, self.batch_size, self.flush_interval, self.compression)
+
+    async def stop(self) -> None:
+        """Flush everything queued, close the file and wait for pending compressions."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = self._queue = None
+        await asyncio.to_thread(self._close)
+        await self.wait_compressions()
+
+    async def wait_compressions(self) -> None:
+        """Until the closed files being compressed now (e.g. the leftovers found at start()) are done."""
+        if self._compressions:
+            await asyncio.gather(*self._compressions, return_exceptions=True)
+
+    # ---------- writer task ----------
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            deadline = loop.time() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+            stopping = item is None
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[str, dict]]) -> None:
+        # group consecutive events per day (a batch can straddle midnight)
+        runs = []
+        for day, payload in batch:
+            if runs and runs[-1][0] == day:
+                runs[-1][1].append(payload)
+            else:
+                runs.append((day, [payload]))
+        for day, payloads in runs:
+            try:
+                closed = await asyncio.to_thread(self._append, day, payloads)
+            except Exception:
+                logger.exception("Failed to write %d events for %s", len(payloads), day)
+                continue
+            if closed is not None and self.compression != "none":
+                self._compress_later(closed)
+
+    def _compress_later(self, path: Path) -> None:
+        task = asyncio.create_task(asyncio.to_thread(self._compress, path))
+        self._compressions.add(task)
+        task.add_done_callback(self._compressions.discard)
+
+    def _compress(self, path: Path) -> None:
+        try:
+            logger.info("Compressed closed event log %s", compress_file(path, self.compression))
+        except Exception:
+            logger.exception("Failed to compress %s", path)
+
+    # ---------- writer thread ----------
+    def _append(self, day: str, payloads: list[dict]) -> Path | None:
+        """Append payloads to the day's file; returns the previous day's file if this rotated."""
+        closed = None
+        if day != self._day:
+            if self._fh is not None:
+                closed = Path(self._fh.name)
+                self._fh.close()
+            self._fh = event_file(self.log_dir, day, self.shard).open("a", encoding="utf-8")
+            self._day = day
+        self._fh.write("".join(json.dumps(p, ensure_ascii=False) + "\n" for p in payloads))
+        self._fh.flush()
+        EVENTS_WRITTEN.inc(len(payloads))
+        EVENT_FLUSHES.inc()
+        return closed
+
+    def _close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._day = None
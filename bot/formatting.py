@@ -0,0 +1,173 @@
+# formatting.py
+"""
+Text-formatting kernel shared by the renderers (and main.py's /help).
+
+Per-character work uses precompiled tables (str.translate for the unicode
+styles, one compiled regex for MarkdownV2 escaping), and number formatting
+has column variants that format a whole list of values in one pass instead
+of a try/except per cell.
+"""
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+
+FIGURE_SPACE = "\u2007"  # digit-width space
+FIG = "` `"  # figure space: same width as digits in proportional fonts
+
+# ---- unicode "font" converter ----
+STYLES = {
+    "mono":          {"A":0x1D670, "a":0x1D68A, "0":0x1D7F6},  # Mathematical Monospace
+    "sans":          {"A":0x1D5A0, "a":0x1D5BA, "0":0x1D7E2},  # Sans-serif
+    "sans_bold":     {"A":0x1D5D4, "a":0x1D5EE, "0":0x1D7EC},  # Sans-serif Bold
+    "serif_bold":    {"A":0x1D400, "a":0x1D41A, "0":0x1D7CE},  # Bold
+    "serif_italic":  {"A":0x1D434, "a":0x1D44E, "0":None},     # Italic (no special digits)
+    "serif_bi":      {"A":0x1D468, "a":0x1D482, "0":None},     # Bold Italic
+    "fullwidth":     {"A":0xFF21,  "a":0xFF41,  "0":0xFF10, "space":0x3000},  # Ｆｕｌｌｗｉｄｔｈ
+}
+
+@lru_cache(maxsize=None)
+def _style_table(style: str) -> dict[int, str]:
+    spec = STYLES.get(style)
+    if not spec:
+        raise ValueError(f"Unknown style '{style}'. Try: {', '.join(STYLES)}")
+    table = {}
+    for first, count in (("A", 26), ("a", 26), ("0", 10)):
+        base = spec.get(first)
+        if base is None:
+            continue
+        for i in range(count):
+            table[ord(first) + i] = chr(base + i)
+    if style == "fullwidth" and "space" in spec:
+        table[ord(" ")] = chr(spec["space"])  # optional fullwidth space
+    return table
+
+@lru_cache(maxsize=None)
+def _unstyle_table() -> dict[int, str]:
+    table = {}
+    for style in STYLES:
+        for src, dst in _style_table(style).items():
+            table[ord(dst)] = chr(src)
+    return table
+
+def stylize(text: str, style: str = "mono") -> str:
+    return text.translate(_style_table(style))
+
+def unstylize(text: str) -> str:
+    """Inverse of stylize for every style (plain ASCII letters/digits back)."""
+    return text.translate(_unstyle_table())
+
+# ---- Telegram MarkdownV2 ----
+MD_V2_SPECIAL = "_*[]()~`>#+-=|{}.!"
+# one precompiled pass; measurably faster than str.translate with a dict table
+_MD_V2_RE = re.compile(r"([\\_*\[\]()~`>#+\-=|{}.!])")
+
+def escape_md_v2(text: str) -> str:
+    """Escape backslash and the full MarkdownV2 special set."""
+    if not text:
+        return text
+    return _MD_V2_RE.sub(r"\\\1", text)
+
+def inline_code_line(s: str) -> str:
+    # Inline-code helper: backticks inside would close the span
+    return f"`{str(s).replace('`','ˋ')}`"
+
+# ---- digit-aligned padding ----
+def count_separators(s: str) -> int:
+    return s.count("-") + s.count(",")
+
+def column_width(cells: list[str], header: str = "") -> int:
+    """Display width of a column: widest of header and cells."""
+    return max(len(header), max(map(len, cells), default=0))
+
+def column_separators(cells: list[str], header: str = "") -> int:
+    """Most '-'/',' separators in any cell of the column (header included)."""
+    return max(count_separators(header), max(map(count_separators, cells), default=0))
+
+def replace_spacing(s: str, max_sep: int, cur_sep: int) -> str:
+    """
+    Separator-aware padding hook. Cells with fewer separators than the column
+    maximum currently keep their plain spaces, so the cell is returned as is.
+    """
+    return s
+
+def right_pad_figspace(s: str, width: int) -> str:
+    # Left-pad with FIGURE_SPACE so numbers right-align visually
+    return (FIGURE_SPACE * max(0, width - len(s))) + s
+
+def pad_with_figspace(s: str, width: int, num_seps: int, align: str = "left") -> str:
+    s_count = "" if s is None else str(s).strip().replace("`","")
+    pad = max(0, width - len(s_count))
+    # num of figure spaces = pad - num_seps (if any)
+    num_inlines = max(0, pad - num_seps)
+    num_seps = 0 if pad == 0 else num_seps
+    convert_pads = (" " * num_inlines) + f"`{' ' * num_seps}`"
+    return (convert_pads + s) if align == "right" else (s + convert_pads)
+
+# ---- numbers ----
+_COMMAS0 = "{:,.0f}".format
+_FAST_NUMBER_TYPES = frozenset({int, float, bool, Decimal, np.int64, np.int32, np.float64, np.float32})
+# num_to_float goes through str(), so True/False parse as 0.0 there
+_FAST_FLOAT_TYPES = _FAST_NUMBER_TYPES - {bool}
+
+def fmt_number(x, default=0):
+    # Safe, compact formatting for ints/floats/strings
+    try:
+        if isinstance(x, str) and x.strip() == "":
+            return ""
+        n = float(x)
+        if n.is_integer():
+            return f"{int(n):,}"
+        if default == 0:
+            return f"{n:,.0f}"
+        elif default == 2:
+            return f"{n:,.2f}"
+    except Exception:
+        return str(x)
+
+def _as_list(values) -> list:
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+def fmt_number_column(values) -> list[str]:
+    """
+    fmt_number over a whole column. Purely numeric columns are converted to
+    float once and formatted with a single map; anything else (None, strings)
+    falls back to the per-cell path so the output is identical.
+    """
+    values = _as_list(values)
+    if all(type(v) in _FAST_NUMBER_TYPES for v in values):
+        arr = np.asarray(values, dtype=float) + 0.0  # -0.0 -> 0.0 like int() would
+        return list(map(_COMMAS0, arr.tolist()))
+    return [fmt_number(v) for v in values]
+
+def num_to_float(x):
+    if x is None: return 0.0
+    s = str(x).replace(",", "").replace(" ", "")
+    try:
+        return float(s)
+    except Exception:
+        return 0.0
+
+def num_to_float_column(values) -> np.ndarray:
+    values = _as_list(values)
+    if all(type(v) in _FAST_FLOAT_TYPES for v in values):
+        return np.asarray(values, dtype=float)
+    return np.asarray([num_to_float(v) for v in values], dtype=float)
+
+def fmt_commas0(x):
+    return _COMMAS0(num_to_float(x))
+
+def fmt_commas0_column(values) -> list[str]:
+    return list(map(_COMMAS0, num_to_float_column(values).tolist()))
+
+def fmt_pct_int(x):
+    if x is None: return "0"
+    return f"{num_to_float(x)*100:.0f}"
+
+def fmt_pct(val, decimals=1) -> str:
+    try:
+        v = float(val) * 100.0
+        return f"{v:.{decimals}f}%"
+    except Exception:
+        return str(val)
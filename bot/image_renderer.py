@@ -0,0 +1,112 @@
+# image_renderer.py
+"""
+PNG rendering of the text reports (image mode, `-img`).
+
+A country's report is the same list of MarkdownV2 messages the text mode
+sends; here the markup is stripped back to plain monospaced lines and drawn
+into one image, so the table no longer depends on the client's font size.
+
+Pillow is optional (requirements2.txt). Without it, or without a monospaced
+TrueType font (IMAGE_FONT; Pillow's built-in default font is proportional,
+so the columns would not line up), available() is False and the callers
+keep sending text.
+"""
+import io
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # image mode is simply unavailable
+    Image = ImageDraw = ImageFont = None
+
+from bot.formatting import unstylize
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FONT = os.environ.get("IMAGE_FONT", "DejaVuSansMono.ttf")
+IMAGE_FONT_BOLD = os.environ.get("IMAGE_FONT_BOLD", "DejaVuSansMono-Bold.ttf")
+FONT_SIZE = 18
+LINE_SPACING = 6
+PADDING = 24
+# greyscale ("L") images: the tables are black on white and L keeps the PNGs small
+BACKGROUND = 255
+TEXT_COLOR = 40
+HEADING_COLOR = 0
+
+# Telegram photo limits; bigger images go out as documents
+PHOTO_MAX_SIDES = 10000
+PHOTO_MAX_RATIO = 20
+
+# an escaped character, or a markup character (code span / bold / italic)
+_MD_V2_TOKEN = re.compile(r"\\(.)|[`*_]", re.DOTALL)
+
+class ReportImage(NamedTuple):
+    caption: str
+    png: bytes
+    width: int
+    height: int
+
+    @property
+    def fits_photo(self) -> bool:
+        return (self.width + self.height <= PHOTO_MAX_SIDES
+                and max(self.width, self.height) <= PHOTO_MAX_RATIO * min(self.width, self.height))
+
+def available() -> bool:
+    return Image is not None and _font(False) is not None
+
+def markdown_v2_to_lines(text: str) -> list[tuple[str, bool]]:
+    """(plain text, is_heading) per line of a MarkdownV2 message."""
+    lines = []
+    for raw in text.split("\n"):
+        heading = raw.lstrip().startswith("*")
+        plain = _MD_V2_TOKEN.sub(lambda m: m.group(1) or "", raw)
+        lines.append((unstylize(plain), heading))
+    return lines
+
+@lru_cache(maxsize=None)
+def _font(bold: bool):
+    """The monospaced TrueType font, or None if there is none (bold falls back to regular)."""
+    path = IMAGE_FONT_BOLD if bold else IMAGE_FONT
+    try:
+        font = ImageFont.truetype(path, FONT_SIZE)
+    except OSError:
+        font = None
+    if font is not None and font.getlength("iiii") != font.getlength("WWWW"):
+        font = None
+    if font is None:
+        if bold:
+            return _font(False)
+        logger.warning("No monospaced TrueType font at IMAGE_FONT=%s; image mode is off, reports go out as text", path)
+    return font
+
+def render_lines_png(lines: list[tuple[str, bool]]) -> tuple[bytes, int, int]:
+    regular, bold = _font(False), _font(True)
+    line_height = FONT_SIZE + LINE_SPACING
+    text_width = max(((bold if h else regular).getlength(t) for t, h in lines), default=0)
+    width = int(text_width) + 2 * PADDING
+    height = len(lines) * line_height + 2 * PADDING
+
+    img = Image.new("L", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    for i, (text, heading) in enumerate(lines):
+        if text:
+            draw.text((PADDING, PADDING + i * line_height), text,
+                      font=bold if heading else regular, fill=HEADING_COLOR if heading else TEXT_COLOR)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue(), width, height
+
+def render_messages_png(texts: list[str], caption: str) -> ReportImage:
+    """One image for a whole report: the messages one after another, a blank line apart."""
+    lines = []
+    for i, text in enumerate(texts):
+        if i:
+            lines.append(("", False))
+        lines.extend(markdown_v2_to_lines(text))
+    png, width, height = render_lines_png(lines)
+    return ReportImage(caption, png, width, height)
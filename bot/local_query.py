@@ -0,0 +1,371 @@
+# local_query.py
+"""
+Local query backend: the sql/*.sql templates run unchanged against DuckDB
+tables, so every report command works offline (development, benchmarks,
+replays) without BigQuery credentials.
+
+    QUERY_BACKEND=duckdb
+    LOCAL_DB        DuckDB database file (default data/local.duckdb; :memory: for a throwaway one)
+    LOCAL_NOW       optional ISO timestamp the templates see as "now" (CURRENT_DATE etc.), so
+                    a fixed dataset gives the same /apf and /dpf answers on any day
+
+The database holds ext_funding_tx, ext_member and account with the columns
+in SCHEMA. A missing file is created with empty tables; an existing one is
+opened read-only, so several bot workers can share it.
+
+translate_sql() rewrites the BigQuery dialect the templates use:
+
+  `project.dataset.table`      -> table (the dataset prefix is dropped)
+  `group`                      -> "group"
+  @param                       -> $param (bound by name)
+  DECLARE ...;                 -> removed (scripting; declared names are not substituted)
+  CURRENT_DATE(tz), CURRENT_TIME(tz), DATE/TIME/DATETIME/TIMESTAMP(...)
+                               -> casts and ICU timezone(); '+06:00' style zones become Etc/GMT-6
+  DATE_ADD/SUB, TIMESTAMP_ADD/SUB, *_DIFF, DATE_TRUNC(.., WEEK(MONDAY))
+  COUNTIF, SAFE_DIVIDE, GENERATE_ARRAY, UNNEST(..) AS x, FLOAT64/INT64/STRING
+                               -> their DuckDB equivalents
+
+QUALIFY, window functions, CTEs and the rest are the same in both. The
+session runs in UTC, as BigQuery does, so TIMESTAMP columns compare the same.
+A cancelled request interrupts its DuckDB query.
+"""
+import datetime
+import functools
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+from bot.admission import QueryCancelled, current_request
+from bot.query_client import JOB_POLL_SECONDS, QueryClient
+
+try:
+    import duckdb
+except ImportError:  # the local backend is simply unavailable
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+TS = "TIMESTAMPTZ"
+SCHEMA = {
+    "account": {"id": "BIGINT", "name": "VARCHAR", "group": "VARCHAR", "gamePrefix": "VARCHAR"},
+    "ext_member": {"id": "BIGINT", "accountId": "BIGINT", "apiIdentifier": "VARCHAR", "registerAt": TS},
+    "ext_funding_tx": {
+        "id": "BIGINT", "type": "VARCHAR", "status": "VARCHAR", "method": "VARCHAR", "providerKey": "VARCHAR",
+        "reqCurrency": "VARCHAR", "netCurrency": "VARCHAR", "netAmount": "DOUBLE",
+        "accountId": "BIGINT", "memberId": "BIGINT",
+        "createdAt": TS, "completedAt": TS, "updatedAt": TS, "insertedAt": TS,
+    },
+}
+
+def create_schema(con) -> None:
+    for table, columns in SCHEMA.items():
+        cols = ", ".join(f'"{name}" {kind}' for name, kind in columns.items())
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+
+def connect(path: str, read_only: bool | None = None):
+    """Open (or create, with SCHEMA) a local DuckDB database; existing files open read-only by default."""
+    if duckdb is None:
+        raise RuntimeError("QUERY_BACKEND=duckdb needs the duckdb package (requirements2.txt)")
+    if path != ":memory:" and Path(path).exists():
+        con = duckdb.connect(path, read_only=True if read_only is None else read_only)
+    else:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        con = duckdb.connect(path)
+        create_schema(con)
+    con.execute("SET TimeZone = 'UTC'")
+    return con
+
+# --- BigQuery -> DuckDB ---
+
+_CALL = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_INTERVAL = re.compile(r"^INTERVAL\s+(.+?)\s+([A-Za-z]+)$", re.I | re.S)
+_OFFSET = re.compile(r"'([+-])(\d{1,2}):00'")
+_ALIAS = re.compile(r"\s+AS\s+([A-Za-z_]\w*)", re.I)
+_TYPES = {"FLOAT64": "DOUBLE", "INT64": "BIGINT", "STRING": "VARCHAR", "BOOL": "BOOLEAN",
+          "NUMERIC": "DECIMAL(38, 9)", "BIGNUMERIC": "DOUBLE", "BYTES": "BLOB"}
+# microseconds per unit, for the truncating *_DIFF of timestamps
+_MICROS = {"MICROSECOND": 1, "MILLISECOND": 1_000, "SECOND": 1_000_000, "MINUTE": 60_000_000,
+           "HOUR": 3_600_000_000, "DAY": 86_400_000_000}
+
+def _strip_comments(sql: str) -> str:
+    """Drop -- / # / /* */ comments outside string literals and quoted identifiers."""
+    out, i, n, quote = [], 0, len(sql), None
+    while i < n:
+        ch = sql[i]
+        if quote:
+            out.append(ch)
+            if ch == "\\" and i + 1 < n:
+                out.append(sql[i + 1])
+                i += 1
+            elif ch == quote:
+                quote = None
+            i += 1
+        elif ch in "'\"`":
+            quote = ch
+            out.append(ch)
+            i += 1
+        elif sql.startswith("--", i) or ch == "#":
+            j = sql.find("\n", i)
+            i = n if j < 0 else j
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+def _closing(sql: str, start: int) -> int:
+    """Index of the ')' closing the '(' just before `start`."""
+    depth, quote = 1, None
+    for i in range(start, len(sql)):
+        ch = sql[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError(f"Unbalanced parentheses in SQL near: {sql[start - 20:start + 40]!r}")
+
+def _split_args(text: str) -> list[str]:
+    args, depth, quote, last = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(text[last:i])
+            last = i + 1
+    args.append(text[last:])
+    return [a.strip() for a in args] if text.strip() else []
+
+def _interval(arg: str) -> tuple[str, str]:
+    m = _INTERVAL.match(arg)
+    if not m:
+        raise ValueError(f"Expected 'INTERVAL <n> <unit>', got {arg!r}")
+    return m.group(1), m.group(2).upper()
+
+def _zone(arg: str) -> str:
+    """A time zone argument; fixed offsets ('+06:00') become Etc/GMT zones, which ICU knows."""
+    def etc(m):
+        hours = int(m.group(2))
+        if hours == 0:
+            return "'UTC'"
+        return f"'Etc/GMT{'-' if m.group(1) == '+' else '+'}{hours}'"
+    return _OFFSET.sub(etc, arg)
+
+def _is_zone(arg: str) -> bool:
+    """Whether the 2nd argument of DATETIME(x, y) is a zone (literal, CASE, *tz column) rather than a TIME."""
+    a = arg.strip()
+    if a.upper().startswith("TIME ") or a.upper().startswith("TIME("):
+        return False
+    return a.startswith("'") or a.upper().startswith("CASE") or re.search(r"(tz|zone)$", a, re.I) is not None
+
+def _shift(op: str, cast: str | None):
+    def rule(args):
+        n, unit = _interval(args[1])
+        expr = f"({args[0]}) {op} ({n}) * INTERVAL 1 {unit}"
+        return f"CAST({expr} AS {cast})" if cast else f"({expr})"
+    return rule
+
+def _diff_ts(args):
+    a, b, unit = args[0], args[1], args[2].upper()
+    if unit not in _MICROS:
+        return f"date_diff('{unit.lower()}', {b}, {a})"
+    return f"CAST(trunc((epoch_us({a}) - epoch_us({b})) / {_MICROS[unit]}) AS BIGINT)"
+
+def _trunc(cast: str | None):
+    def rule(args):
+        x, part = args[0], re.sub(r"\s+", "", args[1].upper())
+        if part in ("WEEK", "WEEK(SUNDAY)"):
+            expr = f"date_trunc('week', ({x}) + INTERVAL 1 DAY) - INTERVAL 1 DAY"
+        elif part in ("WEEK(MONDAY)", "ISOWEEK"):
+            expr = f"date_trunc('week', {x})"
+        elif part.startswith("WEEK("):
+            raise ValueError(f"Unsupported week start in DATE_TRUNC: {args[1]}")
+        else:
+            expr = f"date_trunc('{part.lower()}', {x})"
+        return f"CAST({expr} AS {cast})" if cast else expr
+    return rule
+
+def _date(args):
+    if len(args) == 3:
+        return f"make_date({', '.join(args)})"
+    if len(args) == 2:
+        return f"CAST(timezone({_zone(args[1])}, {args[0]}) AS DATE)"
+    return f"CAST({args[0]} AS DATE)"
+
+def _time(args):
+    if len(args) == 3:
+        return f"make_time({', '.join(args)})"
+    if len(args) == 2:
+        return f"CAST(timezone({_zone(args[1])}, {args[0]}) AS TIME)"
+    return f"CAST({args[0]} AS TIME)"
+
+def _datetime(args):
+    if len(args) == 1:
+        return f"CAST({args[0]} AS TIMESTAMP)"
+    if _is_zone(args[1]):
+        return f"timezone({_zone(args[1])}, {args[0]})"
+    return f"(CAST({args[0]} AS DATE) + {args[1]})"
+
+def _timestamp(args):
+    if len(args) == 2:
+        return f"timezone({_zone(args[1])}, CAST({args[0]} AS TIMESTAMP))"
+    return f"CAST({args[0]} AS {TS})"
+
+# now(), unless LocalQueryClient pins the clock (LOCAL_NOW)
+_NOW = "coalesce(getvariable('local_now'), now())"
+
+def _now_in(kind: str):
+    def rule(args):
+        now = f"timezone({_zone(args[0])}, {_NOW})" if args else _NOW
+        return f"CAST({now} AS {kind})" if kind else now
+    return rule
+
+_RULES = {
+    "CURRENT_DATE": _now_in("DATE"),
+    "CURRENT_TIME": _now_in("TIME"),
+    "CURRENT_DATETIME": _now_in("TIMESTAMP"),
+    "CURRENT_TIMESTAMP": lambda args: _NOW,
+    "DATE": _date,
+    "TIME": _time,
+    "DATETIME": _datetime,
+    "TIMESTAMP": _timestamp,
+    "DATE_ADD": _shift("+", "DATE"),
+    "DATE_SUB": _shift("-", "DATE"),
+    "DATETIME_ADD": _shift("+", "TIMESTAMP"),
+    "DATETIME_SUB": _shift("-", "TIMESTAMP"),
+    "TIMESTAMP_ADD": _shift("+", None),
+    "TIMESTAMP_SUB": _shift("-", None),
+    "DATE_DIFF": lambda args: f"date_diff('{args[2].lower()}', {args[1]}, {args[0]})",
+    "DATETIME_DIFF": _diff_ts,
+    "TIMESTAMP_DIFF": _diff_ts,
+    "DATE_TRUNC": _trunc("DATE"),
+    "DATETIME_TRUNC": _trunc("TIMESTAMP"),
+    "TIMESTAMP_TRUNC": _trunc(None),
+    "COUNTIF": lambda args: f"count(*) FILTER (WHERE {args[0]})",
+    "SAFE_DIVIDE": lambda args: f"(({args[0]}) / NULLIF({args[1]}, 0))",
+    "GENERATE_ARRAY": lambda args: f"generate_series({', '.join(args)})",
+}
+
+def _rewrite_calls(sql: str) -> str:
+    out, pos = [], 0
+    while True:
+        m = _CALL.search(sql, pos)
+        if m is None:
+            out.append(sql[pos:])
+            return "".join(out)
+        name = m.group(1).upper()
+        if name not in _RULES and name != "UNNEST":
+            out.append(sql[pos:m.end()])
+            pos = m.end()
+            continue
+        close = _closing(sql, m.end())
+        args = [_rewrite_calls(a) for a in _split_args(sql[m.end():close])]
+        out.append(sql[pos:m.start()])
+        pos = close + 1
+        if name == "UNNEST":
+            # FROM x, UNNEST(arr) AS d: BigQuery names the element d; DuckDB needs a column alias
+            out.append(f"UNNEST({', '.join(args)})")
+            alias = _ALIAS.match(sql, pos)
+            if alias:
+                out.append(f" AS _{alias.group(1)}({alias.group(1)})")
+                pos = alias.end()
+        else:
+            out.append(_RULES[name](args))
+
+@functools.lru_cache(maxsize=64)
+def translate_sql(sql: str) -> str:
+    """BigQuery Standard SQL (as the sql/ templates write it) -> DuckDB SQL with $name parameters."""
+    sql = _strip_comments(sql)
+    sql = re.sub(r"^\s*DECLARE\b[^;]*;", "", sql, flags=re.I | re.M)
+    sql = _rewrite_calls(sql)
+    sql = re.sub(r"`[\w-]+\.[\w-]+\.(\w+)`", r"\1", sql)      # `project.dataset.table`
+    sql = re.sub(r"`[\w-]+\.(\w+)`", r"\1", sql)              # `dataset.table`
+    sql = re.sub(r"`([^`]+)`", r'"\1"', sql)
+    sql = re.sub(r"\bAS\s+(" + "|".join(_TYPES) + r")\b", lambda m: f"AS {_TYPES[m.group(1).upper()]}",
+                 sql, flags=re.I)
+    sql = re.sub(r"(?<!@)@(\w+)", r"$\1", sql)
+    return sql.strip()
+
+def bind(params: list[tuple], sql: str) -> dict:
+    """(name, BigQuery type, value) -> {name: value} with DATE strings as dates; only the names
+    `sql` uses (DuckDB refuses extra ones)."""
+    used = set(re.findall(r"\$(\w+)", sql))
+    out = {}
+    for name, kind, value in params:
+        if name not in used:
+            continue
+        if kind == "DATE" and isinstance(value, str):
+            value = datetime.date.fromisoformat(value)
+        out[name] = value
+    return out
+
+class LocalQueryClient(QueryClient):
+    """QueryClient running the sql/ templates against a local DuckDB database."""
+
+    name = "duckdb"
+
+    def __init__(self, config, backend=None, con=None, now: datetime.datetime | None = None):
+        super().__init__(config, backend)
+        self.path = getattr(config, "LOCAL_DB", None) or os.environ.get("LOCAL_DB", "data/local.duckdb")
+        self.con = con if con is not None else connect(self.path)
+        pinned = os.environ.get("LOCAL_NOW")
+        self.now = now or (datetime.datetime.fromisoformat(pinned) if pinned else None)
+        if self.now is not None and self.now.tzinfo is None:
+            self.now = self.now.replace(tzinfo=datetime.timezone.utc)
+        logger.info("Local query backend: %s%s", self.path if con is None else "given connection",
+                    f", now pinned at {self.now.isoformat()}" if self.now else "")
+
+    def _execute(self, template: str, params: list[tuple], fetch):
+        """Run a translated template on its own cursor and return fetch(cursor); a watcher thread
+        interrupts it if the request is cancelled meanwhile. Blocking."""
+        cursor = self.con.cursor()
+        cursor.execute("SET TimeZone = 'UTC'")  # cursors do not inherit the session settings
+        if self.now is not None:
+            cursor.execute(f"SET VARIABLE local_now = TIMESTAMPTZ '{self.now.isoformat()}'")
+        req = current_request.get()
+        done = threading.Event()
+        if req is not None:
+            def watch():
+                while not done.wait(JOB_POLL_SECONDS):
+                    if req.cancelled():
+                        cursor.interrupt()
+                        return
+            threading.Thread(target=watch, name="duckdb-cancel", daemon=True).start()
+        try:
+            sql = translate_sql(self.sql(template))
+            cursor.execute(sql, bind(params, sql))
+            return fetch(cursor)
+        except duckdb.InterruptException:
+            if req is None:
+                raise
+            raise QueryCancelled(req.reason or "deadline") from None
+        finally:
+            done.set()
+            cursor.close()
+
+    def fetch_rows(self, template, params):
+        def rows(cursor):
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+        return self._execute(template, params, rows)
+
+    def fetch_frame(self, template, params):
+        return self._execute(template, params, lambda cursor: cursor.fetchdf())
@@ -0,0 +1,221 @@
+# metrics.py
+"""
+In-process counters shared by the bot modules.
+
+    HITS = metrics.counter("render_cache_hits_total", "Renders served from cache")
+    HITS.inc(kind="apf")
+
+    DEPTH = metrics.gauge("update_queue_depth", "Updates waiting to be processed")
+    DEPTH.inc(); ...; DEPTH.dec()
+
+    WAIT = metrics.histogram("bq_queue_wait_seconds", "Time queries waited for a slot")
+    WAIT.observe(0.12, lane="interactive")
+
+    with metrics.phase("render"):   # command_phase_seconds{phase, command}
+        ...                         # and a span of the update's trace (bot/tracing.py)
+
+snapshot() returns every metric with its labelled values; /stats prints it.
+exposition() is the same in the Prometheus text format, served on
+METRICS_PORT by bot/metrics_server.py.
+
+current_command is the command label of the update being handled (set per
+update by ChatOrderedProcessor); phase() files its timings under it. A
+counter inc or histogram observe costs one to two microseconds and a
+phase() block about three, twice that inside a trace
+(benchmarks/bench_metrics.py).
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+
+from bot import tracing
+
+class Counter:
+    def __init__(self, name: str, documentation: str = ""):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def samples(self) -> list[tuple[dict, float]]:
+        with self._lock:
+            return [(dict(k), v) for k, v in sorted(self._values.items())]
+
+    def series(self) -> dict[str, list[tuple[dict, float]]]:
+        return {self.name: self.samples()}
+
+class Gauge(Counter):
+    """A value that goes up and down (queue depths, work in flight)."""
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    """Observations counted into cumulative `le` buckets, plus their sum and count."""
+
+    def __init__(self, name: str, documentation: str = "", buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # labels -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][i] += 1
+            v[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            v = self._values.get(tuple(sorted(labels.items())))
+            return sum(v[0]) if v else 0
+
+    def sum(self, **labels) -> float:
+        with self._lock:
+            v = self._values.get(tuple(sorted(labels.items())))
+            return v[1] if v else 0.0
+
+    def series(self) -> dict[str, list[tuple[dict, float]]]:
+        with self._lock:
+            items = [(dict(k), list(v[0]), v[1]) for k, v in sorted(self._values.items())]
+        buckets, sums, counts = [], [], []
+        for labels, per_bucket, total in items:
+            cumulative = 0
+            for le, n in zip([*map(str, self.buckets), "+Inf"], per_bucket):
+                cumulative += n
+                buckets.append(({**labels, "le": le}, cumulative))
+            sums.append((labels, total))
+            counts.append((labels, cumulative))
+        return {f"{self.name}_bucket": buckets, f"{self.name}_sum": sums, f"{self.name}_count": counts}
+
+_REGISTRY: dict[str, Counter | Histogram] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def _get_or_create(cls, name: str, documentation: str):
+    with _REGISTRY_LOCK:
+        m = _REGISTRY.get(name)
+        if m is None:
+            m = _REGISTRY[name] = cls(name, documentation)
+        elif type(m) is not cls:
+            raise TypeError(f"metric {name!r} is already registered as a {type(m).__name__}")
+        return m
+
+def counter(name: str, documentation: str = "") -> Counter:
+    """Get or create the counter called `name`."""
+    return _get_or_create(Counter, name, documentation)
+
+def gauge(name: str, documentation: str = "") -> Gauge:
+    """Get or create the gauge called `name`."""
+    return _get_or_create(Gauge, name, documentation)
+
+def histogram(name: str, documentation: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create the histogram called `name` (`buckets` only matters the first time)."""
+    with _REGISTRY_LOCK:
+        m = _REGISTRY.get(name)
+        if m is None:
+            m = _REGISTRY[name] = Histogram(name, documentation, buckets)
+        elif type(m) is not Histogram:
+            raise TypeError(f"metric {name!r} is already registered as a {type(m).__name__}")
+        return m
+
+def snapshot() -> dict[str, list[tuple[dict, float]]]:
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    out = {}
+    for m in metrics:
+        out.update(m.series())
+    return out
+
+def format_snapshot(buckets: bool = False) -> str:
+    """Plain-text listing, one `name{label="v"} value` line per sample (histograms: _sum/_count only
+    unless `buckets`)."""
+    lines = []
+    for name, samples in sorted(snapshot().items()):
+        if not buckets and name.endswith("_bucket") and isinstance(_REGISTRY.get(name[:-7]), Histogram):
+            continue
+        if not samples:
+            lines.append(f"{name} 0")
+        for labels, value in samples:
+            lbl = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{lbl}}} {value:g}" if lbl else f"{name} {value:g}")
+    return "\n".join(lines)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def exposition() -> str:
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _REGISTRY_LOCK:
+        metrics = sorted(_REGISTRY.values(), key=lambda m: m.name)
+    lines = []
+    for m in metrics:
+        kind = "histogram" if isinstance(m, Histogram) else "gauge" if isinstance(m, Gauge) else "counter"
+        if m.documentation:
+            doc = m.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {m.name} {doc}")
+        lines.append(f"# TYPE {m.name} {kind}")
+        for name, samples in m.series().items():
+            for labels, value in samples:
+                lbl = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{lbl}}} {_number(value)}" if lbl else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+# ---------- per-command phases ----------
+# the command the current update runs ("apf", "help", ...); set per update by ChatOrderedProcessor
+current_command: contextvars.ContextVar[str] = contextvars.ContextVar("metrics_command", default="other")
+
+PHASE_SECONDS = histogram("command_phase_seconds",
+                          "Time spent per command phase: auth, query, transform, render, send",
+                          buckets=(0.0005, 0.001, 0.0025, *DEFAULT_BUCKETS))
+
+class phase:
+    """
+    Time a block as one phase of the current command: `with metrics.phase("query"): ...`
+    It is also a trace span, named `span` (e.g. "execute_pmh_query") or after the phase,
+    with `attrs` on the span only.
+    """
+
+    __slots__ = ("name", "started", "span")
+
+    def __init__(self, name: str, span: str | None = None, **attrs):
+        self.name = name
+        self.span = tracing.span(span or name, phase=name, **attrs) if tracing.active() else None
+
+    def __enter__(self):
+        if self.span is not None:
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        PHASE_SECONDS.observe(time.perf_counter() - self.started, phase=self.name, command=current_command.get())
+        if self.span is not None:
+            self.span.__exit__(*exc)
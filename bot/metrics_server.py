@@ -0,0 +1,44 @@
+# metrics_server.py
+"""
+Prometheus scrape endpoint for the in-process metrics (bot/metrics.py).
+
+    METRICS_PORT     serve GET /metrics on this port; 0 / unset: no endpoint (default)
+    METRICS_LISTEN   address to bind (default 127.0.0.1: scrape from the same host or a sidecar)
+
+The server runs on the bot's event loop (tornado, as the webhook does) and
+only formats the registry when scraped. Every process counts its own
+metrics: with sharded workers the router serves METRICS_PORT and worker i
+serves METRICS_PORT + 1 + i, so scrape each of them.
+"""
+import logging
+
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as TornadoApp, RequestHandler
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.write(metrics.exposition())
+
+class MetricsServer:
+    def __init__(self):
+        self._server: HTTPServer | None = None
+
+    def start(self, listen: str, port: int) -> HTTPServer:
+        """Start serving on the running loop."""
+        self._server = HTTPServer(TornadoApp([("/metrics", _MetricsHandler)]))
+        self._server.listen(port, address=listen)
+        logger.info("Metrics on http://%s:%d/metrics", listen, port)
+        return self._server
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
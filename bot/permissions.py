@@ -0,0 +1,83 @@
+# permissions.py
+"""
+Compiled command permissions: one int bitmask per restricted chat and user.
+
+Bit i stands for commands[i] (main.LIST_VALID_COMMANDS). The masks are built
+once from group_policies / registered_users at startup and then updated one
+entry at a time when /permission, /start or a token redemption changes them,
+so an authorization check is a dict lookup and a bit test.
+
+Same rules as before:
+- a group/supergroup with a policy allows exactly the policy's commands
+  (an empty list allows nothing), for everyone in it;
+- otherwise a user with a non-empty allowed_commands list is limited to it;
+- no policy and no list (or an empty one) means full access.
+Unknown command names in the stored lists are ignored.
+"""
+import logging
+from collections.abc import Iterable, Mapping
+
+logger = logging.getLogger(__name__)
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+class PermissionIndex:
+    def __init__(self, commands: Iterable[str]):
+        self.commands = tuple(commands)
+        self.bits = {c: 1 << i for i, c in enumerate(self.commands)}
+        self.all_mask = (1 << len(self.commands)) - 1
+        self.chat_masks: dict[int, int] = {}  # chats with a group policy
+        self.user_masks: dict[int, int] = {}  # users with a restricted list
+
+    # ---------- compile ----------
+    def mask_of(self, commands: Iterable[str] | None) -> int:
+        mask = 0
+        for c in commands or ():
+            mask |= self.bits.get(str(c).strip().lower(), 0)
+        return mask
+
+    def names(self, mask: int) -> list[str]:
+        """Commands in `mask`, in command-list order."""
+        return [c for c, bit in self.bits.items() if mask & bit]
+
+    def set_chat_policy(self, chat_id, allowed_commands: Iterable[str] | None) -> None:
+        self.chat_masks[int(chat_id)] = self.mask_of(allowed_commands)
+
+    def remove_chat_policy(self, chat_id) -> None:
+        self.chat_masks.pop(int(chat_id), None)
+
+    def set_user(self, user_id: int, allowed_commands: Iterable[str] | None) -> None:
+        if allowed_commands:
+            self.user_masks[int(user_id)] = self.mask_of(allowed_commands)
+        else:
+            self.user_masks.pop(int(user_id), None)  # None / [] => full access
+
+    def load(self, users: Mapping[int, dict], policies: Mapping[str, dict]) -> "PermissionIndex":
+        """Full rebuild (startup)."""
+        self.user_masks.clear()
+        self.chat_masks.clear()
+        for uid, info in users.items():
+            self.set_user(uid, (info or {}).get("allowed_commands"))
+        for chat_id, policy in policies.items():
+            try:
+                self.set_chat_policy(chat_id, (policy or {}).get("allowed_commands"))
+            except ValueError:
+                logger.warning("Ignoring group policy with non-numeric chat id %r", chat_id)
+        return self
+
+    # ---------- check ----------
+    def chat_mask(self, chat_id: int, chat_type: str | None) -> int | None:
+        """The group policy mask, or None if the chat has no policy (or is not a group)."""
+        if chat_type in GROUP_CHAT_TYPES:
+            return self.chat_masks.get(chat_id)
+        return None
+
+    def user_mask(self, user_id: int) -> int:
+        return self.user_masks.get(user_id, self.all_mask)
+
+    def effective_mask(self, chat_id: int | None, chat_type: str | None, user_id: int | None) -> int:
+        mask = self.chat_mask(chat_id, chat_type)
+        return mask if mask is not None else self.user_mask(user_id)
+
+    def allows(self, chat_id: int | None, chat_type: str | None, user_id: int | None, cmd: str) -> bool:
+        return bool(self.effective_mask(chat_id, chat_type, user_id) & self.bits.get(cmd, 0))
@@ -0,0 +1,215 @@
+# profiling.py
+"""
+On-demand CPU profiles of live commands, switched on by an admin (/profile).
+
+    PROFILE_TOP           functions per list in the written report (default 40)
+    PROFILE_MAX_SECONDS   longest a "next N commands" session waits for them (default 600)
+
+A session runs cProfile on the event-loop thread either until N commands
+(optionally of one name) have finished or for a time window. Work the
+session sends to the render and image pools (bot/workers.py) is profiled
+too: that is where the table_renderer builders and their pandas run. On
+Python 3.12+ the loop's profiler already sees every thread; pool processes
+(and threads on older Pythons) run each call under their own profiler and
+the stats are merged in. The loop
+profile covers everything the loop did meanwhile, so other chats' commands
+are in it too. cProfile makes the Python code it sees two to four times
+slower (benchmarks/bench_profiling.py), so keep sessions short.
+
+When the session ends the report is written to <logs>/profiles/:
+profile-YYYYMMDD-HHMMSS.txt (top PROFILE_TOP by cumulative and by own time)
+and .pstats (for snakeviz / pstats). summary() is the short version the
+admin gets in the chat. Profiles are per process: with sharded workers only
+the worker serving the admin's chat is profiled.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", "40"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "600"))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@dataclass
+class Session:
+    out_dir: Path
+    on_report: Callable[[str], Awaitable]   # sends the summary to the admin chat
+    commands: int | None = None              # stop after this many finished commands...
+    seconds: float | None = None             # ...or after this long
+    only: str | None = None                  # count only this command
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+    pool_calls: int = 0
+    pool_stats: list[dict] = field(default_factory=list)   # from pool processes / pre-3.12 threads
+    done: list[tuple[str, float]] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    cpu_started: float = field(default_factory=time.process_time)
+    wall: float = 0.0   # seconds and process CPU seconds, set when it stops
+    cpu: float = 0.0
+    stamp: str = field(default_factory=lambda: datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y%m%d-%H%M%S"))
+    timer: asyncio.TimerHandle | None = None
+
+    def describe(self) -> str:
+        what = f"/{self.only}" if self.only else "commands"
+        if self.commands is not None:
+            return f"the next {self.commands} {what} (at most {PROFILE_MAX_SECONDS:.0f}s)"
+        return f"{what} for {self.seconds:.0f}s"
+
+_session: Session | None = None
+_reports: set[asyncio.Task] = set()
+
+def active() -> bool:
+    return _session is not None
+
+def start(out_dir: Path, on_report: Callable[[str], Awaitable], commands: int | None = None,
+          seconds: float | None = None, only: str | None = None) -> Session:
+    """Start profiling the loop thread (call on the loop). Raises RuntimeError if a session is running."""
+    global _session
+    if _session is not None:
+        raise RuntimeError(f"already profiling {_session.describe()}")
+    session = Session(out_dir, on_report, commands, seconds, only)
+    session.profile.enable()  # ValueError if another profiler (a debugger, coverage) holds the thread
+    _session = session
+    session.timer = asyncio.get_running_loop().call_later(
+        seconds if seconds is not None else PROFILE_MAX_SECONDS, stop)
+    logger.info("Profiling %s", session.describe())
+    return session
+
+def command_done(command: str, seconds: float) -> None:
+    """Count a finished command; ends a "next N commands" session at the Nth."""
+    s = _session
+    if s is None or (s.only is not None and command != s.only):
+        return
+    s.done.append((command, seconds))
+    if s.commands is not None and len(s.done) >= s.commands:
+        stop()
+
+def stop() -> Session | None:
+    """End the session now; the report is written and sent in the background."""
+    global _session
+    s, _session = _session, None
+    if s is None:
+        return None
+    s.profile.disable()
+    s.wall, s.cpu = time.perf_counter() - s.started, time.process_time() - s.cpu_started
+    if s.timer is not None:
+        s.timer.cancel()
+    task = asyncio.get_running_loop().create_task(_report(s))
+    _reports.add(task)
+    task.add_done_callback(_reports.discard)
+    return s
+
+async def close() -> None:
+    """On shutdown: end a running session and wait for the reports being written."""
+    stop()
+    if _reports:
+        await asyncio.gather(*_reports, return_exceptions=True)
+
+# ---------- pool side ----------
+def run_profiled(fn, args: tuple, kwargs: dict) -> tuple:
+    """Runs in a pool thread or process: fn(*args, **kwargs) under its own profiler, plus its raw stats."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ thread: the session's profiler is process-wide and already sees this call
+        return fn(*args, **kwargs), None
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+def add_pool_stats(stats: dict | None) -> None:
+    if _session is not None:
+        _session.pool_calls += 1
+        if stats is not None:
+            _session.pool_stats.append(stats)
+
+class _RawStats:
+    """What pstats.Stats.add() takes: an object with create_stats() and .stats."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+# ---------- report ----------
+def _where(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # builtins: "<method 'join' of 'str' objects>"
+    path = os.path.relpath(filename, ROOT) if filename.startswith(ROOT) else os.path.basename(filename)
+    return f"{path}:{line}({name})"
+
+_NOT_OURS = ("site-packages", f"{os.sep}benchmarks{os.sep}", __file__)
+# the loop and pool threads waiting for work: time, but not CPU anyone can save
+_IDLE = ("<method 'poll' of 'select.epoll' objects>", "<method 'select' of 'select.select' objects>",
+         "<built-in method time.sleep>", "<method 'acquire' of '_thread.lock' objects>")
+
+def _top(stats: pstats.Stats, key: int, n: int, ours: bool = False) -> list[tuple]:
+    """(calls, own s, cumulative s, where) of the n heaviest by own (key=2) or cumulative (key=3) time,
+    waits for I/O or work left out; `ours`: only functions of this repo."""
+    rows = [(nc, tt, ct, func) for func, (cc, nc, tt, ct, _) in stats.stats.items()
+            if func[2] not in _IDLE
+            and (not ours or (func[0].startswith(ROOT) and not any(d in func[0] for d in _NOT_OURS)))]
+    rows.sort(key=lambda r: r[key - 1], reverse=True)
+    return [(nc, tt, ct, _where(func)) for nc, tt, ct, func in rows[:n]]
+
+def _table(rows: list[tuple]) -> str:
+    lines = [f"{'calls':>8} {'own s':>8} {'cum s':>8}  function"]
+    lines += [f"{nc:>8} {tt:>8.3f} {ct:>8.3f}  {where}" for nc, tt, ct, where in rows]
+    return "\n".join(lines)
+
+def _merged(s: Session) -> pstats.Stats:
+    stats = pstats.Stats(s.profile, stream=io.StringIO())
+    for raw in s.pool_stats:
+        stats.add(_RawStats(raw))
+    return stats
+
+def summary(s: Session, stats: pstats.Stats, top: int = 12) -> str:
+    cmds = ", ".join(f"{c} {sec:.1f}s" for c, sec in s.done[:10]) + (" …" if len(s.done) > 10 else "")
+    return "\n".join([
+        f"Profile {s.stamp}: {len(s.done)} command(s) in {s.wall:.1f}s, "
+        f"process CPU {s.cpu:.1f}s, {s.pool_calls} render pool call(s)",
+        cmds or "(no commands finished)",
+        "",
+        "Bot code by cumulative time:",
+        _table(_top(stats, 3, top, ours=True)),
+        "",
+        "Everything by own time:",
+        _table(_top(stats, 2, top)),
+    ])
+
+def write_report(s: Session) -> tuple[str, Path]:
+    """Merge the stats, write profile-<stamp>.txt and .pstats; returns (chat summary, txt path)."""
+    stats = _merged(s)
+    s.out_dir.mkdir(parents=True, exist_ok=True)
+    path = s.out_dir / f"profile-{s.stamp}.txt"
+    stats.dump_stats(path.with_suffix(".pstats"))
+    listing = io.StringIO()
+    stats.stream = listing
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+    stats.sort_stats("tottime").print_stats(PROFILE_TOP)
+    path.write_text(f"{summary(s, stats, PROFILE_TOP)}\n\n{listing.getvalue()}", encoding="utf-8")
+    return summary(s, stats), path
+
+async def _report(s: Session) -> None:
+    try:
+        text, path = await asyncio.to_thread(write_report, s)
+        logger.info("Profile written to %s", path)
+        await s.on_report(f"{text}\n\nFull report: {path}")
+    except Exception:
+        logger.exception("Could not write or send the profile report")
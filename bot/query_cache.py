@@ -0,0 +1,124 @@
+# query_cache.py
+"""
+Short-lived cache of BigQuery results, shared by every worker.
+
+BigQueryClient asks here before running a query: the key is the query name
+plus its parameters, the value the pickled result rows, stored in the
+SHARED_BACKEND (bot/shared_backend.py) with a TTL. When a report is
+requested from many chats at once (report time), each worker or repeat
+request within the TTL reuses one result instead of running its own job.
+
+    QUERY_CACHE_TTL   seconds a result is reused (default 60; 0 disables)
+    QUERY_STALE_TTL   seconds the last result is kept as a fallback (default 86400; 0 disables)
+    QUERY_STALE_MAX   fallback copies kept per query name (default 32)
+
+The reports already say "data up to HH:MM", so a minute-old result is what
+a user at most sees. Separately, the last result of each query is kept
+with its time for QUERY_STALE_TTL: get_stale() is what a command is
+answered with while BigQuery is down (bot/resilience.py). Every distinct
+set of arguments (each /dist <date>) is its own copy, so per query name
+only the QUERY_STALE_MAX most recently stored ones are kept; older ones
+are deleted. The bound is per worker: each one tracks the copies it wrote.
+Values are pickled: the backend must be trusted.
+"""
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+from typing import Awaitable, Callable
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_HITS = metrics.counter("query_cache_hits_total", "Query results served from the shared cache")
+QUERY_CACHE_MISSES = metrics.counter("query_cache_misses_total", "Queries run because the cache had no result")
+STALE_SERVED = metrics.counter("query_stale_served_total", "Query results served stale while BigQuery was unavailable")
+
+class QueryCache:
+    def __init__(self, backend, ttl: float | None = None, stale_ttl: float | None = None,
+                 stale_max: int | None = None):
+        self.backend = backend
+        self.ttl = float(os.environ.get("QUERY_CACHE_TTL", "60")) if ttl is None else ttl
+        self.stale_ttl = float(os.environ.get("QUERY_STALE_TTL", "86400")) if stale_ttl is None else stale_ttl
+        self.stale_max = int(os.environ.get("QUERY_STALE_MAX", "32")) if stale_max is None else stale_max
+        # query name -> fallback keys this process stored, least recently stored first
+        self._stale_keys: dict[str, collections.OrderedDict] = {}
+        self._stale_lock = threading.Lock()  # put() runs on worker threads with a shared backend
+
+    @staticmethod
+    def key(name: str, **params) -> str:
+        digest = hashlib.blake2b(repr(sorted(params.items())).encode(), digest_size=12).hexdigest()
+        return f"query:{name}:{digest}"
+
+    def get(self, name: str, **params):
+        """Cached rows or None. Blocking; a backend failure counts as a miss."""
+        if self.ttl <= 0:
+            return None
+        try:
+            raw = self.backend.get(self.key(name, **params))
+        except Exception:
+            logger.exception("Query cache read failed for %s", name)
+            raw = None
+        (QUERY_CACHE_HITS if raw is not None else QUERY_CACHE_MISSES).inc(query=name)
+        return None if raw is None else pickle.loads(raw)
+
+    def put(self, name: str, rows, **params) -> None:
+        if self.ttl <= 0 and self.stale_ttl <= 0:
+            return
+        key = self.key(name, **params)
+        raw = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+        try:
+            if self.ttl > 0:
+                self.backend.set(key, raw, ttl=self.ttl)
+            if self.stale_ttl > 0:
+                # the fallback copy: stored-at time (8 bytes) + the same pickle
+                self.backend.set(f"stale:{key}", struct.pack("<d", time.time()) + raw, ttl=self.stale_ttl)
+                for old in self._track_stale(name, f"stale:{key}"):
+                    self.backend.delete(old)
+        except Exception:
+            logger.exception("Query cache write failed for %s", name)
+
+    def _track_stale(self, name: str, key: str) -> list[str]:
+        """Note a stored fallback copy; returns the copies of `name` beyond stale_max to delete."""
+        with self._stale_lock:
+            keys = self._stale_keys.setdefault(name, collections.OrderedDict())
+            keys[key] = None
+            keys.move_to_end(key)
+            return [keys.popitem(last=False)[0] for _ in range(max(0, len(keys) - max(self.stale_max, 1)))]
+
+    def get_stale(self, name: str, **params) -> tuple[object, float] | None:
+        """(rows, unix time they were stored) of the last result, however old, or None. Blocking."""
+        if self.stale_ttl <= 0:
+            return None
+        try:
+            raw = self.backend.get(f"stale:{self.key(name, **params)}")
+        except Exception:
+            logger.exception("Stale query cache read failed for %s", name)
+            return None
+        if raw is None:
+            return None
+        STALE_SERVED.inc(query=name)
+        return pickle.loads(raw[8:]), struct.unpack("<d", raw[:8])[0]
+
+    async def get_stale_async(self, name: str, **params) -> tuple[object, float] | None:
+        if getattr(self.backend, "shared", False):
+            return await asyncio.to_thread(self.get_stale, name, **params)
+        return self.get_stale(name, **params)
+
+    async def get_or_run(self, name: str, run: Callable[[], Awaitable], **params):
+        # a shared backend is a network/disk round trip: keep it off the event loop
+        shared = getattr(self.backend, "shared", False)
+        rows = await asyncio.to_thread(self.get, name, **params) if shared else self.get(name, **params)
+        if rows is None:
+            rows = await run()
+            if shared:
+                await asyncio.to_thread(self.put, name, rows, **params)
+            else:
+                self.put(name, rows, **params)
+        return rows
@@ -0,0 +1,251 @@
+# query_client.py
+"""
+The report queries, independent of where they run.
+
+QueryClient holds what every backend shares: the execute_*_query methods
+the handlers await, the result cache (bot/query_cache.py), the scheduler
+lanes (bot/query_scheduler.py), the breaker and retries
+(bot/resilience.py), cancellation and the stale-result fallback, and the
+brand-mapping merge of the pmh reports. A backend only says how to run one
+sql/<template>.sql with its parameters (fetch_rows / fetch_frame):
+
+    QUERY_BACKEND   bigquery (default): bot/bq_client.py, BigQuery jobs
+                    duckdb: bot/local_query.py, the same templates against
+                    local ext_funding_tx / ext_member / account tables (LOCAL_DB)
+
+Parameters are (name, type, value) triples with BigQuery type names
+("STRING", "DATE"); DATE values are 'YYYY-MM-DD' strings.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+import pandas as pd
+
+from bot import metrics, tracing
+from bot.admission import QueryCancelled, current_request
+from bot.query_cache import QueryCache
+from bot.query_scheduler import INTERACTIVE, QueryScheduler
+from bot.resilience import RETRIES, BreakerOpen, CircuitBreaker, backoff, is_transient
+from bot.shared_backend import MemoryBackend
+
+logger = logging.getLogger(__name__)
+# directory = "//home//ubuntu//sql"
+directory = ".//sql"
+
+# how often a running query checks whether its request was cancelled
+JOB_POLL_SECONDS = 0.5
+
+JOBS_CANCELLED = metrics.counter("bq_jobs_cancelled_total", "BigQuery jobs cancelled before they finished")
+CANCELLED_SLOT_SECONDS = metrics.counter("bq_cancelled_slot_seconds_total",
+                                         "Slot time spent on BigQuery jobs that were then cancelled")
+JOBS_STARTED = metrics.counter("bq_jobs_total", "Query jobs started, by query and backend")
+JOB_SECONDS = metrics.histogram("bq_job_seconds", "Run time of query jobs that finished, by query and backend")
+
+def _query(name: str):
+    """Make a blocking query method async: served from QueryCache (keyed by its arguments) when a
+    fresh result is there, otherwise run on a thread once QueryScheduler grants a slot in the request's lane.
+
+    Under a QueryRequest the query is its own task: cancelling the request, passing its deadline or
+    cancelling the caller cancels the running query, and the caller gets QueryCancelled. An interactive
+    request whose query cannot run (breaker open, transient failures) gets the last stored result
+    instead, and request.stale_since says how old it is. The whole call is the command's "query" phase,
+    traced as a span named after the method with "slot" (scheduler wait) and "job" below it; no job
+    span means the result came from the cache."""
+    def wrap(fn):
+        async def call(self, *args):
+            run = lambda: self._run(name, fn, args)
+            req = current_request.get()
+            if req is None:
+                return await self.query_cache.get_or_run(name, run, args=args)
+            req.check()
+            task = asyncio.ensure_future(self.query_cache.get_or_run(name, run, args=args))
+            req.tasks.add(task)
+            try:
+                return await asyncio.wait_for(task, req.remaining())
+            except asyncio.CancelledError:
+                if req.reason is not None and not asyncio.current_task().cancelling():
+                    raise QueryCancelled(req.reason) from None
+                req.mark("abandoned")
+                raise
+            except Exception as e:
+                if isinstance(e, TimeoutError) and req.expired():
+                    raise QueryCancelled(req.mark("deadline")) from None
+                if req.lane != INTERACTIVE or not (isinstance(e, BreakerOpen) or is_transient(e)):
+                    raise
+                stale = await self.query_cache.get_stale_async(name, args=args)
+                if stale is None:
+                    raise
+                rows, stored_at = stale
+                logger.warning("Serving %s%r from %.0fs ago: %s", name, args, time.time() - stored_at, e)
+                req.stale_since = stored_at if req.stale_since is None else min(req.stale_since, stored_at)
+                return rows
+            finally:
+                req.tasks.discard(task)
+
+        @functools.wraps(fn)
+        async def inner(self, *args):
+            with metrics.phase("query", fn.__name__, args=", ".join(map(str, args))):
+                return await call(self, *args)
+        return inner
+    return wrap
+
+class QueryClient:
+    """Base of the query backends; subclasses implement fetch_rows and fetch_frame."""
+
+    name = "query"
+
+    def __init__(self, config, backend=None):
+        self.config = config
+        # results shared across workers through SHARED_BACKEND (see bot/query_cache.py)
+        self.query_cache = QueryCache(backend or MemoryBackend())
+        # BQ_MAX_JOBS at once over the interactive / scheduled / batch lanes (bot/query_scheduler.py)
+        self.scheduler = QueryScheduler()
+        # transient failures are retried QUERY_RETRIES times; repeated ones open the breaker (bot/resilience.py)
+        self.breaker = CircuitBreaker(self.name)
+        self.retries = int(os.environ.get("QUERY_RETRIES", "2"))
+                # ▼▼▼ NEW: LOAD BRAND MAPPING CSV AT STARTUP ▼▼▼
+        try:
+            mapping_path = f"{directory}//brand_mapping.csv"
+            self.brand_mapping_df = pd.read_csv(mapping_path)
+            # Ensure the 'brand' column is lowercase for consistent joining
+            self.brand_mapping_df['brand'] = self.brand_mapping_df['brand'].str.upper()
+            logger.info("Successfully loaded brand_mapping.csv")
+        except FileNotFoundError:
+            logger.error("FATAL: brand_mapping.csv not found! The bot may not function correctly.")
+            self.brand_mapping_df = pd.DataFrame() # Create empty df to avoid errors
+
+    # --- what a backend implements (blocking; run on a scheduler thread) ---
+
+    def fetch_rows(self, template: str, params: list[tuple]) -> list[dict]:
+        """Run sql/<template>.sql and return its rows as dicts."""
+        raise NotImplementedError
+
+    def fetch_frame(self, template: str, params: list[tuple]) -> pd.DataFrame:
+        """Run sql/<template>.sql and return its result as a DataFrame."""
+        raise NotImplementedError
+
+    @staticmethod
+    def sql(template: str) -> str:
+        with open(f"{directory}//{template}.sql", "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _fetch(self, template: str, params: list[tuple], frame: bool = False):
+        try:
+            return self.fetch_frame(template, params) if frame else self.fetch_rows(template, params)
+        except QueryCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Error executing {template} query: {e}")
+            raise
+
+    async def _run(self, name: str, fn, args):
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                rows = await self._run_once(name, fn, args)
+            except (QueryCancelled, asyncio.CancelledError):
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success()  # the backend answered; the query itself failed
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                RETRIES.inc(target=self.name, reason=type(e).__name__)
+                logger.warning("Retrying %s%r after %s (attempt %d)", name, args, e, attempt + 1)
+                await asyncio.sleep(backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return rows
+
+    async def _run_once(self, name: str, fn, args):
+        waiting = tracing.begin("slot")
+        async with self.scheduler.slot():
+            tracing.end(waiting)
+            started = time.perf_counter()
+            JOBS_STARTED.inc(query=name, backend=self.name)
+            job = asyncio.ensure_future(asyncio.to_thread(fn, self, *args))
+            try:
+                with tracing.span("job", backend=self.name):
+                    rows = await asyncio.shield(job)
+                JOB_SECONDS.observe(time.perf_counter() - started, query=name, backend=self.name)
+                return rows
+            except asyncio.CancelledError:
+                req = current_request.get()
+                # the thread sees the reason within JOB_POLL_SECONDS and cancels its job; keep the slot till then
+                reason = req.mark("deadline" if req.expired() else "abandoned") if req is not None else "abandoned"
+                await asyncio.wait({job})
+                if not job.cancelled() and isinstance(job.exception(), QueryCancelled):
+                    JOBS_CANCELLED.inc(query=name, reason=reason)
+                    CANCELLED_SLOT_SECONDS.inc(time.perf_counter() - started, reason=reason)
+                raise
+
+    # --- the report queries ---
+
+    @_query("apf")
+    def execute_apf_query(self, target_country):
+        return self._fetch("apf_function", [("target_country", "STRING", target_country)])
+
+    # ▼ NEW: for /dist
+    @_query("dist")
+    def execute_dist_query(self, target_date: str, selected_country: str | None):
+        """
+        Distribution (channels by country) for an EXACT local date (Asia/Bangkok).
+        Params:
+        - target_date: 'YYYY-MM-DD'
+        - selected_country: STRING or None
+        """
+        return self._fetch("dist_function", [
+            ("target_date", "DATE", target_date),
+            ("selected_country", "STRING", selected_country),
+        ])
+
+    @_query("dpf")
+    def execute_dpf_query(self, target_country: str | None):
+        """
+        Deposit Performance (DPF): last 3 local days, capped at 'now'.
+        Optional filter by country (TH/PH/BD/PK/ID) when target_country is provided.
+        """
+        return self._fetch("dpf_function", [("target_country", "STRING", target_country)])
+
+    @_query("pmh")
+    def execute_pmh_query(self, target_date: str, selected_country: str | None) -> list[dict]:
+        """
+        Executes the Payment Health query for a specific date and optional country.
+        """
+        df = self._fetch("pmh_function", [
+            ("target_date", "DATE", target_date),
+            ("selected_country", "STRING", selected_country),
+        ], frame=True)
+        df_final = df.merge(self.brand_mapping_df, how = "left")
+        logger.debug("pmh rows:\n%s", df_final.head(10))
+        return df_final.to_dict(orient='records')
+
+    @_query("pmh_week")
+    def execute_pmh_week_query(self, as_of_date: str, selected_country: str | None) -> list[dict]:
+        df = self._fetch("pmh_week_function", [
+            ("as_of_date", "DATE", as_of_date),
+            ("selected_country", "STRING", selected_country),
+        ], frame=True)
+
+        # keep your mapping behavior (brand upper)
+        df["brand"] =  df["brand"].str.upper().str.strip()
+        df_final = df.merge(self.brand_mapping_df, how="left")
+        logger.debug("pmh_week brands without a mapping: %s", df_final[df_final["group_name"].isna()]["brand"].unique())
+        return df_final.to_dict(orient="records")
+
+def open_query_client(config, backend=None) -> QueryClient:
+    """The QueryClient for config.QUERY_BACKEND (bigquery | duckdb); backends are imported on demand."""
+    if config.QUERY_BACKEND == "duckdb":
+        from bot.local_query import LocalQueryClient
+        return LocalQueryClient(config, backend)
+    if config.QUERY_BACKEND == "bigquery":
+        from bot.bq_client import BigQueryClient
+        return BigQueryClient(config, backend)
+    raise ValueError(f"Unknown QUERY_BACKEND '{config.QUERY_BACKEND}'. Try: bigquery, duckdb")
@@ -0,0 +1,176 @@
+# query_scheduler.py
+"""
+BigQuery job slots, shared by three lanes.
+
+    interactive   report commands. First in line for every free slot; the
+                  waiters take turns by chat (round-robin), so one chat
+                  firing ten queries cannot starve the others.
+    scheduled     periodic refreshes. While fewer than BQ_SCHEDULED_SHARE
+                  of them run, they get the next free slot even ahead of
+                  interactive waiters; beyond that they come after them.
+    batch         backfills. Only when nobody else waits, at most
+                  BQ_BATCH_MAX_JOBS at a time, and submitted with BigQuery's
+                  BATCH priority (see BigQueryClient).
+
+    BQ_MAX_JOBS          jobs running at once across lanes (default 4)
+    BQ_SCHEDULED_SHARE   slots the scheduled lane may claim ahead of interactive (default 1)
+    BQ_BATCH_MAX_JOBS    cap on concurrent batch jobs (default 1)
+
+A query's lane and queue key come from the current QueryRequest
+(bot/admission.py): handlers get "interactive" keyed by chat; refreshes and
+backfills wrap their calls in `admission.lane("scheduled")` /
+`admission.lane("batch")`. Slots are never held idle: with no scheduled
+work, interactive queries use all of them. The limits are per process.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Hashable
+
+from bot import metrics
+from bot.admission import current_request
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, SCHEDULED, BATCH = "interactive", "scheduled", "batch"
+LANES = (INTERACTIVE, SCHEDULED, BATCH)
+
+JOBS_RUNNING = metrics.gauge("bq_jobs_running", "BigQuery jobs holding a slot")
+JOBS_QUEUED = metrics.gauge("bq_jobs_queued", "BigQuery jobs waiting for a slot")
+QUEUE_WAIT = metrics.histogram("bq_queue_wait_seconds", "Time BigQuery jobs waited for a slot",
+                               buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+class _FairQueue:
+    """Waiters in one FIFO per key; popped round-robin across keys."""
+
+    def __init__(self):
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+
+    def __bool__(self) -> bool:
+        return bool(self._queues)
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def push(self, key, fut: asyncio.Future) -> None:
+        self._queues.setdefault(key, deque()).append(fut)
+
+    def pop(self) -> asyncio.Future:
+        key, q = next(iter(self._queues.items()))
+        fut = q.popleft()
+        if q:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        return fut
+
+    def discard(self, key, fut: asyncio.Future) -> None:
+        q = self._queues.get(key)
+        if q is not None and fut in q:
+            q.remove(fut)
+            if not q:
+                del self._queues[key]
+
+    def position(self, key, fut: asyncio.Future) -> int:
+        """1-based place of `fut` in the order the waiters will be served."""
+        # round r serves the r-th waiter of every key, in rotation order
+        k = self._queues[key].index(fut)
+        ahead, earlier_in_rotation = 0, True
+        for other, q in self._queues.items():
+            if other == key:
+                earlier_in_rotation = False
+            ahead += min(len(q), k) + (earlier_in_rotation and len(q) > k)
+        return ahead + 1
+
+class QueryScheduler:
+    def __init__(self, max_jobs: int | None = None, scheduled_share: int | None = None,
+                 batch_max_jobs: int | None = None):
+        env = os.environ.get
+        self.max_jobs = max_jobs or int(env("BQ_MAX_JOBS", "4"))
+        self.scheduled_share = int(env("BQ_SCHEDULED_SHARE", "1")) if scheduled_share is None else scheduled_share
+        self.batch_max_jobs = batch_max_jobs or int(env("BQ_BATCH_MAX_JOBS", "1"))
+        self.running = dict.fromkeys(LANES, 0)
+        self._waiting = {lane: _FairQueue() for lane in LANES}
+
+    def queued(self, lane: str | None = None) -> int:
+        return len(self._waiting[lane]) if lane else sum(len(q) for q in self._waiting.values())
+
+    def _next_lane(self) -> str | None:
+        """The lane the next free slot goes to, or None."""
+        if self._waiting[SCHEDULED] and self.running[SCHEDULED] < self.scheduled_share:
+            return SCHEDULED
+        if self._waiting[INTERACTIVE]:
+            return INTERACTIVE
+        if self._waiting[SCHEDULED]:
+            return SCHEDULED
+        if self._waiting[BATCH] and self.running[BATCH] < self.batch_max_jobs:
+            return BATCH
+        return None
+
+    def _dispatch(self) -> None:
+        while sum(self.running.values()) < self.max_jobs:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            fut = self._waiting[lane].pop()
+            JOBS_QUEUED.dec(lane=lane)
+            if fut.done():  # cancelled while queued
+                continue
+            self.running[lane] += 1
+            JOBS_RUNNING.inc(lane=lane)
+            fut.set_result(None)
+
+    async def acquire(self, lane: str = INTERACTIVE, key=None) -> float:
+        """Wait for a slot in `lane`; returns the seconds waited."""
+        if lane not in self._waiting:
+            raise ValueError(f"unknown query lane {lane!r}")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting[lane].push(key, fut)
+        JOBS_QUEUED.inc(lane=lane)
+        self._dispatch()
+        if fut.done():
+            QUEUE_WAIT.observe(0.0, lane=lane)
+            return 0.0
+        started = time.perf_counter()
+        try:
+            req = current_request.get()
+            if req is not None and req.notify is not None and not req.notified:
+                req.notified = True
+                try:
+                    await req.notify(self._waiting[lane].position(key, fut))
+                except Exception:
+                    logger.exception("Failed to send the queue position")
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(lane)  # the slot was handed over just as we were cancelled
+            else:
+                fut.cancel()
+                self._waiting[lane].discard(key, fut)
+                JOBS_QUEUED.dec(lane=lane)
+            raise
+        waited = time.perf_counter() - started
+        QUEUE_WAIT.observe(waited, lane=lane)
+        return waited
+
+    def release(self, lane: str = INTERACTIVE) -> None:
+        self.running[lane] -= 1
+        JOBS_RUNNING.dec(lane=lane)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str | None = None, key=None):
+        """Hold a slot for one job; lane and key default to the current request's."""
+        req = current_request.get()
+        if lane is None:
+            lane = req.lane if req is not None else INTERACTIVE
+        if key is None and req is not None:
+            key = req.chat_id
+        await self.acquire(lane, key)
+        try:
+            yield
+        finally:
+            self.release(lane)
@@ -0,0 +1,92 @@
+# render_cache.py
+"""
+Memoized report renders.
+
+The send_* functions in table_renderer build a list of outgoing messages and
+then send them. The build step is cached here under a fingerprint of the
+input data plus every parameter that shows up in the output (max_width, the
+"up to HH:MM" header minute, the target date, ...). A repeat delivery of the
+same data within the same header minute is then just the sends.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Callable
+
+import pandas as pd
+
+from bot import metrics
+
+RENDER_CACHE_HITS = metrics.counter("render_cache_hits_total", "Report renders served from the render cache")
+RENDER_CACHE_MISSES = metrics.counter("render_cache_misses_total", "Report renders built from scratch")
+
+def _feed(h, data) -> None:
+    if isinstance(data, pd.DataFrame):
+        h.update(repr((list(data.columns), [str(t) for t in data.dtypes])).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        except TypeError:
+            # unhashable cells (e.g. list values in total_count)
+            h.update(pickle.dumps(data.to_dict("split")))
+    elif isinstance(data, Mapping):
+        for k in sorted(data, key=str):
+            h.update(repr(k).encode())
+            _feed(h, data[k])
+    else:
+        h.update(repr(data).encode())
+
+def fingerprint(data, **params) -> str:
+    """Cheap content hash of `data` (rows, {country: rows} or a DataFrame) and `params`."""
+    h = hashlib.blake2b(digest_size=16)
+    _feed(h, data)
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+class RenderCache:
+    """Small thread-safe LRU of rendered message tuples."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, kind: str, data, **params) -> tuple[str, str]:
+        return (kind, fingerprint(data, **params))
+
+    def get(self, key: tuple[str, str]) -> tuple | None:
+        """Cached messages for `key` (counted as a hit) or None (counted as a miss)."""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        (RENDER_CACHE_HITS if cached is not None else RENDER_CACHE_MISSES).inc(kind=key[0])
+        return cached
+
+    def put(self, key: tuple[str, str], value) -> tuple:
+        value = tuple(value)
+        if self.max_entries <= 0:
+            return value
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_or_build(self, kind: str, build: Callable[[], list], data, **params) -> tuple:
+        key = self.key(kind, data, **params)
+        cached = self.get(key)
+        return cached if cached is not None else self.put(key, build())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+render_cache = RenderCache(int(os.environ.get("RENDER_CACHE_SIZE", "128")))
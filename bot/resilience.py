@@ -0,0 +1,227 @@
+# resilience.py
+"""
+Circuit breakers and retries for the two backends a report depends on.
+
+CircuitBreaker   closed -> open after BREAKER_FAILURES consecutive transient
+                 failures; while open, calls fail at once; after
+                 BREAKER_RESET seconds one trial call goes through
+                 (half-open) and its outcome closes or re-opens it.
+backoff()        full-jitter exponential delay between retries, so workers
+                 and chats retrying together do not hit the backend in step.
+
+BigQueryClient retries a query that failed transiently (5xx, rate limits,
+connection errors) up to QUERY_RETRIES times behind its breaker; when the
+breaker is open, or the retries run out, a command is answered from the
+last stored result (QueryCache.get_stale) with a "stale since HH:MM" banner.
+
+ResilientRequest wraps the Bot API request used for sends: connection
+errors and 5xx are retried, short RetryAfter (429) waits are honoured
+(TELEGRAM_MAX_RETRY_AFTER), and while Telegram keeps failing the breaker
+fails sends at once instead of tying up handlers in timeouts.
+
+    BREAKER_FAILURES           consecutive failures that open a breaker (default 5)
+    BREAKER_RESET              seconds a breaker stays open before a trial call (default 30)
+    QUERY_RETRIES              retries of a transiently failed BigQuery job (default 2)
+    TELEGRAM_RETRIES           retries of a failed Bot API call (default 2)
+    TELEGRAM_MAX_RETRY_AFTER   longest RetryAfter slept through in place (default 5)
+
+Breakers are per process. Every Bot API call is counted by method and status
+(telegram_requests_total, telegram_request_seconds, telegram_retry_after_total,
+telegram_errors_total) and, inside an update, traced as a span named after the
+method with its retries as events.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional, Tuple
+
+from telegram.error import NetworkError, TimedOut
+from telegram.request import BaseRequest, RequestData
+
+from bot import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+BREAKER_STATE = metrics.gauge("breaker_state", "Circuit breaker state: 0 closed, 1 open, 2 half-open")
+BREAKER_OPENED = metrics.counter("breaker_opened_total", "Times a circuit breaker opened")
+BREAKER_REJECTED = metrics.counter("breaker_rejected_total", "Calls failed at once by an open breaker")
+RETRIES = metrics.counter("retries_total", "Calls retried after a transient failure")
+TELEGRAM_REQUESTS = metrics.counter("telegram_requests_total", "Bot API calls answered, by method and HTTP status")
+TELEGRAM_SECONDS = metrics.histogram("telegram_request_seconds", "Bot API call time, by method")
+TELEGRAM_RETRY_AFTER = metrics.counter("telegram_retry_after_total", "Bot API calls answered 429 (RetryAfter), by method")
+TELEGRAM_ERRORS = metrics.counter("telegram_errors_total", "Bot API calls that got no answer, by method and error")
+
+# HTTP statuses and BigQuery error reasons worth retrying
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+TRANSIENT_REASONS = {"backendError", "internalError", "rateLimitExceeded", "jobRateLimitExceeded"}
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Seconds to wait before retry `attempt` (1, 2, ...): uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a BigQuery call failed because of the service rather than the query."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    if getattr(exc, "code", None) in TRANSIENT_STATUS:
+        return True
+    return any(isinstance(e, dict) and e.get("reason") in TRANSIENT_REASONS for e in getattr(exc, "errors", None) or ())
+
+class BreakerOpen(Exception):
+    """Raised instead of calling a backend whose breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable right now; retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int | None = None, reset_after: float | None = None):
+        self.name = name
+        self.failure_threshold = failures or int(os.environ.get("BREAKER_FAILURES", "5"))
+        self.reset_after = float(os.environ.get("BREAKER_RESET", "30")) if reset_after is None else reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, breaker=name)
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUE[state], breaker=self.name)
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic()) if self.state == OPEN else 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open state only one trial call at a time."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self.opened_at + self.reset_after:
+                self._set(HALF_OPEN)
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        BREAKER_REJECTED.inc(breaker=self.name)
+        return False
+
+    def check(self) -> None:
+        if not self.allow():
+            raise BreakerOpen(self.name, self.retry_in() or self.reset_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                logger.info("%s breaker closed", self.name)
+                self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning("%s breaker opened after %d failure(s)", self.name, self.failures)
+                self._set(OPEN)
+                self.opened_at = time.monotonic()
+                BREAKER_OPENED.inc(breaker=self.name)
+
+    def release(self) -> None:
+        """End a call that neither succeeded nor failed (e.g. cancelled), freeing the half-open trial."""
+        with self._lock:
+            self._probing = False
+
+class ResilientRequest(BaseRequest):
+    """BaseRequest wrapper adding retries, short RetryAfter waits and a circuit breaker."""
+
+    def __init__(self, inner: BaseRequest, retries: int | None = None, max_retry_after: float | None = None):
+        self.inner = inner
+        self.retries = int(os.environ.get("TELEGRAM_RETRIES", "2")) if retries is None else retries
+        self.max_retry_after = (float(os.environ.get("TELEGRAM_MAX_RETRY_AFTER", "5"))
+                                if max_retry_after is None else max_retry_after)
+        self.breaker = CircuitBreaker("telegram")
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    @staticmethod
+    def _retry_after(payload: bytes) -> float | None:
+        try:
+            return float(json.loads(payload)["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        with tracing.span(endpoint):
+            return await self._do_request(url, endpoint, method, request_data, read_timeout, write_timeout,
+                                          connect_timeout, pool_timeout)
+
+    async def _do_request(self, url, endpoint, method, request_data, read_timeout, write_timeout,
+                          connect_timeout, pool_timeout) -> Tuple[int, bytes]:
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise NetworkError(f"Telegram API unavailable (breaker open, retry in {self.breaker.retry_in():.0f}s)")
+            started = time.perf_counter()
+            try:
+                status, payload = await self.inner.do_request(url, method, request_data, read_timeout,
+                                                              write_timeout, connect_timeout, pool_timeout)
+            except TimedOut:
+                # the request may have arrived: resending could post the message twice
+                TELEGRAM_ERRORS.inc(method=endpoint, error="TimedOut")
+                self.breaker.record_failure()
+                raise
+            except NetworkError as e:
+                TELEGRAM_ERRORS.inc(method=endpoint, error=type(e).__name__)
+                self.breaker.record_failure()
+                if attempt >= self.retries:
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=endpoint)
+                TELEGRAM_REQUESTS.inc(method=endpoint, status=status)
+                tracing.annotate(status=status)
+                if status == 429:
+                    TELEGRAM_RETRY_AFTER.inc(method=endpoint)
+                if status < 500:
+                    self.breaker.record_success()
+                    retry_after = self._retry_after(payload) if status == 429 else None
+                    if retry_after is None or retry_after > self.max_retry_after or attempt >= self.retries:
+                        return status, payload
+                    RETRIES.inc(target="telegram", reason="retry_after")
+                    tracing.event("retry_after", seconds=retry_after)
+                    attempt += 1
+                    await asyncio.sleep(retry_after)
+                    continue
+                self.breaker.record_failure()
+                if attempt >= self.retries:
+                    return status, payload
+            attempt += 1
+            RETRIES.inc(target="telegram", reason="error")
+            tracing.event("retry", attempt=attempt + 1)
+            logger.info("Retrying %s (attempt %d)", endpoint, attempt + 1)
+            await asyncio.sleep(backoff(attempt))
@@ -0,0 +1,192 @@
+# sharding.py
+"""
+Multi-worker webhook mode: one router, N bot worker processes.
+
+    BOT_WORKERS        number of worker processes (default 1: no router, plain webhook)
+    WORKER_LISTEN      address the workers' internal servers bind (default 127.0.0.1)
+    WORKER_PORT_BASE   worker i listens on WORKER_PORT_BASE + i (default WEBHOOK_PORT + 1)
+    BOT_WORKER_URLS    comma-separated http://host:port of workers started elsewhere
+                       (`python main.py worker <i>` on each node); no local spawning then
+
+The router owns the public webhook (WEBHOOK_URL/WEBHOOK_PATH, secret token).
+For every update it reads the chat id from the raw JSON and forwards the
+body unchanged to worker `chat_id % N`, answering Telegram with the worker's
+status (so a failed hand-off is retried by Telegram). The same chat always
+lands on the same worker, whose ChatOrderedProcessor keeps it in order.
+
+A worker is an ordinary RealTimeBot Application without an Updater: its
+WorkerIngress server accepts forwarded updates (checking the secret header)
+and puts them on the update queue. Users, permissions and query results are
+shared through SHARED_BACKEND (bot/shared_backend.py, bot/shared_state.py).
+"""
+import asyncio
+import json
+import logging
+
+from telegram import Update
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as TornadoApp, RequestHandler
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+WORKER_PATH = "update"
+
+ROUTED = metrics.counter("router_updates_total", "Updates forwarded by the shard router")
+ROUTE_FAILURES = metrics.counter("router_failures_total", "Updates a worker did not accept")
+
+# update fields that carry a chat, directly or on their message
+_CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                "chat_member", "chat_join_request", "message_reaction", "message_reaction_count",
+                "chat_boost", "removed_chat_boost")
+_USER_FIELDS = ("inline_query", "chosen_inline_result", "callback_query", "shipping_query",
+                "pre_checkout_query", "poll_answer")
+
+def shard_key(update: dict) -> int:
+    """Chat id of a raw update; the user id when there is no chat; else the update id."""
+    for field in _CHAT_FIELDS:
+        obj = update.get(field)
+        if isinstance(obj, dict) and isinstance(obj.get("chat"), dict):
+            return int(obj["chat"]["id"])
+    cq = update.get("callback_query")
+    if isinstance(cq, dict) and isinstance(cq.get("message"), dict) and isinstance(cq["message"].get("chat"), dict):
+        return int(cq["message"]["chat"]["id"])
+    for field in _USER_FIELDS:
+        obj = update.get(field)
+        if isinstance(obj, dict):
+            sender = obj.get("from") or obj.get("user")
+            if isinstance(sender, dict) and "id" in sender:
+                return int(sender["id"])
+    return int(update.get("update_id", 0))
+
+def shard_for(update: dict, shards: int) -> int:
+    # Python's % is non-negative for a positive divisor, so group ids (< 0) spread too
+    return shard_key(update) % shards
+
+# ---------- router (public webhook) ----------
+class _RouterHandler(RequestHandler):
+    def initialize(self, worker_urls: list[str], secret: str | None, client: AsyncHTTPClient):
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.client = client
+
+    async def post(self):
+        if self.secret is not None and self.request.headers.get(SECRET_HEADER) != self.secret:
+            self.set_status(403)
+            return
+        try:
+            update = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        shard = shard_for(update, len(self.worker_urls))
+        headers = {"Content-Type": "application/json"}
+        if self.secret is not None:
+            headers[SECRET_HEADER] = self.secret
+        try:
+            await self.client.fetch(HTTPRequest(self.worker_urls[shard], method="POST",
+                                                 body=self.request.body, headers=headers))
+            ROUTED.inc(worker=shard)
+            self.set_status(200)
+        except HTTPClientError as e:
+            ROUTE_FAILURES.inc(worker=shard)
+            # 599 is tornado's "no response" (timeout, refused): not a status to hand on
+            self.set_status(e.code if 500 <= e.code < 599 else 502)
+        except Exception:
+            logger.exception("Forwarding update %s to worker %d failed", update.get("update_id"), shard)
+            ROUTE_FAILURES.inc(worker=shard)
+            self.set_status(502)
+
+class ShardRouter:
+    def __init__(self, worker_urls: list[str], url_path: str, secret: str | None = None,
+                 max_clients: int = 100):
+        if not worker_urls:
+            raise ValueError("ShardRouter needs at least one worker URL")
+        self.worker_urls = [f"{u.rstrip('/')}/{WORKER_PATH}" for u in worker_urls]
+        self.url_path = "/" + url_path.strip("/")
+        self.secret = secret
+        self.client = AsyncHTTPClient(force_instance=True, max_clients=max_clients)
+        self._server: HTTPServer | None = None
+
+    def app(self) -> TornadoApp:
+        return TornadoApp([(self.url_path, _RouterHandler,
+                            {"worker_urls": self.worker_urls, "secret": self.secret, "client": self.client})])
+
+    def start(self, listen: str, port: int, ssl_options=None) -> HTTPServer:
+        """Start serving on the running loop."""
+        self._server = HTTPServer(self.app(), ssl_options=ssl_options, xheaders=True)
+        self._server.listen(port, address=listen)
+        return self._server
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
+        self.client.close()
+
+# ---------- worker side ----------
+class _IngressHandler(RequestHandler):
+    # not "application": tornado passes its own app under that name
+    def initialize(self, bot_app, secret: str | None):
+        self.bot_app = bot_app
+        self.secret = secret
+
+    async def post(self):
+        if self.secret is not None and self.request.headers.get(SECRET_HEADER) != self.secret:
+            self.set_status(403)
+            return
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except Exception:
+            logger.exception("Worker got an unreadable update")
+            self.set_status(400)
+            return
+        await self.bot_app.update_queue.put(update)
+        self.set_status(200)
+
+class WorkerIngress:
+    """HTTP endpoint a worker's Application receives routed updates on."""
+
+    def __init__(self, application, secret: str | None = None):
+        self.application = application
+        self.secret = secret
+        self._server: HTTPServer | None = None
+
+    def start(self, listen: str, port: int) -> HTTPServer:
+        app = TornadoApp([(f"/{WORKER_PATH}", _IngressHandler,
+                           {"bot_app": self.application, "secret": self.secret})])
+        self._server = HTTPServer(app)
+        self._server.listen(port, address=listen)
+        return self._server
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
+
+async def serve_worker(application, listen: str, port: int, secret: str | None,
+                       stop: asyncio.Event) -> None:
+    """Run `application` fed by a WorkerIngress until `stop` is set (same hooks as run_webhook)."""
+    ingress = WorkerIngress(application, secret)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        ingress.start(listen, port)
+        logger.info("Worker listening on %s:%d/%s", listen, port, WORKER_PATH)
+        await stop.wait()
+    finally:
+        await ingress.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
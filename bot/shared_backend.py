@@ -0,0 +1,361 @@
+# shared_backend.py
+"""
+Key-value backends for state that several bot workers have to share.
+
+    SHARED_BACKEND   memory:// (default) | sqlite:///path/to/shared.db | redis://host:6379/0
+    MEMORY_BACKEND_MAX_KEYS   keys with a TTL the memory backend holds at most (default 10000)
+
+All three offer the same small interface: plain keys with an optional TTL
+(get/set/setnx/delete/incr) and hashes (hget/hset/hgetall) for record tables.
+Values are bytes; callers pick the encoding.
+
+  memory   dicts in this process. Nothing is shared (shared = False), which is
+           all a single worker needs. Expired keys are swept on every set(),
+           and past MEMORY_BACKEND_MAX_KEYS the keys closest to expiry go
+           first; keys without a TTL (counters) are never evicted.
+  sqlite   one SQLite file in WAL mode. Every worker on a host (or on a
+           shared disk that supports SQLite locking) opens the same file.
+  redis    any server speaking the Redis protocol (RESP2), across nodes. The
+           client is a plain socket, so no extra package is needed;
+           benchmarks/fake_redis.py is the stand-in used locally.
+
+Calls block; code on the event loop wraps them in asyncio.to_thread or runs
+them on its own thread (see bot/shared_state.py).
+"""
+import heapq
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_keys: int | None = None):
+        self.max_keys = max_keys or int(os.environ.get("MEMORY_BACKEND_MAX_KEYS", "10000"))
+        self._values: dict[str, tuple[bytes, float | None]] = {}
+        self._hashes: dict[str, dict[str, bytes]] = {}
+        # (expires, key) of every key set with a TTL; entries of keys since overwritten or deleted are skipped
+        self._expiries: list[tuple[float, str]] = []
+        self._ttl_keys = 0  # live keys with a TTL
+        self._lock = threading.Lock()
+
+    def _put(self, key: str, item: tuple[bytes, float | None] | None) -> None:
+        """Replace or (None) remove a plain key, keeping the TTL bookkeeping. Caller holds the lock."""
+        old = self._values.pop(key, None)
+        if old is not None and old[1] is not None:
+            self._ttl_keys -= 1
+        if item is not None:
+            self._values[key] = item
+            if item[1] is not None:
+                self._ttl_keys += 1
+                heapq.heappush(self._expiries, (item[1], key))
+
+    def _sweep(self, now: float) -> None:
+        """Drop expired keys, then the ones closest to expiry beyond max_keys. Caller holds the lock."""
+        heap = self._expiries
+        while heap and (heap[0][0] <= now or self._ttl_keys > self.max_keys):
+            expires, key = heapq.heappop(heap)
+            item = self._values.get(key)
+            if item is not None and item[1] == expires:
+                self._put(key, None)
+        if len(heap) > 2 * self._ttl_keys + 1024:
+            # mostly entries of overwritten keys: rebuild
+            self._expiries = [(e, k) for e, k in heap if self._values.get(k, (b"", None))[1] == e]
+            heapq.heapify(self._expiries)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.monotonic():
+                self._put(key, None)
+                return None
+            return item[0]
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._put(key, (bytes(value), now + ttl if ttl else None))
+            self._sweep(now)
+
+    def setnx(self, key: str, value: bytes) -> bool:
+        with self._lock:
+            item = self._values.get(key)
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                return False
+            self._put(key, (bytes(value), None))
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._put(key, None)
+            self._hashes.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._values.get(key, (b"0", None))[0]) + amount
+            self._put(key, (str(value).encode(), None))
+            return value
+
+    def hget(self, name: str, field: str) -> bytes | None:
+        with self._lock:
+            return self._hashes.get(name, {}).get(field)
+
+    def hset(self, name: str, field: str, value: bytes) -> None:
+        with self._lock:
+            self._hashes.setdefault(name, {})[field] = bytes(value)
+
+    def hgetall(self, name: str) -> dict[str, bytes]:
+        with self._lock:
+            return dict(self._hashes.get(name, {}))
+
+    def close(self) -> None:
+        pass
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key      TEXT PRIMARY KEY,
+    value    BLOB NOT NULL,
+    expires  REAL                -- unix time; NULL = never
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    name     TEXT NOT NULL,
+    field    TEXT NOT NULL,
+    value    BLOB NOT NULL,
+    PRIMARY KEY (name, field)
+);
+"""
+
+class SQLiteBackend:
+    shared = True
+
+    def __init__(self, path: str | Path, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        # one connection per thread; SQLite serializes the writers across processes
+        self._local = threading.local()
+        self._conn().executescript(SQLITE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        conn = self._conn()
+        conn.execute("INSERT INTO kv (key, value, expires) VALUES (?, ?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                     (key, bytes(value), time.time() + ttl if ttl else None))
+        if ttl:
+            # keep the file from growing with expired cache entries
+            conn.execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+
+    def setnx(self, key: str, value: bytes) -> bool:
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE key = ? AND expires <= ?", (key, time.time()))
+        return conn.execute("INSERT INTO kv (key, value, expires) VALUES (?, ?, NULL) ON CONFLICT(key) DO NOTHING",
+                            (key, bytes(value))).rowcount == 1
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        conn.execute("DELETE FROM hashes WHERE name = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = int(row[0] if row else 0) + amount
+            conn.execute("INSERT INTO kv (key, value, expires) VALUES (?, ?, NULL) "
+                         "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = NULL",
+                         (key, str(value).encode()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def hget(self, name: str, field: str) -> bytes | None:
+        row = self._conn().execute("SELECT value FROM hashes WHERE name = ? AND field = ?", (name, field)).fetchone()
+        return row[0] if row else None
+
+    def hset(self, name: str, field: str, value: bytes) -> None:
+        self._conn().execute("INSERT INTO hashes (name, field, value) VALUES (?, ?, ?) "
+                             "ON CONFLICT(name, field) DO UPDATE SET value = excluded.value",
+                             (name, field, bytes(value)))
+
+    def hgetall(self, name: str) -> dict[str, bytes]:
+        return dict(self._conn().execute("SELECT field, value FROM hashes WHERE name = ?", (name,)))
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class RedisError(Exception):
+    pass
+
+class RedisBackend:
+    """
+    Minimal RESP2 client: one socket, one command at a time. A command that
+    fails before it reaches the server is sent again on a new connection;
+    once it is written, only a command that is safe to apply twice is
+    (an INCRBY is not: the server may have applied it before the reply got lost).
+    """
+    shared = True
+    RETRY_AFTER_SEND = frozenset({"GET", "SET", "DEL", "HGET", "HSET", "HGETALL"})
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: str | None = None, timeout: float = 5.0):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock: socket.socket | None = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    # ---------- protocol ----------
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._roundtrip(("AUTH", self.password))
+        if self.db:
+            self._roundtrip(("SELECT", self.db))
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            finally:
+                self._sock = self._file = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def _roundtrip(self, args):
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    def _stale(self) -> bool:
+        """True if the server has closed the idle connection (readable, but at EOF)."""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            return bool(readable) and self._sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def command(self, *args):
+        with self._lock:
+            for attempt in (0, 1):
+                sent = False
+                try:
+                    if self._sock is not None and self._stale():
+                        self._disconnect()
+                    if self._sock is None:
+                        self._connect()
+                    # sendall raises unless every byte went out, and the server ignores a partial command
+                    self._sock.sendall(self._encode(args))
+                    sent = True
+                    return self._read()
+                except (ConnectionError, socket.timeout, OSError):
+                    self._disconnect()
+                    if attempt or (sent and str(args[0]).upper() not in self.RETRY_AFTER_SEND):
+                        raise
+
+    # ---------- interface ----------
+    def get(self, key: str) -> bytes | None:
+        return self.command("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        if ttl:
+            self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+        else:
+            self.command("SET", key, value)
+
+    def setnx(self, key: str, value: bytes) -> bool:
+        return self.command("SET", key, value, "NX") is not None
+
+    def delete(self, key: str) -> None:
+        self.command("DEL", key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self.command("INCRBY", key, amount)
+
+    def hget(self, name: str, field: str) -> bytes | None:
+        return self.command("HGET", name, field)
+
+    def hset(self, name: str, field: str, value: bytes) -> None:
+        self.command("HSET", name, field, value)
+
+    def hgetall(self, name: str) -> dict[str, bytes]:
+        flat = self.command("HGETALL", name) or []
+        return {flat[i].decode(): flat[i + 1] for i in range(0, len(flat), 2)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+BACKENDS = ("memory", "sqlite", "redis")
+
+def open_backend(url: str | None = None):
+    """memory:// | sqlite:///abs/path.db (sqlite://rel/path.db) | redis://[:password@]host[:port][/db]"""
+    url = (url or "memory://").strip()
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend()
+    if parsed.scheme == "sqlite":
+        path = (parsed.netloc + parsed.path) if parsed.netloc else parsed.path
+        if not path:
+            raise ValueError("SHARED_BACKEND=sqlite needs a path, e.g. sqlite:///srv/bot/shared.db")
+        return SQLiteBackend(path)
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisBackend(parsed.hostname or "127.0.0.1", parsed.port or 6379,
+                            int(db) if db else 0, parsed.password)
+    raise ValueError(f"Unknown SHARED_BACKEND '{url}'. Try: memory://, sqlite:///path.db, redis://host:6379/0")
@@ -0,0 +1,173 @@
+# shared_state.py
+"""
+Users, invite tokens and group policies when several workers serve the bot.
+
+Every worker keeps RealTimeBot's dicts and PermissionIndex as its read
+cache. Two pieces keep those caches in step across processes:
+
+BackendStateStore   the StateStore interface (load_*/put_*/close) over a
+                    bot/shared_backend.py backend: one hash per table, one
+                    JSON record per field. Used with STATE_STORE=backend,
+                    typically on Redis when the workers sit on several
+                    nodes. With the default STATE_STORE=sqlite, workers on
+                    one host simply share the same STATE_DB file.
+
+StateChanges        a change feed in the shared backend. After a write has
+                    landed, publish() bumps `state:version` and records
+                    (kind, key) under `state:change:<version>` for a day.
+                    Before each update, a worker polls the version (one
+                    GET) and reloads just the records that changed.
+
+    STATE_STORE   sqlite (default) | backend
+
+With the in-process memory backend nothing is shared and both are no-ops.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("user", "token", "policy")
+TABLES = {"user": "state:users", "token": "state:invite_tokens", "policy": "state:group_policies"}
+
+def _dump(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False).encode()
+
+class BackendStateStore:
+    def __init__(self, backend):
+        self.backend = backend
+        self.path = getattr(backend, "path", None) or type(backend).__name__
+        # one thread talks to the backend; handlers never block on it
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+
+    def _load_all(self, kind: str) -> dict:
+        return {k: json.loads(v) for k, v in self.backend.hgetall(TABLES[kind]).items()}
+
+    def _load_one(self, kind: str, key) -> dict | None:
+        value = self.backend.hget(TABLES[kind], str(key))
+        return None if value is None else json.loads(value)
+
+    def _write(self, kind: str, key, value: bytes) -> None:
+        try:
+            self.backend.hset(TABLES[kind], str(key), value)
+        except Exception:
+            logger.exception("State store write failed: %s %s", kind, key)
+
+    # ---------- callers ----------
+    def load_users(self) -> dict[int, dict]:
+        return {int(k): v for k, v in self._executor.submit(self._load_all, "user").result().items()}
+
+    def load_tokens(self) -> dict[str, dict]:
+        return self._executor.submit(self._load_all, "token").result()
+
+    def load_group_policies(self) -> dict[str, dict]:
+        return self._executor.submit(self._load_all, "policy").result()
+
+    def load_user(self, user_id: int) -> dict | None:
+        return self._executor.submit(self._load_one, "user", int(user_id)).result()
+
+    def load_token(self, invite_id: str) -> dict | None:
+        return self._executor.submit(self._load_one, "token", invite_id).result()
+
+    def load_group_policy(self, chat_id) -> dict | None:
+        return self._executor.submit(self._load_one, "policy", chat_id).result()
+
+    # records are serialized here, on the caller's side, like StateStore's rows
+    def put_user(self, user_id: int, info: dict) -> Future:
+        return self._executor.submit(self._write, "user", int(user_id), _dump(info))
+
+    def put_token(self, invite_id: str, data: dict) -> Future:
+        return self._executor.submit(self._write, "token", invite_id, _dump(data))
+
+    def put_group_policy(self, chat_id, policy: dict) -> Future:
+        return self._executor.submit(self._write, "policy", chat_id, _dump(policy))
+
+    def seed_from(self, store) -> int:
+        """Copy every record of another store (e.g. the local StateStore) if this one is still empty."""
+        if any(self._executor.submit(self._load_all, kind).result() for kind in KINDS):
+            return 0
+        n = 0
+        for uid, info in store.load_users().items():
+            self.put_user(uid, info)
+            n += 1
+        for invite_id, data in store.load_tokens().items():
+            self.put_token(invite_id, data)
+            n += 1
+        for chat_id, policy in store.load_group_policies().items():
+            self.put_group_policy(chat_id, policy)
+            n += 1
+        self._executor.submit(lambda: None).result()
+        logger.info("Seeded the shared state store with %d records", n)
+        return n
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+class StateChanges:
+    VERSION = "state:version"
+    ENTRY = "state:change:{}"
+    ENTRY_TTL = 24 * 3600
+    # a version whose entry is still missing after this long was lost (crashed writer)
+    MISSING_GRACE = 5.0
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.enabled = bool(backend.shared)
+        # read before the caches are loaded, so nothing written in between is missed
+        self.seen = int(self.backend.get(self.VERSION) or 0) if self.enabled else 0
+        self._missing_since: float | None = None
+        self._lock = threading.Lock()  # concurrent updates poll from several threads
+
+    def publish(self, kind: str, key) -> None:
+        if not self.enabled:
+            return
+        try:
+            version = self.backend.incr(self.VERSION)
+            self.backend.set(self.ENTRY.format(version), json.dumps([kind, str(key)]).encode(), ttl=self.ENTRY_TTL)
+        except Exception:
+            logger.exception("Failed to publish state change %s %s", kind, key)
+
+    def publish_after(self, future: Future, kind: str, key) -> Future:
+        """Publish once `future` (a put_* write) is done; runs on the store thread."""
+        if self.enabled:
+            future.add_done_callback(lambda _: self.publish(kind, key))
+        return future
+
+    def poll(self) -> list[tuple[str, str]] | None:
+        """(kind, key) changed since the last poll, oldest first; None means reload everything. Blocking."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            return self._poll()
+
+    def _poll(self) -> list[tuple[str, str]] | None:
+        current = int(self.backend.get(self.VERSION) or 0)
+        changes = []
+        while self.seen < current:
+            raw = self.backend.get(self.ENTRY.format(self.seen + 1))
+            if raw is None:
+                # the writer may sit between incr and set; look again on the next poll
+                if self._missing_since is None:
+                    self._missing_since = time.monotonic()
+                if time.monotonic() - self._missing_since < self.MISSING_GRACE:
+                    return changes
+                logger.warning("State change %d is missing; reloading all state", self.seen + 1)
+                self.seen, self._missing_since = current, None
+                return None
+            self._missing_since = None
+            kind, key = json.loads(raw)
+            changes.append((kind, key))
+            self.seen += 1
+        return changes
+
+def fetch_changes(store, changes: list[tuple[str, str]]) -> list[tuple[str, str, dict | None]]:
+    """The current record for each changed (kind, key), deduplicated. Blocking."""
+    loaders = {"user": store.load_user, "token": store.load_token, "policy": store.load_group_policy}
+    out = []
+    for kind, key in dict.fromkeys(changes):
+        if kind in loaders:
+            out.append((kind, key, loaders[kind](int(key) if kind == "user" else key)))
+    return out
@@ -0,0 +1,224 @@
+# state_store.py
+"""
+Registered users, invite tokens and group policies in one SQLite database.
+
+Replaces the logs/*.json files that were rewritten whole on every /start,
+/register_now, token use and /permission. Each change is now a single-row
+upsert, so a registration costs the same with 10 users or 100k.
+
+    STATE_DB   database path (default: logs/state.db)
+
+The database runs in WAL mode and is only ever touched from one dedicated
+thread: put_* calls queue the write there and return a Future (handlers can
+`await asyncio.wrap_future(...)` it), so the event loop never blocks on disk.
+RealTimeBot keeps its dicts as the read cache and loads them from here at
+startup.
+
+On first open each table is filled from its legacy JSON file, if present
+(including the old {"user_ids": [...]} registered_users schema), and the file
+is renamed to *.json.migrated.
+"""
+import json
+import logging
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id          INTEGER PRIMARY KEY,
+    username         TEXT,
+    first_name       TEXT,
+    last_name        TEXT,
+    ts               TEXT,
+    registered_via   TEXT,
+    invite_note      TEXT,
+    allowed_commands TEXT            -- JSON list; NULL = full access
+);
+CREATE TABLE IF NOT EXISTS invite_tokens (
+    invite_id        TEXT PRIMARY KEY,
+    exp              INTEGER NOT NULL,
+    max_uses         INTEGER NOT NULL DEFAULT -1,
+    uses             INTEGER NOT NULL DEFAULT 0,
+    note             TEXT,
+    revoked          INTEGER NOT NULL DEFAULT 0,
+    created_at       TEXT,
+    allowed_commands TEXT
+);
+CREATE TABLE IF NOT EXISTS group_policies (
+    chat_id          TEXT PRIMARY KEY,
+    allowed_commands TEXT,
+    set_by           INTEGER,
+    ts               TEXT
+);
+"""
+
+USER_FIELDS = ("username", "first_name", "last_name", "ts", "registered_via", "invite_note", "allowed_commands")
+TOKEN_FIELDS = ("exp", "max_uses", "uses", "note", "revoked", "created_at", "allowed_commands")
+POLICY_FIELDS = ("allowed_commands", "set_by", "ts")
+
+def _dump_list(value):
+    return None if value is None else json.dumps(list(value), ensure_ascii=False)
+
+def _load_list(value):
+    return None if value is None else json.loads(value)
+
+def _upsert_sql(table: str, key: str, fields: tuple) -> str:
+    cols = (key, *fields)
+    updates = ", ".join(f"{f} = excluded.{f}" for f in fields)
+    return (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+
+USER_UPSERT = _upsert_sql("users", "user_id", USER_FIELDS)
+TOKEN_UPSERT = _upsert_sql("invite_tokens", "invite_id", TOKEN_FIELDS)
+POLICY_UPSERT = _upsert_sql("group_policies", "chat_id", POLICY_FIELDS)
+
+def _user_row(user_id: int, info: dict) -> tuple:
+    return (int(user_id), *(info.get(f) for f in USER_FIELDS[:-1]), _dump_list(info.get("allowed_commands")))
+
+def _token_row(invite_id: str, data: dict) -> tuple:
+    return (str(invite_id), int(data.get("exp", 0)), int(data.get("max_uses", -1)), int(data.get("uses", 0)),
+            data.get("note"), int(bool(data.get("revoked", False))), data.get("created_at"),
+            _dump_list(data.get("allowed_commands")))
+
+def _policy_row(chat_id, policy: dict) -> tuple:
+    return (str(chat_id), _dump_list(policy.get("allowed_commands")), policy.get("set_by"), policy.get("ts"))
+
+def _read_json(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def legacy_users(data) -> dict[int, dict]:
+    """registered_users.json in either schema -> {user_id: info}."""
+    if isinstance(data, dict) and isinstance(data.get("users"), list):
+        return {u["user_id"]: {f: u.get(f) for f in USER_FIELDS}
+                for u in data["users"] if isinstance(u.get("user_id"), int)}
+    # Old schema (backward compatible): {"user_ids": [...]}
+    if isinstance(data, dict) and isinstance(data.get("user_ids"), list):
+        return {int(uid): {} for uid in data["user_ids"]}
+    return {}
+
+class StateStore:
+    def __init__(self, path: str | Path, legacy_dir: str | Path | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # one thread owns the connection; SQLite calls never run on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._conn: sqlite3.Connection | None = None
+        self._executor.submit(self._open, Path(legacy_dir) if legacy_dir else None).result()
+
+    # ---------- store thread ----------
+    def _open(self, legacy_dir: Path | None) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; WAL keeps it consistent
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        if legacy_dir is not None:
+            self._migrate(legacy_dir)
+
+    def _migrate(self, legacy_dir: Path) -> None:
+        sources = (
+            ("users", "registered_users.json", USER_UPSERT,
+             lambda d: [_user_row(k, v) for k, v in legacy_users(d).items()]),
+            ("invite_tokens", "invite_tokens.json", TOKEN_UPSERT,
+             lambda d: [_token_row(k, v) for k, v in (d.get("tokens") or {}).items()]),
+            ("group_policies", "group_policies.json", POLICY_UPSERT,
+             lambda d: [_policy_row(k, v) for k, v in d.items()] if isinstance(d, dict) else []),
+        )
+        for table, filename, sql, to_rows in sources:
+            path = legacy_dir / filename
+            if not path.exists():
+                continue
+            if self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                logger.warning("%s exists but %s already has rows; leaving the file alone", path, table)
+                continue
+            try:
+                rows = to_rows(_read_json(path))
+                with self._conn:
+                    self._conn.executemany(sql, rows)
+                path.rename(path.with_suffix(".json.migrated"))
+                logger.info("Migrated %d rows from %s into %s", len(rows), path, table)
+            except Exception:
+                logger.exception("Failed to migrate %s; starting %s empty", path, table)
+
+    def _write(self, sql: str, row: tuple) -> None:
+        try:
+            with self._conn:
+                self._conn.execute(sql, row)
+        except Exception:
+            logger.exception("State store write failed: %s", row[0])
+
+    def _load_users(self, user_id: int | None = None) -> dict[int, dict]:
+        where, args = ("WHERE user_id = ?", (int(user_id),)) if user_id is not None else ("", ())
+        cur = self._conn.execute(f"SELECT user_id, {', '.join(USER_FIELDS)} FROM users {where} ORDER BY user_id", args)
+        users = {}
+        for uid, *values in cur:
+            info = dict(zip(USER_FIELDS, values))
+            info["allowed_commands"] = _load_list(info["allowed_commands"])
+            users[uid] = info
+        return users
+
+    def _load_tokens(self, invite_id: str | None = None) -> dict[str, dict]:
+        where, args = ("WHERE invite_id = ?", (str(invite_id),)) if invite_id is not None else ("", ())
+        cur = self._conn.execute(f"SELECT invite_id, {', '.join(TOKEN_FIELDS)} FROM invite_tokens {where}", args)
+        tokens = {}
+        for invite_id, *values in cur:
+            data = dict(zip(TOKEN_FIELDS, values))
+            data["revoked"] = bool(data["revoked"])
+            data["allowed_commands"] = _load_list(data["allowed_commands"])
+            tokens[invite_id] = data
+        return tokens
+
+    def _load_group_policies(self, chat_id=None) -> dict[str, dict]:
+        where, args = ("WHERE chat_id = ?", (str(chat_id),)) if chat_id is not None else ("", ())
+        cur = self._conn.execute(f"SELECT chat_id, {', '.join(POLICY_FIELDS)} FROM group_policies {where}", args)
+        policies = {}
+        for chat_id, *values in cur:
+            policy = dict(zip(POLICY_FIELDS, values))
+            policy["allowed_commands"] = _load_list(policy["allowed_commands"])
+            policies[chat_id] = policy
+        return policies
+
+    # ---------- callers ----------
+    def load_users(self) -> dict[int, dict]:
+        """Blocking; meant for startup."""
+        return self._executor.submit(self._load_users).result()
+
+    def load_tokens(self) -> dict[str, dict]:
+        return self._executor.submit(self._load_tokens).result()
+
+    def load_group_policies(self) -> dict[str, dict]:
+        return self._executor.submit(self._load_group_policies).result()
+
+    # single records, for picking up changes other workers made (bot/shared_state.py)
+    def load_user(self, user_id: int) -> dict | None:
+        return self._executor.submit(self._load_users, user_id).result().get(int(user_id))
+
+    def load_token(self, invite_id: str) -> dict | None:
+        return self._executor.submit(self._load_tokens, invite_id).result().get(str(invite_id))
+
+    def load_group_policy(self, chat_id) -> dict | None:
+        return self._executor.submit(self._load_group_policies, chat_id).result().get(str(chat_id))
+
+    # rows are built here, on the caller's side, so later edits of the cached
+    # dicts cannot race with the write
+    def put_user(self, user_id: int, info: dict) -> Future:
+        return self._executor.submit(self._write, USER_UPSERT, _user_row(user_id, info))
+
+    def put_token(self, invite_id: str, data: dict) -> Future:
+        return self._executor.submit(self._write, TOKEN_UPSERT, _token_row(invite_id, data))
+
+    def put_group_policy(self, chat_id, policy: dict) -> Future:
+        return self._executor.submit(self._write, POLICY_UPSERT, _policy_row(chat_id, policy))
+
+    def close(self) -> None:
+        """Finish queued writes, then close the connection."""
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
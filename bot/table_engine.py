@@ -0,0 +1,106 @@
+# table_engine.py
+"""
+Column-spec table engine used by every text report.
+
+A table is described by a list of ColumnSpec (which key to read, header,
+alignment, how to format the column, how to pad it). layout_table formats
+each column once, measures it once, and the result can be rendered as
+header + body lines with plain or figure-space padding.
+"""
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Callable, NamedTuple, Sequence
+
+import pandas as pd
+
+from bot.formatting import FIGURE_SPACE, column_separators, column_width, escape_md_v2
+
+ColumnFormatter = Callable[[list], list[str]]
+
+def str_column(values: list) -> list[str]:
+    return [str(v) for v in values]
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """
+    key        dict key, DataFrame column or tuple index the values come from
+    header     header cell text
+    align      "left" or "right"
+    formatter  whole-column formatter: list of raw values -> list of strings
+    default    value used when a mapping row has no `key`
+    escape     MarkdownV2-escape cells after measuring (width stays that of the
+               unescaped text, as the DPF tables always did)
+    figspace   pad with FIGURE_SPACE instead of plain spaces
+    """
+    key: Any
+    header: str
+    align: str = "right"
+    formatter: ColumnFormatter = str_column
+    default: Any = None
+    escape: bool = False
+    figspace: bool = False
+
+def text_columns(headers: Sequence[str]) -> list[ColumnSpec]:
+    """Positional specs for pre-formatted rows: first column left, the rest right."""
+    return [ColumnSpec(i, str(h), "left" if i == 0 else "right") for i, h in enumerate(headers)]
+
+def frame_columns(df: pd.DataFrame, first_align: str = "left") -> list[ColumnSpec]:
+    """Specs for every column of a DataFrame, headers = column names."""
+    return [ColumnSpec(col, str(col), first_align if i == 0 else "right") for i, col in enumerate(df.columns)]
+
+def _column_values(spec: ColumnSpec, rows) -> list:
+    if isinstance(rows, pd.DataFrame):
+        return rows[spec.key].tolist()
+    if rows and isinstance(rows[0], Mapping):
+        return [r.get(spec.key, spec.default) for r in rows]
+    return [r[spec.key] for r in rows]
+
+def _pad(cells: list[str], width: int, spec: ColumnSpec) -> list[str]:
+    fill = FIGURE_SPACE if spec.figspace else " "
+    if spec.align == "left":
+        return [c.ljust(width, fill) for c in cells]
+    return [c.rjust(width, fill) for c in cells]
+
+class TableLayout(NamedTuple):
+    specs: tuple[ColumnSpec, ...]
+    columns: tuple[list[str], ...]  # formatted (unescaped) cells per column
+    widths: tuple[int, ...]
+
+    @property
+    def separators(self) -> tuple[int, ...]:
+        return tuple(column_separators(c, s.header) for c, s in zip(self.columns, self.specs))
+
+    def line_width(self, sep: str = "  ") -> int:
+        return sum(self.widths) + len(sep) * (len(self.widths) - 1)
+
+    def header_line(self, sep: str = "  ") -> str:
+        return sep.join(_pad([s.header], w, s)[0] for s, w in zip(self.specs, self.widths))
+
+    def body_lines(self, sep: str = "  ") -> list[str]:
+        padded = []
+        for spec, cells, width in zip(self.specs, self.columns, self.widths):
+            if spec.escape:
+                cells = [escape_md_v2(c) for c in cells]
+            padded.append(_pad(cells, width, spec))
+        return list(map(sep.join, zip(*padded)))
+
+    def lines(self, sep: str = "  ", header: bool = True) -> list[str]:
+        body = self.body_lines(sep)
+        return [self.header_line(sep), *body] if header else body
+
+def layout_table(specs: Sequence[ColumnSpec], rows, widths: Sequence[int] | None = None) -> TableLayout:
+    """
+    Format and measure `rows` (list of dicts, list of sequences or a DataFrame).
+    Pass `widths` to reuse the column widths of another table, e.g. so a group
+    summary and its brand blocks line up.
+    """
+    specs = tuple(specs)
+    columns = tuple(spec.formatter(_column_values(spec, rows)) for spec in specs)
+    if widths is None:
+        widths = tuple(column_width(c, s.header) for s, c in zip(specs, columns))
+    return TableLayout(specs, columns, tuple(widths))
+
+def render_table(specs: Sequence[ColumnSpec], rows, widths: Sequence[int] | None = None,
+                 sep: str = "  ", header: bool = True) -> str:
+    """Monospaced table text (no code-span wrapping)."""
+    return "\n".join(layout_table(specs, rows, widths).lines(sep, header=header))
@@ -1,42 +1,27 @@
-from telegram import Update
+from telegram import InputMediaPhoto, Update
 from telegram.constants import ParseMode
 from textwrap import wrap
 from collections import defaultdict
+from itertools import islice
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import asyncio
+import logging
 import numpy as np
+import pandas as pd
 import time
+from typing import NamedTuple
 
-# ---- unicode "font" converter ----
-STYLES = {
-    "mono":          {"A":0x1D670, "a":0x1D68A, "0":0x1D7F6},  # Mathematical Monospace
-    "sans":          {"A":0x1D5A0, "a":0x1D5BA, "0":0x1D7E2},  # Sans-serif
-    "sans_bold":     {"A":0x1D5D4, "a":0x1D5EE, "0":0x1D7EC},  # Sans-serif Bold
-    "serif_bold":    {"A":0x1D400, "a":0x1D41A, "0":0x1D7CE},  # Bold
-    "serif_italic":  {"A":0x1D434, "a":0x1D44E, "0":None},     # Italic (no special digits)
-    "serif_bi":      {"A":0x1D468, "a":0x1D482, "0":None},     # Bold Italic
-    "fullwidth":     {"A":0xFF21,  "a":0xFF41,  "0":0xFF10, "space":0x3000},  # Ｆｕｌｌｗｉｄｔｈ
-}
-
-def stylize(text: str, style: str = "mono") -> str:
-    spec = STYLES.get(style)
-    if not spec:
-        raise ValueError(f"Unknown style '{style}'. Try: {', '.join(STYLES)}")
+from bot.formatting import (
+    stylize, escape_md_v2, inline_code_line,
+    fmt_number, fmt_number_column, num_to_float, fmt_commas0_column, fmt_pct_int,
+)
+from bot.table_engine import ColumnSpec, layout_table, render_table, text_columns, frame_columns
+from bot.render_cache import render_cache
+from bot.workers import image_pool, render_pool
+from bot import image_renderer, metrics, tracing
 
-    out = []
-    for ch in text:
-        o = ch
-        if "A" <= ch <= "Z" and spec.get("A") is not None:
-            o = chr(spec["A"] + (ord(ch) - ord("A")))
-        elif "a" <= ch <= "z" and spec.get("a") is not None:
-            o = chr(spec["a"] + (ord(ch) - ord("a")))
-        elif "0" <= ch <= "9" and spec.get("0") is not None:
-            o = chr(spec["0"] + (ord(ch) - ord("0")))
-        elif ch == " " and style == "fullwidth" and "space" in spec:
-            o = chr(spec["space"])  # optional fullwidth space
-        out.append(o)
-    return "".join(out)
+logger = logging.getLogger(__name__)
 
 def get_date_range_header():
     """Get the current time and date range for the header."""
@@ -52,34 +37,6 @@ def get_date_range_header():
     return current_time, dates
     
 # ---------- Helpers ----------
-def escape_md_v2(text: str) -> str:
-    escape_chars = r"_*[]()~>#+-=|{}.!"
-    for ch in escape_chars:
-        text = text.replace(ch, "\\" + ch)
-    return text
-
-def _fmt_number(x, default= 0):
-    # Safe, compact formatting for ints/floats/strings
-    try:
-        if isinstance(x, str) and x.strip() == "":
-            return ""
-        n = float(x)
-        if n.is_integer():
-            return f"{int(n):,}"
-        if default == 0:
-            return f"{n:,.0f}"
-        elif default == 2:
-            return f"{n:,.2f}"
-    except Exception:
-        return str(x)
-    
-def fmt_pct(val, decimals=1) -> str:
-    try:
-        v = float(val) * 100.0
-        return f"{v:.{decimals}f}%"
-    except Exception:
-        return str(val)
-    
 def split_table_text(text, max_length=4000):
     """Split table text into chunks that fit Telegram's message limit."""
     lines = text.split("\n")
@@ -118,96 +75,148 @@ def split_table_text_customize(text: str, first_len: int = 1400, max_len: int =
         chunks.append("\n".join(current))
     return chunks
 
-# ---------- Rendering using TableFormatter ----------
+# ---------- Outgoing messages ----------
+class OutgoingMessage(NamedTuple):
+    """One send_message call: text + kwargs, then `delay` seconds of pause."""
+    text: str
+    parse_mode: str | None = ParseMode.MARKDOWN_V2
+    disable_web_page_preview: bool | None = None
+    delay: float = 0
+
+async def send_messages(update: Update, messages) -> None:
+    with metrics.phase("send"):
+        for m in messages:
+            kwargs = {}
+            if m.parse_mode is not None:
+                kwargs["parse_mode"] = m.parse_mode
+            if m.disable_web_page_preview is not None:
+                kwargs["disable_web_page_preview"] = m.disable_web_page_preview
+            await update.effective_chat.send_message(m.text, **kwargs)
+            if m.delay:
+                await asyncio.sleep(m.delay)
+
+async def _cached_render(kind: str, build, *args, data, **params) -> tuple:
+    """
+    Render-cache lookup on the loop; on a miss build(*args) runs in the render
+    pool (see bot/workers.py), so only the sends happen on the event loop.
+    """
+    with metrics.phase("render", f"render {kind}"):
+        key = render_cache.key(kind, data, **params)
+        cached = render_cache.get(key)
+        tracing.annotate(cache="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        return render_cache.put(key, await render_pool.run(build, *args))
+
+# ---------- Image mode (one PNG per country) ----------
+REPORT_TITLES = {
+    "apf": "Acquisition Summary",
+    "dpf": "Deposit Performance",
+    "dist": "Total Summary",
+    "pmh_total": "Group Comparison",
+    "pmh_provider": "Payment Health by Provider",
+    "pmh_method": "Payment Health by Method",
+    "pmh_week": "Weekly Report",
+}
 
-# Inline-code helper: no newlines allowed inside
-def inline_code_line(s: str) -> str:
-    return f"`s`"
+def _split_country_groups(country_groups: dict, *rest) -> list[tuple[str, tuple]]:
+    """Per-country build arguments for the {country: rows} reports."""
+    return [(c, ({c: rows}, *rest)) for c, rows in sorted(
+        ((c, r) for c, r in country_groups.items() if c is not None), key=lambda x: x[0])]
 
-def count_separators(s: str) -> int:
-    return s.count("-") + s.count(",")
+def _split_frame(df: pd.DataFrame, *rest) -> list[tuple[str, tuple]]:
+    """Per-country build arguments for the DataFrame reports."""
+    return [(str(c), (cdf, *rest)) for c, cdf in df.groupby("country")]
+
+def build_report_images(kind: str, build, country_inputs) -> list:
+    """Runs in the image pool: each country's messages drawn into one PNG."""
+    return [
+        image_renderer.render_messages_png([m.text for m in build(*args)], caption=f"{country} {REPORT_TITLES[kind]}")
+        for country, args in country_inputs
+    ]
+
+async def send_images(update: Update, images) -> None:
+    """Consecutive photos go out as media groups (max 10); oversized images as documents."""
+    chat = update.effective_chat
+    batch = []
+
+    async def flush():
+        if len(batch) == 1:
+            await chat.send_photo(batch[0].png, caption=batch[0].caption)
+        elif batch:
+            await chat.send_media_group([InputMediaPhoto(im.png, caption=im.caption) for im in batch])
+        batch.clear()
+
+    with metrics.phase("send"):
+        for im in images:
+            if not im.fits_photo:
+                await flush()
+                await chat.send_document(im.png, filename=f"{im.caption}.png", caption=im.caption)
+                continue
+            batch.append(im)
+            if len(batch) == 10:
+                await flush()
+        await flush()
+
+async def _cached_images(kind: str, build, country_inputs, *, data, **params) -> tuple:
+    with metrics.phase("render", f"render {kind} images"):
+        key = render_cache.key(f"{kind}:img", data, **params)
+        cached = render_cache.get(key)
+        tracing.annotate(cache="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        return render_cache.put(key, await image_pool.run(build_report_images, kind, build, country_inputs))
+
+def _image_mode(image: bool, kind: str) -> bool:
+    if image and not image_renderer.available():
+        logger.warning("Image mode requested for %s but Pillow or a monospaced font is missing; sending text", kind)
+        return False
+    return image
+
+def _header_minute() -> str:
+    """Render-cache bucket for reports whose header shows "up to HH:MM" (GMT+7)."""
+    return datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y-%m-%d %H:%M")
+
+# ---------- Rendering using TableFormatter ----------
 
 current_time, _ = get_date_range_header()
 
+APF_COLUMNS = (
+    ColumnSpec("date", "Date", "left", default=""),
+    ColumnSpec("NAR", "NAR", formatter=fmt_number_column, default=0),
+    ColumnSpec("FTD", "FTD", formatter=fmt_number_column, default=0),
+    ColumnSpec("STD", "STD", formatter=fmt_number_column, default=0),
+    ColumnSpec("TTD", "TTD", formatter=fmt_number_column, default=0),
+)
+
+def _apf_widths(rows) -> tuple[tuple, tuple]:
+    """(widths, separators) per APF column, computed from what you'll actually print."""
+    layout = layout_table(APF_COLUMNS, rows)
+    return layout.widths, layout.separators
+
 def render_apf_table_v2(country, rows, max_width=72, brand=False, widths=None, separators=None):
-    # --- AFTER ---
-    FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩", "BR":"🇧🇷"}
-    flag = FLAGS.get(country, "")
-    
     # --- group by brand ---
     brand_groups = defaultdict(list)
     for r in rows:
         brand_groups[r.get("brand", "Unknown")].append(r)
 
-  # Use provided widths/separators or calculate them if not provided
-    if widths and separators:
-        w0, w1, w2, w3, w4 = widths
-        x0, x1, x2, x3, x4 = separators
-    else:
-        # widths computed from what you'll actually print
-        dates_all = [str(r.get("date","")) for r in rows]
-        nars_all  = [str(_fmt_number(r.get("NAR", 0))) for r in rows]
-        ftds_all  = [str(_fmt_number(r.get("FTD", 0))) for r in rows]
-        stds_all  = [str(_fmt_number(r.get("STD", 0))) for r in rows]
-        ttds_all  = [str(_fmt_number(r.get("TTD", 0))) for r in rows]
-
-        w0 = max(len("Date"), *(len(x) for x in dates_all)) if dates_all else len("Date")
-        x0 = max(count_separators("Date"), *(count_separators(x) for x in dates_all)) if dates_all else count_separators("Date")
-
-        w1 = max(len("NAR"), *(len(x) for x in nars_all)) if nars_all else len("NAR")
-        x1 = max(count_separators("NAR"), *(count_separators(x) for x in nars_all)) if nars_all else count_separators("NAR")
-
-        w2 = max(len("FTD"), *(len(x) for x in ftds_all)) if ftds_all else len("FTD")
-        x2 = max(count_separators("FTD"), *(count_separators(x) for x in ftds_all)) if ftds_all else count_separators("FTD")
-
-        w3 = max(len("STD"), *(len(x) for x in stds_all)) if stds_all else len("STD")
-        x3 = max(count_separators("STD"), *(count_separators(x) for x in stds_all)) if stds_all else count_separators("STD")
-
-        w4 = max(len("TTD"), *(len(x) for x in ttds_all)) if ttds_all else len("TTD")
-        x4 = max(count_separators("TTD"), *(count_separators(x) for x in ttds_all)) if ttds_all else count_separators("TTD")
-
-    list_seperators = [x0 + x1, x2, x3, x4, 0]
-    # print(list_seperators)
-
-    def fmt_row(d, n, f, s, t):
-        d = str(d)
-        n = str(n)
-        f = str(f)
-        s = str(s)
-        t = str(t)
-        _d = count_separators(d)
-        _n = count_separators(n)
-        _f = count_separators(f)
-        _s = count_separators(s)
-        _t = count_separators(t)
-        print(d, n, f, s, t)
-        return "  ".join([
-            replace_spacing(d.ljust(w0), x0, _d),
-            replace_spacing(n.rjust(w1), x1, _n),
-            replace_spacing(f.rjust(w2), x2, _f),
-            replace_spacing(s.rjust(w3), x3, _s),
-            replace_spacing(t.rjust(w4), x4, _t),
-        ])
-
-    header = fmt_row("Date", "NAR", "FTD", "STD", "TTD")
-    sep = "-".join(["-" * w0, "-" * w1, "-" * w2, "-" * w3, "-" * w4])
+    # One layout for every brand block (brand order), sliced per brand below.
+    # Use provided widths/separators or calculate them if not provided
+    brands_sorted = sorted(brand_groups.items())
+    layout = layout_table(APF_COLUMNS, [r for _, items in brands_sorted for r in items],
+                          widths if (widths and separators) else None)
+    header = layout.header_line()
+    body = iter(layout.body_lines())
 
     # --- build output ---
     current_time, date_range = get_date_range_header()
 
     if not brand:
-
         if list(brand_groups.keys())[0] == "TOTAL":
             subtitle = escape_md_v2(f"{country} Acquisition Summary by Country \n(up to {current_time} GMT+7)")
         else:
             subtitle = escape_md_v2(f"{country} Acquisition Summary by Group \n(up to {current_time} GMT+7)")
-
-        title_line = subtitle
-
-        parts = [title_line]
-
-        parts.append(wrap_separators(inline_code_line(header)))
-
+        parts = [subtitle, wrap_separators(inline_code_line(header))]
     else:
         if (country == "BD") or (country == "PK"):
             parts = [wrap_separators(inline_code_line(header))]
@@ -215,33 +224,16 @@ def render_apf_table_v2(country, rows, max_width=72, brand=False, widths=None, s
             parts = []
 
     # Then each brand with only its rows
-
-        # Sort brands by TTD (DESC)
-
     first = True
-    for brand_name, items in sorted(brand_groups.items()):
+    for brand_name, items in brands_sorted:
         if not first:
             parts.append("")  # blank line between brands
         first = False
-        print(country, brand)
 
         parts.append(stylize(f"*{escape_md_v2(str(brand_name))}*", style="sans_bold"))
-        for r in items:
-            parts.append(
-                wrap_separators(
-                    inline_code_line(
-                        fmt_row(
-                            r.get("date", ""),
-                            _fmt_number(r.get("NAR", 0)),
-                            _fmt_number(r.get("FTD", 0)),
-                            _fmt_number(r.get("STD", 0)),
-                            _fmt_number(r.get("TTD", 0)),
-                        )
-                    )
-                )
-            )
+        for line in islice(body, len(items)):
+            parts.append(wrap_separators(inline_code_line(line)))
 
-    print(parts)
     return "\n".join(parts)
 
 # ------- TESTING APF TABLE with GROUP and BRAND -------
@@ -276,32 +268,8 @@ def render_group_then_brands(country: str, group_name: str, group_rows: list[dic
     group_label = f"{group_name.upper()}"
     group_summary_rows = _aggregate_by_date_for_group(group_rows, group_label)
 
-   # 1. Combine all rows to find the maximum possible width
-    all_rows = group_summary_rows + group_rows
-    
-    dates_all = [str(r.get("date","")) for r in all_rows]
-    nars_all  = [str(_fmt_number(r.get("NAR", 0))) for r in all_rows]
-    ftds_all  = [str(_fmt_number(r.get("FTD", 0))) for r in all_rows]
-    stds_all  = [str(_fmt_number(r.get("STD", 0))) for r in all_rows]
-    ttds_all  = [str(_fmt_number(r.get("TTD", 0))) for r in all_rows]
-
-    w0 = max(len("Date"), *(len(x) for x in dates_all)) if dates_all else len("Date")
-    x0 = max(count_separators("Date"), *(count_separators(x) for x in dates_all)) if dates_all else count_separators("Date")
-
-    w1 = max(len("NAR"), *(len(x) for x in nars_all)) if nars_all else len("NAR")
-    x1 = max(count_separators("NAR"), *(count_separators(x) for x in nars_all)) if nars_all else count_separators("NAR")
-
-    w2 = max(len("FTD"), *(len(x) for x in ftds_all)) if ftds_all else len("FTD")
-    x2 = max(count_separators("FTD"), *(count_separators(x) for x in ftds_all)) if ftds_all else count_separators("FTD")
-
-    w3 = max(len("STD"), *(len(x) for x in stds_all)) if stds_all else len("STD")
-    x3 = max(count_separators("STD"), *(count_separators(x) for x in stds_all)) if stds_all else count_separators("STD")
-
-    w4 = max(len("TTD"), *(len(x) for x in ttds_all)) if ttds_all else len("TTD")
-    x4 = max(count_separators("TTD"), *(count_separators(x) for x in ttds_all)) if ttds_all else count_separators("TTD")
-    
-    common_widths = (w0, w1, w2, w3, w4)
-    common_separators = (x0, x1, x2, x3, x4)
+    # 1. Combine all rows to find the maximum possible width
+    common_widths, common_separators = _apf_widths(group_summary_rows + group_rows)
 
    # 2. Render both blocks using the common widths/separators
     if (country != "BD") and (country != "PK"):
@@ -345,20 +313,10 @@ def render_country_total(country: str, rows: list[dict], max_width=72) -> str:
     # header ON (brand=False default) so it has the country title + table header
     return render_apf_table_v2(country, total_rows, max_width=max_width)
 
-# ---------- Summation helpers ----------
-def _sum_field(rows, field="NAR"):
-    s = 0
-    for r in rows:
-        v = r.get(field, 0)
-        try:
-            s += int(v)
-        except Exception:
-            s += int(float(v or 0))
-    return s
-
 # ---------- Telegram send ----------
-async def send_apf_tables(update: Update, country_groups, max_width=72, max_length=4000):
+def build_apf_messages(country_groups, max_width=72) -> list[OutgoingMessage]:
     # country_groups: { "TH": rows_th, "PH": rows_ph, ... } where each row has keys: date, country, group, brand, NAR/FTD/STD/TTD
+    messages = []
     for country, rows in sorted(
         ((c, r) for c, r in country_groups.items() if c is not None),
         key=lambda x: x[0]
@@ -373,31 +331,30 @@ async def send_apf_tables(update: Update, country_groups, max_width=72, max_leng
         # order groups by total NAR DESC
         groups_sorted = sorted(groups.items(), key=lambda kv: _sum_field(kv[1], "NAR"), reverse=True)
 
-        # print(f"Country {country} has {len(rows)} rows in {len(groups_sorted)} groups.")
-
         # one message per GROUP
         for gname, g_rows in groups_sorted:
             msg = render_group_then_brands(country, gname, g_rows, max_width=max_width)
-            
             for chunk in split_table_text_customize(msg, first_len=2000):
-                # safe_chunk = escape_md_v2(chunk)
-                await update.effective_chat.send_message(
-                    chunk,
-                    parse_mode=ParseMode.MARKDOWN_V2,
-                    disable_web_page_preview=False
-                )
-                await asyncio.sleep(1)
+                messages.append(OutgoingMessage(chunk, disable_web_page_preview=False, delay=1))
 
         # --- country GRAND TOTAL by date (all groups/brands) ---
         total_msg = render_country_total(country, rows, max_width=max_width)
         for chunk in split_table_text_customize(total_msg, first_len=2000):
-            # safe_chunk = escape_md_v2(chunk)
-            await update.effective_chat.send_message(
-                chunk,
-                parse_mode=ParseMode.MARKDOWN_V2,
-                disable_web_page_preview=True
-            )
-            await asyncio.sleep(1)
+            messages.append(OutgoingMessage(chunk, disable_web_page_preview=True, delay=1))
+    return messages
+
+async def send_apf_tables(update: Update, country_groups, max_width=72, max_length=4000, image: bool = False):
+    if _image_mode(image, "apf"):
+        images = await _cached_images(
+            "apf", build_apf_messages, _split_country_groups(country_groups, max_width),
+            data=country_groups, max_width=max_width, minute=_header_minute(),
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "apf", build_apf_messages, country_groups, max_width,
+        data=country_groups, max_width=max_width, minute=_header_minute(),
+    )
+    await send_messages(update, messages)
 
 # ---------- Channel distribution rendering ----------
 def _to_percent_number(val) -> float:
@@ -407,21 +364,6 @@ def _to_percent_number(val) -> float:
     - If input has '%', treat as already percent.
     - Else: if <= 1.5 (heuristic), treat as fraction and x100; otherwise already percent.
     """
-    if val is None:
-        return 0.0
-    s = str(val).strip()
-    had_pct = ("%" in s) or ("％" in s)
-    s = s.replace("%", "").replace("％", "").replace(",", "")  # remove symbols
-    try:
-        x = float(s)
-    except Exception:
-        return 0.0
-    if had_pct:
-        return x
-    # Heuristic: values like 0.12 → 12%; values like 171.8 → already percent
-    return x * 100.0 if x <= 1.5 else x
-
-def _to_percent_number(val) -> float:
     if val is None:
         return 0.0
     s = str(val).strip()
@@ -437,17 +379,23 @@ def _to_percent_number(val) -> float:
 FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩", "BR":"🇧🇷"}
 CURRENCIES = {"PH":"PHP","TH":"THB","BD":"BDT","PK":"PKR","ID":"IDR", "BR":"BRL"}
 
+def _pct_number_column(values) -> list[str]:
+    return [f"{_to_percent_number(v):.0f}" for v in values]
+
+DIST_COLUMNS = (
+    ColumnSpec(0, "#"),
+    ColumnSpec(1, "Cnt", formatter=fmt_number_column),
+    ColumnSpec(2, "Vol", formatter=fmt_number_column),
+    ColumnSpec(3, "Avg", formatter=fmt_number_column),
+    ColumnSpec(4, "%", formatter=_pct_number_column),
+)
+
 def render_channel_distribution(country: str, rows: list[dict], topn: int = 5) -> str:
     FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩"}
     CURRENCIES = {"PH":"PHP","TH":"THB","BD":"BDT","PK":"PKR","ID":"IDR"}
     flag = FLAGS.get(country, "")
     currency = CURRENCIES.get(country, "")
 
-    def escape_md_v2(text: str) -> str:
-        for ch in r"_*[]()~`>#+-=|{}.!":
-            text = text.replace(ch, "\\"+ch)
-        return text
-
     raw_title = f"COUNTRY: {country} {flag} - ({currency})"
     # title = stylize(f"*{escape_md_v2(raw_title)}*", style="sans_bold")
     title = f"{country} Total Summary"
@@ -457,59 +405,24 @@ def render_channel_distribution(country: str, rows: list[dict], topn: int = 5) -
                 .replace("-bd","").replace("-id","").replace("-pk","").replace("bank-transfer","bank")
                 .replace("-ph","").replace("qr-code","qr").replace("vcpay-native", "vcpay")
                 for r in rows]
-    counts  = [str(_fmt_number(r.get("deposit_tnx_count"))) for r in rows]
-    vols    = [str(_fmt_number(r.get("total_deposit_amount_native"))) for r in rows]
-    avgs    = [str(_fmt_number(r.get("average_deposit_amount_native"))) for r in rows]
-    ratios  = [f"{_to_percent_number(r.get('pct_of_country_total_native',0)):.0f}" for r in rows]
+    metrics = layout_table(DIST_COLUMNS, [
+        (i, r.get("deposit_tnx_count"), r.get("total_deposit_amount_native"),
+         r.get("average_deposit_amount_native"), r.get("pct_of_country_total_native", 0))
+        for i, r in enumerate(rows, start=1)
+    ])
 
     # --- Wrap channel names (for mapping table) ---
     MAX_CHANNEL = 25
     chan_wrapped = [wrap(ch, width=MAX_CHANNEL, break_long_words=True, break_on_hyphens=True) or [""] for ch in channels]
 
-    # --- Column widths for Table A (metrics) ---
-    w_idx = max(len("#"), len(str(len(rows))))
-    w_cnt = max(len("Cnt"), *(len(x) for x in counts or ["0"]))
-    x1 = max(count_separators("Cnt"), *(count_separators(x) for x in counts or ["0"]))
-
-    w_vol = max(len("Vol"), *(len(x) for x in vols   or ["0"]))
-    x2 = max(count_separators("Vol"), *(count_separators(x) for x in vols   or ["0"]))
-
-    w_avg = max(len("Avg"), *(len(x) for x in avgs   or ["0"]))
-    x3 = max(count_separators("Avg"), *(count_separators(x) for x in avgs   or ["0"]))
-
-    w_pct = max(len("%"),   *(len(x) for x in ratios or ["0"]))
-    # replace_spacing
-    headerA = "  ".join([
-        "#".rjust(w_idx),
-        replace_spacing("Cnt".rjust(w_cnt), x1, 0),
-        replace_spacing("Vol".rjust(w_vol), x2, 0),
-        replace_spacing("Avg".rjust(w_avg), x3, 0),
-        "%".rjust(w_pct),
-    ])
-    sepA = (r"-" * len(headerA))
+    # --- Table A (metrics): widths from the layout; only the rule line uses the header width ---
+    w_idx = metrics.widths[0]
+    sepA = (r"-" * metrics.line_width())
 
-    # --- Inline-code each line so Telegram preserves spacing ---
-    def inline_code_line(s: str) -> str:
-        return f"`{s.replace('`','ˋ')}`"
-    
-    # --- Build Table A: one line per row ---
     def inline_code(s: str) -> str:
         return f"`{s}`"
-    # headerA = [wrap_separators(inline_code(headerA))]
 
-    linesA = []
-    for i in range(len(rows)):
-        _count = count_separators(counts[i])
-        _vols = count_separators(vols[i])
-        _avgs = count_separators(avgs[i])
-        
-        linesA.append("  ".join([
-            str(i+1).rjust(w_idx),
-            replace_spacing(counts[i].rjust(w_cnt), x1, _count),
-            replace_spacing(vols[i].rjust(w_vol), x2, _vols),
-            replace_spacing(avgs[i].rjust(w_avg), x3, _avgs),
-            ratios[i].rjust(w_pct),
-        ]))
+    linesA = metrics.body_lines()
 
     # --- Build Table B: index → channel mapping ---
     headerB = f"{'#'.rjust(w_idx)}  Channel"
@@ -521,98 +434,45 @@ def render_channel_distribution(country: str, rows: list[dict], topn: int = 5) -
         for frag in frags[1:]:
             linesB.append(f"{'   ' * w_idx}  {frag}")
 
-    # White comma
-    # codeA = [wrap_separators(inline_code_line(l)) for l in linesA]
-
     codeA = [(inline_code_line(l)) for l in linesA]
 
     codeB = [escape_md_v2(l) for l in linesB]
     halfB = f"`{"\n".join([*codeB])}`"
-    # print(halfB)
-    # print("\n".join([title, *codeA]))
     return "\n".join([title,*codeA, "", inline_code(escape_md_v2(sepA)), halfB])
     # return "\n".join([title, *headerA, *codeA, "", *sublinesB, *codeB])
 
-async def send_channel_distribution(update: Update, country_groups: dict[str, list[dict]], max_width: int = 35):
-    for country, rows in sorted(country_groups.items()):
-        text = render_channel_distribution(country, rows)
-        # fancy = stylize(text, style = "mono")
-        await update.effective_chat.send_message(text, parse_mode=ParseMode.MARKDOWN_V2,
-            disable_web_page_preview=False)
+def build_channel_distribution_messages(country_groups: dict[str, list[dict]]) -> list[OutgoingMessage]:
+    return [
+        OutgoingMessage(render_channel_distribution(country, rows), disable_web_page_preview=False)
+        for country, rows in sorted(country_groups.items())
+    ]
+
+async def send_channel_distribution(update: Update, country_groups: dict[str, list[dict]], max_width: int = 35,
+                                    image: bool = False):
+    if _image_mode(image, "dist"):
+        images = await _cached_images(
+            "dist", build_channel_distribution_messages, _split_country_groups(country_groups), data=country_groups,
+        )
+        return await send_images(update, images)
+    # no time in the header, so a repeated /dist for a past date is always a hit
+    messages = await _cached_render(
+        "dist", build_channel_distribution_messages, country_groups, data=country_groups,
+    )
+    await send_messages(update, messages)
         
 # Constants
 FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩"}
 CURRENCIES = {"PH":"PHP","TH":"THB","BD":"BDT","PK":"PKR","ID":"IDR"}
 
-FIGURE_SPACE = "\u2007"  # digit-width space
-
 def fmt_num_commas(x) -> str:
-    # Use your own _fmt_number (adds commas), but no thin spaces
-    return _fmt_number(x)
-
-def fmt_pct(val, decimals=1) -> str:
-    try:
-        v = float(val) * 100.0
-        return f"{v:.{decimals}f}%"
-    except Exception:
-        return str(val)
-
-def right_pad_figspace(s: str, width: int) -> str:
-    # Left-pad with FIGURE_SPACE so numbers right-align visually
-    n = len(s)
-    return (FIGURE_SPACE * max(0, width - n)) + s
-
-# ------- small helpers -------
-def _num_to_float(x):
-    if x is None: return 0.0
-    s = str(x).replace(",", "").replace(" ", "")
-    try:
-        return float(s)
-    except Exception:
-        return 0.0
+    # Use your own fmt_number (adds commas), but no thin spaces
+    return fmt_number(x)
 
 def _shrink_date(d):
     # match APF visual: "2025-09-12" -> "25 0912" style; you used replace("202","2")
     # keep exactly your rule:
     return str(d)
 
-def _fmt_commas0(x):
-    try:
-        return f"{_num_to_float(x):,.0f}"
-    except Exception:
-        return str(x)
-
-def _fmt_pct_int(x):
-    if x is None: return "0"
-    try:
-        return f"{_num_to_float(x)*100:.0f}"
-    except Exception:
-        return "0"
-
-def inline_code_line(s: str) -> str:
-    return f"`{str(s).replace('`','ˋ')}`"
-
-FIG = "` `"  # figure space: same width as digits in proportional fonts
-
-def pad_with_figspace(s: str, width: int, num_seps: int, align: str = "left") -> str:
-    s_count = "" if s is None else str(s).strip().replace("`","")
-    # how many figure spaces needed? => Max width trừ cho width of s
-    pad = max(0, width - len(s_count))
-
-    # num of figure spaces = pad - num_seps (if any)
-    num_inlines = max(0, pad - num_seps)
-    num_seps = 0 if pad == 0 else num_seps
-
-    string_inlines = "" if num_inlines == 0 else f"{num_inlines*' '}"
-    
-    convert_pads = string_inlines + f"`{num_seps*" "}`"
-    
-    print(f"Len: {len(s)}, Num inlines: {num_inlines}, Num seps: {num_seps}, String: '{s}' -> '{convert_pads + s if align=='right' else s + convert_pads}'")
-
-    return (convert_pads + s) if align == "right" else (s + convert_pads)
-
-
-
 def _sum_field(rows, field="TotalDeposit"):
     s = 0.0
     for r in rows:
@@ -622,44 +482,45 @@ def _sum_field(rows, field="TotalDeposit"):
         except Exception:
             pass
     return s
-import re
+def _dpf_date_column(values) -> list[str]:
+    return [str(v).replace("/","") for v in values]
 
-def escape_md_v2(text: str) -> str:
-    if not text:
-        return text
-    # escape backslash first
-    text = text.replace("\\", "\\\\")
-    # escape the full Telegram set
-    return re.sub(r"([_*[\]()~`>#+\-=\|{}\.!])", r"\\\1", text)
+def _dpf_avg_column(values) -> list[str]:
+    # "-" when a day had no average at all
+    cells = fmt_commas0_column([0.0 if a is None else a for a in values])
+    return [c if a is not None else "-" for c, a in zip(cells, values)]
 
-def render_dpf_table_v2(country, rows, max_width=72, brand=False, widths=None, separators=None):
-    # --- helpers used here are assumed to exist in your env:
-    # escape_md_v2, stylize, inline_code_line, wrap_separators, backtick_with_trailing_spaces
-    # _num_to_float, _fmt_commas0, _fmt_pct_int, _shrink_date, _sum_field,
-    # count_separators, get_date_range_header
-    # --- AFTER ---
-    FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩", "BR":"🇧🇷"}
-    CURRENCIES = {"TH":"THB","PH":"PHP","BD":"BDT","PK":"PKR","ID":"IDR", "BR":"BRL"}
-    flag     = FLAGS.get(country, "")
-    currency = CURRENCIES.get(country, "")
+def _pct_int_column(values) -> list[str]:
+    return [fmt_pct_int(v) for v in values]
 
-    import pandas as pd
+# Number cells are escaped before padding but measured unescaped
+DPF_COLUMNS = (
+    ColumnSpec("date", "Date", "left", formatter=_dpf_date_column),
+    ColumnSpec("AverageDeposit", "Avg", formatter=_dpf_avg_column, escape=True),
+    ColumnSpec("TotalDeposit", "Total", formatter=fmt_commas0_column, escape=True),
+    ColumnSpec("Weightage", "%", formatter=_pct_int_column, escape=True),
+)
 
+def _dpf_widths(prepped) -> tuple[tuple, tuple]:
+    layout = layout_table(DPF_COLUMNS, prepped)
+    return layout.widths, layout.separators
+
+def render_dpf_table_v2(country, rows, max_width=72, brand=False, widths=None, separators=None):
     # group by brand
     brand_groups = defaultdict(list)
     for r in rows:
         brand_groups[r.get("brand", "Unknown")].append(r)
-        
+
     # collapse rows by date within each brand; compute Weightage vs latest day per brand
-    prepped = []
+    prepped_by_brand = {}
     for b, items in brand_groups.items():
         by_date = {}
         for r in items:
             d = str(r.get("date", ""))
             obj = by_date.setdefault(d, {"date": d, "brand": b, "AverageDeposit": [], "TotalDeposit": 0.0})
-            obj["TotalDeposit"] += _num_to_float(r.get("TotalDeposit", 0))
+            obj["TotalDeposit"] += num_to_float(r.get("TotalDeposit", 0))
             if r.get("AverageDeposit") is not None:
-                obj["AverageDeposit"].append(_num_to_float(r["AverageDeposit"]))
+                obj["AverageDeposit"].append(num_to_float(r["AverageDeposit"]))
 
         collapsed = []
         for d, obj in by_date.items():
@@ -674,101 +535,36 @@ def render_dpf_table_v2(country, rows, max_width=72, brand=False, widths=None, s
         latest_total = collapsed[0]["TotalDeposit"] if collapsed else 0.0
         for rr in collapsed:
             rr["Weightage"] = (rr["TotalDeposit"]/latest_total) if latest_total else None
-        prepped.extend(collapsed)
-
-    # string render per row (already formatted)
-    def _row_strs(r):
-        return (
-            str(r["date"]).replace("/",""),
-            _fmt_commas0(r["AverageDeposit"]) if r["AverageDeposit"] is not None else "-",
-            _fmt_commas0(r["TotalDeposit"]),
-            _fmt_pct_int(r["Weightage"])
+        prepped_by_brand[b] = collapsed
+
+    # sort brands by TotalDeposit DESC
+    brands_sorted = sorted(
+        brand_groups.items(),
+        key=lambda kv: _sum_field(kv[1], "TotalDeposit"),
+        reverse=True
         )
-       # Use provided widths/separators or calculate them if not provided
-    if widths and separators:
-        w0, w1, w2, w3 = widths
-        x0, x1, x2, x3 = separators
-    else:
-        # collect for width + separator counts
-        dates_all, avgs_all, totals_all, w_all = [], [], [], []
-        for r in prepped:
-            d, a, t, w = _row_strs(r)
-            dates_all.append(d); avgs_all.append(a); totals_all.append(t); w_all.append(w)
-
-        w0 = max(len("Date"),  *(len(s) for s in dates_all)) if dates_all else len("Date")
-        w1 = max(len("Avg"),   *(len(s) for s in avgs_all))  if avgs_all else len("Avg")
-        w2 = max(len("Total"), *(len(s) for s in totals_all))if totals_all else len("Total")
-        w3 = max(len("%"),     *(len(s) for s in w_all))     if w_all     else len("%")
-
-        x0 = max(count_separators("Date"),  *(count_separators(x) for x in dates_all))  if dates_all  else count_separators("Date")
-        x1 = max(count_separators("Avg"),   *(count_separators(x) for x in avgs_all))   if avgs_all   else count_separators("Avg")
-        x2 = max(count_separators("Total"), *(count_separators(x) for x in totals_all)) if totals_all else count_separators("Total")
-        x3 = max(count_separators("%"),     *(count_separators(x) for x in w_all))      if w_all      else count_separators("%")
-
-    # widths = (w0, w1, w2, w3)
-    list_separators = [x0 + x1, x2, x3, 0]
-    print("LIST SEPERATORS:", x0, x1, x2, x3)
-    # plain-space aligned row (no figure spaces)
-    def fmt_row(d, a, t, w):
-        d = str(d); a = str(a); t = str(t); w = str(w)
-        _a = count_separators(a)
-        _t = count_separators(t)
-
-        return "  ".join([
-            d.ljust(w0),
-            replace_spacing(a.rjust(w1), max_sep=x1, cur_sep=_a),
-            replace_spacing(t.rjust(w2), max_sep=x2, cur_sep=_t),
-            w.rjust(w3),
-        ])
-    
-    def fmt_header_row(d, a, t, w):
-        d = str(d); a = str(a); t = str(t); w = str(w)
-        _d = count_separators(d)
-        _a = count_separators(a)
-        _t = count_separators(t)
-        return "  ".join([
-            replace_spacing(d.ljust(w0), max_sep=x0, cur_sep=_d),
-            replace_spacing(a.rjust(w1), max_sep=x1, cur_sep=_a),
-            replace_spacing(t.rjust(w2), max_sep=x2, cur_sep=_t),
-            w.rjust(w3),
-        ])
-    
-    # header + horizontal sep built from real widths
-    header = fmt_header_row("Date", "Avg", "Total", "%")
-    sep    = "-".join(["-" * w0, "-" * w1, "-" * w2, "-" * w3])
+
+    # One layout for every brand block, sliced per brand below.
+    # Use provided widths/separators or calculate them if not provided
+    layout = layout_table(DPF_COLUMNS, [r for b, _ in brands_sorted for r in prepped_by_brand[b]],
+                          widths if (widths and separators) else None)
+    header = layout.header_line()  # plain-space aligned, no figure spaces
+    body = iter(layout.body_lines())
 
     # --- build output (APF style) ---
     current_time, _ = get_date_range_header()
-    title    = stylize(f"*{escape_md_v2(f'COUNTRY: {country} {flag} ({currency})')}*", style="sans_bold")
-    print("BRAND GROUPS", brand_groups)
-    print(list(brand_groups.keys()))
-    
+
     if list(brand_groups.keys())[0] == "TOTAL":
         subtitle = "\n" + escape_md_v2(f"{country} Deposit Performance by Country \n(up to {current_time} GMT+7)")
     else:
         subtitle = "\n" + escape_md_v2(f"{country} Deposit Performance by Group \n(up to {current_time} GMT+7)")
 
-    parts = []
-    
     if not brand:
-        # parts.append(title + subtitle)
-        parts.append(subtitle)
-        # parts.append(inline_code_line(sep))
-        parts.append(wrap_separators(inline_code_line(header)))
-        # parts.append(inline_code_line(sep))
-
-    # sort brands by TotalDeposit DESC
-    brands_sorted = sorted(
-        brand_groups.items(),
-        key=lambda kv: _sum_field(kv[1], "TotalDeposit"),
-        reverse=True
-        )
-    
-    if brand:
-        if (country == "BD") | (country == "PK"):
-            parts = [wrap_separators(inline_code_line(header))]
-        else:
-            parts = []
+        parts = [subtitle, wrap_separators(inline_code_line(header))]
+    elif (country == "BD") | (country == "PK"):
+        parts = [wrap_separators(inline_code_line(header))]
+    else:
+        parts = []
 
     first = True
     for brand_name, _ in brands_sorted:
@@ -776,34 +572,14 @@ def render_dpf_table_v2(country, rows, max_width=72, brand=False, widths=None, s
             parts.append("")  # blank line between brands
         first = False
 
-        # if brand == False:
-            # parts.append(stylize(f"*{escape_md_v2(str(brand_name))}*", style="sans_bold"))
-
-        # if brand == True:
         parts.append(stylize(f"*{escape_md_v2(str(brand_name))}*", style="sans_bold"))
-        
-        # rows for this brand (already collapsed in prepped)
-        for r in filter(lambda x: x["brand"] == brand_name, prepped):
- 
-            d, a, t, w = _row_strs(r)
-            line = fmt_row(d, escape_md_v2(a), escape_md_v2(t), escape_md_v2(w))
 
-            # print(line)
+        # rows for this brand (already collapsed)
+        for line in islice(body, len(prepped_by_brand[brand_name])):
             parts.append(wrap_separators(inline_code_line(line)))
 
-    # print(parts)
-
     return "\n".join(parts)
 
-def replace_spacing(s: str, max_sep: int, cur_sep: int):
-    print(cur_sep, max_sep, s)
-    if cur_sep < max_sep:
-        dif = max_sep - cur_sep
-        print(s.replace(" "*dif, f"`{" "*dif}`"), 1)
-        return s.replace(" "*dif, f"{" "*dif}", 1)
-    else:
-        return s
-    
 # ------- aggregate by date (used for group summary / country total) -------
 def _aggregate_dpf_by_date(rows: list[dict], pseudo_brand: str):
     """Per-date totals across given rows; averages averaged; % vs latest date."""
@@ -811,9 +587,9 @@ def _aggregate_dpf_by_date(rows: list[dict], pseudo_brand: str):
     for r in rows:
         d = str(r.get("date", ""))
         by_date.setdefault(d, {"date": d, "brand": pseudo_brand, "TotalDeposit": 0.0, "AvgList": []})
-        by_date[d]["TotalDeposit"] += _num_to_float(r.get("TotalDeposit", 0))
+        by_date[d]["TotalDeposit"] += num_to_float(r.get("TotalDeposit", 0))
         if r.get("AverageDeposit") is not None:
-            by_date[d]["AvgList"].append(_num_to_float(r["AverageDeposit"]))
+            by_date[d]["AvgList"].append(num_to_float(r["AverageDeposit"]))
     collapsed = []
     for d, obj in by_date.items():
         avg_val = (sum(obj["AvgList"])/len(obj["AvgList"])) if obj["AvgList"] else None
@@ -830,33 +606,9 @@ def render_dpf_group_then_brands(country: str, group_name: str, group_rows: list
     # 1. Aggregate group summary data
     group_summary_rows = _aggregate_dpf_by_date(group_rows, pseudo_brand=group_name.upper())
     
-    # 2. **Calculate widths based on group summary data**
-    temp_rows = []
-    for r in group_summary_rows:
-        d = str(r.get("date", "")).replace("/", "")
-        a = _fmt_commas0(r["AverageDeposit"]) if r["AverageDeposit"] is not None else "-"
-        t = _fmt_commas0(r["TotalDeposit"])
-        w = _fmt_pct_int(r["Weightage"])
-        temp_rows.append((d, a, t, w))
-
-    dates_all, avgs_all, totals_all, w_all = zip(*temp_rows)
-
-    w0 = max(len("Date"), *(len(s) for s in dates_all))
-    w1 = max(len("Avg"), *(len(s) for s in avgs_all))
-    w2 = max(len("Total"), *(len(s) for s in totals_all))
-    w3 = max(len("%"), *(len(s) for s in w_all))
-
-    x0 = max(count_separators("Date"), *(count_separators(x) for x in dates_all))
-    x1 = max(count_separators("Avg"), *(count_separators(x) for x in avgs_all))
-    x2 = max(count_separators("Total"), *(count_separators(x) for x in totals_all))
-    x3 = max(count_separators("%"), *(count_separators(x) for x in w_all))
-
-    common_widths = (w0, w1, w2, w3)
-    common_separators = (x0, x1, x2, x3)
-
-       # 3) BRAND breakdown (your function already groups by brand inside)
-    brands_block = render_dpf_table_v2(country, group_rows, max_width=max_width, brand = True)
-    
+    # 2. Widths come from the group summary rows only
+    common_widths, common_separators = _dpf_widths(group_summary_rows)
+
     # 3. Call render_dpf_table_v2 for both tables, passing the common widths
     group_block = render_dpf_table_v2(country, group_summary_rows, max_width=max_width, widths=common_widths, separators=common_separators)
     brands_block = render_dpf_table_v2(country, group_rows, max_width=max_width, brand=True, widths=common_widths, separators=common_separators)
@@ -877,12 +629,8 @@ def render_dpf_country_total(country: str, rows: list[dict], max_width=72) -> st
     return render_dpf_table_v2(country, total_rows, max_width=max_width, brand=False)
 
 # ------- sender (sort groups by TotalDeposit desc) -------
-async def send_dpf_tables(update: Update, country_groups: dict[str, list[dict]], max_width: int = 72):
-    # def escape_md_v2(text: str) -> str:
-    #     for ch in r"=-,+":
-    #         text = text.replace(ch, "\\"+ch)
-    #     return text
-      
+def build_dpf_messages(country_groups: dict[str, list[dict]], max_width: int = 72) -> list[OutgoingMessage]:
+    messages = []
     for country, rows in sorted(country_groups.items()):
         # split by group
         groups = defaultdict(list)
@@ -897,22 +645,27 @@ async def send_dpf_tables(update: Update, country_groups: dict[str, list[dict]],
         for gname, g_rows in groups_sorted:
             msg = render_dpf_group_then_brands(country, gname, g_rows, max_width=max_width)
             for chunk in split_table_text_customize(msg, first_len=2000):
-                await update.effective_chat.send_message(
-                chunk, 
-                parse_mode=ParseMode.MARKDOWN_V2,
-                disable_web_page_preview=True
-                )
-                await asyncio.sleep(1)
+                messages.append(OutgoingMessage(chunk, disable_web_page_preview=True, delay=1))
 
         # final country GRAND TOTAL by date
         total_msg = render_dpf_country_total(country, rows, max_width=max_width)
         for chunk in split_table_text_customize(total_msg, first_len=2000):
-            await update.effective_chat.send_message(
-            chunk, 
-            parse_mode=ParseMode.MARKDOWN_V2, 
-            disable_web_page_preview=True
-            )
-            await asyncio.sleep(1)
+            messages.append(OutgoingMessage(chunk, disable_web_page_preview=True, delay=1))
+    return messages
+
+async def send_dpf_tables(update: Update, country_groups: dict[str, list[dict]], max_width: int = 72,
+                          image: bool = False):
+    if _image_mode(image, "dpf"):
+        images = await _cached_images(
+            "dpf", build_dpf_messages, _split_country_groups(country_groups, max_width),
+            data=country_groups, max_width=max_width, minute=_header_minute(),
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "dpf", build_dpf_messages, country_groups, max_width,
+        data=country_groups, max_width=max_width, minute=_header_minute(),
+    )
+    await send_messages(update, messages)
 
 # -----------------------------------------------------------
 import pandas as pd
@@ -1052,41 +805,17 @@ def format_split_summary_table(title: str, subtitle: str, report_df: pd.DataFram
     if report_df.empty:
         return ""
 
-    # Convert all data to strings for width calculation
-    df_str = report_df.astype(str)
-    
-    # Add an index column '#' to link the two tables
-    df_str.insert(0, '#', range(1, 1 + len(df_str)))
-    df_str['#'] = df_str['#'].astype(str)
-
-    # Separate the method names from the numerical data
-    method_map_df = df_str[['#', 'Method']]
-    numerical_df = df_str.drop(columns=['Method'])
+    # Numerical table with an index column '#' linking it to the method names
+    numbered = report_df.drop(columns=["Method"])
+    numbered.insert(0, "#", range(1, 1 + len(numbered)))
+    table_A = layout_table(frame_columns(numbered, first_align="right"), numbered)
+    table_A_lines = table_A.lines()
 
-    # --- Part 1: Build the Numerical Table ---
-    col_widths_A = {col: max(len(col), numerical_df[col].str.len().max()) for col in numerical_df.columns}
-    header_A = "  ".join(col.rjust(col_widths_A[col]) for col in numerical_df.columns)
-    
-    table_A_lines = [header_A]
-    for _, row in numerical_df.iterrows():
-        parts = [row[col].rjust(col_widths_A[col]) for col in numerical_df.columns]
-        table_A_lines.append("  ".join(parts))
-
-    # --- Part 2: Build the Method Name Mapping Table ---
-    # First, calculate the full width of the numerical table to use for the separator
-    table_A_width = len(header_A)
-
-    # The header for the second table is now a separator line
-    header_B = "-" * table_A_width
-    
-    # Calculate the correct width for the index column for proper alignment
-    w_idx_B = method_map_df['#'].str.len().max()
-    
-    # Start the table lines with the new separator header
-    table_B_lines = [header_B]
-
-    for _, row in method_map_df.iterrows():
-        table_B_lines.append(f"{row['#'].rjust(w_idx_B)}  {row['Method']}")
+    # Method mapping: a rule as wide as table A, then "#  Method" lines
+    w_idx_B = table_A.widths[0]
+    table_B_lines = ["-" * table_A.line_width()]
+    for i, method in enumerate(report_df["Method"].astype(str), start=1):
+        table_B_lines.append(f"{str(i).rjust(w_idx_B)}  {method}")
 
     # --- Combine all parts into the final message string ---
     message_parts = [
@@ -1100,22 +829,20 @@ def format_split_summary_table(title: str, subtitle: str, report_df: pd.DataFram
     return "\n".join(message_parts)
 
 
-async def send_method_summaries(update: Update, df: pd.DataFrame, target_date: str):
+def build_method_summary_messages(df: pd.DataFrame, target_date: str) -> list[OutgoingMessage]:
     """
-    Processes and sends method summary reports, with Deposit and Withdrawal
-    in separate messages. Each message splits the table for readability.
+    Deposit and Withdrawal method summaries per country, as separate messages.
+    Each message splits the table for readability.
     """
     if df.empty:
-        await update.effective_chat.send_message(
-            "`No method data to process.`", parse_mode=ParseMode.MARKDOWN_V2
-        )
-        return
+        return [OutgoingMessage("`No method data to process.`")]
 
+    messages = []
     for country, country_df in df.groupby("country"):
         try:
             title = f"{country} Payment Health by Method ({target_date})"
 
-            # --- 1. Process and Send Deposit Message ---
+            # --- 1. Deposit Message ---
             deposit_df = process_deposits_by_method(country_df)
             if not deposit_df.empty:
                 deposit_text = format_split_summary_table(
@@ -1123,19 +850,12 @@ async def send_method_summaries(update: Update, df: pd.DataFrame, target_date: s
                     subtitle="Deposit",
                     report_df=deposit_df
                 )
-                await update.effective_chat.send_message(
-                    deposit_text, parse_mode=ParseMode.MARKDOWN_V2
-                )
-                await asyncio.sleep(1)
+                messages.append(OutgoingMessage(deposit_text, delay=1))
             else:
-                 await update.effective_chat.send_message(
-                    f"*{escape_md_v2(title)}*\n_No deposit data to display for this period._",
-                    parse_mode=ParseMode.MARKDOWN_V2
-                )
-                 await asyncio.sleep(1)
-
+                messages.append(OutgoingMessage(
+                    f"*{escape_md_v2(title)}*\n_No deposit data to display for this period._", delay=1))
 
-            # --- 2. Process and Send Withdrawal Message ---
+            # --- 2. Withdrawal Message ---
             withdrawal_df = process_withdrawals_by_method(country_df)
             if not withdrawal_df.empty:
                 withdrawal_text = format_split_summary_table(
@@ -1143,24 +863,29 @@ async def send_method_summaries(update: Update, df: pd.DataFrame, target_date: s
                     subtitle="Withdrawal",
                     report_df=withdrawal_df
                 )
-                await update.effective_chat.send_message(
-                    withdrawal_text, parse_mode=ParseMode.MARKDOWN_V2
-                )
-                await asyncio.sleep(1)
+                messages.append(OutgoingMessage(withdrawal_text, delay=1))
             else:
-                await update.effective_chat.send_message(
-                    f"*{escape_md_v2(title)}*\n_No withdrawal data to display for this period._",
-                    parse_mode=ParseMode.MARKDOWN_V2
-                )
-                await asyncio.sleep(1)
-
+                messages.append(OutgoingMessage(
+                    f"*{escape_md_v2(title)}*\n_No withdrawal data to display for this period._", delay=1))
 
         except Exception as e:
             error_msg = f"Failed to generate method report for {country}: {e}"
             print(error_msg)
-            await update.effective_chat.send_message(
-                escape_md_v2(error_msg), parse_mode=ParseMode.MARKDOWN_V2
-            )
+            messages.append(OutgoingMessage(escape_md_v2(error_msg)))
+    return messages
+
+
+async def send_method_summaries(update: Update, df: pd.DataFrame, target_date: str, image: bool = False):
+    if _image_mode(image, "pmh_method") and not df.empty:
+        images = await _cached_images(
+            "pmh_method", build_method_summary_messages, _split_frame(df, target_date),
+            data=df, target_date=str(target_date),
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "pmh_method", build_method_summary_messages, df, target_date, data=df, target_date=str(target_date),
+    )
+    await send_messages(update, messages)
 
 # --- Pandas Processing Functions (No changes needed) ---
 def process_deposits(df: pd.DataFrame) -> pd.DataFrame:
@@ -1272,44 +997,18 @@ def format_table(report_df: pd.DataFrame) -> str:
     if report_df.empty:
         return "No data to display."
 
-    # Convert all data to strings for width calculation
-    df_str = report_df.astype(str)
-    
-    # Calculate the max width for each column
-    column_widths = {
-        col: max(len(col), df_str[col].str.len().max())
-        for col in df_str.columns
-    }
-
-    # Build the table header and rows
-    header = "  ".join(
-        col.ljust(column_widths[col]) if i == 0 else col.rjust(column_widths[col])
-        for i, col in enumerate(df_str.columns)
-    )
-    
-    table_lines = [header]
-    for _, row in df_str.iterrows():
-        parts = [
-            row[col].ljust(column_widths[col]) if i == 0 else row[col].rjust(column_widths[col])
-            for i, col in enumerate(df_str.columns)
-        ]
-        table_lines.append("  ".join(parts))
-
-    return "\n".join(table_lines)
+    return render_table(frame_columns(report_df), report_df)
 
 
-async def send_provider_summaries(update: Update, df: pd.DataFrame, target_date: str):
+def build_provider_summary_messages(df: pd.DataFrame, target_date: str) -> list[OutgoingMessage]:
     """
-    Processes and sends combined provider summary reports (Deposit + Withdrawal)
-    in a single message per country.
+    Combined provider summary (Deposit + Withdrawal), one message per country.
     Only the table sections are wrapped in `code blocks`, not the entire message.
     """
     if df.empty:
-        await update.effective_chat.send_message(
-            "`No provider data to process.`", parse_mode=ParseMode.MARKDOWN_V2
-        )
-        return
+        return [OutgoingMessage("`No provider data to process.`")]
 
+    messages = []
     for country, country_df in df.groupby("country"):
         try:
             # --- Process both deposit and withdrawal ---
@@ -1336,21 +1035,26 @@ async def send_provider_summaries(update: Update, df: pd.DataFrame, target_date:
             else:
                 parts.append("_No withdrawal data to display._")
 
-            # --- Combine ---
-            message_text = "\n".join(parts)
-
-            # --- Send ---
-            await update.effective_chat.send_message(
-                message_text, parse_mode=ParseMode.MARKDOWN_V2
-            )
-            await asyncio.sleep(1)
+            messages.append(OutgoingMessage("\n".join(parts), delay=1))
 
         except Exception as e:
             error_msg = f"Failed to generate report for {country}: {e}"
             print(error_msg)
-            await update.effective_chat.send_message(
-                escape_md_v2(error_msg), parse_mode=ParseMode.MARKDOWN_V2
-            )
+            messages.append(OutgoingMessage(escape_md_v2(error_msg)))
+    return messages
+
+
+async def send_provider_summaries(update: Update, df: pd.DataFrame, target_date: str, image: bool = False):
+    if _image_mode(image, "pmh_provider") and not df.empty:
+        images = await _cached_images(
+            "pmh_provider", build_provider_summary_messages, _split_frame(df, target_date),
+            data=df, target_date=str(target_date),
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "pmh_provider", build_provider_summary_messages, df, target_date, data=df, target_date=str(target_date),
+    )
+    await send_messages(update, messages)
 
 # --- NEW: Asynchronous Sending Functions ---
 FLAGS = {"TH":"🇹🇭","PH":"🇵🇭","BD":"🇧🇩","PK":"🇵🇰","ID":"🇮🇩", "BR":"🇧🇷"}
@@ -1453,30 +1157,7 @@ def _format_markdown_table(headers: List[str], data: List[List[str]]) -> str:
     if not data:
         return ""
 
-    # Calculate column widths for alignment
-    col_widths = [0] * len(headers)
-    for i, header in enumerate(headers):
-        col_widths[i] = len(str(header))
-    for row in data:
-        for i, cell in enumerate(row):
-            col_widths[i] = max(col_widths[i], len(str(cell)))
-
-    # Format header
-    header_line = "  ".join(
-        str(headers[i]).ljust(col_widths[i]) if i == 0 else str(headers[i]).rjust(col_widths[i])
-        for i in range(len(headers))
-    )
-
-    # Format body
-    body_lines = []
-    for row in data:
-        line = "  ".join(
-            str(row[j]).ljust(col_widths[j]) if j == 0 else str(row[j]).rjust(col_widths[j])
-            for j in range(len(row))
-        )
-        body_lines.append(line)
-
-    return "\n".join([header_line] + body_lines)
+    return render_table(text_columns(headers), data)
 
 # --- render_pmh_comparison_table (Unchanged) ---
 def render_pmh_comparison_table(total_report: dict, group_reports: list[tuple[str, dict]], title: str) -> str:
@@ -1558,19 +1239,20 @@ def _compute_pmh_report(df_slice: pd.DataFrame) -> dict:
 
 
 # --- Main Function (MODIFIED) ---  
-async def send_pmh_total(update: Update, df: pd.DataFrame, target_date):
+def _now_gmt7() -> datetime:
+    return datetime.now(timezone(timedelta(hours=7)))
+
+def build_pmh_total_messages(df: pd.DataFrame, target_date, now_gmt7: datetime | None = None) -> list[OutgoingMessage]:
     """
     For each country in df:
       - Computes TOTAL and individual group stats.
-      - Sends a SINGLE message with a comparison table.
+      - A SINGLE message with a comparison table.
     """
     if df.empty:
-        await update.effective_chat.send_message("`No data.`", parse_mode=ParseMode.MARKDOWN_V2)
-        return
+        return [OutgoingMessage("`No data.`")]
 
-    # --- NEW: Get current date/time in GMT+7 ---
-    gmt_plus_7 = timezone(timedelta(hours=7))
-    now_gmt7 = datetime.now(gmt_plus_7)
+    # --- Current date/time in GMT+7 ---
+    now_gmt7 = now_gmt7 or _now_gmt7()
     today_gmt7_str = now_gmt7.date().isoformat() # Format: 'YYYY-MM-DD'
     current_time_str = now_gmt7.strftime('%H:%M')
     
@@ -1579,6 +1261,7 @@ async def send_pmh_total(update: Update, df: pd.DataFrame, target_date):
     is_today = str(target_date) == today_gmt7_str
     # --- END NEW ---
 
+    messages = []
     for country, cdf in df.groupby("country"):
         # 1) --- Data Processing ---
         country_title_2 = escape_md_v2(f"{country} Group Comparison ({target_date})")
@@ -1625,12 +1308,24 @@ async def send_pmh_total(update: Update, df: pd.DataFrame, target_date):
             )
             if comparison_message:
                 for chunk in split_table_text_customize(comparison_message, first_len=3500):
-                    await update.effective_chat.send_message(
-                        chunk,
-                        parse_mode=ParseMode.MARKDOWN_V2,
-                        disable_web_page_preview=False
-                    )
-                    await asyncio.sleep(1)
+                    messages.append(OutgoingMessage(chunk, disable_web_page_preview=False, delay=1))
+    return messages
+
+async def send_pmh_total(update: Update, df: pd.DataFrame, target_date, image: bool = False):
+    now_gmt7 = _now_gmt7()
+    # the header only shows the time when target_date is today
+    minute = now_gmt7.strftime("%H:%M") if str(target_date) == now_gmt7.date().isoformat() else None
+    if _image_mode(image, "pmh_total") and not df.empty:
+        images = await _cached_images(
+            "pmh_total", build_pmh_total_messages, _split_frame(df, target_date, now_gmt7),
+            data=df, target_date=str(target_date), minute=minute,
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "pmh_total", build_pmh_total_messages, df, target_date, now_gmt7,
+        data=df, target_date=str(target_date), minute=minute,
+    )
+    await send_messages(update, messages)
 
 def _safe_div(n, d):
     try:
@@ -1713,37 +1408,148 @@ def _growth_pct(cur_val, prev_val):
         return 100.0 if (cur_val or 0) > 0 else 0.0
     return ((float(cur_val) - float(prev_val)) / float(prev_val)) * 100.0
 
+def _growth_pct_frame(cur: pd.DataFrame, prev: pd.DataFrame) -> pd.DataFrame:
+    """
+    Array version of _growth_pct over aligned metric frames (same index/columns).
+    A zero baseline reads as +100% when the current value is positive, else 0.
+    """
+    c = cur.to_numpy(dtype=float)
+    p = prev.reindex(index=cur.index, columns=cur.columns, fill_value=0.0).to_numpy(dtype=float)
+    zero_base = np.where(c > 0, 100.0, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(p == 0, zero_base, (c - p) / p * 100.0)
+    return pd.DataFrame(growth, index=cur.index, columns=cur.columns)
+
+# -- Weekly pivot (all groups + TOTAL in one pass) ---
+
+_WEEKLY_BASE_COLS = ["n", "dur", "f5", "f15"]
+_NULL_KEY = "<null>"
+
+def _weekly_base_pivot(cdf: pd.DataFrame, gkey: str) -> pd.DataFrame:
+    """
+    Single pivot over (period, group, tnx_type, status) for one country.
+    Index: (period, group); columns: (field, tnx_type, status) where field is
+    n (total_count), dur (avg seconds x count), f5 / f15 (within 300s / 900s).
+    Group keys are stringified once, exactly like the old per-group filter did.
+    NULL tnx_type / status become _NULL_KEY: pivot_table drops rows with a NaN
+    key, while the per-slice totals counted them (num, and the % denominators).
+    """
+    counts = cdf["total_count"]
+    work = pd.DataFrame({
+        "period": cdf["period"].to_numpy(),
+        "group": cdf[gkey].astype(str).to_numpy(),
+        "tnx_type": cdf["tnx_type"].fillna(_NULL_KEY).to_numpy(),
+        "status": cdf["status"].fillna(_NULL_KEY).to_numpy(),
+        "n": counts.to_numpy(),
+        "dur": (cdf["avg_diff_seconds_transaction"] * counts).to_numpy(),
+        "f5": cdf["transaction_within_300s"].to_numpy(),
+        "f15": cdf["transaction_within_900s"].to_numpy(),
+    })
+    return work.pivot_table(
+        index=["period", "group"],
+        columns=["tnx_type", "status"],
+        values=_WEEKLY_BASE_COLS,
+        aggfunc="sum",
+        fill_value=0,
+    )
+
+def _pivot_cell(pivot: pd.DataFrame, field: str, tnx_type: str, status: str | None = None) -> np.ndarray:
+    """Column of the weekly pivot as a float array (zeros when the combination never occurs)."""
+    key = (field, tnx_type) if status is None else (field, tnx_type, status)
+    try:
+        block = pivot[key]
+    except KeyError:
+        return np.zeros(len(pivot))
+    if isinstance(block, pd.DataFrame):
+        return block.to_numpy(dtype=float).sum(axis=1)
+    return block.to_numpy(dtype=float)
+
+def _safe_pct_array(n: np.ndarray, d: np.ndarray) -> np.ndarray:
+    return np.divide(n, d, out=np.zeros_like(n, dtype=float), where=(d != 0)) * 100.0
+
+def _weekly_metrics_frames(pivot: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Vectorized equivalent of _weekly_deposits_metrics / _weekly_withdrawals_metrics
+    for every row of the pivot at once. Returns (deposits, withdrawals) frames with
+    the same keys as the per-slice dicts.
+    """
+    dep_total = _pivot_cell(pivot, "n", "DEPOSIT")
+    dep_comp  = _pivot_cell(pivot, "n", "DEPOSIT", "completed")
+    dep_tout  = _pivot_cell(pivot, "n", "DEPOSIT", "timeout")
+    dep_err   = _pivot_cell(pivot, "n", "DEPOSIT", "error")
+    dep_dur   = _pivot_cell(pivot, "dur", "DEPOSIT", "completed")
+
+    deposits = pd.DataFrame({
+        "num": dep_total,
+        "avg_s": np.divide(dep_dur, dep_comp, out=np.zeros_like(dep_dur), where=(dep_comp != 0)),
+        "sc": _safe_pct_array(dep_comp, dep_total),
+        "to": _safe_pct_array(dep_tout, dep_total),
+        "er": _safe_pct_array(dep_err, dep_total),
+    }, index=pivot.index)
+
+    wdr_comp = _pivot_cell(pivot, "n", "WITHDRAWAL", "completed")
+    withdrawals = pd.DataFrame({
+        "num": _pivot_cell(pivot, "n", "WITHDRAWAL"),
+        "p5m": _safe_pct_array(_pivot_cell(pivot, "f5", "WITHDRAWAL", "completed"), wdr_comp),
+        "p15m": _safe_pct_array(_pivot_cell(pivot, "f15", "WITHDRAWAL", "completed"), wdr_comp),
+    }, index=pivot.index)
+    return deposits, withdrawals
+
+def compute_weekly_group_metrics(cdf: pd.DataFrame, gkey: str) -> dict:
+    """
+    Current/previous deposit and withdrawal metrics for every group of one
+    country (plus TOTAL when there is more than one group), and their growth.
+
+    Returns a dict with:
+      groups        sorted group names (strings)
+      cur_dep, prv_dep, cur_wdr, prv_wdr   frames indexed by group
+      dep_growth, wdr_growth               growth % frames indexed by group
+    """
+    pivot = _weekly_base_pivot(cdf, gkey)
+    groups = sorted(pivot.index.get_level_values("group").unique())
+
+    if len(groups) > 1:
+        # TOTAL = per-period sum over groups; same metric maths as a group row
+        totals = pivot.groupby(level="period").sum()
+        totals.index = pd.MultiIndex.from_product([totals.index, ["TOTAL"]], names=["period", "group"])
+        pivot = pd.concat([pivot, totals])
+
+    deposits, withdrawals = _weekly_metrics_frames(pivot)
+    labels = groups + (["TOTAL"] if len(groups) > 1 else [])
+
+    def _period(frame: pd.DataFrame, period: str) -> pd.DataFrame:
+        if period in frame.index.get_level_values("period"):
+            part = frame.xs(period, level="period")
+        else:
+            part = frame.iloc[0:0].droplevel("period")
+        return part.reindex(labels, fill_value=0.0)
+
+    cur_dep, prv_dep = _period(deposits, "CUR"), _period(deposits, "PREV")
+    cur_wdr, prv_wdr = _period(withdrawals, "CUR"), _period(withdrawals, "PREV")
+    return dict(
+        groups=groups,
+        cur_dep=cur_dep, prv_dep=prv_dep,
+        cur_wdr=cur_wdr, prv_wdr=prv_wdr,
+        dep_growth=_growth_pct_frame(cur_dep, prv_dep),
+        wdr_growth=_growth_pct_frame(cur_wdr, prv_wdr),
+    )
+
 # -- Table Build Functions (MODIFIED) ---
 
-def _build_growth_table(base_headers, cur_rows, prev_rows, keys_order, group_order):
+def _build_growth_table(base_headers, growth, keys_order, group_order):
     """
-    MODIFIED: Added 'group_order' to ensure same sorting as main table.
-    MODIFIED: Growth formatted to 0 decimal places.
-    MODIFIED: Group name is now UPPERCASE.
+    growth: frame of growth % indexed by group (see _growth_pct_frame).
+    'group_order' keeps the same sorting as the main table.
+    Growth formatted to 0 decimal places; group name in UPPERCASE.
     """
     headers = base_headers[:]  # copy
+    values = growth.reindex(index=group_order, columns=keys_order, fill_value=0.0).to_numpy(dtype=float)
     data = []
-    
-    # CHANGED: Iterate over the pre-sorted group_order list
-    for g in group_order:
-        cur = cur_rows.get(g, {})
-        prv = prev_rows.get(g, {})
-        
-        # CHANGED: Convert group name to UPPERCASE
-        row = [str(g).upper()] 
-        
-        for k in keys_order:
-            if k != "er":
-                growth = _growth_pct(cur.get(k, 0.0), prv.get(k, 0.0))
-                # CHANGED: Format to 0 decimal places (e.g., "+10" instead of "+10.1")
-                row.append(("+" if growth >= 0 else "") + f"{growth:.0f}")
-            else:
-                growth = _growth_pct(cur.get(k, 0.0), prv.get(k, 0.0))
-                # CHANGED: Format to 0 decimal places (e.g., "+10" instead of "+10.1")
-                row.append(("+" if growth >= 0 else "") + f"{growth:.0f}")
+    for g, row_vals in zip(group_order, values.tolist()):
+        row = [str(g).upper()]
+        row.extend(("+" if v >= 0 else "") + f"{v:.0f}" for v in row_vals)
         data.append(row)
-    df = pd.DataFrame(data, columns=headers)
-    return format_table(df) # Assuming format_table() exists
+    return render_table(text_columns(headers), data)
 
 def _build_deposits_table(rows):
     headers = ["Group", "#", "Avg", "%SC", "%TO", "%ER"]
@@ -1759,8 +1565,7 @@ def _build_deposits_table(rows):
             _fmt_pcti(m["to"]),
             _fmt_pcti(m["er"], 1),
         ])
-    df = pd.DataFrame(data, columns=headers)
-    return format_table(df) # Assuming format_table() exists
+    return render_table(text_columns(headers), data)
 
 def _build_withdrawals_table(rows):
     headers = ["Group", "#", "%<5min", "%<15min"]
@@ -1774,8 +1579,7 @@ def _build_withdrawals_table(rows):
             _fmt_pcti(m["p5m"]),
             _fmt_pcti(m["p15m"]),
         ])
-    df = pd.DataFrame(data, columns=headers)
-    return format_table(df) # Assuming format_table() exists
+    return render_table(text_columns(headers), data)
 
 # --- Main Function (MODIFIED) ---
 def week_of_month(dt: datetime, week_start: int = 0) -> int:
@@ -1793,77 +1597,55 @@ def week_of_month(dt: datetime, week_start: int = 0) -> int:
 def month_week_label(dt: datetime, week_start: int = 0) -> str:
     return f"Week {week_of_month(dt, week_start)} - {dt.strftime('%b %y')}"
 
-async def send_pmh_week(update: Update, df: pd.DataFrame, as_of_date: str):
+def build_pmh_week_messages(df: pd.DataFrame, as_of_date: str, now_g7: datetime | None = None) -> list[OutgoingMessage]:
     if df.empty:
-        await update.effective_chat.send_message("`No weekly data.`", parse_mode=ParseMode.MARKDOWN_V2)
-        return
+        return [OutgoingMessage("`No weekly data.`")]
 
-    g7 = timezone(timedelta(hours=7))
-    now_g7 = datetime.now(g7)
+    now_g7 = now_g7 or _now_gmt7()
     now_time = now_g7.strftime("%H:%M")
 
     as_of_dt = datetime.strptime(str(as_of_date), "%Y-%m-%d").date()
     week_start = (as_of_dt - timedelta(days=(as_of_dt.weekday())))
     is_today = (as_of_dt == now_g7.date())
 
+    messages = []
     for country, cdf in df.groupby("country"):
-        cur_df = cdf[cdf["period"] == "CUR"].copy()
-        prv_df = cdf[cdf["period"] == "PREV"].copy()
-
         gkey = "group_name" if "group_name" in cdf.columns else "brand"
 
-        cur_dep, prv_dep, cur_wdr, prv_wdr = {}, {}, {}, {}
-        groups = sorted(set(cur_df[gkey].astype(str)).union(set(prv_df[gkey].astype(str))))
-
-        for g in groups:
-            g_cur = cur_df[cur_df[gkey].astype(str) == g]
-            g_prv = prv_df[prv_df[gkey].astype(str) == g]
-            cur_dep[g] = _weekly_deposits_metrics(g_cur)
-            prv_dep[g] = _weekly_deposits_metrics(g_prv)
-            cur_wdr[g] = _weekly_withdrawals_metrics(g_cur)
-            prv_wdr[g] = _weekly_withdrawals_metrics(g_prv)
+        # One pivot for all groups + TOTAL (see compute_weekly_group_metrics)
+        weekly = compute_weekly_group_metrics(cdf, gkey)
+        groups = weekly["groups"]
+        cur_dep, cur_wdr = weekly["cur_dep"], weekly["cur_wdr"]
 
         # These sorted lists control the order for BOTH main and growth tables
-        dep_order = sorted(groups, key=lambda x: cur_dep.get(x, {}).get("num", 0.0), reverse=True)
-        wdr_order = sorted(groups, key=lambda x: cur_wdr.get(x, {}).get("num", 0.0), reverse=True)
+        dep_num = cur_dep["num"].to_dict()
+        wdr_num = cur_wdr["num"].to_dict()
+        dep_order = sorted(groups, key=lambda x: dep_num.get(x, 0.0), reverse=True)
+        wdr_order = sorted(groups, key=lambda x: wdr_num.get(x, 0.0), reverse=True)
 
-        # === CHANGED: Add TOTAL row logic ===
         # Only add a TOTAL row if there is more than one group
         if len(groups) > 1:
-            # Calculate metrics for the entire period (all groups)
-            # We can re-use the metrics functions on the period dataframes
-            total_cur_dep = _weekly_deposits_metrics(cur_df)
-            total_prv_dep = _weekly_deposits_metrics(prv_df)
-            total_cur_wdr = _weekly_withdrawals_metrics(cur_df)
-            total_prv_wdr = _weekly_withdrawals_metrics(prv_df)
-         
-            # Add to the metric dictionaries
-            cur_dep["TOTAL"] = total_cur_dep
-            prv_dep["TOTAL"] = total_prv_dep
-            cur_wdr["TOTAL"] = total_cur_wdr
-            prv_wdr["TOTAL"] = total_prv_wdr
-            
-            # Add "TOTAL" to the end of the sorted order lists
             dep_order.append("TOTAL")
             wdr_order.append("TOTAL")
-        # === End of TOTAL row logic ===
 
         # These row builders will now include "TOTAL" if it was added to dep_order/wdr_order
-        dep_rows = [(g, cur_dep[g]) for g in dep_order]
-        wdr_rows = [(g, cur_wdr[g]) for g in wdr_order]
+        dep_records = cur_dep.to_dict(orient="index")
+        wdr_records = cur_wdr.to_dict(orient="index")
+        dep_rows = [(g, dep_records[g]) for g in dep_order]
+        wdr_rows = [(g, wdr_records[g]) for g in wdr_order]
 
         deposits_table     = _build_deposits_table(dep_rows)
         withdrawals_table  = _build_withdrawals_table(wdr_rows)
 
         dep_growth_table = _build_growth_table(
             base_headers=["Group", "#", "Avg", "%SC", "%TO", "%ER"],
-            cur_rows=cur_dep, prev_rows=prv_dep,
+            growth=weekly["dep_growth"],
             keys_order=["num","avg_s","sc","to","er"],
             group_order=dep_order  # This list now includes "TOTAL" if needed
         )
         wdr_growth_table = _build_growth_table(
             base_headers=["Group", "#", "%<5min", "%<15min"],
-            cur_rows=cur_wdr, prev_rows=prv_wdr,
+            growth=weekly["wdr_growth"],
             keys_order=["num","p5m","p15m"],
             group_order=wdr_order  # This list now includes "TOTAL" if needed
         )
@@ -1890,7 +1672,7 @@ async def send_pmh_week(update: Update, df: pd.DataFrame, as_of_date: str):
             # escape_md_v2("DEPOSITS +/- % (vs. same days last week)"),
             f"`{dep_growth_table}`",
         ])
-        await update.effective_chat.send_message(msg_deposits, parse_mode=ParseMode.MARKDOWN_V2)
+        messages.append(OutgoingMessage(msg_deposits))
 
        # --- ONE message for Withdrawals: main + growth ---
         msg_withdrawals = "\n".join([
@@ -1905,7 +1687,25 @@ async def send_pmh_week(update: Update, df: pd.DataFrame, as_of_date: str):
             # escape_md_v2("WITHDRAWALS +/- % (vs. same days last week)"),
             f"`{wdr_growth_table}`",
         ])
-        await update.effective_chat.send_message(msg_withdrawals, parse_mode=ParseMode.MARKDOWN_V2)# %%%
+        messages.append(OutgoingMessage(msg_withdrawals))
+    return messages
+
+async def send_pmh_week(update: Update, df: pd.DataFrame, as_of_date: str, image: bool = False):
+    now_g7 = _now_gmt7()
+    minute = now_g7.strftime("%H:%M") if str(as_of_date) == now_g7.date().isoformat() else None
+    if _image_mode(image, "pmh_week") and not df.empty:
+        images = await _cached_images(
+            "pmh_week", build_pmh_week_messages, _split_frame(df, as_of_date, now_g7),
+            data=df, as_of_date=str(as_of_date), minute=minute,
+        )
+        return await send_images(update, images)
+    messages = await _cached_render(
+        "pmh_week", build_pmh_week_messages, df, as_of_date, now_g7,
+        data=df, as_of_date=str(as_of_date), minute=minute,
+    )
+    await send_messages(update, messages)
+
+# %%%
 def wrap_separators(s: str) -> str:
     """
     Replace '-' and ',' in the string with MarkdownV2-safe backtick-wrapped versions.
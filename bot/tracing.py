@@ -0,0 +1,304 @@
+# tracing.py
+"""
+Per-update span tracing: where the minute of one slow command went.
+
+    TRACE_BUFFER   finished traces kept in memory for /trace (default 200; 0 = tracing off)
+    TRACE_EXPORT   append every finished trace to this file, one OTLP/JSON line each
+                   (the resourceSpans shape an OpenTelemetry collector's file receiver reads);
+                   unset: no export (default)
+
+ChatOrderedProcessor starts a trace when an update arrives and finishes it
+when the handler is done; the trace's root span is the whole update. Spans
+below it come from
+
+    with tracing.span("parse"):        # any block of the handler
+        ...
+    with metrics.phase("query", "execute_pmh_query"):   # every metrics phase is a span too
+        ...
+
+and ResilientRequest adds one per Bot API call (sendMessage, with its 429s
+as events). The current trace and span travel in ContextVars, so tasks the
+handler starts (the query task, asyncio.to_thread) record into the same
+trace; outside an update span() does nothing.
+
+The last TRACE_BUFFER traces sit in a ring buffer; waterfall() draws one
+as text for the admin /trace command, to_otlp() gives its JSON.
+"""
+import asyncio
+import collections
+import contextvars
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "telegram-bq-bot"
+
+# span ids only need to be unique within a trace: a counter, formatted on export
+_span_ids = itertools.count(random.getrandbits(62) + 1)
+
+class Span:
+    __slots__ = ("name", "span_id", "parent", "start", "end", "attrs", "events", "error")
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attrs = attrs
+        self.events: list[tuple[float, str, dict]] = []
+        self.error: str | None = None
+
+    def depth(self) -> int:
+        d, p = 0, self.parent
+        while p is not None:
+            d, p = d + 1, p.parent
+        return d
+
+class Trace:
+    __slots__ = ("trace_id", "wall", "root", "spans")
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.root = Span(name, None, attrs)
+        self.wall = time.time() - (time.perf_counter() - self.root.start)  # epoch seconds at root.start
+        self.spans = [self.root]  # in start order; appended from any task or thread
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @property
+    def seconds(self) -> float:
+        return ((self.root.end or time.perf_counter()) - self.root.start)
+
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("trace_span", default=None)
+
+_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER", "200"))
+_EXPORT = os.environ.get("TRACE_EXPORT") or None
+_buffer: collections.deque[Trace] = collections.deque(maxlen=max(_BUFFER_SIZE, 1))
+_buffer_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+def enabled() -> bool:
+    return _BUFFER_SIZE > 0
+
+def active() -> bool:
+    """Whether this task is inside a traced update."""
+    return _trace.get() is not None
+
+def current() -> Trace | None:
+    return _trace.get()
+
+# ---------- recording ----------
+def start(name: str, **attrs) -> Trace | None:
+    """Begin a trace for the current task (one per update); its root span is open until finish()."""
+    if _BUFFER_SIZE <= 0:
+        return None
+    trace = Trace(name, attrs)
+    _trace.set(trace)
+    _span.set(trace.root)
+    return trace
+
+def finish(trace: Trace | None) -> None:
+    """Close the trace, keep it in the ring buffer and export it if TRACE_EXPORT is set."""
+    if trace is None or trace.root.end is not None:
+        return
+    trace.root.end = time.perf_counter()
+    with _buffer_lock:
+        _buffer.append(trace)
+    if _EXPORT:
+        line = json.dumps(to_otlp(trace), separators=(",", ":"))
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _append_export, line)
+        except RuntimeError:
+            _append_export(line)
+
+def _append_export(line: str) -> None:
+    try:
+        with _export_lock, open(_EXPORT, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning("Could not export trace to %s: %s", _EXPORT, e)
+
+class span:
+    """Time a block as a child of the current span: `with tracing.span("parse"): ...`"""
+
+    __slots__ = ("name", "attrs", "span", "token")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span = None
+
+    def __enter__(self):
+        trace = _trace.get()
+        if trace is not None:
+            self.span = Span(self.name, _span.get(), self.attrs)
+            trace.spans.append(self.span)
+            self.token = _span.set(self.span)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        s = self.span
+        if s is None:
+            return
+        s.end = time.perf_counter()
+        if exc_type is not None:
+            s.error = exc_type.__name__
+        _span.reset(self.token)
+        self.span = None
+
+def begin(name: str, **attrs) -> Span | None:
+    """Open a leaf span where a `with` block does not fit (e.g. around a lock acquisition); close it with end()."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    s = Span(name, _span.get(), attrs)
+    trace.spans.append(s)
+    return s
+
+def end(s: Span | None) -> None:
+    if s is not None and s.end is None:
+        s.end = time.perf_counter()
+
+def annotate(**attrs) -> None:
+    """Add attributes to the current span (the root span between spans)."""
+    s = _span.get()
+    if s is not None:
+        s.attrs.update(attrs)
+
+def event(name: str, **attrs) -> None:
+    """Mark a moment in the current span, e.g. a 429 before its retry."""
+    s = _span.get()
+    if s is not None:
+        s.events.append((time.perf_counter(), name, attrs))
+
+def fail(error: BaseException) -> None:
+    """Mark the update's trace as failed (errors no span saw, e.g. in PTB's error handler)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.root.error = type(error).__name__
+
+# ---------- reading ----------
+def recent(n: int | None = None, name: str | None = None) -> list[Trace]:
+    """Finished traces, newest first (only those of command `name` if given)."""
+    with _buffer_lock:
+        traces = list(_buffer)
+    traces.reverse()
+    if name is not None:
+        traces = [t for t in traces if t.name == name]
+    return traces[:n] if n is not None else traces
+
+def find(prefix: str) -> Trace | None:
+    prefix = prefix.lower()
+    return next((t for t in recent() if t.trace_id.startswith(prefix)), None)
+
+def _duration(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+def _attrs_text(attrs: dict, limit: int = 40) -> str:
+    text = " ".join(f"{k}={v}" for k, v in attrs.items())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _runs(spans: list[Span]) -> list[list[Span]]:
+    """Spans in start order, consecutive childless siblings of one name (the sendMessage of
+    every table) grouped into one run."""
+    parents = {id(s.parent) for s in spans}
+    runs: list[list[Span]] = []
+    for s in spans:
+        last = runs[-1][-1] if runs else None
+        if (last is not None and id(s) not in parents and id(last) not in parents
+                and s.name == last.name and s.parent is last.parent):
+            runs[-1].append(s)
+        else:
+            runs.append([s])
+    return runs
+
+def waterfall(trace: Trace, width: int = 20, max_lines: int = 35) -> str:
+    """
+    One line per span: start offset, duration, a bar on the trace's time axis
+    and the span name, indented by depth. A run of same-named sibling spans is
+    one line ("sendMessage ×14", from the first start to the last end, the
+    pauses between them included). Gaps between a span's children are time
+    nobody accounted for (the event loop busy with other chats).
+    """
+    total = trace.seconds or 1e-9
+    t0 = trace.root.start
+    lines = []
+    runs = _runs(sorted(trace.spans, key=lambda s: s.start))
+    for run in runs[:max_lines]:
+        s = run[0]
+        start = s.start - t0
+        stop = max((x.end if x.end is not None else trace.root.end or x.start) for x in run) - t0
+        lo = min(int(start / total * width), width - 1)
+        hi = max(lo + 1, min(width, round(stop / total * width)))
+        bar = " " * lo + "█" * (hi - lo) + " " * (width - hi)
+        attrs = {k: v for k, v in s.attrs.items() if k != "phase"}
+        extra = [f"×{len(run)}"] if len(run) > 1 else []
+        extra += [_attrs_text(attrs)] if attrs and s is not trace.root and len(run) == 1 else []
+        events = collections.Counter(name for x in run for _, name, _ in x.events)
+        extra += [f"{name}×{n}" if n > 1 else name for name, n in events.items()]
+        extra += [f"ERROR {x.error}" for x in run if x.error]
+        label = "  " * s.depth() + s.name + (" " + " ".join(extra) if extra else "")
+        lines.append(f"{_duration(start):>7} {_duration(stop - start):>7} |{bar}| {label}")
+    if len(runs) > max_lines:
+        lines.append(f"… {len(runs) - max_lines} more (/trace json {trace.trace_id[:8]})")
+    return "\n".join(lines)
+
+def summary(trace: Trace) -> str:
+    """One line: id, command, when, total time and who."""
+    when = time.strftime("%H:%M:%S", time.localtime(trace.wall))
+    who = _attrs_text({k: v for k, v in trace.root.attrs.items() if k in ("chat_id", "user_id")})
+    error = f" ERROR {trace.root.error}" if trace.root.error else ""
+    return f"{trace.trace_id[:8]} {when} {trace.name} {_duration(trace.seconds)} {who}{error}"
+
+# ---------- export ----------
+def _otlp_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+def _otlp_attrs(attrs: dict) -> list[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()]
+
+def to_otlp(trace: Trace) -> dict:
+    """The trace as an OTLP/JSON ExportTraceServiceRequest (one resource, one scope)."""
+    t0 = trace.root.start
+
+    def nanos(t: float | None) -> str:
+        return str(int((trace.wall + ((t if t is not None else trace.root.end or t0) - t0)) * 1e9))
+
+    spans = []
+    for s in trace.spans:
+        out = {
+            "traceId": trace.trace_id,
+            "spanId": f"{s.span_id:016x}",
+            "name": s.name,
+            "kind": 2 if s is trace.root else 1,  # SERVER for the update, INTERNAL below it
+            "startTimeUnixNano": nanos(s.start),
+            "endTimeUnixNano": nanos(s.end),
+            "attributes": _otlp_attrs(s.attrs),
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+        }
+        if s.parent is not None:
+            out["parentSpanId"] = f"{s.parent.span_id:016x}"
+        if s.events:
+            out["events"] = [{"timeUnixNano": nanos(t), "name": name, "attributes": _otlp_attrs(a)}
+                             for t, name, a in s.events]
+        spans.append(out)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attrs({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": "bot.tracing"}, "spans": spans}],
+    }]}
@@ -0,0 +1,125 @@
+# update_processor.py
+"""
+Concurrent update handling with per-chat ordering.
+
+With PTB's default every update waits for the previous one, so a long
+`/pmh_week A` in one chat holds up `/help` everywhere. ChatOrderedProcessor
+(passed to ApplicationBuilder.concurrent_updates) lets different chats run in
+parallel while updates of the same chat still run one after another, in
+arrival order.
+
+    UPDATE_CONCURRENCY   max updates processed at once, all chats (default 16)
+
+An update first waits for its chat's turn and only then for a global slot,
+so one chat flooding the bot queues behind itself instead of taking every
+slot. Updates without a chat (e.g. inline queries) only take a slot.
+
+`on_arrival(update)` is called as soon as an update is received, before it
+waits for its turn (RealTimeBot uses it to cancel the report a new command
+supersedes); `on_done(update)` after it has been handled, in the handler's
+context. `label(update)` names the update's command for the metrics; it is
+set as metrics.current_command for the handler, so the phase timings of
+bot/metrics.py are filed under it, and names the update's trace
+(bot/tracing.py), which runs from arrival to the end of handling with the
+wait for the chat's turn and a slot as its "queue" span.
+
+Metrics: update_queue_depth (waiting), updates_in_flight (running),
+updates_processed_total, update_wait_seconds_total and command_seconds
+(arrival to end of handling, by command).
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot import metrics, tracing
+
+QUEUE_DEPTH = metrics.gauge("update_queue_depth", "Updates received but not yet being processed")
+IN_FLIGHT = metrics.gauge("updates_in_flight", "Updates being processed right now")
+PROCESSED = metrics.counter("updates_processed_total", "Updates processed")
+WAIT_SECONDS = metrics.counter("update_wait_seconds_total", "Time updates spent queued before processing")
+COMMAND_SECONDS = metrics.histogram("command_seconds", "Time from receiving an update to the end of its handling")
+
+# PTB's process_update (final) holds the base class's semaphore around do_process_update. That
+# semaphore gets a cap no burst reaches (it also keeps the Application running one task per
+# update); the chat turn and the UPDATE_CONCURRENCY slot are taken in do_process_update.
+_UNBOUNDED = 1 << 30
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int | None = None,
+                 on_arrival: Callable[[object], None] | None = None,
+                 on_done: Callable[[object], None] | None = None,
+                 label: Callable[[object], str] | None = None):
+        super().__init__(_UNBOUNDED)
+        self.concurrency = max_concurrent_updates or int(os.environ.get("UPDATE_CONCURRENCY", "16"))
+        self.on_arrival = on_arrival
+        self.on_done = on_done
+        self.label = label
+        self._slots = asyncio.BoundedSemaphore(self.concurrency)
+        # chat_id -> [lock, updates holding or waiting for it]; dropped when idle
+        self._chats: dict[int, list] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def chat_id(update: object) -> int | None:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        # chat turn first, then one of our own slots (the base class's semaphore never blocks)
+        command = self.label(update) if self.label is not None else "update"
+        metrics.current_command.set(command)  # this task runs the handler
+        chat_id = self.chat_id(update)
+        trace = tracing.start(command, chat_id=chat_id) if chat_id is not None else tracing.start(command)
+        if self.on_arrival is not None:
+            self.on_arrival(update)
+        entry = None
+        if chat_id is not None:
+            entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+        QUEUE_DEPTH.inc()
+        queued = time.perf_counter()
+        queue_span = tracing.begin("queue")
+        waiting = True
+        try:
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._slots:
+                    QUEUE_DEPTH.dec()
+                    waiting = False
+                    tracing.end(queue_span)
+                    WAIT_SECONDS.inc(time.perf_counter() - queued)
+                    IN_FLIGHT.inc()
+                    try:
+                        await coroutine
+                    finally:
+                        IN_FLIGHT.dec()
+                        PROCESSED.inc()
+                        COMMAND_SECONDS.observe(time.perf_counter() - queued, command=command)
+                        if self.on_done is not None:
+                            self.on_done(update)
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            if waiting:
+                # cancelled (e.g. on shutdown) before it got to run
+                QUEUE_DEPTH.dec()
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            tracing.end(queue_span)
+            tracing.finish(trace)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[chat_id]
@@ -0,0 +1,242 @@
+# usage.py
+"""
+Usage analytics over the event logs (admin /usage).
+
+Closed days of logs/events-YYYYMMDD[.w<i>].jsonl[.gz|.zst] (one file per
+worker in multi-worker mode) are compacted once into Parquet, one partition
+per day:
+
+    logs/usage/day=YYYYMMDD/events.parquet
+
+Only the analytics columns are kept (ts, user_id, chat_id, chat_type,
+command); message text is not copied. A date range only opens the matching
+day directories. Within a day, rows are sorted by command (then user_id and
+chat_id, which helps compression) and written in small row groups, so the
+Parquet min/max statistics index command: a /usage /<command> filter skips
+the row groups of every other command. user_id and chat_id are not indexed,
+since every row group holds most users and chats. The top-users and
+per-chat sections read those columns of every day in range. They are two
+compressed int64 columns, so a month takes well under a second
+(benchmarks/bench_usage.py). Today's file is still being written and is
+read from the JSONL directly.
+
+compact_closed_days() runs at startup, once this worker's EventLogWriter
+has compressed its leftover files, and again every night shortly after
+midnight GMT+7 (see UsageCompactor). pyarrow is optional
+(requirements2.txt); without it available() is False and /usage says so.
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.json as pj
+    import pyarrow.parquet as pq
+except ImportError:  # usage analytics are simply unavailable
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+TZ = ZoneInfo("Asia/Bangkok")
+ROW_GROUP_SIZE = 16_384
+_EVENT_FILE = re.compile(r"^events-(\d{8})(\.w\d+)?\.jsonl(\.gz|\.zst)?$")
+_COMMAND = r"^/(?P<cmd>[A-Za-z0-9_]+)"
+
+def available() -> bool:
+    return pa is not None
+
+def _raw_schema():
+    return pa.schema([
+        ("ts", pa.string()), ("user_id", pa.int64()), ("chat_id", pa.int64()),
+        ("chat_type", pa.string()), ("text", pa.string()), ("command", pa.string()),
+    ])
+
+def events_schema():
+    """Columns kept for analytics."""
+    return pa.schema([
+        ("ts", pa.timestamp("us", tz="UTC")), ("user_id", pa.int64()), ("chat_id", pa.int64()),
+        ("chat_type", pa.string()), ("command", pa.string()),
+    ])
+
+def event_files(log_dir: Path) -> dict[str, list[Path]]:
+    """{YYYYMMDD: [path per worker]} of the event logs in log_dir."""
+    found: dict[tuple[str, str], Path] = {}
+    for path in log_dir.glob("events-*.jsonl*"):
+        m = _EVENT_FILE.match(path.name)
+        if m:
+            # a compressed copy wins over a leftover plain file
+            key = (m.group(1), m.group(2) or "")
+            if key not in found or m.group(3):
+                found[key] = path
+    files: dict[str, list[Path]] = {}
+    for (day, _), path in sorted(found.items()):
+        files.setdefault(day, []).append(path)
+    return files
+
+def _read_one(path: Path) -> "pa.Table":
+    opts = pj.ParseOptions(explicit_schema=_raw_schema(), unexpected_field_behavior="ignore")
+    with pa.input_stream(str(path), compression="detect") as src:
+        raw = pj.read_json(src, parse_options=opts)
+    # /dpf@MyBot a 20250901 -> "dpf"; older events carry it in "command"
+    cmd = pc.struct_field(pc.extract_regex(pc.coalesce(raw["command"], raw["text"]), _COMMAND), "cmd")
+    return pa.table({
+        "ts": pc.cast(raw["ts"], pa.timestamp("us", tz="UTC")),
+        "user_id": raw["user_id"],
+        "chat_id": raw["chat_id"],
+        "chat_type": raw["chat_type"],
+        "command": pc.utf8_lower(cmd),
+    })
+
+def read_events(paths: Path | list[Path]) -> "pa.Table":
+    """One day's JSONL (plain/.gz/.zst, one or more worker files) as the analytics columns."""
+    if isinstance(paths, Path):
+        return _read_one(paths)
+    return pa.concat_tables([_read_one(p) for p in paths])
+
+def compact_day(paths: Path | list[Path], usage_dir: Path, day: str) -> Path:
+    table = read_events(paths).sort_by([("command", "ascending"), ("user_id", "ascending"), ("chat_id", "ascending")])
+    out = usage_dir / f"day={day}" / "events.parquet"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd", write_statistics=True)
+    tmp.replace(out)
+    return out
+
+def compact_closed_days(log_dir: str | Path, usage_dir: str | Path | None = None) -> list[str]:
+    """Compact every closed day that has no Parquet partition yet. Returns the days done."""
+    log_dir = Path(log_dir)
+    usage_dir = Path(usage_dir) if usage_dir else log_dir / "usage"
+    today = datetime.now(TZ).strftime("%Y%m%d")
+    done = []
+    for day, paths in sorted(event_files(log_dir).items()):
+        if day >= today or (usage_dir / f"day={day}" / "events.parquet").exists():
+            continue
+        try:
+            try:
+                compact_day(paths, usage_dir, day)
+            except FileNotFoundError:
+                # another worker's writer compressed one of its leftover files meanwhile: read the copy
+                compact_day(event_files(log_dir)[day], usage_dir, day)
+            done.append(day)
+        except Exception:
+            logger.exception("Failed to compact %s", day)
+    if done:
+        logger.info("Compacted %d day(s) of events into %s", len(done), usage_dir)
+    return done
+
+def load_range(log_dir: str | Path, start: date, end: date, usage_dir: str | Path | None = None,
+               filter=None) -> "pa.Table":
+    """Events from start..end (inclusive, GMT+7 days): compacted days plus today's live file."""
+    log_dir = Path(log_dir)
+    usage_dir = Path(usage_dir) if usage_dir else log_dir / "usage"
+    lo, hi = start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+    schema = events_schema()
+
+    parts = []
+    if usage_dir.exists():
+        dataset = ds.dataset(usage_dir, format="parquet", partitioning=ds.partitioning(
+            pa.schema([("day", pa.string())]), flavor="hive"))
+        expr = (ds.field("day") >= lo) & (ds.field("day") <= hi)
+        if filter is not None:
+            expr = expr & filter
+        parts.append(dataset.to_table(columns=schema.names, filter=expr))
+
+    today = datetime.now(TZ).strftime("%Y%m%d")
+    live = event_files(log_dir).get(today, [])
+    if lo <= today <= hi:
+        for path in live:
+            try:
+                table = read_events(path)
+                parts.append(table.filter(filter) if filter is not None else table)
+            except Exception:
+                logger.exception("Failed to read %s", path)
+
+    if not parts:
+        return schema.empty_table()
+    # Parquet reads the string columns back dictionary-encoded; unify to plain strings
+    return pa.concat_tables([t.cast(schema) for t in parts])
+
+def top_commands(table: "pa.Table", limit: int = 10) -> list[tuple[str, int, int]]:
+    """(command, runs, distinct users), most used first."""
+    cmds = table.filter(pc.is_valid(table["command"]))
+    agg = cmds.group_by("command").aggregate([("command", "count"), ("user_id", "count_distinct")])
+    agg = agg.sort_by([("command_count", "descending"), ("command", "ascending")]).slice(0, limit)
+    return list(zip(agg["command"].to_pylist(), agg["command_count"].to_pylist(),
+                    agg["user_id_count_distinct"].to_pylist()))
+
+def top_users(table: "pa.Table", limit: int = 10) -> list[tuple[int, int, int]]:
+    """(user_id, commands run, messages), by commands run."""
+    is_cmd = pc.cast(pc.is_valid(table["command"]), pa.int64())
+    agg = (table.append_column("is_cmd", is_cmd)
+           .group_by("user_id").aggregate([("is_cmd", "sum"), ("is_cmd", "count")]))
+    agg = agg.sort_by([("is_cmd_sum", "descending"), ("is_cmd_count", "descending")]).slice(0, limit)
+    return list(zip(agg["user_id"].to_pylist(), agg["is_cmd_sum"].to_pylist(), agg["is_cmd_count"].to_pylist()))
+
+def chat_activity(table: "pa.Table", limit: int = 10) -> list[tuple[int, str, int, int, int]]:
+    """(chat_id, chat_type, messages, commands, distinct users), busiest first."""
+    is_cmd = pc.cast(pc.is_valid(table["command"]), pa.int64())
+    agg = (table.append_column("is_cmd", is_cmd)
+           .group_by(["chat_id", "chat_type"])
+           .aggregate([("is_cmd", "count"), ("is_cmd", "sum"), ("user_id", "count_distinct")]))
+    agg = agg.sort_by([("is_cmd_count", "descending")]).slice(0, limit)
+    return list(zip(agg["chat_id"].to_pylist(), agg["chat_type"].to_pylist(), agg["is_cmd_count"].to_pylist(),
+                    agg["is_cmd_sum"].to_pylist(), agg["user_id_count_distinct"].to_pylist()))
+
+def usage_report(log_dir: str | Path, start: date, end: date, section: str = "all",
+                 command: str | None = None, limit: int = 10) -> str:
+    """Plain-text /usage answer for start..end."""
+    flt = (ds.field("command") == command) if command else None
+    table = load_range(log_dir, start, end, filter=flt)
+    lines = [f"Usage {start.isoformat()} → {end.isoformat()}: {table.num_rows:,} events"
+             + (f" for /{command}" if command else "")]
+    if section in ("all", "commands") and not command:
+        lines += ["", "Top commands (runs / users)"]
+        lines += [f"  /{c}: {n:,} / {u:,}" for c, n, u in top_commands(table, limit)] or ["  (none)"]
+    if section in ("all", "users"):
+        lines += ["", "Top users (commands / messages)"]
+        lines += [f"  {uid}: {c:,} / {m:,}" for uid, c, m in top_users(table, limit)] or ["  (none)"]
+    if section in ("all", "chats"):
+        lines += ["", "Chats (messages / commands / users)"]
+        lines += [f"  {cid} [{ct or '?'}]: {m:,} / {c:,} / {u:,}"
+                  for cid, ct, m, c, u in chat_activity(table, limit)] or ["  (none)"]
+    return "\n".join(lines)
+
+class UsageCompactor:
+    """Background task: compact closed days now, then every night at 00:10 GMT+7."""
+
+    def __init__(self, log_dir: str | Path):
+        self.log_dir = Path(log_dir)
+        self._task: asyncio.Task | None = None
+
+    async def start(self, after: Callable[[], Awaitable] | None = None) -> None:
+        """`after`: awaited before the first run (EventLogWriter.wait_compressions: its files stay put)."""
+        if not available():
+            logger.warning("pyarrow is not installed; usage compaction and /usage are disabled")
+            return
+        self._task = asyncio.create_task(self._run(after), name="usage-compactor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, after: Callable[[], Awaitable] | None) -> None:
+        if after is not None:
+            await after()
+        while True:
+            try:
+                await asyncio.to_thread(compact_closed_days, self.log_dir)
+            except Exception:
+                logger.exception("Usage compaction failed")
+            now = datetime.now(TZ)
+            # after midnight, once the event writer has rotated and compressed yesterday
+            next_run = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), TZ) + timedelta(minutes=10)
+            await asyncio.sleep((next_run - now).total_seconds())
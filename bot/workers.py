@@ -0,0 +1,82 @@
+# workers.py
+"""
+Executor for the CPU-bound transform + render phase of the reports.
+
+The pandas aggregation and string building in table_renderer's
+build_*_messages functions run here instead of on the event loop, so one big
+"A" report does not stall every other chat. Only the Telegram sends stay on
+the loop.
+
+    RENDER_EXECUTOR  thread (default) | process | inline
+    RENDER_WORKERS   pool size (default: min(4, CPU count))
+
+    IMAGE_EXECUTOR   executor for image-mode PNG renders (default: process)
+    IMAGE_WORKERS    its pool size (default: same rule as RENDER_WORKERS)
+
+"process" sidesteps the GIL but pays for pickling the input rows/DataFrame
+and the rendered messages (see benchmarks/bench_workers.py). "inline" runs
+on the loop like before, which is handy when debugging.
+
+While an admin /profile session is on (bot/profiling.py), each call runs
+under its own profiler in the worker and its stats join the session's.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from bot import profiling
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ("thread", "process", "inline")
+
+class RenderPool:
+    def __init__(self, kind: str | None = None, workers: int | None = None, env_prefix: str = "RENDER"):
+        kind = (kind or os.environ.get(f"{env_prefix}_EXECUTOR", "thread")).strip().lower()
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown {env_prefix}_EXECUTOR '{kind}'. Try: {', '.join(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = workers or int(os.environ.get(f"{env_prefix}_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor | None:
+        if self.kind == "inline":
+            return None
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    # spawn: the parent runs threads (PTB, this pool), so fork is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+                logger.info("Render pool started: %s x%d", self.kind, self.workers)
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool. In process mode fn and its arguments must pickle."""
+        executor = self.executor
+        if executor is None:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        if profiling.active():
+            result, stats = await loop.run_in_executor(executor, profiling.run_profiled, fn, args, kwargs)
+            profiling.add_pool_stats(stats)
+            return result
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+render_pool = RenderPool()
+# Pillow drawing is CPU-bound and mostly holds the GIL, hence processes by default
+image_pool = RenderPool(os.environ.get("IMAGE_EXECUTOR", "process"), env_prefix="IMAGE")
@@ -1,30 +1,56 @@
 import os
+import sys
+import asyncio
 import logging
-from telegram import Update
+import math
+import multiprocessing
+import signal
+import ssl
+from telegram import Bot, Update
 from telegram.constants import ParseMode
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, TypeHandler, filters
 from dotenv import load_dotenv
 
-import json
 from pathlib import Path
 
 from bot.config import Config
-from bot.bq_client import BigQueryClient
+from bot.query_client import open_query_client
 from bot.table_renderer import send_apf_tables, send_channel_distribution, send_dpf_tables, send_pmh_total, send_pmh_week
 
-from bot.table_renderer import (send_provider_summaries, send_method_summaries
+from bot.table_renderer import (send_provider_summaries, send_method_summaries, split_table_text
 )
+from bot.formatting import stylize
+from bot import metrics, profiling, tracing
+from bot.metrics_server import MetricsServer
+from bot.workers import image_pool, render_pool
+from bot.state_store import StateStore
+from bot.event_log import EventLogWriter
+from bot import usage
+from bot.permissions import PermissionIndex
+from bot.update_processor import ChatOrderedProcessor
+from bot.shared_backend import open_backend
+from bot.shared_state import BackendStateStore, StateChanges, fetch_changes
+from bot.sharding import ShardRouter, serve_worker
+from bot import admission
+from bot.admission import QueryCancelled
+from bot.resilience import ResilientRequest
 
 import pandas as pd
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 import hmac, hashlib, base64, secrets, time  # add these
+import html
+import json
 # Load environment variables
 load_dotenv()
 
 VALID_COMMANDS= {"apf", "dpf", "dist", "pmh_total", "pmh_provider", "pmh_method", "pmh_week"}
 LIST_VALID_COMMANDS = ["apf", "dpf", "dist", "pmh_total", "pmh_provider", "pmh_method", "pmh_week"]
+# commands with their own metrics label (others are "other", plain messages "message")
+COMMAND_LABELS = {*LIST_VALID_COMMANDS, "start", "help", "register_now", "admin_create_link", "permission",
+                  "stats", "usage", "trace", "profile"}
 # --- Aliases ---
 PMH_ALIAS = {"pmh": ["pmh_total", "pmh_provider", "pmh_method", "pmh_week"]}
 def _expand_aliases(cmds: list[str]) -> list[str]:
@@ -45,6 +71,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+COMMAND_ERRORS = metrics.counter("command_errors_total", "Commands that ended in an error, by command")
+
 def _parse_target_date(date_str: str):
     """Parse YYYYMMDD -> 'YYYY-MM-DD' string; raise on invalid."""
     dt = datetime.strptime(date_str, "%Y%m%d")  # will raise ValueError if bad
@@ -63,64 +91,69 @@ def get_date_range_header():
     ]
     return current_time, dates
 
-# ---- unicode "font" converter ----
-STYLES = {
-    "mono":          {"A":0x1D670, "a":0x1D68A, "0":0x1D7F6},  # Mathematical Monospace
-    "sans":          {"A":0x1D5A0, "a":0x1D5BA, "0":0x1D7E2},  # Sans-serif
-    "sans_bold":     {"A":0x1D5D4, "a":0x1D5EE, "0":0x1D7EC},  # Sans-serif Bold
-    "serif_bold":    {"A":0x1D400, "a":0x1D41A, "0":0x1D7CE},  # Bold
-    "serif_italic":  {"A":0x1D434, "a":0x1D44E, "0":None},     # Italic (no special digits)
-    "serif_bi":      {"A":0x1D468, "a":0x1D482, "0":None},     # Bold Italic
-    "fullwidth":     {"A":0xFF21,  "a":0xFF41,  "0":0xFF10, "space":0x3000},  # Ｆｕｌｌｗｉｄｔｈ
-}
-
-def stylize(text: str, style: str = "mono") -> str:
-    spec = STYLES.get(style)
-    if not spec:
-        raise ValueError(f"Unknown style '{style}'. Try: {', '.join(STYLES)}")
+class ReportApplication(Application):
+    """Application that calls `on_stop` first when stopping, before it waits for running handlers."""
 
-    out = []
-    for ch in text:
-        o = ch
-        if "A" <= ch <= "Z" and spec.get("A") is not None:
-            o = chr(spec["A"] + (ord(ch) - ord("A")))
-        elif "a" <= ch <= "z" and spec.get("a") is not None:
-            o = chr(spec["a"] + (ord(ch) - ord("a")))
-        elif "0" <= ch <= "9" and spec.get("0") is not None:
-            o = chr(spec["0"] + (ord(ch) - ord("0")))
-        elif ch == " " and style == "fullwidth" and "space" in spec:
-            o = chr(spec["space"])  # optional fullwidth space
-        out.append(o)
-    return "".join(out)
+    def __init__(self, on_stop=None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_stop = on_stop
+
+    async def stop(self) -> None:
+        if self.on_stop is not None and self.running:
+            self.on_stop()
+        await super().stop()
 
 class RealTimeBot:
-    def __init__(self):
+    def __init__(self, worker_index: int | None = None):
         self.config = Config()
-        self.bq_client = BigQueryClient(self.config)
+        # None: the only process; 0..N-1: one of the sharded webhook workers (bot/sharding.py)
+        self.worker_index = worker_index
+        # what several workers share: query results, the state change feed, optionally the state itself
+        self.backend = open_backend(self.config.SHARED_BACKEND)
+        # BigQuery, or local DuckDB tables with QUERY_BACKEND=duckdb (bot/query_client.py)
+        self.bq_client = open_query_client(self.config, self.backend)
+        # per-user / per-chat token buckets weighted by command cost (bot/admission.py)
+        self.rate_limiter = admission.RateLimiter()
+        # the report each (chat, user) is running: cancelled when superseded, past its deadline or on stop
+        self.in_flight = admission.InFlight()
 
         base_dir = Path(__file__).resolve().parent
 
         self.logs_dir = base_dir / "logs"
         self.logs_dir.mkdir(exist_ok=True)
 
-        self.registered_file = self.logs_dir / "registered_users.json"
-        self.registered_users = self._load_registered_users()
-        
-        # Initialize invite tokens
-        self.tokens_file = self.logs_dir / "invite_tokens.json"
-        self.invite_tokens = self._load_invite_tokens()
+        # users / invite tokens / group policies live in SQLite (migrated from logs/*.json
+        # on first start) or, with STATE_STORE=backend, in the shared backend;
+        # the dicts below are the in-memory read cache, kept in step with other workers by state_changes
+        self.state_changes = StateChanges(self.backend)
+        self.state = StateStore(os.getenv("STATE_DB") or self.logs_dir / "state.db", legacy_dir=self.logs_dir)
+        if self.config.STATE_STORE == "backend":
+            local, self.state = self.state, BackendStateStore(self.backend)
+            self.state.seed_from(local)
+            local.close()
+        self.registered_users = self.state.load_users()
+        self.invite_tokens = self.state.load_tokens()
+        self._seed_token_counters(self.invite_tokens)
         self.register_secret = os.getenv("REGISTER_LINK_SECRET", "change_me_now")
 
+        # events-YYYYMMDD.jsonl, written in batches by a background task (started in post_init);
+        # each sharded worker writes its own events-YYYYMMDD.w<i>.jsonl
+        self.event_log = EventLogWriter(self.logs_dir, shard=f".w{worker_index}" if worker_index is not None else "")
+        # closed days -> logs/usage/day=YYYYMMDD/*.parquet for /usage (at startup, then nightly)
+        self.usage_compactor = usage.UsageCompactor(self.logs_dir)
+        # GET /metrics in the Prometheus text format when METRICS_PORT is set (bot/metrics_server.py)
+        self.metrics_server = MetricsServer()
+
         # Admins (comma-separated user IDs in env)
         raw_admins = os.getenv("ADMIN_USER_IDS", "")
         self.admin_user_ids = {int(x) for x in raw_admins.replace(" ", "").split(",") if x.strip().isdigit()}
 
-        self.group_policies_file = self.logs_dir / "group_policies.json"
-        self.group_policies = self._load_group_policies()  # { chat_id(str): {"allowed_commands":[...], "set_by": int, "ts": iso } }
-
+        self.group_policies = self.state.load_group_policies()  # { chat_id(str): {"allowed_commands":[...], "set_by": int, "ts": iso } }
+        # per-chat / per-user bitmasks over LIST_VALID_COMMANDS; kept in step by _save_user and /permission
+        self.permissions = PermissionIndex(LIST_VALID_COMMANDS).load(self.registered_users, self.group_policies)
 
-        logger.info("registered_file path: %s", self.registered_file.resolve())
-        logger.info("invite_tokens path:   %s", self.tokens_file.resolve())
+        logger.info("state store: %s (%d users, %d invite tokens, %d group policies)",
+                    self.state.path, len(self.registered_users), len(self.invite_tokens), len(self.group_policies))
 
     def _visible_commands_for_chat(self, update: Update) -> list[str]:
         """
@@ -130,40 +163,10 @@ class RealTimeBot:
         """
         chat = update.effective_chat
         user = update.effective_user
-        all_cmds = LIST_VALID_COMMANDS
-
-        # Group policy?
-        if chat and chat.type in ("group", "supergroup"):
-            policy = self.group_policies.get(str(chat.id))
-            if policy is not None:
-                allowed = policy.get("allowed_commands") or []
-                # normalize and filter
-                allowed_norm = [c for c in all_cmds if c in set(x.lower() for x in allowed)]
-                return allowed_norm
-
-        # No group policy -> per-user
-        allowed_user = self._user_allowed_commands(int(user.id) if user else -1)  # None => full
-        if allowed_user is None:
-            return all_cmds
-        return [c for c in all_cmds if c in allowed_user]
+        mask = self.permissions.effective_mask(
+            chat.id if chat else None, chat.type if chat else None, int(user.id) if user else -1)
+        return self.permissions.names(mask)
     
-    def _load_group_policies(self) -> dict:
-        try:
-            if self.group_policies_file.exists():
-                with self.group_policies_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        return data
-        except Exception:
-            logger.exception("Failed to load group_policies.json; starting empty")
-        return {}
-
-    def _save_group_policies(self) -> None:
-        try:
-            with self.group_policies_file.open("w", encoding="utf-8") as f:
-                json.dump(self.group_policies, f, ensure_ascii=False, indent=2)
-        except Exception:
-            logger.exception("Failed to save group_policies.json")
     
     async def _ensure_allowed(self, update: Update, cmd: str) -> bool:
         """
@@ -171,25 +174,25 @@ class RealTimeBot:
         Group policy (if set) is enforced for that chat.
         If no group policy, fall back to per-user allowed_commands.
         """
-        user = update.effective_user
-        chat = update.effective_chat
-        msg = update.effective_message
+        with metrics.phase("auth"):
+            user = update.effective_user
+            chat = update.effective_chat
+            msg = update.effective_message
 
-        if not user or not chat:
-            if msg:
-                await msg.reply_text("⚠️ Cannot identify user/chat.")
-            return False
+            if not user or not chat:
+                if msg:
+                    await msg.reply_text("⚠️ Cannot identify user/chat.")
+                return False
 
-        cmd = cmd.lower()
+            bit = self.permissions.bits.get(cmd.lower(), 0)
 
-        # 1) If the chat is a group/supergroup and has a policy, enforce it for everyone.
-        if chat.type in ("group", "supergroup"):
-            policy = self.group_policies.get(str(chat.id))
-            if policy is not None:
-                allowed = set(c.lower() for c in (policy.get("allowed_commands") or []))
-                if cmd in allowed:
+            # 1) If the chat is a group/supergroup and has a policy, enforce it for everyone.
+            chat_mask = self.permissions.chat_mask(chat.id, chat.type)
+            if chat_mask is not None:
+                if chat_mask & bit:
                     return True
                 # Group policy denies
+                allowed = self.permissions.names(chat_mask)
                 if msg:
                     await msg.reply_text(
                         "⛔ This command is disabled in this group.\n"
@@ -197,37 +200,29 @@ class RealTimeBot:
                     )
                 return False
 
-        # 2) No group policy → check per-user whitelist (None = full)
-        allowed_user = self._user_allowed_commands(user.id)
-        if allowed_user is None or cmd in allowed_user:
-            return True
-
-        if msg:
-            await msg.reply_text(
-                "⛔ This command is not enabled for you.\n"
-                f"Allowed: /{', /'.join(sorted(allowed_user)) if allowed_user else 'all'}\n"
-                f"Ask an admin for permission."
-            )
-        return False
+            # 2) No group policy → check per-user whitelist (no entry = full)
+            user_mask = self.permissions.user_mask(user.id)
+            if user_mask & bit:
+                return True
 
-    def _load_invite_tokens(self) -> dict:
-        """Load invite tokens from logs/invite_tokens.json."""
-        try:
-            if self.tokens_file.exists():
-                with self.tokens_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return data.get("tokens", {})
-        except Exception:
-            logger.exception("Failed to load invite_tokens.json; starting fresh")
-        return {}
+            allowed_user = self.permissions.names(user_mask)
+            if msg:
+                await msg.reply_text(
+                    "⛔ This command is not enabled for you.\n"
+                    f"Allowed: /{', /'.join(sorted(allowed_user)) if allowed_user else 'all'}\n"
+                    f"Ask an admin for permission."
+                )
+            return False
 
-    def _save_invite_tokens(self) -> None:
-        """Save invite tokens to logs/invite_tokens.json."""
-        try:
-            with self.tokens_file.open("w", encoding="utf-8") as f:
-                json.dump({"tokens": self.invite_tokens}, f, ensure_ascii=False, indent=2)
-        except Exception:
-            logger.exception("Failed to save invite_tokens.json")
+    def _seed_token_counters(self, tokens: dict[str, dict]) -> None:
+        """
+        Start each token's use counter in the shared backend (token_uses:<id>) at the
+        uses on record. Set-if-absent: a counter another worker already runs is left
+        alone, and a fresh memory backend picks up where the record stopped.
+        """
+        for invite_id, data in tokens.items():
+            if data.get("uses", 0) > 0:
+                self.backend.setnx(f"token_uses:{invite_id}", str(int(data["uses"])).encode())
 
     def validate_invite_token(self, token: str) -> tuple[bool, str, dict | None]:
         """
@@ -285,16 +280,19 @@ class RealTimeBot:
             if time.time() > exp_time:
                 return False, "Token has expired", None
 
-            # Check usage limits
+            # Check usage limits: count this use atomically in the shared backend (seeded from the
+            # record at startup), so two workers redeeming the same token at once cannot both get under max_uses
             max_uses = token_data.get("max_uses", -1)
-            current_uses = token_data.get("uses", 0)
-            
-            if max_uses != -1 and current_uses >= max_uses:
+            counter = f"token_uses:{invite_id}"
+            uses = self.backend.incr(counter)
+
+            if max_uses != -1 and uses > max_uses:
+                self.backend.incr(counter, -1)
                 return False, "Token usage limit reached", None
 
-            # Token is valid - increment usage
-            token_data["uses"] = current_uses + 1
-            self._save_invite_tokens()
+            # Token is valid - record the usage (the counter, not this field, enforces max_uses)
+            token_data["uses"] = max(uses, token_data.get("uses", 0))
+            self.state_changes.publish_after(self.state.put_token(invite_id, token_data), "token", invite_id)
 
             return True, "Valid token", token_data
 
@@ -315,7 +313,7 @@ class RealTimeBot:
         Create a signed deep-link invite usable at:
         https://t.me/<bot_username>?start=<token>
 
-        Persists server-side state in logs/invite_tokens.json:
+        Persists server-side state in the state store (invite_tokens table):
         {
             "tokens": {
             "<invite_id>": {
@@ -358,15 +356,112 @@ class RealTimeBot:
             "created_at": datetime.now(ZoneInfo("Asia/Bangkok")).isoformat(),
             "allowed_commands": sorted(set(allowed_commands or [])),  # <--- persist
         }
-        self._save_invite_tokens()
+        self.state_changes.publish_after(self.state.put_token(invite_id, self.invite_tokens[invite_id]), "token", invite_id)
 
         # ---- return deep link ----
         return f"https://t.me/{bot_username}?start={token}"
 
+    def _image_flag(self, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Strip a `-img` / `-text` argument; otherwise REPORT_IMAGE_MODE decides."""
+        args = context.args if context.args is not None else []
+        image = self.config.IMAGE_MODE
+        for flag in [a for a in args if a.lower() in ("-img", "-text")]:
+            args.remove(flag)
+            image = flag.lower() == "-img"
+        return image
+
     def _is_admin(self, update: Update) -> bool:
         u = update.effective_user
         return bool(u and int(u.id) in self.admin_user_ids)
 
+    async def _admit(self, update: Update, context: ContextTypes.DEFAULT_TYPE, cmd: str) -> bool:
+        """
+        Charge the command's cost to the user's and the chat's rate limits (admins are exempt),
+        then tag this update's queries with the chat for the fair BigQuery queue.
+        """
+        user, chat = update.effective_user, update.effective_chat
+        cost = admission.command_cost(cmd, context.args)
+        if not self._is_admin(update):
+            wait = self.rate_limiter.admit(user.id, chat.id, cost)
+            if wait:
+                await chat.send_message(
+                    f"⏳ Too many reports at once: /{cmd} {' '.join(context.args or [])} costs {cost} "
+                    f"(a country-wide run costs more). Try again in {math.ceil(wait)}s."
+                )
+                return False
+
+        async def notify(position: int):
+            await chat.send_message(f"⏳ Queued, position {position}. Your report starts as soon as a query slot frees up.")
+
+        request = admission.QueryRequest(chat.id, notify, deadline=time.monotonic() + admission.COMMAND_DEADLINE)
+        admission.current_request.set(request)
+        self.in_flight.start(chat.id, user.id, request)
+        return True
+
+    async def _report_cancelled(self, update: Update, cmd: str, e: QueryCancelled):
+        logger.info("/%s cancelled (%s) in chat %s", cmd, e.reason, update.effective_chat.id)
+        if e.reason == "deadline":
+            await update.effective_chat.send_message(
+                f"⌛ /{cmd} took longer than {admission.COMMAND_DEADLINE:.0f}s and was stopped. "
+                "Try one country, or again in a few minutes.")
+        elif e.reason == "shutdown":
+            await update.effective_chat.send_message(f"🔁 The bot is restarting; please send /{cmd} again in a minute.")
+        # "superseded": the newer command answers instead
+
+    async def _stale_notice(self, update: Update) -> None:
+        """Once per command: say the report comes from stored results because BigQuery is unavailable."""
+        request = admission.current_request.get()
+        if request is None or request.stale_since is None or request.stale_noticed:
+            return
+        request.stale_noticed = True
+        since = datetime.fromtimestamp(request.stale_since, ZoneInfo("Asia/Bangkok")).strftime("%d %b %H:%M")
+        await update.effective_chat.send_message(
+            f"⚠️ BigQuery is not responding. Showing the last stored results, stale since {since} (GMT+7).")
+
+    @staticmethod
+    def _report_command(update: object) -> str | None:
+        """The report command (apf, pmh_week, ...) a message asks for, if any."""
+        msg = update.effective_message if isinstance(update, Update) else None
+        text = (msg.text or "") if msg else ""
+        if not text.startswith("/"):
+            return None
+        cmd = text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+        return cmd if cmd in admission.COMMAND_COSTS else None
+
+    @staticmethod
+    def _command_label(update: object) -> str:
+        """Metrics label of an update: its command, "other" for unknown commands, "message" for the rest."""
+        msg = update.effective_message if isinstance(update, Update) else None
+        text = (msg.text or "") if msg else ""
+        if not text.startswith("/"):
+            return "message"
+        cmd = text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+        return cmd if cmd in COMMAND_LABELS else "other"
+
+    def _on_update_arrival(self, update: object) -> None:
+        """A new report command from a user cancels the report they are still waiting for in that chat."""
+        if isinstance(update, Update) and update.effective_user:
+            # only report commands keep their text in the trace (others may carry invite tokens)
+            text = update.effective_message.text if self._report_command(update) else None
+            tracing.annotate(user_id=update.effective_user.id, **({"text": text} if text else {}))
+        if self._report_command(update) and update.effective_user and update.effective_chat:
+            if self.in_flight.supersede(update.effective_chat.id, update.effective_user.id):
+                logger.info("Report of user %s in chat %s superseded", update.effective_user.id, update.effective_chat.id)
+
+    def _on_update_done(self, update: object) -> None:
+        if profiling.active():
+            command, trace = metrics.current_command.get(), tracing.current()
+            if command not in ("message", "other", "profile"):
+                profiling.command_done(command, trace.seconds if trace is not None else 0.0)
+        request = admission.current_request.get()
+        if request is not None and isinstance(update, Update) and update.effective_user and update.effective_chat:
+            self.in_flight.finish(update.effective_chat.id, update.effective_user.id, request)
+
+    def _on_stop(self) -> None:
+        n = self.in_flight.cancel_all("shutdown")
+        if n:
+            logger.info("Cancelled %d running report(s) on shutdown", n)
+
     async def admin_create_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Admin guard
         logger.info("Admin create link requested by user_id=%s", update.effective_user.id if update.effective_user else "unknown")
@@ -461,78 +556,11 @@ class RealTimeBot:
             f"📝 {note or '(no note)'}"
         )
 
-    def _load_registered_users(self) -> dict[int, dict]:
-        """
-        Load registered users from logs/registered_users.json.
-        Supports old schema: {"user_ids": [int, ...]}
-        New schema: {"users": [{"user_id": int, "username": str|None, "first_name": str|None,
-                                "last_name": str|None, "ts": iso8601}, ...]}
-        Returns in-memory mapping: { user_id: {username, first_name, last_name, ts} }
-        """
-        try:
-            if self.registered_file.exists():
-                with self.registered_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                # New schema
-                if isinstance(data, dict) and "users" in data and isinstance(data["users"], list):
-                    users = {}
-                    for u in data["users"]:
-                        uid = u.get("user_id")
-                        if isinstance(uid, int):
-                            users[uid] = {
-                                "username":   u.get("username"),
-                                "first_name": u.get("first_name"),
-                                "last_name":  u.get("last_name"),
-                                "ts":         u.get("ts"),
-                                "allowed_commands": u.get("allowed_commands"),  # <-- KEEP
-                            }
-                    return users
-
-                # Old schema (backward compatible): {"user_ids": [...]}
-                if isinstance(data, dict) and "user_ids" in data and isinstance(data["user_ids"], list):
-                    return {int(uid): {"username": None, "first_name": None, "last_name": None, "ts": None}
-                            for uid in data["user_ids"]}
-
-        except Exception:
-            logger.exception("Failed to load registered_users.json")
-        return {}
-
-    def _save_registered_users(self) -> None:
-        """
-        Save in new schema: {"users": [ ... ]}, stable, human-readable ordering.
-        """
-        try:
-            out = {
-                "users": [
-                    {
-                        "user_id":   int(uid),
-                        "username":  info.get("username"),
-                        "first_name": info.get("first_name"),
-                        "last_name":  info.get("last_name"),
-                        "ts":         info.get("ts"),
-                        "allowed_commands": info.get("allowed_commands"),  # <-- SAVE
-
-                    }
-                    for uid, info in sorted(self.registered_users.items(), key=lambda kv: kv[0])
-                ]
-            }
-            with self.registered_file.open("w", encoding="utf-8") as f:
-                json.dump(out, f, ensure_ascii=False, indent=2)
-        except Exception:
-            logger.exception("Failed to save registered_users.json")
-    
-    def _user_allowed_commands(self, user_id: int) -> set[str] | None:
-        """
-        Returns a set of allowed commands (lowercase) or None for full access.
-        """
-        info = self.registered_users.get(int(user_id))
-        if not info:
-            return None
-        allowed = info.get("allowed_commands")
-        if not allowed:
-            return None  # None => full access
-        return {c.lower() for c in allowed}
+    async def _save_user(self, uid: int) -> None:
+        """Upsert one user row (on the state store thread) from the in-memory cache and refresh its permission bits."""
+        rec = self.registered_users[uid]
+        self.permissions.set_user(uid, rec.get("allowed_commands"))
+        await asyncio.wrap_future(self.state_changes.publish_after(self.state.put_user(uid, rec), "user", uid))
 
     # async def _ensure_allowed(self, update: Update, cmd: str) -> bool:
     #     """
@@ -566,7 +594,11 @@ class RealTimeBot:
         # If there is a token, validate it FIRST (even if user exists)
         token = context.args[0] if (context.args and len(context.args) > 0) else None
         if token:
-            is_valid, message, token_data = self.validate_invite_token(token)
+            # a shared backend is a network/disk round trip: keep it off the event loop
+            if self.backend.shared:
+                is_valid, message, token_data = await asyncio.to_thread(self.validate_invite_token, token)
+            else:
+                is_valid, message, token_data = self.validate_invite_token(token)
             if not is_valid:
                 return await update.effective_chat.send_message(f"⚠️ Registration failed: {message}")
 
@@ -591,7 +623,7 @@ class RealTimeBot:
                 "allowed_commands": keep_allowed,   # <-- preserve exactly (None/list/[])
             })
             self.registered_users[uid] = rec
-            self._save_registered_users()
+            await self._save_user(uid)
             logger.info("User %s saved with allowed=%r", uid, allowed)
 
             return await update.effective_chat.send_message(
@@ -614,7 +646,7 @@ class RealTimeBot:
             "registered_via": "manual",
             # no allowed_commands field -> full access
         }
-        self._save_registered_users()
+        await self._save_user(uid)
         return await update.effective_chat.send_message("🎉 Registered. Type /help to begin.")
 
     async def register_now(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -632,7 +664,7 @@ class RealTimeBot:
                 "last_name":  getattr(user, "last_name", None),
                 "ts":         self.registered_users[uid].get("ts") or datetime.now(ZoneInfo("Asia/Bangkok")).isoformat(),
             })
-            self._save_registered_users()
+            await self._save_user(uid)
             return await update.effective_chat.send_message("✅ You are already registered!")
 
         # New registration
@@ -643,7 +675,7 @@ class RealTimeBot:
             "ts":         datetime.now(ZoneInfo("Asia/Bangkok")).isoformat(),
             "registered_via": "manual",
         }
-        self._save_registered_users()
+        await self._save_user(uid)
 
         await update.effective_chat.send_message(
             f"🎉 Welcome, {user.first_name or 'User'}! You are now registered.\n"
@@ -651,32 +683,11 @@ class RealTimeBot:
         )
 
     def _log_event(self, payload: dict):
-        try:
-            now_bkk = datetime.now(ZoneInfo("Asia/Bangkok"))
-            day = now_bkk.strftime("%Y%m%d")
-            log_path = self.logs_dir / f"events-{day}.jsonl"
-
-            # ensure timestamp in GMT+7
-            payload = dict(payload)  # avoid mutating caller's dict
-            payload.setdefault("ts", now_bkk.isoformat())
-
-            # make sure folder exists (defensive)
-            self.logs_dir.mkdir(parents=True, exist_ok=True)
-
-            with log_path.open("a", encoding="utf-8") as f:
-                json.dump(payload, f, ensure_ascii=False)
-                f.write("\n")
-
-            logger.info("Logged event to %s", log_path)
-        except Exception:
-            logger.exception("Failed to write log event")
+        # queued for the background writer; dropped (and counted) if the queue is full
+        self.event_log.log_nowait(payload)
 
     async def echo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        logger.warning("🚀 echo() triggered!")   # WARNING always shows up
-        if update.effective_message:
-            logger.warning("Text received: %s", update.effective_message.text)
-        else:
-            logger.warning("No text in message")
+        # runs for every message in every group: keep it to a queue put
         msg = update.effective_message
         user = update.effective_user
         chat = update.effective_chat
@@ -692,8 +703,8 @@ class RealTimeBot:
             "chat_type": chat.type if chat else None,
             "text": text,
         }
-        logger.info("MSG %s", payload)
-        self._log_event(payload)
+        logger.debug("MSG %s", payload)
+        await self.event_log.emit(payload)  # waits only if the writer is backed up
         
     # async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -800,6 +811,7 @@ class RealTimeBot:
         parts.append("*📍 Supported Countries:* TH, PH, BD, PK, BR")
         parts.append("*🕒 Timezone:* GMT+7\n")
         parts.append("_Please reduce your font size if the table appears misaligned_")
+        parts.append("_...or add_ `-img` _to a report command to get one image per country_")
 
         text = "\n".join(parts)
         await update.effective_chat.send_message(text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
@@ -816,40 +828,46 @@ class RealTimeBot:
             return
 
         try:
-            if not context.args:
-                return await update.effective_chat.send_message(
-                    "Please type the correct function: `/apf a` or `/apf <COUNTRY>` (TH, PH, BD, PK)",
-                    parse_mode=ParseMode.MARKDOWN,
-                )
-
-            sel = context.args[0].upper().strip()
-            if sel == "A":
-                selected_country = None
-                scope_label = "all countries"
-            else:
-                if sel not in self.config.APF_ALLOWED:
+            with tracing.span("parse"):
+                image = self._image_flag(context)
+                if not context.args:
                     return await update.effective_chat.send_message(
-                        f"❌ Unsupported country `{sel}`. Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}"
+                        "Please type the correct function: `/apf a` or `/apf <COUNTRY>` (TH, PH, BD, PK)",
+                        parse_mode=ParseMode.MARKDOWN,
                     )
-                selected_country = sel
-                scope_label = sel
 
+                sel = context.args[0].upper().strip()
+                if sel == "A":
+                    selected_country = None
+                    scope_label = "all countries"
+                else:
+                    if sel not in self.config.APF_ALLOWED:
+                        return await update.effective_chat.send_message(
+                            f"❌ Unsupported country `{sel}`. Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}"
+                        )
+                    selected_country = sel
+                    scope_label = sel
+
+            if not await self._admit(update, context, "apf"):
+                return
             rows = await self.bq_client.execute_apf_query(selected_country)
+            await self._stale_notice(update)
             if not rows:
                 return await update.effective_chat.send_message(f"No data for {scope_label}.")
 
             country_groups = {}
-            for row in rows:
-                row["group"] = str(row["group"]).replace("PH96G1", "96G1")\
-                        .replace("PHBLG", "BLG")\
-                        .replace("1", "").replace("2", "")\
-                        .replace("KZG", "KZO").replace("PHK", "KZO").replace("IDK", "KZO").replace("PKK", "KZO")
-                
-                row["group"] = normalize_brand(row["group"])
-                country = row.get("country", "Unknown")
-                if country not in country_groups:
-                    country_groups[country] = []
-                country_groups[country].append(row)
+            with metrics.phase("transform"):
+                for row in rows:
+                    row["group"] = str(row["group"]).replace("PH96G1", "96G1")\
+                            .replace("PHBLG", "BLG")\
+                            .replace("1", "").replace("2", "")\
+                            .replace("KZG", "KZO").replace("PHK", "KZO").replace("IDK", "KZO").replace("PKK", "KZO")
+
+                    row["group"] = normalize_brand(row["group"])
+                    country = row.get("country", "Unknown")
+                    if country not in country_groups:
+                        country_groups[country] = []
+                    country_groups[country].append(row)
 
             current_time, date_range = get_date_range_header()
             header_text = (
@@ -858,9 +876,12 @@ class RealTimeBot:
                 f"📅 Date range: {date_range[2]} → {date_range[0]}"
             )
             # await update.effective_chat.send_message(header_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
-            await send_apf_tables(update, country_groups, max_width=52, max_length=2400)
+            await send_apf_tables(update, country_groups, max_width=52, max_length=2400, image=image)
 
+        except QueryCancelled as e:
+            await self._report_cancelled(update, "apf", e)
         except Exception as e:
+            COMMAND_ERRORS.inc(command="apf")
             logger.exception("Error in /apf")
             await update.effective_chat.send_message(
                 f"Error: `{e}`\nLocation: {self.config.BQ_LOCATION}", 
@@ -876,44 +897,53 @@ class RealTimeBot:
             return
 
         try:
-            if len(context.args) < 2:
-                return await update.effective_chat.send_message(
-                    f"Usage:\n`/pmh_{mode} <COUNTRY/A> <YYYYMMDD>`",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            with tracing.span("parse"):
+                image = self._image_flag(context)
+                if len(context.args) < 2:
+                    return await update.effective_chat.send_message(
+                        f"Usage:\n`/pmh_{mode} <COUNTRY/A> <YYYYMMDD>`",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
 
-            selector = context.args[0].upper().strip()
-            date_str = context.args[1].strip()
+                selector = context.args[0].upper().strip()
+                date_str = context.args[1].strip()
 
-            try:
-                target_date = _parse_target_date(date_str)
-            except ValueError:
-                return await update.effective_chat.send_message("❌ Invalid date format. Use `YYYYMMDD`.")
+                try:
+                    target_date = _parse_target_date(date_str)
+                except ValueError:
+                    return await update.effective_chat.send_message("❌ Invalid date format. Use `YYYYMMDD`.")
 
-            if selector == "A":
-                countries_to_process = self.config.APF_ALLOWED
-            else:
-                if selector not in self.config.APF_ALLOWED:
-                    return await update.effective_chat.send_message(f"❌ Unsupported country: `{selector}`.")
-                countries_to_process = [selector]
+                if selector == "A":
+                    countries_to_process = self.config.APF_ALLOWED
+                else:
+                    if selector not in self.config.APF_ALLOWED:
+                        return await update.effective_chat.send_message(f"❌ Unsupported country: `{selector}`.")
+                    countries_to_process = [selector]
 
+            if not await self._admit(update, context, f"pmh_{mode}"):
+                return
             for country_code in countries_to_process:
                 # --- SIMPLIFIED: Always call the same query function ---
                 rows = await self.bq_client.execute_pmh_query(target_date, country_code)
+                await self._stale_notice(update)
                 
                 if not rows:
                     await update.effective_chat.send_message(f"ℹ️ No data found for {country_code} on {target_date}.")
                     continue
 
-                df = pd.DataFrame(rows)
+                with metrics.phase("transform"):
+                    df = pd.DataFrame(rows)
                 if mode == "total":
-                    await send_pmh_total(update, df, target_date)
+                    await send_pmh_total(update, df, target_date, image=image)
                 elif mode == "provider":
-                    await send_provider_summaries(update, df, target_date)
+                    await send_provider_summaries(update, df, target_date, image=image)
                 elif mode == "method":
-                    await send_method_summaries(update, df, target_date)
+                    await send_method_summaries(update, df, target_date, image=image)
 
+        except QueryCancelled as e:
+            await self._report_cancelled(update, f"pmh_{mode}", e)
         except Exception as e:
+            COMMAND_ERRORS.inc(command=f"pmh_{mode}")
             logger.exception(f"Error in /pmh_{mode}")
             await update.effective_chat.send_message(
                 f"An error occurred in /pmh_{mode}: `{e}`", parse_mode=ParseMode.MARKDOWN
@@ -934,38 +964,47 @@ class RealTimeBot:
         if not await self._ensure_allowed(update, "pmh_total"):  # reuse same permission bucket
             return
         try:
-            if len(context.args) < 2:
-                return await update.effective_chat.send_message(
-                    "Usage:\n`/pmh_week <COUNTRY/A> <YYYYMMDD>`",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-
-            selector = context.args[0].upper().strip()
-            date_str = context.args[1].strip()
-            try:
-                as_of_date = _parse_target_date(date_str)  # 'YYYY-MM-DD'
-            except ValueError:
-                return await update.effective_chat.send_message("❌ Invalid date format. Use `YYYYMMDD`.")
-
-            if selector == "A":
-                countries_to_process = self.config.APF_ALLOWED
-            else:
-                if selector not in self.config.APF_ALLOWED:
-                    return await update.effective_chat.send_message(f"❌ Unsupported country: `{selector}`.")
-                countries_to_process = [selector]
+            with tracing.span("parse"):
+                image = self._image_flag(context)
+                if len(context.args) < 2:
+                    return await update.effective_chat.send_message(
+                        "Usage:\n`/pmh_week <COUNTRY/A> <YYYYMMDD>`",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
 
+                selector = context.args[0].upper().strip()
+                date_str = context.args[1].strip()
+                try:
+                    as_of_date = _parse_target_date(date_str)  # 'YYYY-MM-DD'
+                except ValueError:
+                    return await update.effective_chat.send_message("❌ Invalid date format. Use `YYYYMMDD`.")
+
+                if selector == "A":
+                    countries_to_process = self.config.APF_ALLOWED
+                else:
+                    if selector not in self.config.APF_ALLOWED:
+                        return await update.effective_chat.send_message(f"❌ Unsupported country: `{selector}`.")
+                    countries_to_process = [selector]
+
+            if not await self._admit(update, context, "pmh_week"):
+                return
             for country_code in countries_to_process:
                 rows = await self.bq_client.execute_pmh_week_query(as_of_date, country_code)
+                await self._stale_notice(update)
                 if not rows:
                     await update.effective_chat.send_message(
                         f"ℹ️ No weekly data for {country_code} up to {as_of_date}."
                     )
                     continue
 
-                df = pd.DataFrame(rows)
-                await send_pmh_week(update, df, as_of_date)
+                with metrics.phase("transform"):
+                    df = pd.DataFrame(rows)
+                await send_pmh_week(update, df, as_of_date, image=image)
 
+        except QueryCancelled as e:
+            await self._report_cancelled(update, "pmh_week", e)
         except Exception as e:
+            COMMAND_ERRORS.inc(command="pmh_week")
             logger.exception("Error in /pmh_week")
             await update.effective_chat.send_message(
                 f"An error occurred in /pmh_week: `{e}`",
@@ -999,40 +1038,45 @@ class RealTimeBot:
         # "command": update.effective_message.text,   # logs "/help" or "/start"
         # })
         try:
-            if len(context.args) < 2:
-                return await update.effective_chat.send_message(
-                    "Usage: `/dist a <YYYYMMDD>` or `/dist <COUNTRY> <YYYYMMDD>`",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-
-            selector = context.args[0].upper().strip()
-            date_str = context.args[1].strip()
+            with tracing.span("parse"):
+                image = self._image_flag(context)
+                if len(context.args) < 2:
+                    return await update.effective_chat.send_message(
+                        "Usage: `/dist a <YYYYMMDD>` or `/dist <COUNTRY> <YYYYMMDD>`",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
 
-            # Parse target date
-            try:
-                target_date = _parse_target_date(date_str)  # 'YYYY-MM-DD'
-            except ValueError:
-                return await update.effective_chat.send_message(
-                    "❌ Invalid date format. Use `YYYYMMDD` (e.g., `20250901`).",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                selector = context.args[0].upper().strip()
+                date_str = context.args[1].strip()
 
-            # Country filter
-            if selector == "A":
-                selected_country_value = None
-                target_label = "all countries"
-            else:
-                if selector not in self.config.APF_ALLOWED:
+                # Parse target date
+                try:
+                    target_date = _parse_target_date(date_str)  # 'YYYY-MM-DD'
+                except ValueError:
                     return await update.effective_chat.send_message(
-                        f"❌ Unsupported country `{selector}`. "
-                        f"Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}",
+                        "❌ Invalid date format. Use `YYYYMMDD` (e.g., `20250901`).",
                         parse_mode=ParseMode.MARKDOWN
                     )
-                selected_country_value = selector
-                target_label = selector
 
+                # Country filter
+                if selector == "A":
+                    selected_country_value = None
+                    target_label = "all countries"
+                else:
+                    if selector not in self.config.APF_ALLOWED:
+                        return await update.effective_chat.send_message(
+                            f"❌ Unsupported country `{selector}`. "
+                            f"Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}",
+                            parse_mode=ParseMode.MARKDOWN
+                        )
+                    selected_country_value = selector
+                    target_label = selector
+
+            if not await self._admit(update, context, "dist"):
+                return
             # Query BQ: exact date + native currency
             rows = await self.bq_client.execute_dist_query(target_date, selected_country_value)
+            await self._stale_notice(update)
 
             if not rows:
                 return await update.effective_chat.send_message(
@@ -1042,9 +1086,10 @@ class RealTimeBot:
 
             # Group rows by country
             country_groups: dict[str, list[dict]] = {}
-            for r in rows:
-                c = (r.get("country") or "") or "Unknown"
-                country_groups.setdefault(c, []).append(r)
+            with metrics.phase("transform"):
+                for r in rows:
+                    c = (r.get("country") or "") or "Unknown"
+                    country_groups.setdefault(c, []).append(r)
 
             # Header
             header_text = (
@@ -1055,9 +1100,12 @@ class RealTimeBot:
             await update.effective_chat.send_message(header_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
 
             # Render (table_renderer handles native currency keys)
-            await send_channel_distribution(update, country_groups, max_width=72)
+            await send_channel_distribution(update, country_groups, max_width=72, image=image)
 
+        except QueryCancelled as e:
+            await self._report_cancelled(update, "dist", e)
         except Exception as e:
+            COMMAND_ERRORS.inc(command="dist")
             logging.exception("Error in /dist")
             await update.effective_chat.send_message(
                 f"Error: `{e}`\nLocation: {self.config.BQ_LOCATION}",
@@ -1084,39 +1132,45 @@ class RealTimeBot:
             return
         
         try:
-            if not context.args:
-                return await update.effective_chat.send_message(
-                    "Usage: `/dpf a` or `/dpf <COUNTRY>` (TH, PH, BD, PK, BR)",
-                    parse_mode=ParseMode.MARKDOWN,
-                )
-
-            sel = context.args[0].upper().strip()
-            if sel == "A":
-                selected_country = None
-                scope_label = "all countries"
-            else:
-                if sel not in self.config.APF_ALLOWED:
+            with tracing.span("parse"):
+                image = self._image_flag(context)
+                if not context.args:
                     return await update.effective_chat.send_message(
-                        f"❌ Unsupported country `{sel}`. Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}",
+                        "Usage: `/dpf a` or `/dpf <COUNTRY>` (TH, PH, BD, PK, BR)",
                         parse_mode=ParseMode.MARKDOWN,
                     )
-                selected_country = sel
-                scope_label = sel
 
+                sel = context.args[0].upper().strip()
+                if sel == "A":
+                    selected_country = None
+                    scope_label = "all countries"
+                else:
+                    if sel not in self.config.APF_ALLOWED:
+                        return await update.effective_chat.send_message(
+                            f"❌ Unsupported country `{sel}`. Allowed: {', '.join(sorted(self.config.APF_ALLOWED))}",
+                            parse_mode=ParseMode.MARKDOWN,
+                        )
+                    selected_country = sel
+                    scope_label = sel
+
+            if not await self._admit(update, context, "dpf"):
+                return
             rows = await self.bq_client.execute_dpf_query(selected_country)
+            await self._stale_notice(update)
             if not rows:
                 return await update.effective_chat.send_message(f"No deposit data for {scope_label}.")
 
             country_groups: dict[str, list[dict]] = {}
-            for r in rows:
-                r["group"] = str(r["group"]).replace("PH96G1", "96G1")\
-                        .replace("PHBLG", "BLG")\
-                        .replace("1", "").replace("2", "")\
-                        .replace("KZG", "KZO").replace("PHK", "KZO").replace("IDK", "KZO").replace("PKK", "KZO")
-                
-                r["group"] = normalize_brand(r["group"])
-                c = (r.get("country") or "") or "Unknown"
-                country_groups.setdefault(c, []).append(r)
+            with metrics.phase("transform"):
+                for r in rows:
+                    r["group"] = str(r["group"]).replace("PH96G1", "96G1")\
+                            .replace("PHBLG", "BLG")\
+                            .replace("1", "").replace("2", "")\
+                            .replace("KZG", "KZO").replace("PHK", "KZO").replace("IDK", "KZO").replace("PKK", "KZO")
+
+                    r["group"] = normalize_brand(r["group"])
+                    c = (r.get("country") or "") or "Unknown"
+                    country_groups.setdefault(c, []).append(r)
 
             current_time, date_range = get_date_range_header()
             header_text = (
@@ -1127,9 +1181,12 @@ class RealTimeBot:
             )
             # await update.effective_chat.send_message(header_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
 
-            await send_dpf_tables(update, country_groups, max_width=52)
+            await send_dpf_tables(update, country_groups, max_width=52, image=image)
 
+        except QueryCancelled as e:
+            await self._report_cancelled(update, "dpf", e)
         except Exception as e:
+            COMMAND_ERRORS.inc(command="dpf")
             logger.exception("Error in /dpf")
             await update.effective_chat.send_message(
                 f"Error: `{e}`\nLocation: {self.config.BQ_LOCATION}",
@@ -1207,7 +1264,10 @@ class RealTimeBot:
             "set_by": int(update.effective_user.id) if update.effective_user else None,
             "ts": datetime.now(ZoneInfo("Asia/Bangkok")).isoformat(),
         }
-        self._save_group_policies()
+        self.permissions.set_chat_policy(target_chat_id, allowed)
+        await asyncio.wrap_future(self.state_changes.publish_after(
+            self.state.put_group_policy(target_chat_id, self.group_policies[str(target_chat_id)]),
+            "policy", target_chat_id))
 
         # Build confirmation text (HTML-safe)
         return await update.effective_chat.send_message(
@@ -1217,12 +1277,224 @@ class RealTimeBot:
                 "Type /help to see available commands."
             )
 
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Admin guard
+        if not self._is_admin(update):
+            return await update.effective_chat.send_message("⚠️ You are not authorized to view stats.")
+
+        text = metrics.format_snapshot() or "(no metrics recorded yet)"
+        # one line per series, so a busy bot outgrows a single message; split on lines like the tables
+        for chunk in split_table_text(f"📊 Bot metrics\n{text}"):
+            await update.effective_chat.send_message(chunk)
 
     
-    def run(self):
-        application = ApplicationBuilder().token(self.config.TELEGRAM_TOKEN).build()
+    async def usage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /usage [commands|users|chats] [/<command>] [<YYYYMMDD> [<YYYYMMDD>]]
+        Default: everything over the last 7 days (GMT+7), today included.
+        """
+        # Admin guard
+        if not self._is_admin(update):
+            return await update.effective_chat.send_message("⚠️ You are not authorized to view usage.")
+        if not usage.available():
+            return await update.effective_chat.send_message("⚠️ Usage analytics need pyarrow (requirements2.txt).")
+
+        section, command, dates = "all", None, []
+        for a in context.args or []:
+            a = a.strip().lower()
+            if a in ("all", "commands", "users", "chats"):
+                section = a
+            elif a.startswith("/"):
+                command = a[1:].split("@", 1)[0]
+            else:
+                try:
+                    dates.append(datetime.strptime(a, "%Y%m%d").date())
+                except ValueError:
+                    return await update.effective_chat.send_message(
+                        "Usage: `/usage [commands|users|chats] [/<command>] [<YYYYMMDD> [<YYYYMMDD>]]`",
+                        parse_mode=ParseMode.MARKDOWN,
+                    )
+
+        today = datetime.now(ZoneInfo("Asia/Bangkok")).date()
+        if not dates:
+            start, end = today - timedelta(days=6), today
+        elif len(dates) == 1:
+            start, end = dates[0], today
+        else:
+            start, end = min(dates[:2]), max(dates[:2])
+
+        try:
+            text = await asyncio.to_thread(usage.usage_report, self.logs_dir, start, end, section, command)
+        except Exception as e:
+            COMMAND_ERRORS.inc(command="usage")
+            logger.exception("Error in /usage")
+            return await update.effective_chat.send_message(f"An error occurred in /usage: {e}")
+        await update.effective_chat.send_message(f"📈 {text}")
+
+    async def trace_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /trace [last [<command>]]   waterfall of the latest finished update (of that command)
+        /trace list [<command>]     the latest 15, one line each
+        /trace <id>                 waterfall of one trace (id prefix from the list)
+        /trace json [<id>]          the trace as OTLP/JSON, as a file
+        """
+        # Admin guard
+        if not self._is_admin(update):
+            return await update.effective_chat.send_message("⚠️ You are not authorized to view traces.")
+        if not tracing.enabled():
+            return await update.effective_chat.send_message("⚠️ Tracing is off (TRACE_BUFFER=0).")
+
+        args = [a.strip().lower() for a in context.args or []]
+        action = args[0] if args else "last"
+        name = args[1].lstrip("/").split("@", 1)[0] if len(args) > 1 else None
+        if action == "list":
+            traces = tracing.recent(15, name)
+            text = "\n".join(tracing.summary(t) for t in traces) or "(no traces yet)"
+            return await update.effective_chat.send_message(f"<pre>{html.escape(text)}</pre>", parse_mode=ParseMode.HTML)
+        if action == "json":
+            trace = tracing.find(args[1]) if len(args) > 1 else next(iter(tracing.recent(1)), None)
+        elif action == "last":
+            trace = next(iter(tracing.recent(1, name)), None)
+        else:
+            trace = tracing.find(action)
+        if trace is None:
+            return await update.effective_chat.send_message(
+                "No such trace. Usage: `/trace [last [<command>]]`, `/trace list`, `/trace <id>`, `/trace json [<id>]`",
+                parse_mode=ParseMode.MARKDOWN,
+            )
+        if action == "json":
+            body = json.dumps(tracing.to_otlp(trace), indent=1).encode()
+            return await update.effective_chat.send_document(body, filename=f"trace-{trace.trace_id[:8]}.json")
+        text = f"{tracing.summary(trace)}\n{tracing.waterfall(trace)}"
+        await update.effective_chat.send_message(f"<pre>{html.escape(text[:4000])}</pre>", parse_mode=ParseMode.HTML)
+
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /profile [<N>] [/<command>]   cProfile the next N commands (default 5), or only that command
+        /profile <S>s [/<command>]    ...or all commands for S seconds
+        /profile off                  stop now and report
+        The report goes to logs/profiles/ and its summary to this chat (see bot/profiling.py).
+        """
+        # Admin guard
+        if not self._is_admin(update):
+            return await update.effective_chat.send_message("⚠️ You are not authorized to profile the bot.")
+
+        chat_id = update.effective_chat.id
+        args = [a.strip().lower() for a in context.args or []]
+        if args and args[0] in ("off", "stop"):
+            if profiling.stop() is None:
+                return await update.effective_chat.send_message("Not profiling.")
+            return await update.effective_chat.send_message("⏹ Profiling stopped, writing the report…")
+
+        commands, seconds, only = 5, None, None
+        try:
+            for a in args:
+                if a.startswith("/"):
+                    only = a[1:].split("@", 1)[0]
+                elif a.endswith("s"):
+                    commands, seconds = None, float(a[:-1])
+                else:
+                    commands = int(a)
+            if (commands is not None and commands < 1) or (seconds is not None and not 0 < seconds <= 3600):
+                raise ValueError
+        except ValueError:
+            return await update.effective_chat.send_message(
+                "Usage: `/profile [<N>] [/<command>]`, `/profile <S>s [/<command>]` or `/profile off`",
+                parse_mode=ParseMode.MARKDOWN,
+            )
+
+        async def report(text: str):
+            await context.bot.send_message(chat_id, f"<pre>{html.escape(text[:4000])}</pre>", parse_mode=ParseMode.HTML)
+
+        try:
+            session = profiling.start(self.logs_dir / "profiles", report, commands, seconds, only)
+        except (RuntimeError, ValueError) as e:
+            return await update.effective_chat.send_message(f"⚠️ Cannot start profiling: {e}")
+        await update.effective_chat.send_message(f"🔬 Profiling {session.describe()}. The summary will be posted here.")
+
+    async def _sync_shared_state(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Group -1, before any handler: pick up users/tokens/policies other workers changed."""
+        changes = await asyncio.to_thread(self.state_changes.poll)
+        if changes is None:
+            users, tokens, policies = await asyncio.to_thread(
+                lambda: (self.state.load_users(), self.state.load_tokens(), self.state.load_group_policies()))
+            self.registered_users, self.invite_tokens, self.group_policies = users, tokens, policies
+            self.permissions.load(users, policies)
+            return
+        if not changes:
+            return
+        for kind, key, record in await asyncio.to_thread(fetch_changes, self.state, changes):
+            if kind == "user":
+                uid = int(key)
+                if record is None:
+                    self.registered_users.pop(uid, None)
+                else:
+                    self.registered_users[uid] = record
+                self.permissions.set_user(uid, (record or {}).get("allowed_commands"))
+            elif kind == "token":
+                if record is None:
+                    self.invite_tokens.pop(key, None)
+                else:
+                    self.invite_tokens[key] = record
+            elif kind == "policy":
+                if record is None:
+                    self.group_policies.pop(str(key), None)
+                    self.permissions.remove_chat_policy(key)
+                else:
+                    self.group_policies[str(key)] = record
+                    self.permissions.set_chat_policy(key, record.get("allowed_commands"))
+
+    async def _post_init(self, application) -> None:
+        await self.event_log.start()
+        # with several workers, one of them compacts the (shared) logs directory
+        if not self.worker_index:
+            # not while our writer is still compressing leftover files the compactor would read
+            await self.usage_compactor.start(after=self.event_log.wait_compressions)
+        # Prometheus /metrics; sharded worker i is on METRICS_PORT + 1 + i (the router has METRICS_PORT)
+        if self.config.METRICS_PORT:
+            offset = 0 if self.worker_index is None else 1 + self.worker_index
+            self.metrics_server.start(self.config.METRICS_LISTEN, self.config.METRICS_PORT + offset)
+
+    async def _on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Errors the handlers did not catch themselves: counted, then logged as PTB would."""
+        COMMAND_ERRORS.inc(command=self._command_label(update))
+        tracing.fail(context.error)
+        logger.error("Unhandled error while handling an update", exc_info=context.error)
+
+    async def _post_shutdown(self, application) -> None:
+        await self.metrics_server.stop()
+        await profiling.close()
+        await self.usage_compactor.stop()
+        # write out the queued events
+        await self.event_log.stop()
+        # stop the render workers (threads or processes) after polling ends
+        render_pool.shutdown(wait=False)
+        image_pool.shutdown(wait=False)
+        # flush queued state writes before the process exits
+        self.state.close()
+        self.backend.close()
+
+    def build_application(self, builder: ApplicationBuilder | None = None):
+        """The Application with every handler registered; `builder` lets tests swap the HTTP layer."""
+        if builder is None:
+            # Bot API calls: transient failures retried, fail fast while Telegram is down (bot/resilience.py)
+            builder = ApplicationBuilder().request(ResilientRequest(HTTPXRequest(connection_pool_size=256)))
+        application = (
+            builder
+            .application_class(ReportApplication, kwargs={"on_stop": self._on_stop})
+            .token(self.config.TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            # chats run in parallel, updates within one chat stay in order (UPDATE_CONCURRENCY caps the total)
+            .concurrent_updates(ChatOrderedProcessor(on_arrival=self._on_update_arrival, on_done=self._on_update_done,
+                                                     label=self._command_label))
+            .build()
+        )
         # application.add_handler(MessageHandler("who", self.who_command))  # <-- add this
 
+        if self.state_changes.enabled:
+            application.add_handler(TypeHandler(Update, self._sync_shared_state), group=-1)
+
         application.add_handler(CommandHandler("register_now", self.register_now))
         application.add_handler(CommandHandler("start", self.start_command))
 
@@ -1239,13 +1511,112 @@ class RealTimeBot:
 
         application.add_handler(CommandHandler("admin_create_link", self.admin_create_link))
         application.add_handler(CommandHandler("permission", self.permission_command))
+        application.add_handler(CommandHandler("stats", self.stats_command))
+        application.add_handler(CommandHandler("usage", self.usage_command))
+        application.add_handler(CommandHandler("trace", self.trace_command))
+        application.add_handler(CommandHandler("profile", self.profile_command))
 
 
         # Catch-all for logging all invalid messages
         application.add_handler(MessageHandler(filters.ALL, self.echo), group=1)
+        application.add_error_handler(self._on_error)
+        return application
 
-        application.run_polling(poll_interval=2.0, timeout=50)
+    def run(self):
+        application = self.build_application()
+        cfg = self.config
+        if cfg.TELEGRAM_MODE == "webhook":
+            # Telegram pushes each update to WEBHOOK_URL/WEBHOOK_PATH; set_webhook is called on startup.
+            # Without WEBHOOK_CERT/KEY this serves plain HTTP for a TLS-terminating proxy in front.
+            logger.info("Webhook mode: listening on %s:%d/%s for %s/%s",
+                        cfg.WEBHOOK_LISTEN, cfg.WEBHOOK_PORT, cfg.WEBHOOK_PATH, cfg.WEBHOOK_URL, cfg.WEBHOOK_PATH)
+            application.run_webhook(
+                listen=cfg.WEBHOOK_LISTEN,
+                port=cfg.WEBHOOK_PORT,
+                url_path=cfg.WEBHOOK_PATH,
+                webhook_url=f"{cfg.WEBHOOK_URL}/{cfg.WEBHOOK_PATH}",
+                secret_token=cfg.WEBHOOK_SECRET,
+                cert=cfg.WEBHOOK_CERT,
+                key=cfg.WEBHOOK_KEY,
+                max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            application.run_polling(poll_interval=2.0, timeout=50)
+
+    def run_worker(self):
+        """One sharded webhook worker: serve routed updates on WORKER_PORT_BASE + index until SIGINT/SIGTERM."""
+        cfg = self.config
+        application = self.build_application()
+
+        async def main():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            await serve_worker(application, cfg.WORKER_LISTEN, cfg.WORKER_PORT_BASE + self.worker_index,
+                               cfg.WEBHOOK_SECRET, stop)
+
+        asyncio.run(main())
+
+def _worker_main(index: int) -> None:
+    load_dotenv()
+    RealTimeBot(worker_index=index).run_worker()
+
+def run_sharded(cfg: Config) -> None:
+    """Public webhook -> ShardRouter -> BOT_WORKERS local workers (or BOT_WORKER_URLS elsewhere)."""
+    processes = []
+    worker_urls = cfg.BOT_WORKER_URLS
+    if not worker_urls:
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(cfg.BOT_WORKERS):
+            p = ctx.Process(target=_worker_main, args=(i,), name=f"bot-worker-{i}")
+            p.start()
+            processes.append(p)
+        worker_urls = [f"http://{cfg.WORKER_LISTEN}:{cfg.WORKER_PORT_BASE + i}" for i in range(cfg.BOT_WORKERS)]
+
+    async def main():
+        router = ShardRouter(worker_urls, cfg.WEBHOOK_PATH, cfg.WEBHOOK_SECRET)
+        ssl_ctx = None
+        if cfg.WEBHOOK_CERT:
+            ssl_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_ctx.load_cert_chain(cfg.WEBHOOK_CERT, cfg.WEBHOOK_KEY)
+        router.start(cfg.WEBHOOK_LISTEN, cfg.WEBHOOK_PORT, ssl_options=ssl_ctx)
+        metrics_server = MetricsServer()
+        if cfg.METRICS_PORT:
+            metrics_server.start(cfg.METRICS_LISTEN, cfg.METRICS_PORT)
+        async with Bot(cfg.TELEGRAM_TOKEN) as bot:
+            await bot.set_webhook(
+                url=f"{cfg.WEBHOOK_URL}/{cfg.WEBHOOK_PATH}",
+                certificate=Path(cfg.WEBHOOK_CERT).read_bytes() if cfg.WEBHOOK_CERT else None,
+                secret_token=cfg.WEBHOOK_SECRET,
+                max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        logger.info("Shard router on %s:%d/%s -> %d workers: %s", cfg.WEBHOOK_LISTEN, cfg.WEBHOOK_PORT,
+                    cfg.WEBHOOK_PATH, len(worker_urls), ", ".join(worker_urls))
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        await metrics_server.stop()
+        await router.stop()
+
+    try:
+        asyncio.run(main())
+    finally:
+        for p in processes:
+            p.terminate()  # SIGTERM: each worker drains and runs its post_shutdown
+        for p in processes:
+            p.join(timeout=30)
 
 if __name__ == "__main__":
-    bot = RealTimeBot()
-    bot.run()
\ No newline at end of file
+    if len(sys.argv) > 2 and sys.argv[1] == "worker":
+        # a worker on another node, reached through BOT_WORKER_URLS
+        RealTimeBot(worker_index=int(sys.argv[2])).run_worker()
+    elif Config().worker_count > 1:
+        run_sharded(Config())
+    else:
+        bot = RealTimeBot()
+        bot.run()
\ No newline at end of file